@@ -1,5 +1,8 @@
+import copy
 import json
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 # 配置文件路径
 CONFIG_FILE = "config.json"
@@ -125,7 +128,10 @@ def get_default_config():
             "novice_bonus": 1.2,  # 新手奖励系数
             "enable_time_period_coeff": False,  # 是否启用时段系数
             "enable_lucky_coeff": False,  # 是否启用幸运系数
-            "enable_mood_coeff": False  # 是否启用心情系数
+            "base_luck_rate": 0.1,  # 基础幸运率
+            "fatigue_factor": 0.9,  # 幸运率随当日行为数的衰减因子
+            "enable_mood_coeff": False,  # 是否启用心情系数
+            "daily_score_target": 300  # 当日得分目标（连续达标天数）
         },
         "time_period_config": {
             "golden": {
@@ -152,6 +158,11 @@ def get_default_config():
                 "time_ranges": [[0, 6]],
                 "coefficient": 0.5,
                 "description": "应睡眠时间"
+            },
+            "efficient": {
+                "time_ranges": [],  # 由历史记录学习，见user_state.efficient_periods
+                "coefficient": 1.2,
+                "description": "个人高效时段"
             }
         }
     }
@@ -169,8 +180,49 @@ TIME_PERIOD_CONFIG = config["time_period_config"]
 for period in TIME_PERIOD_CONFIG.values():
     period["time_ranges"] = [tuple(range_) for range_ in period["time_ranges"]]
 
+# 统一积分计算核心（ScoringEngine与ScoringCalculator共用）
+from src.scoring.engine import ScoringCore
+SCORING_CORE = ScoringCore(LEVEL_CONFIG, GLOBAL_CONFIG, TIME_PERIOD_CONFIG)
+
+# 精力恢复积分（间隔恢复、跨天睡眠恢复）
+from src.scoring.recovery import RecoveryIntegrator, PASSIVE_RECOVERY_MIN_GAP, to_datetime
+RECOVERY_INTEGRATOR = RecoveryIntegrator(GLOBAL_CONFIG)
+
 # 延迟导入，避免循环依赖
-from storage_engine import StorageEngine
+from storage_engine import StorageEngine, MAX_BEHAVIOR_SPAN
+from src.db import energy_series, events
+from src.scoring.efficiency import EfficiencyTracker
+from src.scoring.replay import StateReplayer, day_start_ts, in_beginner_period, next_day_key, recovery_start_ts
+from src.scoring.rescore import DayRescorer
+from src.scoring.intervals import IntervalIndex
+from src.scoring.achievements import AchievementEngine
+from src.scoring.lucky import LuckyEngine, LuckyStream
+from src.scoring.streaks import day_conditions, streak_summary, CONDITION_POSITIVE, DEFAULT_DAILY_SCORE_TARGET
+
+# 状态重放（每日状态快照、任意时刻的状态查询）
+STATE_REPLAYER = StateReplayer(GLOBAL_CONFIG, RECOVERY_INTEGRATOR)
+
+# 成就引擎（记录行为时增量更新计数器并检查成就）
+ACHIEVEMENT_ENGINE = AchievementEngine()
+
+# 幸运系数引擎（每个用户一条确定性随机数流，检查点保存在user_state.lucky_state）
+LUCKY_ENGINE = LuckyEngine(GLOBAL_CONFIG)
+
+# 当日得分目标（旧配置文件没有该项时使用默认值）
+DAILY_SCORE_TARGET = GLOBAL_CONFIG.get("daily_score_target", DEFAULT_DAILY_SCORE_TARGET)
+
+# 高效时段统计在system_config中的键
+EFFICIENCY_STATE_KEY = "efficiency_stats"
+# 补录、修改、删除行为时递增的修订号；检查点的修订号落后时丢弃检查点重新学习
+EFFICIENCY_REVISION_KEY = "efficiency_revision"
+
+# 高效时段的后台学习任务（单线程，进程退出前等待未完成的任务）
+EFFICIENCY_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="efficiency")
+_efficiency_lock = threading.Lock()
+_efficiency_pending = None
+
+# 上次每日重置的日期在system_config中的键
+LAST_RESET_DATE_KEY = "last_reset_date"
 
 # 默认用户数据结构（2.0扩展版）
 DEFAULT_USER_DATA = {
@@ -222,10 +274,14 @@ def load_user_data():
     # 获取总得分
     total_score = storage.get_total_score()
     
+    # 新手期：从第一条记录的日期起按配置的天数计算
+    beginner_period = in_beginner_period(storage.first_record_day(), get_today_date(),
+                                         GLOBAL_CONFIG["beginner_period_days"])
+    
     storage.close()
     
-    # 构建兼容的用户数据格式
-    user_data = DEFAULT_USER_DATA.copy()
+    # 构建兼容的用户数据格式（深拷贝，避免历史列表在多次加载间共享）
+    user_data = copy.deepcopy(DEFAULT_USER_DATA)
     user_data.update({
         "day_energy": user_state["current_energy"],
         "combo_count": user_state["combo_count"],
@@ -236,6 +292,7 @@ def load_user_data():
         "total_score": total_score,
         "behavior_day_list": today_records,
         "recent_behaviors": today_records[-3:],  # 最近3个行为
+        "beginner_period": beginner_period,
     })
     
     return user_data
@@ -258,16 +315,157 @@ def add_behavior_to_db(name, level, category, base_score_per_min, energy_cost_pe
     storage.close()
     return result
 
-def add_behavior_record(level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume):
-    """向数据库添加行为记录"""
+def get_unlocked_achievements(unlock_ts=None):
+    """获取已解锁的成就（附带规则名称和提示语），unlock_ts指定时只取该时刻解锁的成就"""
     storage = StorageEngine()
-    result = storage.add_behavior_record(
-        level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume
-    )
+    achievements = storage.get_achievements(unlock_ts)
+    storage.close()
+    result = []
+    for achievement in achievements:
+        rule = ACHIEVEMENT_ENGINE.rules.get(achievement["type"])
+        if rule:
+            result.append(dict(achievement, name=rule["name"], message=rule["message"]))
+    return result
+
+def day_counter_key(name, level):
+    """每日计数键：有行为名称时按行为计数，否则按等级计数"""
+    return f"behavior:{name}" if name else f"level:{level}"
+
+def get_behavior_day_counter(name, level, ts=None):
+    """获取行为当日已记录次数和上次出现时间戳"""
+    storage = StorageEngine()
+    counter = storage.get_day_counter(day_counter_key(name, level), ts)
+    storage.close()
+    return counter
+
+def load_interval_index(start_ts, end_ts, storage=None):
+    """建立[start_ts, end_ts)附近行为记录的区间索引（覆盖索引查询 + 内存二分）"""
+    own_storage = storage is None
+    storage = storage or StorageEngine()
+    index = IntervalIndex.from_records(storage.get_span_candidates(start_ts, end_ts))
+    if own_storage:
+        storage.close()
+    return index
+
+def find_overlapping_behaviors(start_ts, end_ts, exclude_id=None, storage=None):
+    """与[start_ts, end_ts)重叠的行为记录
     
-    # 更新用户状态
-    user_state = storage.get_user_state()
-    new_energy = max(0, user_state["current_energy"] - energy_consume)
+    Returns:
+        (开始时间戳, 结束时间戳, 记录id)列表
+    """
+    return load_interval_index(start_ts, end_ts, storage).overlapping(start_ts, end_ts, exclude_id)
+
+def behaviors_at(moment):
+    """某一时刻正在进行的行为记录
+    
+    Args:
+        moment: datetime或时间戳
+    
+    Returns:
+        行为记录列表
+    """
+    ts = int(moment.timestamp() if isinstance(moment, datetime) else moment)
+    storage = StorageEngine()
+    records = [storage.get_record(item_id) for _, _, item_id in load_interval_index(ts, ts, storage).at(ts)]
+    storage.close()
+    return records
+
+def unrecorded_gaps(day=None, min_minutes=PASSIVE_RECOVERY_MIN_GAP, now=None):
+    """某天没有记录任何行为的空档（今天截止到当前时刻）
+    
+    Args:
+        day: 日期（datetime或YYYY-MM-DD），默认为今天
+        min_minutes: 只返回不短于该分钟数的空档，默认为被动恢复的最小间隔
+        now: 当前时间
+    
+    Returns:
+        (开始时间戳, 结束时间戳)列表
+    """
+    now = now or datetime.now()
+    day_key = day.strftime("%Y-%m-%d") if isinstance(day, datetime) else (day or now.strftime("%Y-%m-%d"))
+    start_ts = day_start_ts(day_key)
+    end_ts = min(day_start_ts(next_day_key(day_key)), int(now.timestamp()))
+    if end_ts <= start_ts:
+        return []
+    return load_interval_index(start_ts, end_ts).gaps(start_ts, end_ts, min_minutes * 60)
+
+def last_behavior_end(before_ts, storage=None):
+    """before_ts之前最后一次行为的结束时刻（间隔恢复从这里开始计算）
+    
+    上次行为在前一天及更早时，夜间的恢复已由每日重置的睡眠恢复计入，起点为当天睡眠结束的时刻
+    （见recovery_start_ts）
+    """
+    own_storage = storage is None
+    storage = storage or StorageEngine()
+    last_end = load_interval_index(before_ts - MAX_BEHAVIOR_SPAN, before_ts, storage).last_end_before(before_ts)
+    if last_end is None:
+        last_end = storage.get_user_state()["last_record_ts"]
+    if own_storage:
+        storage.close()
+    return recovery_start_ts(last_end, before_ts) if last_end else last_end
+
+def gap_recovery_before(start_ts, storage=None):
+    """上一次行为结束到start_ts之间空档的恢复（记录行为时计分和写入精力变化共用）
+    
+    Returns:
+        字典：start（空档开始时刻，没有上次行为时为None）、energy（空档开始时的精力）、
+        amount（恢复量）、energy_after（start_ts时的精力，已应用精力上限）
+    """
+    own_storage = storage is None
+    storage = storage or StorageEngine()
+    energy = storage.get_user_state()["current_energy"]
+    last_end = last_behavior_end(start_ts, storage)
+    if own_storage:
+        storage.close()
+    
+    amount = 0.0
+    if last_end and start_ts > last_end:
+        amount = RECOVERY_INTEGRATOR.gap_recovery(last_end, start_ts)["total"]
+    return {
+        "start": last_end,
+        "energy": energy,
+        "amount": amount,
+        "energy_after": min(GLOBAL_CONFIG["energy_max"], energy + amount)
+    }
+
+def check_behavior_span(start_ts, end_ts, exclude_id=None, storage=None):
+    """检查行为区间：时长不超过一天，且不与已有行为重叠
+    
+    Returns:
+        错误信息，没有问题时返回None
+    """
+    if end_ts - start_ts > MAX_BEHAVIOR_SPAN:
+        return "单条行为不能超过24小时"
+    overlaps = find_overlapping_behaviors(start_ts, end_ts, exclude_id, storage)
+    if overlaps:
+        spans = ", ".join(
+            f"{datetime.fromtimestamp(start).strftime('%m-%d %H:%M')}-{datetime.fromtimestamp(end).strftime('%H:%M')}"
+            for start, end, _ in overlaps
+        )
+        return f"与已有行为重叠: {spans}"
+    return None
+
+def add_behavior_record(level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, name=None,
+                        lucky=None):
+    """向数据库添加行为记录，并追加recovery_applied、behavior_recorded状态事件
+    
+    成就与位图的初始化、记录插入、每日计数、恢复事件、幸运随机数流的检查点、behavior_recorded事件
+    （含成就计数器、成就解锁、连续天数位图）在同一事务中写入，任何一步失败时全部回滚
+    
+    Args:
+        lucky: calculate_lucky_coefficient的结果（final_score已乘以其系数），未抽取时为None；
+               系数随记录保存，重新计分时重新应用
+    
+    Returns:
+        是否添加成功
+    """
+    storage = StorageEngine()
+    
+    # 上一次行为结束到本次行为开始之间空档的恢复（与记录时计分使用的精力一致；在写入之前读取）
+    gap = gap_recovery_before(start_ts, storage)
+    energy = gap["energy_after"]
+    
+    new_energy = max(0, energy - energy_consume)
     
     # B级行为后恢复其消耗的30%
     if level == "B":
@@ -278,15 +476,114 @@ def add_behavior_record(level, duration, mood, start_ts, end_ts, base_score, dyn
     # 应用精力上限
     new_energy = min(new_energy, GLOBAL_CONFIG["energy_max"])
     
-    storage.update_user_state(
-        current_energy=new_energy,
-        today_total_score=user_state["today_total_score"] + final_score,
-        today_behavior_count=user_state["today_behavior_count"] + 1,
-        last_record_ts=end_ts
-    )
+    try:
+        storage.write_achievement_seed(ACHIEVEMENT_ENGINE, start_ts)
+        storage.write_streak_seed(DAILY_SCORE_TARGET)
+        record_id = storage.insert_record_row(
+            level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, name,
+            lucky["coefficient"] if lucky else 1.0
+        )
+        
+        # 更新每日计数（按行为开始时间归日）
+        storage.write_day_counter(day_counter_key(name, level), start_ts)
+        
+        if gap["amount"] > 0:
+            # 空档中的恢复曲线采样点与恢复事件一起写入精力时间序列
+            samples = energy_series.gap_samples(RECOVERY_INTEGRATOR, gap["energy"], gap["start"], start_ts)
+            storage.write_state_event(events.RECOVERY_APPLIED, {
+                "amount": gap["amount"],
+                "energy_after": energy
+            }, start_ts, samples)
+        
+        storage.write_behavior_event({
+            "record_id": record_id,
+            "name": name,
+            "level": level,
+            "duration": duration,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "final_score": final_score,
+            "energy_consume": energy_consume,
+            "energy_after": new_energy
+        }, end_ts, ACHIEVEMENT_ENGINE, DAILY_SCORE_TARGET)
+        
+        # 幸运随机数流前进到抽取之后（记录失败时一起回滚）
+        if lucky:
+            storage.write_state_event(events.STATE_SET, {"lucky_state": lucky["lucky_state"]}, end_ts)
+        storage.conn.commit()
+    except Exception as e:
+        storage.conn.rollback()
+        print(f"添加行为记录失败: {e}")
+        return False
+    finally:
+        storage.close()
     
-    storage.close()
-    return result
+    # 高效时段在后台增量学习，不占用记录行为的写入路径
+    schedule_efficient_periods_update()
+    return True
+
+def schedule_efficient_periods_update():
+    """在后台线程中增量学习高效时段
+    
+    已有任务排队未开始时不再重复提交：排队的任务会处理到届时为止的全部新记录
+    
+    Returns:
+        任务的Future
+    """
+    global _efficiency_pending
+    with _efficiency_lock:
+        if _efficiency_pending is None or _efficiency_pending.running() or _efficiency_pending.done():
+            _efficiency_pending = EFFICIENCY_EXECUTOR.submit(_learn_efficient_periods)
+        return _efficiency_pending
+
+def _learn_efficient_periods():
+    """后台学习任务（异常只打印，不影响记录行为）"""
+    try:
+        return update_efficient_periods()
+    except Exception as e:
+        print(f"高效时段学习失败: {e}")
+        return None
+
+def update_efficient_periods(storage=None, rebuild=False):
+    """从检查点之后的行为记录增量学习高效时段，写回user_state.efficient_periods
+    
+    检查点按记录id增量推进，无法感知已学习记录的修改：补录、修改、删除行为后修订号递增，
+    检查点的修订号不一致时从全部历史重新学习。
+    有新记录或重新学习时才保存统计检查点；高效时段发生变化时才更新user_state（追加state_set事件）
+    
+    Args:
+        storage: 存储引擎，为None时自行打开
+        rebuild: 是否丢弃已有统计，从全部历史重新学习
+    
+    Returns:
+        高效时段列表（"HH:MM-HH:MM"）
+    """
+    own_storage = storage is None
+    if own_storage:
+        storage = StorageEngine()
+    
+    # 先读修订号再读记录：学习期间发生的修订会使保存的检查点过期，下次学习时重建
+    revision = storage.get_config(EFFICIENCY_REVISION_KEY, 0)
+    state = None if rebuild else storage.get_config(EFFICIENCY_STATE_KEY)
+    if not state or state.get("revision") != revision:
+        state = None
+        rebuild = True
+    tracker = EfficiencyTracker.from_dict(state) if state else EfficiencyTracker()
+    
+    current_periods = storage.get_user_state()["efficient_periods"]
+    if tracker.consume(storage.iter_records_after(tracker.last_id)) or rebuild:
+        checkpoint = tracker.to_dict()
+        checkpoint["revision"] = revision
+        storage.set_config(EFFICIENCY_STATE_KEY, checkpoint)
+        efficient_periods = tracker.efficient_periods()
+        if efficient_periods != current_periods:
+            storage.update_user_state(efficient_periods=json.dumps(efficient_periods, ensure_ascii=False))
+    else:
+        efficient_periods = current_periods
+    
+    if own_storage:
+        storage.close()
+    return efficient_periods
 
 def get_today_date():
     """获取当前日期，格式：YYYY-MM-DD"""
@@ -299,189 +596,449 @@ def get_current_hour():
 
 def calculate_energy_coefficient(current_energy):
     """计算精力系数"""
-    if current_energy > 70:
-        return 1.0 + (current_energy - 70) * 0.01
-    elif current_energy > 40:
-        return 0.85 + (current_energy - 40) * 0.005
-    else:
-        return 0.7  # 低能量保护
+    return SCORING_CORE.energy_coefficient(current_energy)
 
 def calculate_time_period_coefficient():
-    """计算时段系数"""
-    current_hour = get_current_hour()
-    
-    # 检查各个时段
-    for period, config in TIME_PERIOD_CONFIG.items():
-        if period == "standard":
-            continue  # 标准时段最后处理
-        
-        for start, end in config["time_ranges"]:
-            if start <= current_hour < end:
-                return {
-                    "coefficient": config["coefficient"],
-                    "period_type": period,
-                    "description": config["description"]
-                }
-    
-    # 默认返回标准时段
-    return {
-        "coefficient": TIME_PERIOD_CONFIG["standard"]["coefficient"],
-        "period_type": "standard",
-        "description": TIME_PERIOD_CONFIG["standard"]["description"]
-    }
+    """计算当前时刻的时段系数（逐分钟系数表查表）"""
+    now = datetime.now()
+    return SCORING_CORE.time_periods.lookup(now.hour * 60 + now.minute)
+
+def calculate_time_period_coefficient_for_span(start_ts, end_ts):
+    """计算[start_ts, end_ts)的时段系数，跨时段时按时长加权平均"""
+    return SCORING_CORE.time_periods.average_between(start_ts, end_ts)
 
 def calculate_combo_coefficient(recent_behaviors, current_level):
     """计算连击系数"""
-    # 检查当前行为是否为正向行为（S/A/B）
-    is_positive = current_level in ["S", "A", "B"]
+    return SCORING_CORE.combo_result([b["level"] for b in recent_behaviors], current_level)
+
+def calculate_lucky_coefficient(behaviors_count):
+    """计算幸运系数
     
-    # 获取最近的正向行为
-    positive_recent = [b for b in recent_behaviors if b["level"] in ["S", "A", "B"]]
+    使用用户自己的确定性随机数流，从user_state中的检查点（种子、已用计数、连续未触发次数）抽取，
+    不写回检查点：抽取后的检查点随结果返回，由add_behavior_record与行为记录在同一事务内写入，
+    记录失败时流不前进，重放和模拟从同一检查点出发可以得到相同的结果
     
-    combo_count = len(positive_recent)
+    Args:
+        behaviors_count: 今日已记录行为数
     
-    # 计算连击系数
-    if combo_count == 0:
-        combo_coeff = 1.0
-    elif combo_count == 1:
-        combo_coeff = 1.1
-    elif combo_count == 2:
-        combo_coeff = 1.2
-    else:
-        combo_coeff = GLOBAL_CONFIG["max_combo_bonus"]  # 上限1.3
+    Returns:
+        coefficient、is_lucky、lucky_type、new_unlucky_count、lucky_state（抽取后的检查点）
+    """
+    storage = StorageEngine()
+    stream = LuckyStream.from_state(storage.get_user_state()["lucky_state"])
+    storage.close()
+    result = LUCKY_ENGINE.draw(stream, behaviors_count)
+    result["new_unlucky_count"] = stream.unlucky
+    result["lucky_state"] = stream.to_state()
+    return result
+
+def reset_daily_data_if_needed(user_data, now=None):
+    """如果不是当天的数据，重置当日数据
     
-    # 检查是否是中断后的第一个正面行为
-    is_negative_break = len(recent_behaviors) > 0 and recent_behaviors[-1]["level"] in ["C", "D"]
-    if is_positive and is_negative_break:
-        combo_coeff *= GLOBAL_CONFIG["rebound_bonus"]
+    以上次重置日期为准判断跨天（首次运行时以上次记录日期为准），
+    离开多天时每个夜晚都计算睡眠恢复，重置结果写回user_state
+    """
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
     
-    # 检查是否是同领域专精
-    # 简化处理：假设相同等级为同领域
-    is_same_field = len(positive_recent) > 0 and all(b["level"] == current_level for b in positive_recent)
-    if is_same_field and combo_count >= 1:
-        combo_coeff *= 1.15
+    storage = StorageEngine()
+    last_reset_date = storage.get_config(LAST_RESET_DATE_KEY)
+    if last_reset_date is None and user_data["last_record_time"]:
+        last_reset_date = datetime.fromisoformat(user_data["last_record_time"]).strftime("%Y-%m-%d")
     
-    return {
-        "coefficient": combo_coeff,
-        "combo_count": combo_count,
-        "is_same_field": is_same_field,
-        "is_negative_break": is_negative_break
-    }
+    # 当天已重置，或首次使用没有需要重置的数据
+    if last_reset_date == today or last_reset_date is None:
+        if last_reset_date is None:
+            storage.set_config(LAST_RESET_DATE_KEY, today)
+        storage.close()
+        return user_data
+    
+    # 为上次快照之后、今天之前的每个记录日写入状态快照
+    write_daily_snapshots(today, storage)
+    
+    # 保存上一个记录日的得分
+    if user_data["day_score"] != 0 or user_data["day_energy_cost"] != 0:
+        user_data["history_score"].append({
+            "date": last_reset_date,
+            "score": user_data["day_score"]
+        })
+        user_data["history_energy_cost"].append({
+            "date": last_reset_date,
+            "cost": user_data["day_energy_cost"]
+        })
+    
+    # 跨天恢复机制：经过的每个夜晚都有睡眠恢复（默认8小时×7点=56点）
+    previous_energy = user_data["day_energy"]
+    nights = RECOVERY_INTEGRATOR.nights_between(datetime.strptime(last_reset_date, "%Y-%m-%d"), now)
+    new_day_energy = previous_energy + nights * RECOVERY_INTEGRATOR.sleep_recovery
+    
+    # 若无睡眠数据，默认每晚+50点
+    # 注：此处简化处理，实际应基于授权数据或用户输入
+    if not user_data["last_record_time"]:
+        new_day_energy = previous_energy + nights * GLOBAL_CONFIG["cross_day_recovery_default"]
+    
+    # 应用精力上限
+    new_day_energy = min(GLOBAL_CONFIG["energy_max"], new_day_energy)
+    
+    # 重置当日数据
+    user_data["day_score"] = 0
+    user_data["day_energy"] = new_day_energy
+    user_data["day_energy_cost"] = 0
+    user_data["behavior_day_list"] = []
+    user_data["today_behaviors_count"] = 0
+    user_data["consecutive_unlucky_count"] = 0
+    user_data["combo_count"] = 0
+    user_data["recent_behaviors"] = []
+    user_data["lucky_triggers_today"] = 0
+    user_data["is_first_behavior_today"] = True
+    
+    # 幸运保底的连续未触发次数同样按天清零（种子和已用计数不变），与每日重置事件一起提交
+    lucky_state = storage.get_user_state()["lucky_state"]
+    if lucky_state:
+        stream = LuckyStream.from_state(lucky_state)
+        if stream.unlucky:
+            stream.unlucky = 0
+            storage.write_state_event(events.STATE_SET, {"lucky_state": stream.to_state()}, now.timestamp())
+    
+    storage.append_state_event(events.DAILY_RESET, {
+        "day_key": today,
+        "previous_day": last_reset_date,
+        "sleep_recovery": new_day_energy - previous_energy,
+        "energy_after": new_day_energy
+    }, now.timestamp())
+    storage.set_config(LAST_RESET_DATE_KEY, today)
+    storage.close()
+    return user_data
+
+def _replay_start(storage, day_key):
+    """day_key之前最近的快照状态，以及需要从哪个时间戳开始重放"""
+    snapshot = storage.get_latest_snapshot(day_key)
+    if snapshot is None:
+        return STATE_REPLAYER.initial_state(), 0
+    return STATE_REPLAYER.from_snapshot(snapshot), day_start_ts(next_day_key(snapshot["day_key"]))
 
-def calculate_lucky_coefficient(behaviors_count, consecutive_unlucky):
-    """计算幸运系数"""
-    import random
+def write_daily_snapshots(until_day_key, storage=None):
+    """为最近快照之后、until_day_key之前的每个有记录的日期写入每日状态快照
     
-    # 计算实际幸运率
-    actual_luck_rate = GLOBAL_CONFIG["base_luck_rate"] * (GLOBAL_CONFIG["fatigue_factor"] ** behaviors_count)
+    记录按开始时间归日；没有记录的日期不写快照：重放从之前最近的快照开始，
+    跨过的夜晚由StateReplayer.start_day按天数计算睡眠恢复，兑换记录按时间读取，结果相同
     
-    # 安慰幸运：连续3次未触发，下次必触发
-    if consecutive_unlucky >= 3:
-        is_lucky = True
-        consecutive_unlucky = 0
-    else:
-        is_lucky = random.random() < actual_luck_rate
-        
-    if is_lucky:
-        # 5%概率超级幸运
-        if random.random() < 0.05:
-            lucky_coeff = 2.0
-            lucky_type = "super"
-        else:
-            lucky_coeff = 1.5
-            lucky_type = "normal"
-        consecutive_unlucky = 0
-    else:
-        lucky_coeff = 1.0
-        lucky_type = "none"
-        consecutive_unlucky += 1
+    Returns:
+        写入的快照数
+    """
+    own_storage = storage is None
+    storage = storage or StorageEngine()
     
-    return {
-        "coefficient": lucky_coeff,
-        "is_lucky": is_lucky,
-        "lucky_type": lucky_type,
-        "new_unlucky_count": consecutive_unlucky
-    }
+    state, from_ts = _replay_start(storage, until_day_key)
+    until_ts = day_start_ts(until_day_key) - 1
+    snapshots = STATE_REPLAYER.daily_snapshots(
+        state,
+        storage.iter_records_between(from_ts, until_ts),
+        storage.get_redemptions_between(from_ts, until_ts)
+    )
+    for snapshot in snapshots:
+        storage.save_daily_snapshot(snapshot)
+    
+    if own_storage:
+        storage.close()
+    return len(snapshots)
 
-def reset_daily_data_if_needed(user_data):
-    """如果不是当天的数据，重置当日数据"""
-    today = get_today_date()
-    # 检查是否需要重置当日数据
-    if not user_data["history_score"] or user_data["history_score"][-1]["date"] != today:
-        # 保存昨天的得分
-        if user_data["day_score"] != 0 or user_data["day_energy_cost"] != 0:
-            user_data["history_score"].append({
-                "date": get_today_date(),
-                "score": user_data["day_score"]
-            })
-            user_data["history_energy_cost"].append({
-                "date": get_today_date(),
-                "cost": user_data["day_energy_cost"]
-            })
-        
-        # 跨天恢复机制
-        # 前日剩余精力
-        previous_energy = user_data["day_energy"]
-        
-        # 睡眠恢复：默认8小时×7点=56点
-        sleep_recovery = 56
+def get_state_at(moment=None):
+    """查询任意时刻的精力、连击、当日计数和积分余额
+    
+    从该时刻前最近的每日快照开始，只重放快照之后的事件（前一天有快照时只重放当天）
+    
+    Args:
+        moment: datetime或时间戳，默认为当前时间
+    
+    Returns:
+        状态字典：energy、combo_count、behavior_count、level_counts、day_score、total_score、balance等
+    """
+    moment = moment or datetime.now()
+    ts = moment.timestamp() if isinstance(moment, datetime) else moment
+    
+    storage = StorageEngine()
+    state, from_ts = _replay_start(storage, datetime.fromtimestamp(ts).strftime("%Y-%m-%d"))
+    state = STATE_REPLAYER.replay(
+        state,
+        storage.iter_records_between(from_ts, ts, ended_by=ts),
+        storage.get_redemptions_between(from_ts, ts)
+    )
+    storage.close()
+    return STATE_REPLAYER.state_at(state, ts)
+
+def get_streaks(today=None):
+    """各条件（有正向行为、当日得分达标、完成S级行为）的当前连续天数、最长连续天数和累计天数"""
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    storage = StorageEngine()
+    storage.seed_streak_bitmaps(DAILY_SCORE_TARGET)
+    bitmaps = storage.get_streak_bitmaps()
+    storage.close()
+    return streak_summary(bitmaps, today)
+
+def get_streak_calendar(year=None, condition=CONDITION_POSITIVE):
+    """某条件一年中每天是否满足（按日期顺序的布尔列表）"""
+    year = year or datetime.now().year
+    storage = StorageEngine()
+    storage.seed_streak_bitmaps(DAILY_SCORE_TARGET)
+    bitmap = storage.get_streak_bitmaps()[condition]
+    storage.close()
+    return bitmap.calendar(year)
+
+def _revision_start_state(storage, day_key):
+    """day_key开始前的状态：从最近的快照重放到前一天结束"""
+    state, from_ts = _replay_start(storage, day_key)
+    until_ts = day_start_ts(day_key) - 1
+    return STATE_REPLAYER.replay(
+        state,
+        storage.iter_records_between(from_ts, until_ts),
+        storage.get_redemptions_between(from_ts, until_ts)
+    )
+
+def _revise_from(storage, affected_days, pivot_ts, now=None):
+    """从pivot_ts所在位置开始重新计分（不提交，由调用方提交）
+    
+    受影响的日期只重新计算pivot_ts之后的记录；之后的日期只有在前一天结束时
+    影响计分的状态（精力、最后记录时间）发生变化时才重新计分，否则只平移快照中的累计得分
+    
+    Returns:
+        重新计分的日期列表
+    """
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    # 与记录时的ScoringEngine一致：叠加用户的高效时段，新手期按每天距第一条记录的天数判断
+    core = ScoringCore(LEVEL_CONFIG, GLOBAL_CONFIG, TIME_PERIOD_CONFIG)
+    core.set_efficient_periods(storage.get_user_state()["efficient_periods"])
+    first_day = storage.first_record_day()
+    
+    day_key = min(affected_days)
+    state = _revision_start_state(storage, day_key)
+    revised_days = []
+    # 分位数草图按月重建，所有日期重新计分后每个(等级, 月份)只重建一次
+    sketch_groups = set()
+    while day_key is not None:
+        records = storage.get_day_records(day_key)
+        from_index = next((i for i, record in enumerate(records) if record["start_ts"] >= pivot_ts), len(records))
+        day_state = copy.deepcopy(state)
+        STATE_REPLAYER.start_day(day_state, day_key)
+        rescorer = DayRescorer(core, STATE_REPLAYER,
+                               in_beginner_period(first_day, day_key, GLOBAL_CONFIG["beginner_period_days"]))
+        previous_day = datetime.fromtimestamp(day_start_ts(day_key) - 1).strftime("%Y-%m-%d")
+        changed, end_state = rescorer.rescore(
+            day_state, records, from_index,
+            storage.get_redemptions_between(day_start_ts(day_key), day_start_ts(next_day_key(day_key)) - 1),
+            {key: counter["last_ts"] for key, counter in storage.get_day_counters(previous_day).items()}
+        )
+        sketch_groups |= storage.update_record_scores(changed, rebuild_sketches=False)
         
-        # 计算新一天的初始精力
-        new_day_energy = previous_energy + sleep_recovery
+        # 当天的防滥用计数按重新排序后的记录重新统计
+        changed_by_id = {record["id"]: record for record in changed}
+        counts = {}
+        for record in records:
+            counter = counts.setdefault(day_counter_key(record["name"], record["level"]), {"count": 0, "last_ts": None})
+            counter["count"] += 1
+            counter["last_ts"] = record["start_ts"]
+        storage.rebuild_day_counters(day_key, counts)
+        storage.write_streak_day(day_key, day_conditions(
+            (record["level"] for record in records), end_state["day_score"], DAILY_SCORE_TARGET
+        ))
         
-        # 若无睡眠数据，默认+50点
-        # 注：此处简化处理，实际应基于授权数据或用户输入
-        if not user_data["last_record_time"]:
-            new_day_energy = previous_energy + GLOBAL_CONFIG["cross_day_recovery_default"]
+        # 过去的日期更新状态快照（今天的快照在明天的每日重置时写入）
+        old_snapshot = storage.get_daily_snapshot(day_key)
+        if day_key < today:
+            if records:
+                storage.write_daily_snapshot(STATE_REPLAYER.to_snapshot(end_state))
+            else:
+                storage.delete_daily_snapshot(day_key)
         
-        # 应用精力上限
-        new_day_energy = min(GLOBAL_CONFIG["energy_max"], new_day_energy)
+        scored = [changed_by_id.get(record["id"], record) for record in records]
+        storage.replace_energy_range(day_start_ts(day_key), day_start_ts(next_day_key(day_key)),
+                                     *_energy_day_points(day_state, scored))
+        summary = {
+            "total_score": end_state["day_score"],
+            "behavior_count": end_state["behavior_count"],
+            "energy_cost": sum(record["energy_consume"] or 0.0 for record in scored),
+            "level_counts": end_state["level_counts"],
+            "end_energy": end_state["energy"]
+        }
+        payload = {"day_key": day_key, "summary": summary, "changed_ids": sorted(changed_by_id)}
+        if day_key == today:
+            payload["user_state"] = _today_user_state(end_state)
+            payload["recent_levels"] = end_state["recent_levels"]
+        events.append_event(storage.conn, events.BEHAVIOR_REVISED, payload, now.timestamp())
+        revised_days.append(day_key)
         
-        # 重置当日数据
-        user_data["day_score"] = 0
-        user_data["day_energy"] = new_day_energy
-        user_data["day_energy_cost"] = 0
-        user_data["behavior_day_list"] = []
-        user_data["today_behaviors_count"] = 0
-        user_data["consecutive_unlucky_count"] = 0
-        user_data["combo_count"] = 0
-        user_data["recent_behaviors"] = []
-        user_data["lucky_triggers_today"] = 0
-        user_data["is_first_behavior_today"] = True
-    return user_data
+        next_day = storage.next_record_day(day_key)
+        unchanged = (old_snapshot is not None and day_key >= max(affected_days)
+                     and abs(old_snapshot["end_energy"] - end_state["energy"]) <= 1e-9
+                     and old_snapshot["last_record_ts"] == end_state["last_record_ts"])
+        if unchanged:
+            storage.shift_snapshots_after(day_key, end_state["total_score"] - old_snapshot["total_score"])
+            break
+        if next_day is None or next_day > today:
+            # 今天还没有记录：今天开始时的精力来自最后一个记录日
+            if day_key < today:
+                today_state = copy.deepcopy(end_state)
+                STATE_REPLAYER.start_day(today_state, today)
+                events.append_event(storage.conn, events.BEHAVIOR_REVISED, {
+                    "day_key": today,
+                    "user_state": _today_user_state(today_state),
+                    "recent_levels": []
+                }, now.timestamp())
+            break
+        state = end_state
+        day_key = next_day
+    storage.rebuild_sketches(sketch_groups)
+    # 成就计数器和已解锁的成就从受影响日期之前的检查点重放（昨天及之后还可能归入实时记录，不写检查点）
+    storage.write_achievement_replay(ACHIEVEMENT_ENGINE, min(affected_days),
+                                     (now - timedelta(days=1)).strftime("%Y-%m-%d"))
+    # 高效时段的统计检查点已包含修改前的得分，递增修订号使其失效（由调用方在提交后安排重新学习）
+    storage.write_config(EFFICIENCY_REVISION_KEY, storage.get_config(EFFICIENCY_REVISION_KEY, 0) + 1)
+    return revised_days
 
-def calculate_energy_recovery(last_record_time):
-    """计算精力恢复"""
-    if not last_record_time:
-        return 0
+def _energy_day_points(day_state, records):
+    """重新计分后一天的精力时间序列：当天开始、每条记录的开始和结束，以及记录之间空档的采样点
     
-    now = datetime.now()
-    last_time = datetime.fromisoformat(last_record_time)
-    time_diff = (now - last_time).total_seconds() / 60  # 转换为分钟
+    Returns:
+        (事件点列表, 采样点列表)，都在当天之内
+    """
+    state = copy.deepcopy(day_state)
+    day_start = day_start_ts(state["day_key"])
+    points = [(day_start, state["energy"])]
+    samples = []
+    for record in records:
+        last_ts = state["last_record_ts"]
+        energy = STATE_REPLAYER.begin_record(state, record)
+        if last_ts is not None and record["start_ts"] > last_ts:
+            samples.extend(energy_series.gap_samples(
+                STATE_REPLAYER.recovery, state["energy"], recovery_start_ts(last_ts, record["start_ts"]), record["start_ts"]
+            ))
+        points.append((record["start_ts"], energy))
+        STATE_REPLAYER.finish_record(state, record, energy)
+        points.append((record["end_ts"], state["energy"]))
+    return points, samples
+
+def _today_user_state(state):
+    """由重放状态得到user_state中的今日字段"""
+    return {
+        "current_energy": state["energy"],
+        "combo_count": state["combo_count"],
+        "today_total_score": state["day_score"],
+        "today_behavior_count": state["behavior_count"],
+        "last_record_ts": state["last_record_ts"]
+    }
+
+def _revise(action, apply_change, affected_days, pivot_ts):
+    """在一个事务内修改记录并重新计分"""
+    storage = StorageEngine()
+    try:
+        result = apply_change(storage)
+        if result:
+            _revise_from(storage, affected_days, pivot_ts)
+        storage.conn.commit()
+    except Exception as e:
+        storage.conn.rollback()
+        print(f"{action}失败: {e}")
+        return False
+    finally:
+        storage.close()
+    
+    if result:
+        schedule_efficient_periods_update()
+    return result
+
+def insert_behavior_at(name, level, duration, mood, start_time):
+    """补录过去某个时刻的行为，并重新计算之后受影响的记录
     
-    recovery = 0
+    Args:
+        name: 行为名称
+        level: 行为等级
+        duration: 时长（分钟）
+        mood: 心情（1-5）
+        start_time: 开始时间（datetime或时间戳）
     
-    # 间隔>30分钟才恢复
-    if time_diff > 30:
-        # 1. 基础被动恢复：每分钟恢复0.02点
-        recovery += time_diff * GLOBAL_CONFIG["passive_recovery_rate"]
-        
-        # 2. 无行为被动回复：间隔>1小时时，每小时恢复1-2点
-        if time_diff > 60:
-            # 转换为小时
-            hours_diff = time_diff / 60
-            
-            # 根据当前时间段调整恢复率
-            current_hour = now.hour
-            if 6 <= current_hour < 12 or 14 <= current_hour < 18:  # 早晨/下午
-                hourly_recovery = 2.0
-            elif 12 <= current_hour < 14 or 18 <= current_hour < 22:  # 中午/晚上
-                hourly_recovery = 1.5
-            else:  # 深夜/凌晨
-                hourly_recovery = 1.0
-            
-            # 计算无行为恢复
-            no_behavior_recovery = hours_diff * hourly_recovery
-            recovery += no_behavior_recovery
-    
-    return recovery
+    Returns:
+        新记录的id，失败时返回False
+    """
+    start_ts = int(start_time.timestamp() if isinstance(start_time, datetime) else start_time)
+    end_ts = start_ts + duration * 60
+    day_key = datetime.fromtimestamp(start_ts).strftime("%Y-%m-%d")
+    
+    error = check_behavior_span(start_ts, end_ts)
+    if error:
+        print(f"补录行为失败: {error}")
+        return False
+    
+    # 得分字段先写0，由重新计分填充
+    return _revise(
+        "补录行为",
+        lambda storage: storage.insert_record_row(level, duration, mood, start_ts, end_ts, 0, 0, 0, 0, name),
+        [day_key], start_ts
+    )
+
+def edit_behavior(record_id, **changes):
+    """修改已有行为（name、level、duration、mood、start_time），并重新计算之后受影响的记录
+    
+    Returns:
+        是否修改成功
+    """
+    storage = StorageEngine()
+    record = storage.get_record(record_id)
+    storage.close()
+    if record is None:
+        print(f"行为记录不存在: {record_id}")
+        return False
+    
+    unknown = set(changes) - {"name", "level", "duration", "mood", "start_time"}
+    if unknown:
+        print(f"不支持修改的字段: {', '.join(sorted(unknown))}")
+        return False
+    
+    start_time = changes.get("start_time", record["start_ts"])
+    start_ts = int(start_time.timestamp() if isinstance(start_time, datetime) else start_time)
+    duration = changes.get("duration", record["duration"])
+    # 旧版记录的开始、结束时间相同，未修改时间和时长时保持原样
+    if "start_time" in changes or "duration" in changes:
+        end_ts = start_ts + duration * 60
+    else:
+        end_ts = record["end_ts"]
+    
+    error = check_behavior_span(start_ts, end_ts, exclude_id=record_id)
+    if error:
+        print(f"修改行为失败: {error}")
+        return False
+    
+    days = {datetime.fromtimestamp(ts).strftime("%Y-%m-%d") for ts in (record["start_ts"], start_ts)}
+    return _revise(
+        "修改行为",
+        lambda storage: storage.update_record_row(
+            record_id, changes.get("level", record["level"]), changes.get("name", record["name"]),
+            duration, changes.get("mood", record["mood"]), start_ts, end_ts
+        ),
+        days, min(record["start_ts"], start_ts)
+    )
+
+def delete_behavior(record_id):
+    """删除行为，并重新计算之后受影响的记录
+    
+    Returns:
+        是否删除成功
+    """
+    storage = StorageEngine()
+    record = storage.get_record(record_id)
+    storage.close()
+    if record is None:
+        print(f"行为记录不存在: {record_id}")
+        return False
+    
+    day_key = datetime.fromtimestamp(record["start_ts"]).strftime("%Y-%m-%d")
+    return _revise("删除行为", lambda storage: storage.delete_record_row(record_id), [day_key], record["start_ts"])
+
+def calculate_energy_recovery(last_record_time, now=None):
+    """计算精力恢复（被动恢复 + 按经过时段积分的无行为恢复，夜间由睡眠恢复计入，见recovery_start_ts）"""
+    if not last_record_time:
+        return 0
+    
+    now = now or datetime.now()
+    start_ts = recovery_start_ts(to_datetime(last_record_time).timestamp(), now.timestamp())
+    return RECOVERY_INTEGRATOR.gap_recovery(start_ts, now)["total"]
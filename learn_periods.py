@@ -0,0 +1,20 @@
+import sys
+from data_manager import update_efficient_periods
+
+def learn_periods(rebuild=False):
+    """高效时段学习任务（可定时运行，只处理上次检查点之后的新记录）"""
+    print("=== 高效时段学习 ===")
+    efficient_periods = update_efficient_periods(rebuild=rebuild)
+    
+    if not efficient_periods:
+        print("历史记录不足，暂未学习到高效时段")
+        return
+    
+    print("高效时段:")
+    for period in efficient_periods:
+        print(f"- {period}")
+    print("========================")
+
+if __name__ == "__main__":
+    # --rebuild：丢弃已有统计，从全部历史重新学习
+    learn_periods(rebuild="--rebuild" in sys.argv[1:])
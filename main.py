@@ -2,6 +2,12 @@ from add_behavior import add_behavior
 from record_behavior import record_behavior
 from visualization_engine import VisualizationEngine
 from exchange_system import ExchangeSystem
+from plan_day import plan_day
+from storage_engine import StorageEngine, DB_FILE
+from src.visualization.html_report import write_html_report
+from src.visualization.timeline_browser import TimelineBrowser
+from datetime import datetime
+import argparse
 
 def main():
     """主程序入口"""
@@ -13,9 +19,10 @@ def main():
         print("2. 记录行为界面")
         print("3. 历史回顾系统")
         print("4. 积分兑换系统")
-        print("5. 退出系统")
+        print("5. 最优日程规划")
+        print("6. 退出系统")
         
-        choice = input("请输入选项编号（1-5）: ")
+        choice = input("请输入选项编号（1-6）: ")
         
         if choice == "1":
             print()
@@ -36,10 +43,45 @@ def main():
             exchange_system.run()
             exchange_system.close()
         elif choice == "5":
+            print()
+            plan_day()
+        elif choice == "6":
             print("\n=== 感谢使用 OneDay 时间管理系统！ ===")
             break
         else:
             print("无效的选项，请重新输入！")
 
+def export_html_report(path, years):
+    """导出最近years年的HTML历史报告"""
+    storage = StorageEngine()
+    try:
+        written = write_html_report(storage, path, years)
+        print(f"历史报告已写入 {path}（{written / 1024:.0f} KB）")
+    finally:
+        storage.close()
+
+def browse_timeline(start=None):
+    """交互浏览历史时间轴（start为YYYY-MM-DD，默认今天）"""
+    # 打开一次存储引擎，确保表和索引已建立
+    StorageEngine().close()
+    TimelineBrowser(DB_FILE).run(datetime.strptime(start, "%Y-%m-%d").date() if start else None)
+
+def parse_args(argv=None):
+    """解析命令行参数（没有子命令时进入交互菜单）"""
+    parser = argparse.ArgumentParser(description="OneDay 时间管理系统")
+    subparsers = parser.add_subparsers(dest="command")
+    report_parser = subparsers.add_parser("report", help="导出历史报告")
+    report_parser.add_argument("--html", required=True, metavar="PATH", help="HTML报告的输出路径")
+    report_parser.add_argument("--years", type=int, default=5, help="报告包含的年数（含今年，默认5）")
+    timeline_parser = subparsers.add_parser("timeline", help="按页浏览历史时间轴")
+    timeline_parser.add_argument("--from", dest="start", metavar="YYYY-MM-DD", help="开始日期（默认今天）")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.command == "report":
+        export_html_report(args.html, args.years)
+    elif args.command == "timeline":
+        browse_timeline(args.start)
+    else:
+        main()
@@ -0,0 +1,61 @@
+from data_manager import load_behaviors, load_user_data
+from src.scoring.planner import DayPlanner, format_minute
+
+# 默认可用时间段：08:00-24:00（16小时）
+DEFAULT_BLOCKS = "08:00-24:00"
+
+def parse_blocks(text):
+    """解析时间段输入，如 "09:00-12:00,14:00-18:00" """
+    blocks = []
+    for part in text.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, end = part.split("-")
+        blocks.append((start.strip(), end.strip()))
+    return blocks
+
+def plan_day():
+    """最优日程规划界面"""
+    print("=== 最优日程规划 ===")
+    
+    # 从行为定义中加载行为目录
+    behaviors = load_behaviors()
+    catalog = list(behaviors.values())
+    if not any(info["level"] in ["S", "A", "B", "R"] for info in catalog):
+        print("当前没有可规划的S/A/B/R级行为，请先添加行为！")
+        return
+    
+    user_data = load_user_data()
+    
+    # 用户输入：可用时间段
+    while True:
+        blocks_input = input(f"请输入可用时间段（如 09:00-12:00,14:00-18:00，默认{DEFAULT_BLOCKS}）: ").strip()
+        try:
+            blocks = parse_blocks(blocks_input or DEFAULT_BLOCKS)
+            planner = DayPlanner(catalog, {
+                "current_energy": user_data["day_energy"],
+                "beginner_period": user_data["beginner_period"]
+            })
+            result = planner.plan(blocks)
+            break
+        except ValueError:
+            print("无效的时间段，请重新输入！")
+    
+    if not result["schedule"]:
+        print("\n当前精力不足以安排任何行为，建议先休息恢复精力。")
+        return
+    
+    print(f"\n=== 推荐日程（当前精力: {user_data['day_energy']:.1f}） ===")
+    for item in result["schedule"]:
+        start_hour, start_minute = item["start"].split(":")
+        end = format_minute(int(start_hour) * 60 + int(start_minute) + item["duration"])
+        print(f"{item['start']}-{end} {item['level']}级 {item['name']} ({item['duration']}分钟)")
+    
+    print(f"\n预计得分: {result['total_score']:.2f}")
+    print(f"最低精力: {result['min_energy']:.1f}")
+    print(f"结束精力: {result['final_energy']:.1f}")
+    print("========================")
+
+if __name__ == "__main__":
+    plan_day()
@@ -1,6 +1,7 @@
 from data_manager import (
     load_behaviors, load_user_data, save_user_data,
-    reset_daily_data_if_needed, calculate_energy_recovery,
+    reset_daily_data_if_needed, gap_recovery_before, get_behavior_day_counter,
+    check_behavior_span, get_unlocked_achievements, get_streaks, calculate_lucky_coefficient,
     LEVEL_CONFIG, MOOD_CONFIG, GLOBAL_CONFIG
 )
 from scoring_engine import ScoringEngine
@@ -18,11 +19,6 @@ def record_behavior():
     # 重置当日数据（如果需要）
     user_data = reset_daily_data_if_needed(user_data)
     
-    # 计算精力恢复
-    if user_data["last_record_time"]:
-        recovery_energy = calculate_energy_recovery(user_data["last_record_time"])
-        user_data["day_energy"] = min(GLOBAL_CONFIG["energy_max"], user_data["day_energy"] + recovery_energy)
-    
     # 用户输入：行为等级
     while True:
         level = input("请输入行为等级（S/A/B/C/D/R）: ").upper()
@@ -73,6 +69,20 @@ def record_behavior():
         except ValueError:
             print("无效的输入，请输入数字！")
     
+    # 本次行为视为刚刚结束的duration分钟，检查是否与已有行为重叠
+    end_ts = int(datetime.now().timestamp())
+    start_ts = end_ts - duration * 60
+    span_error = check_behavior_span(start_ts, end_ts)
+    if span_error:
+        print(f"注意：{span_error}")
+        if input("仍要记录吗？(y/n): ").strip().lower() != "y":
+            print("已取消记录")
+            return
+    
+    # 行为开始时的精力：上一次行为结束到本次行为开始之间空档的恢复
+    # （与写入记录时add_behavior_record追加的恢复事件是同一计算）
+    user_data["day_energy"] = gap_recovery_before(start_ts)["energy_after"]
+    
     # 用户输入：心情（1-5星，默认3星）
     while True:
         mood_input = input("请输入心情（1-5星，默认3星）: ").strip()
@@ -123,32 +133,43 @@ def record_behavior():
     is_recovery = energy_cost_details["is_recovery"]
     
     # 计算得分
-    score_details = scoring_engine.calculate_score(behavior_info, level, duration, mood, current_energy)
+    score_details = scoring_engine.calculate_score(behavior_info, level, duration, mood, current_energy, start_ts, end_ts)
     
     # 应用防滥用与平衡机制
     
-    # 计算同一行为重复次数
-    same_behavior_count = sum(1 for b in user_data["behavior_day_list"] if b["name"] == selected_behavior)
+    # 同一行为当日次数和上次出现时间（每日计数表主键查询）
+    day_counter = get_behavior_day_counter(selected_behavior, level, start_ts)
+    same_behavior_count = day_counter["count"]
     
-    # 检查是否为短时长高频
+    # 检查是否为短时长高频（同一行为10分钟内重复）
     is_short_frequency = False
-    if user_data["last_record_time"]:
-        last_time = datetime.fromisoformat(user_data["last_record_time"])
-        current_time = datetime.now()
-        time_diff = (current_time - last_time).total_seconds() / 60
+    if day_counter["last_ts"] is not None:
+        time_diff = (start_ts - day_counter["last_ts"]) / 60
         if time_diff < 10:
             is_short_frequency = True
     
     # 应用平衡机制
     score_details = scoring_engine.apply_balance_mechanisms(score_details, same_behavior_count, is_short_frequency, level)
+    
+    # 幸运系数（启用时，得分为正的行为从用户的随机数流抽取一次）
+    lucky_result = None
+    if GLOBAL_CONFIG["enable_lucky_coeff"] and score_details["final_score"] > 0:
+        lucky_result = calculate_lucky_coefficient(user_data["today_behaviors_count"])
+        score_details["final_score"] *= lucky_result["coefficient"]
+        user_data["consecutive_unlucky_count"] = lucky_result["new_unlucky_count"]
+        if lucky_result["is_lucky"]:
+            user_data["lucky_triggers_today"] += 1
     final_score = score_details["final_score"]
     
     # 生成行为记录
     behavior_record = scoring_engine.generate_behavior_record(
-        selected_behavior, behavior_info, level, duration, mood, score_details, specific_time, feeling
+        selected_behavior, behavior_info, level, duration, mood, score_details, specific_time, feeling,
+        start_ts, end_ts
     )
     behavior_record["energy_cost"] = final_energy_cost
     behavior_record["is_recovery"] = is_recovery
+    # 抽取的幸运系数和随机数流检查点与记录在同一事务内写入
+    behavior_record["lucky"] = lucky_result
     
     # 更新用户数据
     user_data = scoring_engine.update_user_data(
@@ -185,9 +206,16 @@ def record_behavior():
     print(f"基础分: {score_details['base_score']:.2f} (等级基础分: {behavior_info['base_score_per_min']}/分钟)")
     print(f"动态系数: {score_details['dynamic_coefficient']:.2f}")
     print(f"  ├ 精力系数: {score_details['energy_coefficient']:.2f} (记录前精力: {current_energy:.1f})")
-    print(f"  └ 连击系数: {score_details['combo_coefficient']:.2f} (连击: {combo_result['combo_count']})")
+    if GLOBAL_CONFIG["enable_time_period_coeff"]:
+        print(f"  ├ 连击系数: {score_details['combo_coefficient']:.2f} (连击: {combo_result['combo_count']})")
+        print(f"  └ 时段系数: {score_details['time_period_coefficient']:.2f}")
+    else:
+        print(f"  └ 连击系数: {score_details['combo_coefficient']:.2f} (连击: {combo_result['combo_count']})")
     print(f"开始奖励: {score_details['start_bonus_score']:.2f}")
     print(f"新手奖励: {score_details['novice_bonus']:.2f}")
+    if lucky_result is not None and lucky_result["is_lucky"]:
+        lucky_name = "超级幸运" if lucky_result["lucky_type"] == "super" else "幸运"
+        print(f"{lucky_name}系数: {lucky_result['coefficient']:.1f}")
     print(f"最终得分: {final_score:.2f}")
     
     print(f"\n=== 精力变化 ===")
@@ -206,14 +234,13 @@ def record_behavior():
     print(f"当日得分: {user_data['day_score']:.2f}")
     print(f"总得分: {user_data['total_score']:.2f}")
     print(f"当日已记录行为: {user_data['today_behaviors_count']} 个")
+    positive_streak = get_streaks()["positive"]
+    print(f"连续正向天数: {positive_streak['current']} 天（最长 {positive_streak['longest']} 天）")
     
-    # 渐进惊喜系统
-    if final_score >= 200:
-        print("🎉 恭喜！触发'大师时刻'全屏庆祝！")
-    elif final_score >= 100:
-        print("✨ 恭喜！触发'高效时刻'特效！")
-    elif final_score >= 50:
-        print("🌟 恭喜！解锁小成就动画！")
+    # 渐进惊喜系统：本次行为解锁的成就（记录行为时已由成就引擎写入）
+    record_end_ts = int(datetime.strptime(behavior_record["end_time"], "%Y-%m-%d %H:%M:%S").timestamp())
+    for achievement in get_unlocked_achievements(record_end_ts):
+        print(achievement["message"])
     
     print("========================")
     
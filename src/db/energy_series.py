@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+精力时间序列
+
+energy_timeseries保存精力随时间变化的点：每条带精力的状态事件（行为结束、间隔恢复、
+每日重置、直接设置、重新计分）在追加事件的同一事务内写入一个事件点；
+记录行为时，上一次行为结束到本次开始之间的空档按SAMPLE_INTERVAL写入恢复曲线的采样点。
+补录、修改、删除行为后重新计分的日期整天重写；启用之前的数据库由事件日志补出事件点
+（见src/db/events.py的ensure_energy_series）。
+读取时一次按主键的区间查询，在SQL中按时间分段降采样（每段的平均精力），
+仪表盘的迷你折线图只取回几十行。
+StorageEngine和SQLiteDB共用同一个数据库文件，因此共用本模块
+"""
+
+import sqlite3
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# 点的类型
+KIND_EVENT = "event"    # 状态事件后的精力
+KIND_SAMPLE = "sample"  # 行为空档中恢复曲线的采样
+
+# 空档采样间隔（秒）
+SAMPLE_INTERVAL = 900
+
+# 一个空档最多写入的采样点数
+MAX_GAP_SAMPLES = 96
+
+Point = Tuple[int, float]
+
+
+def create_energy_table(cursor: sqlite3.Cursor) -> None:
+    """创建精力时间序列表（主键即时间索引）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS energy_timeseries (
+            ts INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            energy REAL NOT NULL,
+            PRIMARY KEY (ts, kind)
+        ) WITHOUT ROWID
+    ''')
+
+
+def add_points(conn: sqlite3.Connection, points: Iterable[Point], kind: str = KIND_EVENT) -> None:
+    """写入精力点（同一时刻同类型的点以后写入的为准；不提交）"""
+    conn.executemany('''
+        INSERT OR REPLACE INTO energy_timeseries (ts, kind, energy) VALUES (?, ?, ?)
+    ''', [(int(ts), kind, energy) for ts, energy in points])
+
+
+def gap_samples(recovery, energy: float, start_ts: float, end_ts: float,
+                interval: int = SAMPLE_INTERVAL) -> List[Point]:
+    """空档(start_ts, end_ts)内每interval秒一个的恢复曲线采样点
+
+    Args:
+        recovery: 精力恢复积分（RecoveryIntegrator）
+        energy: 空档开始时的精力
+        start_ts: 空档开始时间戳
+        end_ts: 空档结束时间戳
+        interval: 采样间隔（秒），采样点对齐到interval的整数倍
+
+    Returns:
+        [(时间戳, 精力)]，最多MAX_GAP_SAMPLES个（只取最靠近end_ts的部分）
+    """
+    first = (int(start_ts) // interval + 1) * interval
+    moments = range(max(first, int(end_ts) - MAX_GAP_SAMPLES * interval), int(end_ts), interval)
+    return [(ts, recovery.recover(energy, start_ts, ts)) for ts in moments if ts > start_ts]
+
+
+def replace_range(conn: sqlite3.Connection, start_ts: int, end_ts: int,
+                  points: Iterable[Point], samples: Iterable[Point] = ()) -> None:
+    """用新的事件点和采样点替换[start_ts, end_ts)内的全部点（重新计分用；不提交）"""
+    conn.execute('DELETE FROM energy_timeseries WHERE ts >= ? AND ts < ?', (start_ts, end_ts))
+    add_points(conn, points, KIND_EVENT)
+    add_points(conn, samples, KIND_SAMPLE)
+
+
+def downsample(conn: sqlite3.Connection, start_ts: int, end_ts: int, buckets: int,
+               until_ts: Optional[int] = None) -> List[Optional[float]]:
+    """把[start_ts, end_ts)等分为buckets段，每段的平均精力
+
+    一条语句：区间内按段分组求平均，另取区间开始前的最后一个点作为第一段之前的值；
+    没有点的段沿用前一段的值（两点之间精力连续变化），
+    区间开始前和第一个点之前都没有数据的段、以及开始于until_ts之后（尚未到来）的段为None
+
+    Args:
+        conn: 数据库连接
+        start_ts: 区间开始时间戳
+        end_ts: 区间结束时间戳（不含）
+        buckets: 段数
+        until_ts: 数据截止时间，默认为end_ts
+
+    Returns:
+        长度为buckets的列表
+    """
+    span = max(1, end_ts - start_ts)
+    rows = conn.execute('''
+        SELECT -1, energy FROM (
+            SELECT energy FROM energy_timeseries WHERE ts < ? ORDER BY ts DESC, kind LIMIT 1
+        )
+        UNION ALL
+        SELECT (ts - ?) * ? / ? AS bucket, AVG(energy) FROM energy_timeseries
+        WHERE ts >= ? AND ts < ? GROUP BY bucket
+        ORDER BY 1
+    ''', (start_ts, start_ts, buckets, span, start_ts, end_ts)).fetchall()
+
+    averages = {bucket: energy for bucket, energy in rows}
+    until_ts = end_ts if until_ts is None else until_ts
+    values: List[Optional[float]] = []
+    previous = averages.get(-1)
+    for bucket in range(buckets):
+        if start_ts + bucket * span // buckets >= until_ts:
+            values.append(None)
+            continue
+        previous = averages.get(bucket, previous)
+        values.append(previous)
+    return values
+
+
+def series_summary(values: Sequence[Optional[float]]) -> Optional[Tuple[float, float, float]]:
+    """(最低, 平均, 最高)，没有值时为None"""
+    present = [value for value in values if value is not None]
+    if not present:
+        return None
+    return min(present), sum(present) / len(present), max(present)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户状态事件日志
+
+user_state不再被直接改写：每次状态变化都追加一条state_event（只追加、不修改），
+投影把事件折叠为user_state（当前状态）、combo_state（连击状态）和daily_summary（每日汇总），
+带精力的事件同时写入精力时间序列（energy_timeseries）。
+追加事件与更新投影在同一个事务内完成；每SNAPSHOT_INTERVAL条事件保存一次投影快照，
+重建投影时从最近的快照开始折叠，不必重放全部事件。
+StorageEngine和SQLiteDB共用同一个数据库文件，因此共用本模块
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from src.db import energy_series
+
+# 事件类型
+BEHAVIOR_RECORDED = "behavior_recorded"  # 记录行为
+RECOVERY_APPLIED = "recovery_applied"    # 行为间隔的精力恢复
+DAILY_RESET = "daily_reset"              # 每日重置（含睡眠恢复）
+WISH_REDEEMED = "wish_redeemed"          # 兑换心愿
+STATE_SET = "state_set"                  # 直接设置字段（数据迁移、高效时段学习）
+BEHAVIOR_REVISED = "behavior_revised"    # 补录、修改或删除行为后某天重新计分的结果
+
+EVENT_TYPES = (BEHAVIOR_RECORDED, RECOVERY_APPLIED, DAILY_RESET, WISH_REDEEMED, STATE_SET, BEHAVIOR_REVISED)
+
+# user_state中可由事件设置的字段
+USER_STATE_FIELDS = (
+    "current_energy", "combo_count", "today_total_score",
+    "today_behavior_count", "last_record_ts", "efficient_periods", "lucky_state"
+)
+
+# 每多少条事件保存一次投影快照
+SNAPSHOT_INTERVAL = 100
+
+# 连击检测使用的最近行为数
+RECENT_WINDOW = 3
+
+# 计入连击的正向等级
+POSITIVE_LEVELS = ("S", "A", "B")
+
+
+def create_event_tables(cursor: sqlite3.Cursor) -> None:
+    """创建事件日志、投影和快照表"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS state_event (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            day_key TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            create_ts INTEGER DEFAULT (strftime('%s', 'now'))
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_state_event_day ON state_event(day_key, id)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS combo_state (
+            id INTEGER PRIMARY KEY DEFAULT 1,
+            recent_levels TEXT DEFAULT '[]',
+            last_event_id INTEGER DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            day_key TEXT PRIMARY KEY,
+            start_energy REAL,
+            end_energy REAL,
+            total_score REAL DEFAULT 0.0,
+            behavior_count INTEGER DEFAULT 0,
+            energy_cost REAL DEFAULT 0.0,
+            energy_recovered REAL DEFAULT 0.0,
+            redeemed_cost REAL DEFAULT 0.0,
+            level_counts TEXT DEFAULT '{}'
+        )
+    ''')
+
+    energy_series.create_energy_table(cursor)
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS state_snapshot (
+            event_id INTEGER PRIMARY KEY,
+            projection TEXT NOT NULL,
+            create_ts INTEGER DEFAULT (strftime('%s', 'now'))
+        )
+    ''')
+
+
+def ensure_user_state_columns(cursor: sqlite3.Cursor) -> None:
+    """旧数据库的user_state补充后来增加的列"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(user_state)').fetchall()]
+    if 'lucky_state' not in columns:
+        cursor.execute('ALTER TABLE user_state ADD COLUMN lucky_state TEXT')
+
+
+def ensure_baseline(conn: sqlite3.Connection) -> None:
+    """事件日志为空而user_state已有数据时（启用事件日志之前的数据库），
+    追加一条state_set事件记录现有状态作为基线，使重建投影不丢失状态（不提交）"""
+    if conn.execute('SELECT 1 FROM state_event LIMIT 1').fetchone():
+        return
+    row = conn.execute('''
+        SELECT current_energy, combo_count, today_total_score, today_behavior_count,
+               last_record_ts, efficient_periods, lucky_state
+        FROM user_state WHERE id = 1
+    ''').fetchone()
+    if row:
+        append_event(conn, STATE_SET, dict(zip(USER_STATE_FIELDS, tuple(row))))
+
+
+def ensure_energy_series(conn: sqlite3.Connection) -> bool:
+    """精力时间序列为空而已有事件时（启用时间序列之前的数据库），
+    由事件日志一次性补出事件点（不提交；历史空档没有采样点）
+
+    Returns:
+        是否进行了补录
+    """
+    if conn.execute('SELECT 1 FROM energy_timeseries LIMIT 1').fetchone():
+        return False
+    if not conn.execute('SELECT 1 FROM state_event LIMIT 1').fetchone():
+        return False
+    projection = initial_projection()
+    points = []
+    for event in iter_events(conn):
+        apply_event(projection, event["event_type"], event["payload"], event["ts"])
+        if carries_energy(event["event_type"], event["payload"]):
+            points.append((event["ts"], projection["user_state"]["current_energy"]))
+    energy_series.add_points(conn, points)
+    return True
+
+
+def _day_key(ts: float) -> str:
+    """时间戳所在的日期键，格式：YYYY-MM-DD"""
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+
+def event_day_key(event_type: str, payload: Dict[str, Any], ts: float) -> str:
+    """事件归属的日期：行为按开始时间归日，每日重置和重新计分按payload中的日期，其余按事件时间"""
+    if event_type == BEHAVIOR_RECORDED:
+        return _day_key(payload["start_ts"])
+    if event_type in (DAILY_RESET, BEHAVIOR_REVISED):
+        return payload["day_key"]
+    return _day_key(ts)
+
+
+def carries_energy(event_type: str, payload: Dict[str, Any]) -> bool:
+    """事件是否设置了精力（需要写入精力时间序列）"""
+    if event_type in (BEHAVIOR_RECORDED, RECOVERY_APPLIED, DAILY_RESET):
+        return True
+    if event_type == STATE_SET:
+        return "current_energy" in payload
+    if event_type == BEHAVIOR_REVISED:
+        return "current_energy" in payload.get("user_state", {})
+    return False
+
+
+# ----------------- 投影（纯函数） -----------------
+def initial_projection() -> Dict[str, Any]:
+    """没有任何事件时的投影（与user_state表的默认值一致）"""
+    return {
+        "user_state": {
+            "current_energy": 100.0,
+            "combo_count": 0,
+            "today_total_score": 0.0,
+            "today_behavior_count": 0,
+            "last_record_ts": None,
+            "efficient_periods": None,
+            "lucky_state": None
+        },
+        "recent_levels": [],
+        "last_event_id": 0
+    }
+
+
+def apply_event(projection: Dict[str, Any], event_type: str, payload: Dict[str, Any], ts: float) -> None:
+    """将一条事件折叠进user_state和连击状态（原地修改）
+
+    Args:
+        projection: initial_projection格式的投影
+        event_type: 事件类型
+        payload: 事件内容
+        ts: 事件时间戳
+    """
+    state = projection["user_state"]
+    if event_type == BEHAVIOR_RECORDED:
+        state["current_energy"] = payload["energy_after"]
+        state["today_total_score"] += payload["final_score"]
+        state["today_behavior_count"] += 1
+        state["last_record_ts"] = max(state["last_record_ts"] or 0, payload["end_ts"])
+        recent_levels = (projection["recent_levels"] + [payload["level"]])[-RECENT_WINDOW:]
+        projection["recent_levels"] = recent_levels
+        state["combo_count"] = sum(1 for level in recent_levels if level in POSITIVE_LEVELS)
+    elif event_type == RECOVERY_APPLIED:
+        state["current_energy"] = payload["energy_after"]
+    elif event_type == DAILY_RESET:
+        state["current_energy"] = payload["energy_after"]
+        state["today_total_score"] = 0.0
+        state["today_behavior_count"] = 0
+        state["combo_count"] = 0
+        projection["recent_levels"] = []
+    elif event_type == STATE_SET:
+        state.update(payload)
+    elif event_type == BEHAVIOR_REVISED and "user_state" in payload:
+        # 重新计分涉及今天时，payload带有今天的最新状态
+        state.update(payload["user_state"])
+        projection["recent_levels"] = list(payload["recent_levels"])
+    # WISH_REDEEMED只影响每日汇总
+
+
+def apply_summary(summary: Optional[Dict[str, Any]], event_type: str, payload: Dict[str, Any],
+                  day_key: str) -> Dict[str, Any]:
+    """将一条事件折叠进所属日期的每日汇总
+
+    Args:
+        summary: 该日期当前的汇总，None表示尚无汇总
+        event_type: 事件类型
+        payload: 事件内容
+        day_key: 事件归属的日期
+
+    Returns:
+        更新后的汇总
+    """
+    if summary is None:
+        summary = {
+            "day_key": day_key,
+            "start_energy": None,
+            "end_energy": None,
+            "total_score": 0.0,
+            "behavior_count": 0,
+            "energy_cost": 0.0,
+            "energy_recovered": 0.0,
+            "redeemed_cost": 0.0,
+            "level_counts": {}
+        }
+
+    if event_type == BEHAVIOR_RECORDED:
+        summary["total_score"] += payload["final_score"]
+        summary["behavior_count"] += 1
+        summary["energy_cost"] += payload["energy_consume"]
+        summary["level_counts"][payload["level"]] = summary["level_counts"].get(payload["level"], 0) + 1
+        summary["end_energy"] = payload["energy_after"]
+    elif event_type == RECOVERY_APPLIED:
+        summary["energy_recovered"] += payload["amount"]
+        summary["end_energy"] = payload["energy_after"]
+    elif event_type == DAILY_RESET:
+        summary["start_energy"] = payload["energy_after"]
+        summary["end_energy"] = payload["energy_after"]
+    elif event_type == WISH_REDEEMED:
+        summary["redeemed_cost"] += payload["cost"]
+    elif event_type == BEHAVIOR_REVISED and "summary" in payload:
+        summary.update(payload["summary"])
+    elif event_type == STATE_SET and "current_energy" in payload:
+        summary["end_energy"] = payload["current_energy"]
+    return summary
+
+
+# ----------------- 投影读写 -----------------
+def load_projection(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """读取当前投影（user_state和combo_state）"""
+    projection = initial_projection()
+    row = conn.execute('''
+        SELECT current_energy, combo_count, today_total_score, today_behavior_count,
+               last_record_ts, efficient_periods, lucky_state
+        FROM user_state WHERE id = 1
+    ''').fetchone()
+    if row:
+        projection["user_state"] = dict(zip(USER_STATE_FIELDS, tuple(row)))
+    row = conn.execute('SELECT recent_levels, last_event_id FROM combo_state WHERE id = 1').fetchone()
+    if row:
+        projection["recent_levels"] = json.loads(row[0] or "[]")
+        projection["last_event_id"] = row[1] or 0
+    return projection
+
+
+def save_projection(conn: sqlite3.Connection, projection: Dict[str, Any]) -> None:
+    """写回投影（固定列的UPSERT，不拼接列名）"""
+    state = projection["user_state"]
+    conn.execute('''
+        INSERT INTO user_state (id, current_energy, combo_count, today_total_score,
+                                today_behavior_count, last_record_ts, efficient_periods, lucky_state)
+        VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            current_energy = excluded.current_energy,
+            combo_count = excluded.combo_count,
+            today_total_score = excluded.today_total_score,
+            today_behavior_count = excluded.today_behavior_count,
+            last_record_ts = excluded.last_record_ts,
+            efficient_periods = excluded.efficient_periods,
+            lucky_state = excluded.lucky_state
+    ''', tuple(state[field] for field in USER_STATE_FIELDS))
+    conn.execute('''
+        INSERT INTO combo_state (id, recent_levels, last_event_id) VALUES (1, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            recent_levels = excluded.recent_levels,
+            last_event_id = excluded.last_event_id
+    ''', (json.dumps(projection["recent_levels"]), projection["last_event_id"]))
+
+
+def get_daily_summary(conn: sqlite3.Connection, day_key: str) -> Optional[Dict[str, Any]]:
+    """获取某天的每日汇总（主键查询）"""
+    row = conn.execute('''
+        SELECT day_key, start_energy, end_energy, total_score, behavior_count,
+               energy_cost, energy_recovered, redeemed_cost, level_counts
+        FROM daily_summary WHERE day_key = ?
+    ''', (day_key,)).fetchone()
+    if not row:
+        return None
+    return {
+        "day_key": row[0],
+        "start_energy": row[1],
+        "end_energy": row[2],
+        "total_score": row[3],
+        "behavior_count": row[4],
+        "energy_cost": row[5],
+        "energy_recovered": row[6],
+        "redeemed_cost": row[7],
+        "level_counts": json.loads(row[8] or "{}")
+    }
+
+
+def _save_daily_summary(conn: sqlite3.Connection, summary: Dict[str, Any]) -> None:
+    """写回每日汇总"""
+    conn.execute('''
+        INSERT OR REPLACE INTO daily_summary
+        (day_key, start_energy, end_energy, total_score, behavior_count,
+         energy_cost, energy_recovered, redeemed_cost, level_counts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (summary["day_key"], summary["start_energy"], summary["end_energy"], summary["total_score"],
+          summary["behavior_count"], summary["energy_cost"], summary["energy_recovered"],
+          summary["redeemed_cost"], json.dumps(summary["level_counts"], ensure_ascii=False)))
+
+
+# ----------------- 追加与重建 -----------------
+def append_event(conn: sqlite3.Connection, event_type: str, payload: Dict[str, Any],
+                 ts: Optional[float] = None) -> int:
+    """追加一条事件并更新投影（不提交，由调用方在同一事务内提交）
+
+    Args:
+        conn: 数据库连接
+        event_type: 事件类型（EVENT_TYPES之一）
+        payload: 事件内容（可JSON序列化）
+        ts: 事件时间戳，默认为当前时间
+
+    Returns:
+        事件id
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"未知的事件类型: {event_type}")
+    if event_type == STATE_SET:
+        unknown = set(payload) - set(USER_STATE_FIELDS)
+        if unknown:
+            raise ValueError(f"user_state没有字段: {', '.join(sorted(unknown))}")
+
+    ts = int(ts if ts is not None else datetime.now().timestamp())
+    day_key = event_day_key(event_type, payload, ts)
+    cursor = conn.execute('''
+        INSERT INTO state_event (event_type, ts, day_key, payload) VALUES (?, ?, ?, ?)
+    ''', (event_type, ts, day_key, json.dumps(payload, ensure_ascii=False)))
+    event_id = cursor.lastrowid
+
+    projection = load_projection(conn)
+    apply_event(projection, event_type, payload, ts)
+    projection["last_event_id"] = event_id
+    save_projection(conn, projection)
+    _save_daily_summary(conn, apply_summary(get_daily_summary(conn, day_key), event_type, payload, day_key))
+    if carries_energy(event_type, payload):
+        energy_series.add_points(conn, [(ts, projection["user_state"]["current_energy"])])
+
+    if event_id % SNAPSHOT_INTERVAL == 0:
+        save_snapshot(conn, projection)
+    return event_id
+
+
+def save_snapshot(conn: sqlite3.Connection, projection: Dict[str, Any]) -> None:
+    """保存投影快照（以最后折叠的事件id为键）"""
+    conn.execute('''
+        INSERT OR REPLACE INTO state_snapshot (event_id, projection) VALUES (?, ?)
+    ''', (projection["last_event_id"], json.dumps(projection, ensure_ascii=False)))
+
+
+def iter_events(conn: sqlite3.Connection, after_id: int = 0, day_key: Optional[str] = None):
+    """按id升序流式读取事件
+
+    Args:
+        conn: 数据库连接
+        after_id: 只读取id大于after_id的事件
+        day_key: 只读取归属该日期的事件
+
+    Yields:
+        事件字典：id、event_type、ts、day_key、payload
+    """
+    if day_key is None:
+        cursor = conn.execute('''
+            SELECT id, event_type, ts, day_key, payload FROM state_event WHERE id > ? ORDER BY id
+        ''', (after_id,))
+    else:
+        cursor = conn.execute('''
+            SELECT id, event_type, ts, day_key, payload FROM state_event
+            WHERE day_key = ? AND id > ? ORDER BY id
+        ''', (day_key, after_id))
+    for row in cursor:
+        yield {
+            "id": row[0],
+            "event_type": row[1],
+            "ts": row[2],
+            "day_key": row[3],
+            "payload": json.loads(row[4])
+        }
+
+
+def rebuild_projections(conn: sqlite3.Connection, day_key: Optional[str] = None) -> Dict[str, Any]:
+    """由事件日志重建投影（不提交）
+
+    user_state和连击状态从最近的快照开始折叠；
+    指定day_key时只重建该日的每日汇总，否则重建全部每日汇总
+
+    Args:
+        conn: 数据库连接
+        day_key: 只重建该日的每日汇总
+
+    Returns:
+        重建后的投影
+    """
+    row = conn.execute('SELECT projection FROM state_snapshot ORDER BY event_id DESC LIMIT 1').fetchone()
+    projection = json.loads(row[0]) if row else initial_projection()
+    for event in iter_events(conn, projection["last_event_id"]):
+        apply_event(projection, event["event_type"], event["payload"], event["ts"])
+        projection["last_event_id"] = event["id"]
+    save_projection(conn, projection)
+
+    summaries: Dict[str, Dict[str, Any]] = {}
+    if day_key is None:
+        conn.execute('DELETE FROM daily_summary')
+        events = iter_events(conn)
+    else:
+        conn.execute('DELETE FROM daily_summary WHERE day_key = ?', (day_key,))
+        events = iter_events(conn, day_key=day_key)
+    for event in events:
+        summaries[event["day_key"]] = apply_summary(
+            summaries.get(event["day_key"]), event["event_type"], event["payload"], event["day_key"])
+    for summary in summaries.values():
+        _save_daily_summary(conn, summary)
+    return projection
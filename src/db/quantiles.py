@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分位数草图
+
+每个(等级, 月份)为时长、得分、精力消耗各保存一个KLL分位数草图（BLOB），
+记录行为时增量更新；中位数、p90、p99等分位数把所需月份的草图合并后直接回答，
+不需要对历史记录排序。
+
+误差界：KLL草图的秩误差与数据量无关，只取决于k。k=200（默认）时，
+单个分位数的归一化秩误差约为1.65%（99%置信度），即返回值在真实数据中的排名
+与目标分位的差不超过约1.65%的记录数；草图合并后误差界不变。
+记录数不超过k时草图保存全部数据，结果精确。
+草图不支持删除：修改、删除记录后按该(等级, 月份)的记录重建对应草图
+"""
+
+import random
+import sqlite3
+import struct
+from datetime import datetime
+from math import ceil
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from src.db.rollup import cube_level, month_key
+
+# 草图参数k（越大越精确、越占空间）
+DEFAULT_K = 200
+
+# 相邻层容量的衰减系数
+CAPACITY_DECAY = 2 / 3
+
+# 保存草图的指标（core_behavior的列）
+METRICS = ("duration", "final_score", "energy_consume")
+
+# 常用分位点
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+# BLOB头：k、层数、记录数、最小值、最大值
+_HEADER = struct.Struct("<HHQdd")
+
+GroupKey = Tuple[str, str]
+
+
+class KLLSketch:
+    """KLL分位数草图
+
+    第h层的每个元素代表2^h个原始数据；某层满时排序后隔一个取一个（起点随机）
+    提升到上一层，层容量自顶向下按CAPACITY_DECAY递减
+    """
+
+    def __init__(self, k: int = DEFAULT_K):
+        """初始化草图
+
+        Args:
+            k: 精度参数
+        """
+        self.k = k
+        self.compactors: List[List[float]] = [[]]
+        self.n = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _capacity(self, height: int) -> int:
+        """第height层的容量"""
+        depth = len(self.compactors) - height - 1
+        return max(2, int(ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(height) for height in range(len(self.compactors)))
+
+    def _compress(self) -> None:
+        """压缩到总容量以内（随机数由数据量决定，同样的输入得到同样的草图）"""
+        rng = random.Random(self.n)
+        while self._size() >= self._max_size():
+            for height, compactor in enumerate(self.compactors):
+                if len(compactor) >= self._capacity(height):
+                    if height + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    compactor.sort()
+                    # 奇数个时留下最大的一个，其余隔一个取一个提升
+                    keep = compactor.pop() if len(compactor) % 2 else None
+                    self.compactors[height + 1].extend(compactor[rng.randint(0, 1)::2])
+                    self.compactors[height] = [keep] if keep is not None else []
+                    break
+
+    def update(self, value: float) -> None:
+        """加入一个数据"""
+        self.compactors[0].append(value)
+        self.n += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """合并另一个草图（就地修改，返回自身）"""
+        if not other.n:
+            return self
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantiles(self, fractions: Sequence[float]) -> List[Optional[float]]:
+        """多个分位点的近似值（0为最小值、1为最大值，草图为空时为None）"""
+        if not self.n:
+            return [None] * len(fractions)
+        weighted = sorted((value, 1 << height)
+                          for height, compactor in enumerate(self.compactors) for value in compactor)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target = fraction * total
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(self.max)
+        return results
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """单个分位点的近似值"""
+        return self.quantiles([fraction])[0]
+
+    def to_bytes(self) -> bytes:
+        """序列化为BLOB（小端字节序）"""
+        parts = [_HEADER.pack(self.k, len(self.compactors), self.n,
+                              self.min if self.min is not None else 0.0,
+                              self.max if self.max is not None else 0.0)]
+        for compactor in self.compactors:
+            parts.append(struct.pack(f"<I{len(compactor)}d", len(compactor), *compactor))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KLLSketch":
+        """由BLOB恢复"""
+        k, height_count, n, minimum, maximum = _HEADER.unpack_from(data)
+        sketch = cls(k)
+        sketch.n = n
+        sketch.min, sketch.max = (minimum, maximum) if n else (None, None)
+        sketch.compactors = []
+        offset = _HEADER.size
+        for _ in range(height_count):
+            (length,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            sketch.compactors.append(list(struct.unpack_from(f"<{length}d", data, offset)))
+            offset += 8 * length
+        return sketch
+
+
+def create_sketch_table(cursor: sqlite3.Cursor) -> None:
+    """创建分位数草图表"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quantile_sketch (
+            level TEXT NOT NULL,
+            month TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            sketch BLOB NOT NULL,
+            PRIMARY KEY (level, month, metric)
+        ) WITHOUT ROWID
+    ''')
+
+
+def record_group(record: Mapping[str, Any]) -> GroupKey:
+    """记录所属的(等级, 月份)（按开始时间归月）"""
+    return cube_level(record["level"]), month_key(datetime.fromtimestamp(record["start_ts"]))
+
+
+def _load(conn: sqlite3.Connection, group: GroupKey) -> Dict[str, KLLSketch]:
+    """读取一个(等级, 月份)的各指标草图（没有时为空草图）"""
+    rows = conn.execute('SELECT metric, sketch FROM quantile_sketch WHERE level = ? AND month = ?', group).fetchall()
+    sketches = {metric: KLLSketch() for metric in METRICS}
+    for metric, data in rows:
+        sketches[metric] = KLLSketch.from_bytes(data)
+    return sketches
+
+
+def _save(conn: sqlite3.Connection, group: GroupKey, sketches: Mapping[str, KLLSketch]) -> None:
+    conn.executemany('''
+        INSERT OR REPLACE INTO quantile_sketch (level, month, metric, sketch) VALUES (?, ?, ?, ?)
+    ''', [group + (metric, sketch.to_bytes()) for metric, sketch in sketches.items()])
+
+
+def add_records(conn: sqlite3.Connection, records: Iterable[Mapping[str, Any]]) -> None:
+    """新记录计入所属(等级, 月份)的草图（不提交）"""
+    groups: Dict[GroupKey, Dict[str, KLLSketch]] = {}
+    for record in records:
+        group = record_group(record)
+        if group not in groups:
+            groups[group] = _load(conn, group)
+        for metric in METRICS:
+            groups[group][metric].update(record[metric] or 0.0)
+    for group, sketches in groups.items():
+        _save(conn, group, sketches)
+
+
+def _month_range(month: str) -> Tuple[int, int]:
+    """月份的[开始, 结束)时间戳"""
+    start = datetime.strptime(month, "%Y-%m")
+    return int(start.timestamp()), int(datetime.strptime(month_key(start, 1), "%Y-%m").timestamp())
+
+
+def rebuild_groups(conn: sqlite3.Connection, groups: Iterable[GroupKey]) -> None:
+    """按记录重建指定(等级, 月份)的草图（修改、删除记录后调用；不提交）"""
+    months: Dict[str, Set[str]] = {}
+    for level, month in groups:
+        months.setdefault(month, set()).add(level)
+    for month, levels in months.items():
+        start_ts, end_ts = _month_range(month)
+        sketches = {level: {metric: KLLSketch() for metric in METRICS} for level in levels}
+        rows = conn.execute('''
+            SELECT level, duration, final_score, energy_consume FROM core_behavior
+            WHERE start_ts >= ? AND start_ts < ? ORDER BY id
+        ''', (start_ts, end_ts))
+        for row in rows:
+            level = cube_level(row[0])
+            if level in sketches:
+                for metric, value in zip(METRICS, row[1:]):
+                    sketches[level][metric].update(value or 0.0)
+        for level, level_sketches in sketches.items():
+            if level_sketches[METRICS[0]].n:
+                _save(conn, (level, month), level_sketches)
+            else:
+                conn.execute('DELETE FROM quantile_sketch WHERE level = ? AND month = ?', (level, month))
+
+
+def rebuild_sketches(conn: sqlite3.Connection) -> None:
+    """按全部记录重建草图（不提交）"""
+    conn.execute('DELETE FROM quantile_sketch')
+    groups = {}
+    for row in conn.execute('SELECT level, start_ts, duration, final_score, energy_consume FROM core_behavior ORDER BY id'):
+        record = dict(zip(("level", "start_ts") + METRICS, row))
+        sketches = groups.setdefault(record_group(record), {metric: KLLSketch() for metric in METRICS})
+        for metric in METRICS:
+            sketches[metric].update(record[metric] or 0.0)
+    for group, sketches in groups.items():
+        _save(conn, group, sketches)
+
+
+def ensure_sketches(conn: sqlite3.Connection) -> bool:
+    """草图表为空而已有行为记录时（启用草图之前的数据库）一次性建立（不提交）
+
+    Returns:
+        是否进行了重建
+    """
+    if conn.execute('SELECT 1 FROM quantile_sketch LIMIT 1').fetchone():
+        return False
+    if not conn.execute('SELECT 1 FROM core_behavior LIMIT 1').fetchone():
+        return False
+    rebuild_sketches(conn)
+    return True
+
+
+def percentiles(conn: sqlite3.Connection, metric: str = "duration",
+                fractions: Sequence[float] = DEFAULT_QUANTILES,
+                levels: Optional[Sequence[str]] = None,
+                month_from: Optional[str] = None, month_to: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """按等级合并[month_from, month_to]内的草图并计算分位数
+
+    Args:
+        conn: 数据库连接
+        metric: 指标（duration、final_score、energy_consume）
+        fractions: 分位点
+        levels: 等级，默认全部
+        month_from: 开始月份（YYYY-MM），默认不限
+        month_to: 结束月份（含），默认不限
+
+    Returns:
+        {等级: {"count": 记录数, "quantiles": {分位点: 近似值}}}
+    """
+    if metric not in METRICS:
+        raise ValueError(f"未知指标: {metric}")
+    conditions, params = ["metric = ?"], [metric]
+    if levels:
+        conditions.append(f"level IN ({', '.join('?' * len(levels))})")
+        params.extend(levels)
+    if month_from:
+        conditions.append("month >= ?")
+        params.append(month_from)
+    if month_to:
+        conditions.append("month <= ?")
+        params.append(month_to)
+
+    merged: Dict[str, KLLSketch] = {}
+    for level, data in conn.execute(
+            f"SELECT level, sketch FROM quantile_sketch WHERE {' AND '.join(conditions)} ORDER BY level, month",
+            params):
+        merged.setdefault(level, KLLSketch()).merge(KLLSketch.from_bytes(data))
+    return {
+        level: {"count": sketch.n, "quantiles": dict(zip(fractions, sketch.quantiles(fractions)))}
+        for level, sketch in merged.items()
+    }
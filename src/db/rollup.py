@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行为汇总立方体
+
+按(月份, 星期, 小时, 等级)四个维度预先汇总行为的分钟数、得分、精力消耗和次数。
+行为按本地时间在整点处切分，各小时按时长比例分得分钟数、得分和精力（次数计入开始的小时）。
+另有按(日期, 等级, 行为名称)的每日汇总（按开始时间归日），供任意日期区间的报告使用。
+记录的增、改、删在同一事务内对立方体做增量更新（先减去旧记录的单元，再加上新记录的单元），
+周趋势、最佳时段、月度对比等统计只读取几百个单元，不再扫描全部历史记录。
+StorageEngine和SQLiteDB共用同一个数据库文件，因此共用本模块
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# 立方体维度（也是slice的可分组、可过滤字段）
+DIMENSIONS = ("month", "weekday", "hour", "level")
+
+# 立方体度量
+MEASURES = ("minutes", "score", "energy", "count")
+
+# 旧版存储引擎以整数保存等级
+LEVEL_NAMES = {5: "S", 4: "A", 3: "B", 2: "C", 1: "D", 0: "R"}
+
+WEEKDAY_NAMES = ("一", "二", "三", "四", "五", "六", "日")
+
+CellKey = Tuple[str, int, int, str]
+DayKey = Tuple[str, str, str]
+
+
+def create_rollup_table(cursor: sqlite3.Cursor) -> None:
+    """创建汇总立方体表"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_cube (
+            month TEXT NOT NULL,
+            weekday INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            level TEXT NOT NULL,
+            minutes REAL DEFAULT 0,
+            score REAL DEFAULT 0,
+            energy REAL DEFAULT 0,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (month, weekday, hour, level)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_day (
+            day_key TEXT NOT NULL,
+            level TEXT NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            minutes REAL DEFAULT 0,
+            score REAL DEFAULT 0,
+            energy REAL DEFAULT 0,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (day_key, level, name)
+        ) WITHOUT ROWID
+    ''')
+
+
+def cube_level(level: Any) -> str:
+    """立方体中的等级（兼容整数等级，R级子级并入R）"""
+    if isinstance(level, int):
+        return LEVEL_NAMES.get(level, "B")
+    level = str(level).upper()
+    return "R" if level.startswith("R") else level
+
+
+def record_cells(record: Mapping[str, Any]) -> Dict[CellKey, List[float]]:
+    """行为记录落在立方体中的单元
+
+    Args:
+        record: 行为记录（level、duration、start_ts、end_ts、final_score、energy_consume）
+
+    Returns:
+        {(月份, 星期, 小时, 等级): [分钟数, 得分, 精力, 次数]}
+    """
+    level = cube_level(record["level"])
+    start_ts = record["start_ts"]
+    end_ts = record["end_ts"] or start_ts
+    total = max(0, end_ts - start_ts)
+    duration = record["duration"] or 0
+    score = record["final_score"] or 0.0
+    energy = record["energy_consume"] or 0.0
+
+    cells = {}
+    moment = start_ts
+    while True:
+        local = datetime.fromtimestamp(moment)
+        key = (local.strftime("%Y-%m"), local.weekday(), local.hour, level)
+        boundary = (local.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        piece_end = min(end_ts, boundary)
+        share = (piece_end - moment) / total if total else 1.0
+        cell = cells.setdefault(key, [0.0, 0.0, 0.0, 0])
+        cell[0] += duration * share
+        cell[1] += score * share
+        cell[2] += energy * share
+        if moment == start_ts:
+            cell[3] += 1
+        if piece_end >= end_ts:
+            break
+        moment = piece_end
+    return cells
+
+
+def record_day_key(record: Mapping[str, Any]) -> DayKey:
+    """记录在每日汇总中的键（日期, 等级, 行为名称）"""
+    day_key = datetime.fromtimestamp(record["start_ts"]).strftime("%Y-%m-%d")
+    return day_key, cube_level(record["level"]), record.get("name") or ""
+
+
+def apply_records(conn: sqlite3.Connection, records: Iterable[Mapping[str, Any]], sign: int = 1) -> None:
+    """把记录的单元加到立方体和每日汇总（sign=-1时减去，用于修改和删除；不提交）"""
+    deltas = {}
+    day_deltas = {}
+    for record in records:
+        for key, values in record_cells(record).items():
+            delta = deltas.setdefault(key, [0.0, 0.0, 0.0, 0])
+            for index, value in enumerate(values):
+                delta[index] += sign * value
+        delta = day_deltas.setdefault(record_day_key(record), [0.0, 0.0, 0.0, 0])
+        delta[0] += sign * (record["duration"] or 0)
+        delta[1] += sign * (record["final_score"] or 0.0)
+        delta[2] += sign * (record["energy_consume"] or 0.0)
+        delta[3] += sign
+    if not deltas:
+        return
+    conn.executemany('''
+        INSERT INTO rollup_day (day_key, level, name, minutes, score, energy, count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(day_key, level, name) DO UPDATE SET
+            minutes = minutes + excluded.minutes,
+            score = score + excluded.score,
+            energy = energy + excluded.energy,
+            count = count + excluded.count
+    ''', [key + tuple(delta) for key, delta in day_deltas.items()])
+    conn.executemany('''
+        INSERT INTO rollup_cube (month, weekday, hour, level, minutes, score, energy, count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(month, weekday, hour, level) DO UPDATE SET
+            minutes = minutes + excluded.minutes,
+            score = score + excluded.score,
+            energy = energy + excluded.energy,
+            count = count + excluded.count
+    ''', [key + tuple(delta) for key, delta in deltas.items()])
+
+
+def _iter_behavior_rows(conn: sqlite3.Connection):
+    """逐行读取全部行为记录（立方体重建用；SQLiteDB建立的表没有name列）"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(core_behavior)').fetchall()]
+    name = "name" if "name" in columns else "NULL"
+    cursor = conn.execute(f'''
+        SELECT level, {name}, duration, start_ts, end_ts, final_score, energy_consume FROM core_behavior
+    ''')
+    for row in cursor:
+        yield dict(zip(("level", "name", "duration", "start_ts", "end_ts", "final_score", "energy_consume"), row))
+
+
+def rebuild_rollup(conn: sqlite3.Connection) -> None:
+    """按全部行为记录重建立方体和每日汇总（不提交）"""
+    conn.execute('DELETE FROM rollup_cube')
+    conn.execute('DELETE FROM rollup_day')
+    apply_records(conn, _iter_behavior_rows(conn))
+
+
+def ensure_rollup(conn: sqlite3.Connection) -> bool:
+    """立方体或每日汇总为空而已有行为记录时（启用汇总之前的数据库）一次性重建（不提交）
+
+    Returns:
+        是否进行了重建
+    """
+    if (conn.execute('SELECT 1 FROM rollup_cube LIMIT 1').fetchone()
+            and conn.execute('SELECT 1 FROM rollup_day LIMIT 1').fetchone()):
+        return False
+    if not conn.execute('SELECT 1 FROM core_behavior LIMIT 1').fetchone():
+        return False
+    rebuild_rollup(conn)
+    return True
+
+
+def month_key(moment: datetime, offset: int = 0) -> str:
+    """moment所在月份（offset个月之后）的月份键，格式：YYYY-MM"""
+    index = moment.year * 12 + moment.month - 1 + offset
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class RollupCube:
+    """汇总立方体查询类（切片、切块、上卷）"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        """初始化查询
+
+        Args:
+            conn: 数据库连接
+        """
+        self.conn = conn
+
+    def slice(self, by: Sequence[str] = (), **filters: Any) -> List[Dict[str, Any]]:
+        """按维度过滤并分组汇总
+
+        Args:
+            by: 分组维度，为空时汇总为一行
+            **filters: 维度过滤，值为单个值或列表（月份可用month_from、month_to限定范围）
+
+        Returns:
+            每组一行：分组维度和minutes、score、energy、count
+
+        Examples:
+            cube.slice(by=("hour",), level="S")                 # S级按小时
+            cube.slice(by=("month", "level"), month_from="2025-01")
+        """
+        for dimension in by:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"未知维度: {dimension}")
+
+        conditions, params = [], []
+        for name, value in filters.items():
+            if name == "month_from":
+                conditions.append("month >= ?")
+                params.append(value)
+            elif name == "month_to":
+                conditions.append("month <= ?")
+                params.append(value)
+            elif name not in DIMENSIONS:
+                raise ValueError(f"未知维度: {name}")
+            elif isinstance(value, (list, tuple, set)):
+                values = list(value)
+                conditions.append(f"{name} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+
+        columns = ", ".join(by)
+        query = f'''
+            SELECT {columns + ", " if by else ""}SUM(minutes), SUM(score), SUM(energy), SUM(count)
+            FROM rollup_cube
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            {"GROUP BY " + columns + " ORDER BY " + columns if by else ""}
+        '''
+        rows = []
+        for row in self.conn.execute(query, params).fetchall():
+            item = dict(zip(by, row[:len(by)]))
+            item.update(zip(MEASURES, (value or 0 for value in row[len(by):])))
+            rows.append(item)
+        return rows
+
+    def best_hours(self, level: str = "S", top: int = 3, **filters: Any) -> List[Dict[str, Any]]:
+        """某等级每小时的投入，按分钟数从多到少取前top个小时"""
+        rows = self.slice(by=("hour",), level=level, **filters)
+        rows.sort(key=lambda item: item["minutes"], reverse=True)
+        return [item for item in rows[:top] if item["minutes"] > 0]
+
+    def weekday_trend(self, months: int = 3, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """最近months个月（含本月）按星期汇总，每个星期一行（缺少的星期补0）"""
+        now = now or datetime.now()
+        rows = {item["weekday"]: item for item in self.slice(by=("weekday",), month_from=month_key(now, 1 - months))}
+        return [rows.get(weekday, {"weekday": weekday, "minutes": 0, "score": 0, "energy": 0, "count": 0})
+                for weekday in range(7)]
+
+    def month_over_month(self, now: Optional[datetime] = None, **filters: Any) -> Dict[str, Dict[str, Any]]:
+        """本月与上月的汇总对比
+
+        Returns:
+            {"current": 本月汇总, "previous": 上月汇总}，各含month和各度量
+        """
+        now = now or datetime.now()
+        months = (month_key(now), month_key(now, -1))
+        rows = {item["month"]: item for item in self.slice(by=("month",), month=list(months), **filters)}
+        empty = {"minutes": 0, "score": 0, "energy": 0, "count": 0}
+        return {
+            "current": rows.get(months[0], dict(empty, month=months[0])),
+            "previous": rows.get(months[1], dict(empty, month=months[1]))
+        }
@@ -11,6 +11,7 @@ import sqlite3
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 from datetime import datetime
+from src.db import events, rollup, quantiles
 
 # 数据库文件路径
 DB_PATH = "time_manage.db"
@@ -88,9 +89,11 @@ class SQLiteDB:
                     today_total_score REAL DEFAULT 0,
                     today_behavior_count INTEGER DEFAULT 0,
                     last_record_ts INTEGER,
-                    efficient_periods TEXT
+                    efficient_periods TEXT,
+                    lucky_state TEXT
                 )
             ''')
+            events.ensure_user_state_columns(cursor)
             
             # 3. 配置表
             cursor.execute('''
@@ -138,6 +141,17 @@ class SQLiteDB:
                 )
             ''')
             
+            # 状态事件日志及其投影（含精力时间序列）和快照
+            events.create_event_tables(cursor)
+            events.ensure_energy_series(conn)
+            events.ensure_baseline(conn)
+            
+            # 行为汇总立方体（月份×星期×小时×等级）和分位数草图
+            rollup.create_rollup_table(cursor)
+            rollup.ensure_rollup(conn)
+            quantiles.create_sketch_table(cursor)
+            quantiles.ensure_sketches(conn)
+            
             # 创建索引
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_behavior_ts ON core_behavior(start_ts)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_behavior_level ON core_behavior(level)')
@@ -146,7 +160,7 @@ class SQLiteDB:
     
     # ----------------- 行为记录相关 -----------------
     def add_behavior(self, behavior_data: Dict[str, Any]) -> int:
-        """添加行为记录
+        """添加行为记录（同一事务内计入汇总立方体和分位数草图）
         
         对应iOS的CoreDataManager.addBehavior()
         
@@ -174,6 +188,8 @@ class SQLiteDB:
                 behavior_data["final_score"],
                 behavior_data["energy_consume"]
             ))
+            rollup.apply_records(conn, [behavior_data])
+            quantiles.add_records(conn, [behavior_data])
             return cursor.lastrowid
     
     def get_today_records(self) -> List[Dict[str, Any]]:
@@ -235,6 +251,24 @@ class SQLiteDB:
             result = cursor.fetchone()[0]
             return result or 0.0
     
+    def get_daily_scores(self, start_ts: int, end_ts: int) -> Dict[str, float]:
+        """获取每天的总得分（按开始时间归日，一次分组查询）
+        
+        Args:
+            start_ts: 开始时间戳
+            end_ts: 结束时间戳
+            
+        Returns:
+            {日期键: 当日得分}，没有记录的日期不出现
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT date(start_ts, 'unixepoch', 'localtime') AS day_key, SUM(final_score)
+                FROM core_behavior WHERE start_ts BETWEEN ? AND ? GROUP BY day_key
+            ''', (start_ts, end_ts))
+            return {row[0]: row[1] or 0.0 for row in cursor.fetchall()}
+    
     # ----------------- 用户状态相关 -----------------
     def get_user_state(self) -> Dict[str, Any]:
         """获取用户状态
@@ -262,6 +296,7 @@ class SQLiteDB:
         """更新用户状态
         
         对应iOS的CoreDataManager.updateUserState()
+        追加state_set事件，由投影写回user_state（见src/db/events.py）
         
         Args:
             kwargs: 要更新的字段和值
@@ -273,16 +308,11 @@ class SQLiteDB:
             return True
         
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 构建更新语句
-            set_clause = ', '.join([f"{key} = ?" for key in kwargs.keys()])
-            values = list(kwargs.values())
-            
             try:
-                cursor.execute(f"UPDATE user_state SET {set_clause} WHERE id = 1", values)
-                return cursor.rowcount > 0
+                events.append_event(conn, events.STATE_SET, kwargs)
+                return True
             except Exception as e:
+                conn.rollback()
                 print(f"更新用户状态失败: {e}")
                 return False
     
@@ -385,10 +415,18 @@ class SQLiteDB:
         """
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            redeemed_at = int(datetime.now().timestamp())
             cursor.execute('''
                 UPDATE wishes SET status = 'redeemed', redeemed_at = ? WHERE id = ? AND user_id = ?
-            ''', (int(datetime.now().timestamp()), wish_id, user_id))
-            return cursor.rowcount > 0
+            ''', (redeemed_at, wish_id, user_id))
+            if cursor.rowcount == 0:
+                return False
+            
+            # 同一事务内追加兑换事件
+            cursor.execute('SELECT cost FROM wishes WHERE id = ?', (wish_id,))
+            cost = cursor.fetchone()[0]
+            events.append_event(conn, events.WISH_REDEEMED, {"wish_id": wish_id, "cost": cost}, redeemed_at)
+            return True
     
     def update_wish_progress(self, wish_id: int, progress: float, user_id: int = 1) -> bool:
         """更新心愿进度
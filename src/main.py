@@ -8,21 +8,34 @@ TimeScore 主程序入口
 整合所有模块，处理用户输入和调用各个模块的功能
 """
 
+import argparse
 from src.db.sqlite import SQLiteDB
-from src.visualization.dashboard import Dashboard
+from src.visualization.dashboard import Dashboard, WATCH_INTERVAL
 from src.redeem.exchange import ExchangeSystem
 
 
-def main():
+def main(argv=None):
     """主程序入口
     
     对应iOS的AppDelegate.application(_:didFinishLaunchingWithOptions:)
+    
+    Args:
+        argv: 命令行参数，默认为sys.argv[1:]
     """
-    print("=== Welcome to TimeScore 时间管理系统 ===")
+    parser = argparse.ArgumentParser(description="TimeScore 时间管理系统")
+    parser.add_argument("--watch", action="store_true", help="监视模式：数据变化时自动刷新仪表盘")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="监视模式的轮询间隔（秒）")
+    args = parser.parse_args(argv)
     
     # 初始化数据库连接
     db = SQLiteDB()
     
+    if args.watch:
+        Dashboard(db).watch(args.interval)
+        return
+    
+    print("=== Welcome to TimeScore 时间管理系统 ===")
+    
     try:
         while True:
             # 显示主菜单
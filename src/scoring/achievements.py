@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+成就引擎
+
+成就规则是声明式的：每条规则指定类型、阈值和提示语，编译时按依赖的计数器分组并按阈值排序。
+每记录一个行为只更新它涉及的计数器（累计得分、连续天数、连击长度、各等级累计分钟数），
+再检查依赖这些计数器的规则，耗时只与涉及的规则数有关，从不重新扫描历史
+"""
+
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, Iterable, List, Optional, Sequence, Set
+
+# 计入连击和连续天数的正向等级
+POSITIVE_LEVELS = frozenset(("S", "A", "B"))
+
+# 规则类型
+SINGLE_SCORE = "single_score"    # 单次行为得分达到阈值
+TOTAL_SCORE = "total_score"      # 累计得分达到阈值
+STREAK_DAYS = "streak_days"      # 连续N天有正向行为
+COMBO = "combo"                  # 当天连续正向行为数达到阈值
+LEVEL_MINUTES = "level_minutes"  # 某等级累计分钟数达到阈值
+
+# 默认成就规则
+# group相同的规则互斥：同一次行为只解锁其中阈值最高的一条（原渐进惊喜的逐级提示）
+# repeatable为True的规则每次达到都累加次数
+ACHIEVEMENT_RULES = (
+    {"id": "moment_small", "type": SINGLE_SCORE, "threshold": 50, "group": "moment", "repeatable": True,
+     "name": "小成就", "message": "🌟 恭喜！解锁小成就动画！"},
+    {"id": "moment_efficient", "type": SINGLE_SCORE, "threshold": 100, "group": "moment", "repeatable": True,
+     "name": "高效时刻", "message": "✨ 恭喜！触发'高效时刻'特效！"},
+    {"id": "moment_master", "type": SINGLE_SCORE, "threshold": 200, "group": "moment", "repeatable": True,
+     "name": "大师时刻", "message": "🎉 恭喜！触发'大师时刻'全屏庆祝！"},
+    {"id": "total_1000", "type": TOTAL_SCORE, "threshold": 1000,
+     "name": "千分起步", "message": "🏅 累计得分突破1000！"},
+    {"id": "total_5000", "type": TOTAL_SCORE, "threshold": 5000,
+     "name": "五千里程碑", "message": "🏅 累计得分突破5000！"},
+    {"id": "total_10000", "type": TOTAL_SCORE, "threshold": 10000,
+     "name": "万分达人", "message": "🏆 累计得分突破10000！"},
+    {"id": "streak_3", "type": STREAK_DAYS, "threshold": 3,
+     "name": "三日坚持", "message": "🔥 连续3天有正向行为！"},
+    {"id": "streak_7", "type": STREAK_DAYS, "threshold": 7,
+     "name": "一周坚持", "message": "🔥 连续7天有正向行为！"},
+    {"id": "streak_30", "type": STREAK_DAYS, "threshold": 30,
+     "name": "月度坚持", "message": "🔥 连续30天有正向行为！"},
+    {"id": "combo_3", "type": COMBO, "threshold": 3,
+     "name": "三连击", "message": "⚡ 当天连续3个正向行为！"},
+    {"id": "combo_5", "type": COMBO, "threshold": 5,
+     "name": "五连击", "message": "⚡ 当天连续5个正向行为！"},
+    {"id": "s_minutes_600", "type": LEVEL_MINUTES, "level": "S", "threshold": 600,
+     "name": "深度十小时", "message": "💎 S级行为累计10小时！"},
+    {"id": "a_minutes_3000", "type": LEVEL_MINUTES, "level": "A", "threshold": 3000,
+     "name": "专注五十小时", "message": "💎 A级行为累计50小时！"},
+)
+
+
+def rule_counter_key(rule: Dict[str, Any]) -> str:
+    """规则依赖的计数器"""
+    if rule["type"] == LEVEL_MINUTES:
+        return f"minutes:{rule['level']}"
+    return rule["type"]
+
+
+def _day_key(ts: float) -> str:
+    """时间戳所在的日期键，格式：YYYY-MM-DD"""
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+
+def _previous_day_key(day_key: str) -> str:
+    """前一天的日期键"""
+    return (datetime.strptime(day_key, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+class AchievementEngine:
+    """成就引擎类
+
+    计数器为{计数器键: {"value": 数值, "day_key": 最后更新的日期}}，由调用方读取和保存
+    """
+
+    def __init__(self, rules: Sequence[Dict[str, Any]] = ACHIEVEMENT_RULES):
+        """编译成就规则
+
+        Args:
+            rules: 成就规则列表
+        """
+        self.rules = {rule["id"]: rule for rule in rules}
+        self.rules_by_counter: Dict[str, List[Dict[str, Any]]] = {}
+        for rule in rules:
+            self.rules_by_counter.setdefault(rule_counter_key(rule), []).append(rule)
+        for counter_rules in self.rules_by_counter.values():
+            counter_rules.sort(key=lambda rule: rule["threshold"])
+
+    def counter_keys(self, record: Dict[str, Any]) -> List[str]:
+        """一条行为涉及的计数器（只包含有规则依赖的计数器）
+
+        Args:
+            record: 行为，包含level、final_score、duration
+        """
+        keys = [TOTAL_SCORE, STREAK_DAYS, COMBO, f"minutes:{record['level']}"]
+        return [key for key in keys if key in self.rules_by_counter]
+
+    def update_counters(self, counters: Dict[str, Dict[str, Any]], record: Dict[str, Any], ts: float) -> None:
+        """按一条行为更新计数器（原地修改，缺少的计数器从0开始）
+
+        Args:
+            counters: counter_keys涉及的计数器
+            record: 行为，包含level、final_score、duration
+            ts: 行为时间戳（按开始时间归日）
+        """
+        day_key = _day_key(ts)
+        is_positive = record["level"] in POSITIVE_LEVELS
+        for key in self.counter_keys(record):
+            counter = counters.setdefault(key, {"value": 0, "day_key": None})
+            if key == TOTAL_SCORE:
+                counter["value"] += record["final_score"] or 0.0
+            elif key == STREAK_DAYS:
+                if is_positive and counter["day_key"] != day_key:
+                    if counter["day_key"] == _previous_day_key(day_key):
+                        counter["value"] += 1
+                    else:
+                        counter["value"] = 1
+                    counter["day_key"] = day_key
+            elif key == COMBO:
+                if counter["day_key"] != day_key:
+                    counter["value"] = 0
+                counter["value"] = counter["value"] + 1 if is_positive else 0
+            else:
+                counter["value"] += record["duration"] or 0
+            if key != STREAK_DAYS:
+                counter["day_key"] = day_key
+
+    def candidate_rules(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """一条行为可能解锁的规则（涉及的计数器上的规则和单次得分规则）"""
+        rules = list(self.rules_by_counter.get(SINGLE_SCORE, []))
+        for key in self.counter_keys(record):
+            rules.extend(self.rules_by_counter[key])
+        return rules
+
+    def evaluate(self, counters: Dict[str, Dict[str, Any]], record: Dict[str, Any],
+                 unlocked: Set[str]) -> List[Dict[str, Any]]:
+        """检查一条行为解锁的成就
+
+        Args:
+            counters: 更新后的计数器
+            record: 行为，包含level、final_score、duration
+            unlocked: 候选规则中已经解锁过的规则id
+
+        Returns:
+            本次解锁的规则列表
+        """
+        result = []
+        best_in_group: Dict[str, Dict[str, Any]] = {}
+        for rule in self.candidate_rules(record):
+            if rule["id"] in unlocked and not rule.get("repeatable"):
+                continue
+            if rule["type"] == SINGLE_SCORE:
+                value = record["final_score"] or 0.0
+            else:
+                value = counters[rule_counter_key(rule)]["value"]
+            if value < rule["threshold"]:
+                continue
+            group = rule.get("group")
+            if group is None:
+                result.append(rule)
+            elif group not in best_in_group or rule["threshold"] > best_in_group[group]["threshold"]:
+                best_in_group[group] = rule
+        return result + list(best_in_group.values())
+
+    def replay(self, records: Iterable[Dict[str, Any]],
+               counters: Optional[Dict[str, Dict[str, Any]]] = None,
+               unlocks: Optional[Dict[str, Dict[str, Any]]] = None,
+               on_day_end: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """按时间顺序重放历史行为（一次性初始化计数器和已达成的成就）
+
+        Args:
+            records: 按开始时间升序的行为记录
+            counters: 起始计数器
+            unlocks: 起始的已解锁成就（从检查点继续重放时）
+            on_day_end: 每个有记录的日期重放结束时调用，参数为日期和当时的{"counters", "unlocks"}
+
+        Returns:
+            counters（最终计数器）、unlocks（规则id: {"count": 次数, "unlock_ts": 最后一次解锁时间}）
+        """
+        counters = counters if counters is not None else {}
+        unlocks = unlocks if unlocks is not None else {}
+        result = {"counters": counters, "unlocks": unlocks}
+        day_key = None
+        for record in records:
+            record_day = _day_key(record["start_ts"])
+            if on_day_end is not None and day_key is not None and record_day != day_key:
+                on_day_end(day_key, result)
+            day_key = record_day
+            self.update_counters(counters, record, record["start_ts"])
+            for rule in self.evaluate(counters, record, set(unlocks)):
+                unlock = unlocks.setdefault(rule["id"], {"count": 0, "unlock_ts": None})
+                unlock["count"] += 1
+                unlock["unlock_ts"] = record["end_ts"]
+        if on_day_end is not None and day_key is not None:
+            on_day_end(day_key, result)
+        return result
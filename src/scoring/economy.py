@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+积分经济蒙特卡洛模拟
+
+生成大量合成用户，按可配置的行为分布逐日生成行为，
+经真实的得分/精力规则（DaySimulator）推演N天，统计得分、精力和心愿兑换率的分布，
+用于调整DEFAULT_CONFIG中的平衡参数（max_combo_bonus、rebound_bonus、novice_bonus等）
+
+每个用户使用独立的随机数流（由全局种子和用户编号派生），
+因此结果只取决于种子，与进程数和分块方式无关
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from src.scoring.lucky import LuckyEngine, LuckyStream, DEFAULT_LUCKY_PARAMS, seed_from_text
+from src.scoring.recovery import SLEEP_RECOVERY
+from src.scoring.simulator import DaySimulator, MINUTES_PER_DAY
+from src.utils.config import get_config
+
+# 默认行为等级分布（权重）
+DEFAULT_BEHAVIOR_DISTRIBUTION = {"S": 0.15, "A": 0.25, "B": 0.2, "C": 0.15, "D": 0.05, "R": 0.2}
+
+# 默认心愿成本候选
+DEFAULT_WISH_COSTS = (300, 500, 1000, 2000, 5000)
+
+# 每天第一个行为的开始时间范围（分钟）
+DAY_START_RANGE = (7 * 60, 10 * 60)
+
+
+class EconomySimulator:
+    """积分经济蒙特卡洛模拟类"""
+
+    def __init__(self,
+                 users: int = 1000,
+                 days: int = 30,
+                 seed: int = 0,
+                 behavior_distribution: Optional[Dict[str, float]] = None,
+                 behaviors_per_day: Tuple[int, int] = (3, 10),
+                 duration_range: Tuple[int, int] = (10, 90),
+                 gap_range: Tuple[int, int] = (0, 60),
+                 wish_costs: Sequence[int] = DEFAULT_WISH_COSTS,
+                 config_overrides: Optional[Dict[str, Any]] = None,
+                 workers: Optional[int] = None):
+        """初始化模拟器
+
+        Args:
+            users: 合成用户数量
+            days: 模拟天数
+            seed: 全局随机种子
+            behavior_distribution: 行为等级权重
+            behaviors_per_day: 每天行为数量范围（含两端）
+            duration_range: 单个行为时长范围（分钟，含两端）
+            gap_range: 行为之间的间隔范围（分钟，含两端）
+            wish_costs: 心愿成本候选，每个用户按顺序随机抽取心愿
+            config_overrides: 覆盖global_config中的参数（含幸运系数参数）
+            workers: 进程数，None为CPU核数，0或1为在当前进程中运行
+        """
+        global_config = dict(DEFAULT_LUCKY_PARAMS)
+        global_config.update(get_config("global_config"))
+        global_config.update(config_overrides or {})
+
+        self.users = users
+        self.workers = os.cpu_count() if workers is None else workers
+        self.params = {
+            "days": days,
+            "seed": seed,
+            "distribution": dict(behavior_distribution or DEFAULT_BEHAVIOR_DISTRIBUTION),
+            "behaviors_per_day": tuple(behaviors_per_day),
+            "duration_range": tuple(duration_range),
+            "gap_range": tuple(gap_range),
+            "wish_costs": tuple(wish_costs),
+            "global_config": global_config
+        }
+
+    def run(self) -> Dict[str, Any]:
+        """运行模拟并汇总分布
+
+        Returns:
+            汇总字典：daily_score、end_energy、total_score、redemptions的分布统计，
+            以及redemption_rate（至少兑换一个心愿的用户比例）
+        """
+        if self.workers and self.workers > 1 and self.users > 1:
+            chunk_size = max(1, self.users // (self.workers * 4))
+            chunks = [range(start, min(start + chunk_size, self.users))
+                      for start in range(0, self.users, chunk_size)]
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                parts = executor.map(_simulate_users, [self.params] * len(chunks), chunks)
+                results = [result for part in parts for result in part]
+        else:
+            results = _simulate_users(self.params, range(self.users))
+
+        daily_scores = [score for result in results for score in result["daily_scores"]]
+        end_energies = [energy for result in results for energy in result["end_energies"]]
+        return {
+            "users": self.users,
+            "days": self.params["days"],
+            "seed": self.params["seed"],
+            "daily_score": summarize(daily_scores),
+            "end_energy": summarize(end_energies),
+            "total_score": summarize([result["total_score"] for result in results]),
+            "redemptions": summarize([result["redemptions"] for result in results]),
+            "redemption_rate": sum(1 for result in results if result["redemptions"] > 0) / max(1, len(results)),
+            "zero_energy_rate": sum(result["zero_energy_behaviors"] for result in results)
+                                / max(1, sum(result["behaviors"] for result in results))
+        }
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """计算分布统计
+
+    Args:
+        values: 样本值
+
+    Returns:
+        mean、min、p10、p50、p90、max
+    """
+    if not values:
+        return {"mean": 0.0, "min": 0.0, "p10": 0.0, "p50": 0.0, "p90": 0.0, "max": 0.0}
+    if len(values) == 1:
+        deciles = [values[0]] * 9
+    else:
+        deciles = statistics.quantiles(values, n=10, method="inclusive")
+    return {
+        "mean": statistics.fmean(values),
+        "min": min(values),
+        "p10": deciles[0],
+        "p50": deciles[4],
+        "p90": deciles[8],
+        "max": max(values)
+    }
+
+
+def _simulate_users(params: Dict[str, Any], user_indices: Sequence[int]) -> List[Dict[str, Any]]:
+    """模拟一组用户（进程池任务，须为模块级函数以便序列化）
+
+    Args:
+        params: 模拟参数
+        user_indices: 用户编号
+
+    Returns:
+        每个用户的模拟结果
+    """
+    return [_simulate_user(params, index) for index in user_indices]
+
+
+def _simulate_user(params: Dict[str, Any], user_index: int) -> Dict[str, Any]:
+    """模拟单个合成用户的N天
+
+    Args:
+        params: 模拟参数
+        user_index: 用户编号
+
+    Returns:
+        用户模拟结果
+    """
+    rng = random.Random(f"{params['seed']}:{user_index}")
+    global_config = params["global_config"]
+    levels = list(params["distribution"].keys())
+    weights = list(params["distribution"].values())
+
+    energy = 100.0
+    balance = 0.0
+    total_score = 0.0
+    redemptions = 0
+    behaviors = 0
+    zero_energy_behaviors = 0
+    lucky_engine = LuckyEngine(global_config)
+    lucky_stream = LuckyStream(seed_from_text(f"{params['seed']}:{user_index}:lucky"))
+    next_wish = rng.choice(params["wish_costs"])
+    daily_scores = []
+    end_energies = []
+
+    for day in range(params["days"]):
+        plan = _generate_plan(rng, params, levels, weights)
+        simulator = DaySimulator({
+            "current_energy": energy,
+            "beginner_period": day < global_config["beginner_period_days"]
+        }, global_config=global_config)
+        result = simulator.simulate_day(plan, with_curve=False)
+
+        # 得分为正的行为按当日序号批量抽取幸运系数
+        coefficients = {}
+        if global_config["enable_lucky_coeff"]:
+            lucky_indices = [index for index, behavior in enumerate(result["behaviors"])
+                             if behavior["final_score"] > 0]
+            draws = lucky_engine.draw_batch(lucky_stream, lucky_indices)
+            coefficients = {index: draw["coefficient"] for index, draw in zip(lucky_indices, draws)}
+
+        day_score = 0.0
+        for index, behavior in enumerate(result["behaviors"]):
+            day_score += behavior["final_score"] * coefficients.get(index, 1.0)
+            zero_energy_behaviors += behavior["is_energy_zero"]
+        behaviors += len(result["behaviors"])
+
+        # 兑换：余额足够时按顺序兑换心愿
+        balance += day_score
+        while balance >= next_wish:
+            balance -= next_wish
+            redemptions += 1
+            next_wish = rng.choice(params["wish_costs"])
+
+        total_score += day_score
+        daily_scores.append(day_score)
+        end_energies.append(result["final_energy"])
+
+        # 跨天睡眠恢复
+        energy = min(global_config["energy_max"], result["final_energy"] + SLEEP_RECOVERY)
+
+    return {
+        "daily_scores": daily_scores,
+        "end_energies": end_energies,
+        "total_score": total_score,
+        "redemptions": redemptions,
+        "behaviors": behaviors,
+        "zero_energy_behaviors": zero_energy_behaviors
+    }
+
+
+def _generate_plan(rng: random.Random, params: Dict[str, Any], levels: List[str],
+                   weights: List[float]) -> List[Dict[str, Any]]:
+    """按行为分布生成一天的行为计划
+
+    Args:
+        rng: 用户随机数流
+        params: 模拟参数
+        levels: 等级列表
+        weights: 等级权重
+
+    Returns:
+        行为计划列表
+    """
+    count = rng.randint(*params["behaviors_per_day"])
+    minute = rng.randint(*DAY_START_RANGE)
+    plan = []
+    for level in rng.choices(levels, weights=weights, k=count):
+        duration = rng.randint(*params["duration_range"])
+        if minute + duration > MINUTES_PER_DAY:
+            break
+        plan.append({"level": level, "start": minute, "duration": duration, "mood": rng.randint(1, 5)})
+        minute += duration + rng.randint(*params["gap_range"])
+    return plan
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令行入口：python -m src.scoring.economy --users 1000 --days 30 --set max_combo_bonus=1.4"""
+    parser = argparse.ArgumentParser(description="积分经济蒙特卡洛模拟")
+    parser.add_argument("--users", type=int, default=1000, help="合成用户数量")
+    parser.add_argument("--days", type=int, default=30, help="模拟天数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--workers", type=int, default=None, help="进程数")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖global_config参数，可重复")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key.strip()] = json.loads(value)
+
+    simulator = EconomySimulator(users=args.users, days=args.days, seed=args.seed,
+                                 config_overrides=overrides, workers=args.workers)
+    print(json.dumps(simulator.run(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高效时段学习
+
+按当天分钟数累计历史行为的得分率（每分钟得分）和精力效率（每点精力得分），
+统计量按时间指数衰减（半衰期可配置），越近的记录权重越大。
+每条新记录只更新它覆盖的分钟和包含这些分钟的滑动窗口，不重新扫描历史；
+得分率高于全天平均、且最高的若干个不重叠窗口即为高效时段（user_state.efficient_periods）
+"""
+
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+
+# 一天的分钟数
+MINUTES_PER_DAY = 1440
+
+# 默认半衰期（天）：14天前的记录权重减半
+DEFAULT_HALF_LIFE_DAYS = 14
+
+# 默认高效时段窗口长度（分钟）
+DEFAULT_WINDOW_MINUTES = 60
+
+# 默认保留的高效时段数量
+DEFAULT_TOP_WINDOWS = 3
+
+# 窗口入选所需的最少有效记录分钟数（按衰减后的权重计）
+MIN_WINDOW_MINUTES = 30
+
+# 窗口入选所需的最少记录数（与窗口重叠的记录，按衰减后的权重计），避免单条记录形成高效时段
+MIN_WINDOW_RECORDS = 3
+
+# 衰减权重的指数超过该值时重新归一化，避免浮点溢出
+RENORMALIZE_EXPONENT = 64
+
+# 比较得分率时保留的小数位（避免浮点累加误差影响排序）
+RATE_PRECISION = 6
+
+
+def format_minute(minute: int) -> str:
+    """将当天分钟数格式化为HH:MM（1440格式化为24:00）"""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def parse_period(text: str) -> Tuple[int, int]:
+    """解析"HH:MM-HH:MM"格式的时段
+
+    Args:
+        text: 时段字符串
+
+    Returns:
+        (开始分钟, 结束分钟)，跨零点的时段结束分钟大于1440
+    """
+    start_text, _, end_text = text.partition("-")
+    start = _parse_minute(start_text)
+    end = _parse_minute(end_text)
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+def _parse_minute(text: str) -> int:
+    """解析HH:MM为当天分钟数"""
+    hour, _, minute = text.strip().partition(":")
+    return int(hour) * 60 + int(minute or 0)
+
+
+class EfficiencyTracker:
+    """高效时段统计类
+
+    采用前向衰减：记录按2^((记录时间-基准时间)/半衰期)加权累加，
+    比较时统一换算到同一时刻，因此插入时无需衰减全部1440个分钟的统计量
+    """
+
+    def __init__(self, half_life_days: float = DEFAULT_HALF_LIFE_DAYS,
+                 window_minutes: int = DEFAULT_WINDOW_MINUTES,
+                 top_windows: int = DEFAULT_TOP_WINDOWS):
+        """初始化统计
+
+        Args:
+            half_life_days: 半衰期（天）
+            window_minutes: 高效时段窗口长度（分钟）
+            top_windows: 保留的高效时段数量
+        """
+        self.half_life_seconds = half_life_days * 86400
+        self.window_minutes = window_minutes
+        self.top_windows = top_windows
+        self.reference_ts: Optional[float] = None
+        self.last_id = 0
+        self.last_ts: Optional[float] = None
+
+        # 逐分钟统计量：得分、精力消耗、记录分钟数（均为衰减加权）
+        self.score = [0.0] * MINUTES_PER_DAY
+        self.energy = [0.0] * MINUTES_PER_DAY
+        self.weight = [0.0] * MINUTES_PER_DAY
+
+        # 滑动窗口统计量：索引为窗口开始分钟（跨零点循环）
+        self.window_score = [0.0] * MINUTES_PER_DAY
+        self.window_energy = [0.0] * MINUTES_PER_DAY
+        self.window_weight = [0.0] * MINUTES_PER_DAY
+        # 与窗口重叠的记录数（不能由逐分钟统计量推出，随检查点保存）
+        self.window_records = [0.0] * MINUTES_PER_DAY
+
+    # ----------------- 增量更新 -----------------
+    def add(self, start_ts: float, end_ts: float, duration: int, final_score: float, energy_consume: float) -> None:
+        """累计一条行为记录
+
+        记录时长比时间跨度长时（旧版记录的开始、结束时间都是记录时刻），
+        视为在end_ts之前持续了duration分钟
+
+        Args:
+            start_ts: 开始时间戳
+            end_ts: 结束时间戳
+            duration: 时长（分钟）
+            final_score: 最终得分
+            energy_consume: 精力消耗（恢复为负数）
+        """
+        duration = int(duration or 0)
+        if duration <= 0:
+            return
+        if end_ts - start_ts < duration * 60:
+            start_ts = end_ts - duration * 60
+
+        factor = self._factor(end_ts)
+        self.last_ts = max(self.last_ts or end_ts, end_ts)
+        start = datetime.fromtimestamp(start_ts)
+        start_minute = start.hour * 60 + start.minute
+        duration = min(duration, MINUTES_PER_DAY)
+
+        score_rate = final_score / duration * factor
+        energy_rate = max(0.0, energy_consume) / duration * factor
+
+        for offset in range(duration):
+            minute = (start_minute + offset) % MINUTES_PER_DAY
+            self.score[minute] += score_rate
+            self.energy[minute] += energy_rate
+            self.weight[minute] += factor
+
+        # 与[start_minute, start_minute+duration)重叠的窗口按重叠分钟数更新
+        window = self.window_minutes
+        end_minute = start_minute + duration
+        for window_start in range(start_minute - window + 1, end_minute):
+            overlap = min(window_start + window, end_minute) - max(window_start, start_minute)
+            index = window_start % MINUTES_PER_DAY
+            self.window_score[index] += score_rate * overlap
+            self.window_energy[index] += energy_rate * overlap
+            self.window_weight[index] += factor * overlap
+            self.window_records[index] += factor
+
+    def consume(self, records: Iterable[Dict[str, Any]]) -> int:
+        """流式累计行为记录（只处理id大于检查点的记录）
+
+        Args:
+            records: 按id升序的行为记录，包含id、start_ts、end_ts、duration、final_score、energy_consume
+
+        Returns:
+            本次累计的记录数
+        """
+        count = 0
+        for record in records:
+            if record["id"] <= self.last_id:
+                continue
+            self.add(record["start_ts"], record["end_ts"], record["duration"],
+                     record["final_score"] or 0.0, record["energy_consume"] or 0.0)
+            self.last_id = record["id"]
+            count += 1
+        return count
+
+    def _factor(self, ts: float) -> float:
+        """时间戳对应的前向衰减权重，必要时重新归一化已有统计量"""
+        if self.reference_ts is None:
+            self.reference_ts = ts
+        exponent = (ts - self.reference_ts) / self.half_life_seconds
+        if exponent > RENORMALIZE_EXPONENT:
+            scale = 2.0 ** -exponent
+            for values in (self.score, self.energy, self.weight,
+                           self.window_score, self.window_energy, self.window_weight, self.window_records):
+                for index in range(MINUTES_PER_DAY):
+                    values[index] *= scale
+            self.reference_ts = ts
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    # ----------------- 查询 -----------------
+    def best_windows(self, now_ts: Optional[float] = None) -> List[Dict[str, Any]]:
+        """得分率最高的不重叠窗口
+
+        Args:
+            now_ts: 评估时刻，默认为最后一条记录的时间
+
+        Returns:
+            高效时段列表（按开始时间排序，首尾相接的窗口合并）：
+            start、end（当天分钟数）、score_per_min、efficiency
+        """
+        total_weight = sum(self.weight)
+        if self.reference_ts is None or total_weight <= 0:
+            return []
+        now_ts = now_ts if now_ts is not None else self.last_ts
+        scale = 2.0 ** ((now_ts - self.reference_ts) / self.half_life_seconds)
+        min_weight = MIN_WINDOW_MINUTES * scale
+        min_records = MIN_WINDOW_RECORDS * scale
+        average_rate = round(max(0.0, sum(self.score) / total_weight), RATE_PRECISION)
+
+        candidates = []
+        for start in range(MINUTES_PER_DAY):
+            weight = self.window_weight[start]
+            if weight < min_weight or self.window_records[start] < min_records:
+                continue
+            score_rate = round(self.window_score[start] / weight, RATE_PRECISION)
+            if score_rate > average_rate:
+                candidates.append((score_rate, start))
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+
+        window = self.window_minutes
+        chosen: List[int] = []
+        for _, start in candidates:
+            if all(_circular_distance(start, other) >= window for other in chosen):
+                chosen.append(start)
+                if len(chosen) >= self.top_windows:
+                    break
+
+        # 合并首尾相接的窗口
+        spans: List[List[int]] = []
+        for start in sorted(chosen):
+            if spans and spans[-1][1] == start:
+                spans[-1][1] = start + window
+            else:
+                spans.append([start, start + window])
+        if len(spans) > 1 and spans[-1][1] - MINUTES_PER_DAY == spans[0][0]:
+            spans[0][0] = spans[-1][0] - MINUTES_PER_DAY
+            spans.pop()
+
+        periods = []
+        for start, end in spans:
+            score, energy, weight = self._span_totals(start, end)
+            periods.append({
+                "start": start % MINUTES_PER_DAY,
+                "end": start % MINUTES_PER_DAY + (end - start),
+                "score_per_min": score / weight if weight > 0 else 0.0,
+                "efficiency": score / energy if energy > 0 else 0.0
+            })
+        periods.sort(key=lambda period: period["start"])
+        return periods
+
+    def _span_totals(self, start: int, end: int) -> Tuple[float, float, float]:
+        """[start, end)分钟内的得分、精力消耗、权重合计（跨零点循环）"""
+        score = energy = weight = 0.0
+        for minute in range(start, end):
+            minute %= MINUTES_PER_DAY
+            score += self.score[minute]
+            energy += self.energy[minute]
+            weight += self.weight[minute]
+        return score, energy, weight
+
+    def efficient_periods(self, now_ts: Optional[float] = None) -> List[str]:
+        """高效时段的"HH:MM-HH:MM"列表（user_state.efficient_periods的格式）"""
+        return [f"{format_minute(period['start'])}-{format_minute(period['end'] % MINUTES_PER_DAY)}"
+                for period in self.best_windows(now_ts)]
+
+    # ----------------- 持久化 -----------------
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典（窗口的得分、精力、权重加载时重新计算）"""
+        return {
+            "half_life_days": self.half_life_seconds / 86400,
+            "window_minutes": self.window_minutes,
+            "top_windows": self.top_windows,
+            "reference_ts": self.reference_ts,
+            "last_id": self.last_id,
+            "last_ts": self.last_ts,
+            "score": self.score,
+            "energy": self.energy,
+            "weight": self.weight,
+            "window_records": self.window_records
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "EfficiencyTracker":
+        """从to_dict导出的字典恢复
+
+        Args:
+            data: 统计字典
+
+        Returns:
+            统计对象
+        """
+        tracker = cls(data.get("half_life_days", DEFAULT_HALF_LIFE_DAYS),
+                      data.get("window_minutes", DEFAULT_WINDOW_MINUTES),
+                      data.get("top_windows", DEFAULT_TOP_WINDOWS))
+        tracker.reference_ts = data.get("reference_ts")
+        tracker.last_id = data.get("last_id", 0)
+        tracker.last_ts = data.get("last_ts")
+        for name in ("score", "energy", "weight", "window_records"):
+            values = data.get(name)
+            if values and len(values) == MINUTES_PER_DAY:
+                setattr(tracker, name, [float(value) for value in values])
+        tracker._rebuild_windows()
+        return tracker
+
+    def _rebuild_windows(self) -> None:
+        """由逐分钟统计量重新计算滑动窗口统计量（循环滑动，O(1440)）"""
+        window = self.window_minutes
+        for values, sums in ((self.score, self.window_score), (self.energy, self.window_energy),
+                             (self.weight, self.window_weight)):
+            total = sum(values[minute % MINUTES_PER_DAY] for minute in range(window))
+            for start in range(MINUTES_PER_DAY):
+                sums[start] = total
+                total += values[(start + window) % MINUTES_PER_DAY] - values[start]
+
+
+def _circular_distance(a: int, b: int) -> int:
+    """两个当天分钟数之间的循环距离"""
+    distance = abs(a - b) % MINUTES_PER_DAY
+    return min(distance, MINUTES_PER_DAY - distance)
+
+
+def periods_to_ranges(periods: Sequence[str]) -> List[Tuple[int, int]]:
+    """将"HH:MM-HH:MM"列表转换为(开始分钟, 结束分钟)列表，忽略无法解析的项"""
+    ranges = []
+    for text in periods or []:
+        try:
+            ranges.append(parse_period(text))
+        except (ValueError, AttributeError):
+            continue
+    return ranges
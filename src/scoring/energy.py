@@ -7,8 +7,10 @@
 对应iOS的EnergyViewModel
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
+from src.scoring.recovery import RecoveryIntegrator
+from src.scoring.replay import recovery_start_ts
 from src.utils.config import get_config
 
 class EnergyManager:
@@ -29,6 +31,7 @@ class EnergyManager:
         """
         self.user_data = user_data
         self.global_config = get_config("global_config")
+        self.recovery = RecoveryIntegrator(self.global_config)
     
     def update_energy(self, energy_cost: float) -> float:
         """更新精力，应用精力上限
@@ -55,30 +58,26 @@ class EnergyManager:
         
         return new_energy
     
-    def calculate_auto_recovery(self) -> float:
+    def calculate_auto_recovery(self, now: Optional[datetime] = None) -> float:
         """计算自动恢复的精力
         
         对应iOS的EnergyViewModel.calculateAutoRecovery()
         
+        超过30分钟按被动恢复率恢复，超过1小时再按间隔内经过的各时段恢复率积分；
+        上次记录在前一天及更早时，夜间已由每日重置的睡眠恢复计入，从当天睡眠结束时开始计算（见recovery_start_ts）
+        
+        Args:
+            now: 当前时间，默认为系统时间
+            
         Returns:
             恢复的精力值
         """
         if not self.user_data["last_record_ts"]:
             return 0.0
         
-        # 计算时间差（分钟）
-        now = datetime.now().timestamp()
-        time_diff = (now - self.user_data["last_record_ts"]) / 60
-        
-        # 超过30分钟才恢复
-        if time_diff <= 30:
-            return 0.0
-        
-        # 计算恢复的精力
-        # 被动恢复率：每分钟恢复0.02点
-        recovery = time_diff * self.global_config["passive_recovery_rate"]
-        
-        return recovery
+        now = now or datetime.now()
+        start_ts = recovery_start_ts(self.user_data["last_record_ts"], now.timestamp())
+        return self.recovery.gap_recovery(start_ts, now)["total"]
     
     def apply_auto_recovery(self) -> float:
         """应用自动恢复的精力
@@ -93,26 +92,29 @@ class EnergyManager:
             return self.update_energy(-recovery)  # 恢复是负数消耗
         return self.user_data["current_energy"]
     
-    def reset_daily_energy(self) -> float:
+    def reset_daily_energy(self, now: Optional[datetime] = None) -> float:
         """重置每日精力
         
         对应iOS的EnergyViewModel.resetDailyEnergy()
         
+        上次记录之后经过的每个夜晚都计算睡眠恢复（至少一晚）
+        
+        Args:
+            now: 当前时间，默认为系统时间
+            
         Returns:
             重置后的精力值
         """
         # 前日剩余精力
         previous_energy = self.user_data["current_energy"]
         
-        # 睡眠恢复：默认8小时×7点=56点
-        sleep_recovery = 56
-        
-        # 计算新一天的初始精力
-        new_day_energy = previous_energy + sleep_recovery
-        
         # 若无睡眠数据，默认+50点
         if not self.user_data["last_record_ts"]:
             new_day_energy = previous_energy + self.global_config["cross_day_recovery_default"]
+        else:
+            # 睡眠恢复：默认8小时×7点=56点，每晚一次
+            nights = max(1, self.recovery.nights_between(self.user_data["last_record_ts"], now or datetime.now()))
+            new_day_energy = previous_energy + nights * self.recovery.sleep_recovery
         
         # 应用精力上限
         new_day_energy = min(new_day_energy, self.global_config["energy_max"])
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一积分计算核心
+
+旧版ScoringEngine（字典形式的最近行为，GLOBAL_CONFIG）和ScoringCalculator（Behavior对象，get_config）
+都委托到这里，两条调用路径共用同一套得分、精力和平衡规则
+核心只接收等级字符串序列，不关心最近行为的存储形式
+"""
+
+from typing import Dict, Any, Optional, Sequence
+from src.scoring.time_period import TimePeriodTable, compile_time_periods
+
+# 正向行为等级
+POSITIVE_LEVELS = frozenset(("S", "A", "B"))
+
+# 负向行为等级
+NEGATIVE_LEVELS = frozenset(("C", "D"))
+
+# 高消耗等级（其后的R级恢复子级提升一级）
+HIGH_COST_LEVELS = frozenset(("S", "A"))
+
+# 同领域专精加成
+SAME_FIELD_BONUS = 1.15
+
+# R级子级提升
+R_SUBLEVEL_UPGRADE = {"R1": "R2", "R2": "R3", "R3": "R3"}
+
+
+class ScoringCore:
+    """积分计算核心类
+
+    所有配置相关的常量在初始化时预先取出，单次计算不再查配置字典
+    """
+
+    def __init__(self, level_config: Dict[str, Any], global_config: Dict[str, Any],
+                 time_period_config: Optional[Dict[str, Any]] = None):
+        """初始化计算核心
+
+        Args:
+            level_config: 等级配置
+            global_config: 全局配置
+            time_period_config: 时段配置，为None时不计算时段系数
+        """
+        self.level_config = level_config
+        self.global_config = global_config
+
+        self.energy_zero_threshold = global_config["energy_zero_threshold"]
+        self.energy_low_threshold = global_config["energy_low_threshold"]
+        self.low_energy_positive_coeff = global_config["low_energy_positive_coeff"]
+        self.low_energy_recovery_bonus = global_config["low_energy_recovery_bonus"]
+        self.start_bonus_duration = global_config["start_bonus_duration"]
+        self.start_bonus_score = global_config["start_bonus_score"]
+        self.start_bonus_energy = global_config["start_bonus_energy"]
+        self.novice_bonus = global_config["novice_bonus"]
+        self.rebound_bonus = global_config["rebound_bonus"]
+        self.combo_table = (1.0, 1.1, 1.2, global_config["max_combo_bonus"])
+
+        # 时段系数表（enable_time_period_coeff开启时参与动态系数）
+        self.time_period_config = time_period_config
+        self.time_periods: Optional[TimePeriodTable] = (
+            compile_time_periods(time_period_config) if time_period_config else None
+        )
+        self.time_period_enabled = bool(global_config.get("enable_time_period_coeff")) and self.time_periods is not None
+
+        # 行为信息表：非R等级和直接指定的R级子级 -> 行为信息；未指定子级的R级按推测的子级查表
+        self._infos: Dict[str, Dict[str, Any]] = {
+            level: config for level, config in level_config.items() if not level.startswith("R")
+        }
+        self._inferred_r_infos: Dict[str, Dict[str, Any]] = {}
+        for r_level in level_config["R"]["sublevels"]:
+            self._infos[r_level] = self._r_info(r_level, r_level)
+            self._inferred_r_infos[r_level] = self._r_info("R", r_level)
+
+    # ----------------- 行为信息 -----------------
+    def infer_r_sublevel(self, level: str, duration: int, mood: int, last_level: str = None) -> str:
+        """推测R级的子级（R1/R2/R3）
+
+        Args:
+            level: 行为等级
+            duration: 持续时长
+            mood: 心情评分（时长规则总会覆盖心情推测，保留参数以兼容调用方）
+            last_level: 前一个行为的等级
+
+        Returns:
+            推测的子级
+        """
+        # 如果用户已经指定了子级（如R1），直接返回
+        if len(level) > 1:
+            return level
+
+        # 基于时长推测
+        if duration < 15:
+            inferred_sublevel = "R1"
+        elif duration <= 30:
+            inferred_sublevel = "R2"
+        else:
+            inferred_sublevel = "R3"
+
+        # 前行为是高消耗，提升恢复子级
+        if last_level in HIGH_COST_LEVELS:
+            inferred_sublevel = R_SUBLEVEL_UPGRADE[inferred_sublevel]
+
+        return inferred_sublevel
+
+    def get_behavior_info(self, level: str, duration: int, mood: int, last_level: str = None) -> Dict[str, Any]:
+        """获取行为信息，处理R级子级推测
+
+        Args:
+            level: 行为等级
+            duration: 持续时长
+            mood: 心情评分
+            last_level: 前一个行为的等级
+
+        Returns:
+            行为信息字典（调用方不应修改）
+        """
+        info = self._infos.get(level)
+        if info is not None:
+            return info
+        if not level.startswith("R"):
+            return self.level_config[level]
+        return self._inferred_r_infos[self.infer_r_sublevel(level, duration, mood, last_level)]
+
+    def _r_info(self, level: str, r_level: str) -> Dict[str, Any]:
+        """R级子级的行为信息（level为输入的等级）"""
+        sublevel_config = self.level_config["R"]["sublevels"][r_level]
+        return {
+            "name": level,
+            "level": level,
+            "category": "恢复行为",
+            "base_score_per_min": sublevel_config["base_score_per_min"],
+            "energy_cost_per_min": sublevel_config["energy_cost_per_min"],
+            "mental_anchor": sublevel_config["mental_anchor"],
+            "example": sublevel_config["example"],
+            "inferred_sublevel": r_level
+        }
+
+    # ----------------- 系数 -----------------
+    @staticmethod
+    def energy_coefficient(current_energy: float) -> float:
+        """计算精力系数
+
+        Args:
+            current_energy: 当前精力
+
+        Returns:
+            精力系数
+        """
+        if current_energy > 70:
+            return 1.0 + (current_energy - 70) * 0.01
+        elif current_energy > 40:
+            return 0.85 + (current_energy - 40) * 0.005
+        else:
+            return 0.7  # 低能量保护
+
+    def set_efficient_periods(self, efficient_periods: Optional[Sequence[str]]) -> None:
+        """叠加学习到的高效时段，重新编译时段系数表（相同输入复用缓存）
+
+        Args:
+            efficient_periods: 高效时段（"HH:MM-HH:MM"列表）
+        """
+        if self.time_period_config:
+            self.time_periods = compile_time_periods(self.time_period_config, efficient_periods)
+
+    def time_period_coefficient(self, start_minute: float, end_minute: float) -> float:
+        """计算[start_minute, end_minute)的时段系数（按时长加权平均）
+
+        Args:
+            start_minute: 开始分钟（当天分钟数或绝对分钟数）
+            end_minute: 结束分钟
+
+        Returns:
+            时段系数，未启用时段系数时为1.0
+        """
+        if not self.time_period_enabled:
+            return 1.0
+        return self.time_periods.average(start_minute, end_minute)
+
+    def time_period_coefficient_between(self, start: Any, end: Any) -> float:
+        """计算[start, end)的时段系数
+
+        Args:
+            start: 开始时间（datetime或Unix时间戳）
+            end: 结束时间（datetime或Unix时间戳）
+
+        Returns:
+            时段系数，未启用时段系数时为1.0
+        """
+        if not self.time_period_enabled:
+            return 1.0
+        return self.time_periods.average_between(start, end)
+
+    def combo_result(self, recent_levels: Sequence[str], level: str) -> Dict[str, Any]:
+        """计算连击结果
+
+        Args:
+            recent_levels: 最近行为的等级（按时间顺序）
+            level: 当前行为等级
+
+        Returns:
+            连击结果字典
+        """
+        combo_count = 0
+        all_same = True
+        for recent_level in recent_levels:
+            if recent_level in POSITIVE_LEVELS:
+                combo_count += 1
+                if recent_level != level:
+                    all_same = False
+
+        combo_coeff = self.combo_table[combo_count if combo_count < 3 else 3]
+
+        # 中断后的第一个正面行为
+        is_negative_break = bool(recent_levels) and recent_levels[-1] in NEGATIVE_LEVELS
+        if is_negative_break and level in POSITIVE_LEVELS:
+            combo_coeff *= self.rebound_bonus
+
+        # 同领域专精（简化处理：相同等级为同领域）
+        is_same_field = combo_count > 0 and all_same
+        if is_same_field:
+            combo_coeff *= SAME_FIELD_BONUS
+
+        return {
+            "coefficient": combo_coeff,
+            "combo_count": combo_count,
+            "is_same_field": is_same_field,
+            "is_negative_break": is_negative_break
+        }
+
+    # ----------------- 精力与得分 -----------------
+    def energy_cost(self, behavior_info: Dict[str, Any], duration: int, current_energy: float) -> Dict[str, Any]:
+        """计算精力消耗/恢复
+
+        Args:
+            behavior_info: 行为信息
+            duration: 持续时长
+            current_energy: 当前精力
+
+        Returns:
+            精力变化详情：final_energy_cost（正数为消耗，负数为恢复）等
+        """
+        # 开始奖励：前5分钟精力消耗×0.8
+        start_bonus_energy = self.start_bonus_energy if duration <= self.start_bonus_duration else 1.0
+
+        energy_cost_per_min = behavior_info["energy_cost_per_min"]
+        final_energy_cost = energy_cost_per_min * duration * start_bonus_energy
+
+        # 低精力时恢复行为加成
+        if energy_cost_per_min < 0 and current_energy < self.energy_low_threshold:
+            final_energy_cost *= self.low_energy_recovery_bonus
+
+        return {
+            "final_energy_cost": final_energy_cost,
+            "base_energy_cost": energy_cost_per_min * duration,
+            "start_bonus_energy": start_bonus_energy,
+            "is_recovery": energy_cost_per_min < 0
+        }
+
+    def score(self, behavior_info: Dict[str, Any], level: str, duration: int, current_energy: float,
+              recent_levels: Sequence[str], beginner_period: bool, time_period_coeff: float = 1.0) -> Dict[str, Any]:
+        """计算最终得分（V3.0公式：单次得分 = 基础分 × 动态系数 × 开始奖励 × 新手奖励）
+
+        Args:
+            behavior_info: 行为信息
+            level: 行为等级
+            duration: 持续时长
+            current_energy: 行为开始时的精力
+            recent_levels: 最近行为的等级（按时间顺序）
+            beginner_period: 是否处于新手期
+            time_period_coeff: 时段系数（由time_period_coefficient计算）
+
+        Returns:
+            得分详情字典
+        """
+        # 精力为0时不得分
+        if current_energy <= self.energy_zero_threshold:
+            return {
+                "final_score": 0,
+                "base_score": 0,
+                "dynamic_coefficient": 0,
+                "energy_coefficient": 0,
+                "combo_coefficient": 0,
+                "time_period_coefficient": 0,
+                "start_bonus_score": 1.0,
+                "novice_bonus": 1.0,
+                "combo_result": {"coefficient": 0, "combo_count": 0, "is_same_field": False, "is_negative_break": False},
+                "is_energy_zero": True
+            }
+
+        # 精力系数，低精力时正面行为系数设上限
+        energy_coeff = self.energy_coefficient(current_energy)
+        if current_energy < self.energy_low_threshold and level in POSITIVE_LEVELS:
+            energy_coeff = min(energy_coeff, self.low_energy_positive_coeff)
+
+        combo_result = self.combo_result(recent_levels, level)
+        combo_coeff = combo_result["coefficient"]
+        dynamic_coeff = energy_coeff * combo_coeff * time_period_coeff
+
+        start_bonus_score = self.start_bonus_score if duration <= self.start_bonus_duration else 1.0
+        novice_bonus = self.novice_bonus if beginner_period else 1.0
+
+        base_score = behavior_info["base_score_per_min"] * duration
+        final_score = base_score * dynamic_coeff * start_bonus_score * novice_bonus
+
+        return {
+            "final_score": final_score,
+            "base_score": base_score,
+            "dynamic_coefficient": dynamic_coeff,
+            "energy_coefficient": energy_coeff,
+            "combo_coefficient": combo_coeff,
+            "time_period_coefficient": time_period_coeff,
+            "start_bonus_score": start_bonus_score,
+            "novice_bonus": novice_bonus,
+            "combo_result": combo_result,
+            "is_energy_zero": False
+        }
+
+    @staticmethod
+    def apply_balance(final_score: float, same_behavior_count: int, is_short_frequency: bool, level: str,
+                      recent_levels: Sequence[str]) -> float:
+        """应用防滥用与平衡机制
+
+        Args:
+            final_score: 最终得分
+            same_behavior_count: 同一行为今日已记录次数
+            is_short_frequency: 是否为短时长高频（10分钟内重复）
+            level: 行为等级
+            recent_levels: 最近行为的等级
+
+        Returns:
+            应用平衡机制后的得分
+        """
+        # 同一行为重复第4次起收益递减20%
+        if same_behavior_count >= 3:
+            final_score *= 0.8
+
+        # 短时长高频第二次起系数×0.7
+        if is_short_frequency:
+            final_score *= 0.7
+
+        # 防刷R机制：最近R级≥2次，收益降低
+        if level.startswith("R"):
+            r_count = 0
+            for recent_level in recent_levels:
+                if recent_level.startswith("R"):
+                    r_count += 1
+            if r_count >= 2:
+                final_score *= 0.8
+
+        return final_score
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行为时间区间索引
+
+按开始时间排序的区间列表，配合记录的最长区间长度，
+时刻查询（某一时刻在做什么）、重叠查询和空档查询都只需一次二分定位，O(log n + k)。
+旧版记录的开始、结束时间都是记录时刻，按结束前的duration分钟作为实际区间
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+
+def behavior_span(record: Dict[str, Any]) -> Tuple[int, int]:
+    """行为记录实际占用的区间[start, end)
+
+    Args:
+        record: 行为记录，包含start_ts、end_ts、duration
+
+    Returns:
+        (开始时间戳, 结束时间戳)
+    """
+    start_ts, end_ts = record["start_ts"], record["end_ts"]
+    duration_seconds = int(record.get("duration") or 0) * 60
+    if end_ts - start_ts < duration_seconds:
+        start_ts = end_ts - duration_seconds
+    return start_ts, end_ts
+
+
+class IntervalIndex:
+    """区间索引类
+
+    区间按(开始, 结束, id)排序保存；任何与[a, b)重叠的区间，
+    开始时间一定落在[a - 最长区间长度, b)内，因此二分出这一段再过滤即可
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, Any]] = ()):
+        """初始化索引
+
+        Args:
+            intervals: (开始时间戳, 结束时间戳, 记录id)序列
+        """
+        self.items: List[Tuple[int, int, Any]] = sorted(intervals)
+        self.starts = [item[0] for item in self.items]
+        self.max_length = max((end - start for start, end, _ in self.items), default=0)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "IntervalIndex":
+        """由行为记录建立索引"""
+        return cls(behavior_span(record) + (record["id"],) for record in records)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    # ----------------- 修改 -----------------
+    def add(self, start: int, end: int, item_id: Any) -> None:
+        """插入区间，O(log n)定位"""
+        index = bisect_right(self.items, (start, end, item_id))
+        self.items.insert(index, (start, end, item_id))
+        self.starts.insert(index, start)
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, item_id: Any) -> bool:
+        """按id删除区间
+
+        Returns:
+            是否找到并删除
+        """
+        for index, item in enumerate(self.items):
+            if item[2] == item_id:
+                del self.items[index]
+                del self.starts[index]
+                return True
+        return False
+
+    # ----------------- 查询 -----------------
+    def overlapping(self, start: int, end: int, exclude_id: Any = None) -> List[Tuple[int, int, Any]]:
+        """与[start, end)重叠的区间（零长度区间按时刻处理）
+
+        Args:
+            start: 开始时间戳
+            end: 结束时间戳
+            exclude_id: 忽略的区间id（修改记录时排除自身）
+
+        Returns:
+            (开始, 结束, id)列表，按开始时间排序
+        """
+        first = bisect_left(self.starts, start - self.max_length)
+        last = bisect_left(self.starts, end) if end > start else bisect_right(self.starts, start)
+        result = []
+        for item in self.items[first:last]:
+            item_start, item_end, item_id = item
+            if item_id == exclude_id:
+                continue
+            if item_end > start and (item_start < end or item_start == start):
+                result.append(item)
+        return result
+
+    def at(self, ts: int) -> List[Tuple[int, int, Any]]:
+        """时刻ts正在进行的区间（包含开始时刻、不包含结束时刻）"""
+        return [item for item in self.overlapping(ts, ts) if item[0] <= ts < item[1]]
+
+    def gaps(self, start: int, end: int, min_length: int = 0) -> List[Tuple[int, int]]:
+        """[start, end)内没有任何区间覆盖的空档
+
+        Args:
+            start: 开始时间戳
+            end: 结束时间戳
+            min_length: 只返回长度不小于该值（秒）的空档
+
+        Returns:
+            (开始, 结束)列表
+        """
+        result = []
+        cursor = start
+        for item_start, item_end, _ in self.overlapping(start, end):
+            if item_start > cursor:
+                result.append((cursor, item_start))
+            cursor = max(cursor, item_end)
+        if cursor < end:
+            result.append((cursor, end))
+        return [(gap_start, gap_end) for gap_start, gap_end in result if gap_end - gap_start >= min_length]
+
+    def last_end_before(self, ts: int) -> Optional[int]:
+        """ts之前开始的区间中最晚的结束时间（ts之前最后一次行为的结束时刻）"""
+        index = bisect_left(self.starts, ts)
+        first = bisect_left(self.starts, self.starts[index - 1] - self.max_length) if index else 0
+        ends = [item[1] for item in self.items[first:index]]
+        return max(ends) if ends else None
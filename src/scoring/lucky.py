@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+幸运系数引擎
+
+每个用户一条确定性的随机数流：第n个随机数只由(种子, n)决定（splitmix64计数器生成器），
+流的状态只有种子、已用计数和连续未触发次数三个整数，可以保存在user_state中，
+重放和模拟从同一检查点出发得到完全相同的结果。
+每次抽取固定消耗两个随机数（是否触发、是否超级幸运），因此批量抽取可以
+一次生成整批随机数，再按触发位置分段应用保底规则（连续3次未触发下次必触发）
+"""
+
+import hashlib
+import json
+import secrets
+from typing import Dict, Any, List, Optional, Sequence
+
+# 幸运系数参数默认值（global_config中未定义时使用）
+DEFAULT_LUCKY_PARAMS = {"base_luck_rate": 0.1, "fatigue_factor": 0.9}
+
+# 连续未触发多少次后下次必触发
+PITY_THRESHOLD = 3
+
+# 触发幸运时成为超级幸运的概率
+SUPER_LUCKY_RATE = 0.05
+
+# 幸运系数
+LUCKY_COEFFICIENT = 1.5
+SUPER_LUCKY_COEFFICIENT = 2.0
+
+# 每次抽取消耗的随机数个数
+DRAWS_PER_BEHAVIOR = 2
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(value: int) -> int:
+    """splitmix64混合函数"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def uniform(seed: int, counter: int) -> float:
+    """流中第counter个[0, 1)均匀随机数"""
+    return (_splitmix64(seed ^ _splitmix64(counter)) >> 11) / (1 << 53)
+
+
+def seed_from_text(text: str) -> int:
+    """由字符串派生64位种子（模拟中由全局种子和用户编号派生）"""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+class LuckyStream:
+    """用户的幸运随机数流（种子、已用计数、连续未触发次数）"""
+
+    def __init__(self, seed: Optional[int] = None, counter: int = 0, unlucky: int = 0):
+        """初始化随机数流
+
+        Args:
+            seed: 64位种子，不指定时随机生成
+            counter: 已经消耗的随机数个数
+            unlucky: 连续未触发幸运次数
+        """
+        self.seed = seed if seed is not None else secrets.randbits(64)
+        self.counter = counter
+        self.unlucky = unlucky
+
+    @classmethod
+    def from_state(cls, state: Any) -> "LuckyStream":
+        """由user_state中保存的检查点恢复（JSON字符串或字典，为空时新建）"""
+        if isinstance(state, str):
+            state = json.loads(state) if state else None
+        if not state:
+            return cls()
+        return cls(state["seed"], state["counter"], state["unlucky"])
+
+    def to_state(self) -> str:
+        """序列化为检查点（JSON字符串）"""
+        return json.dumps({"seed": self.seed, "counter": self.counter, "unlucky": self.unlucky})
+
+
+class LuckyEngine:
+    """幸运系数引擎类"""
+
+    def __init__(self, global_config: Dict[str, Any]):
+        """初始化引擎
+
+        Args:
+            global_config: 全局配置（base_luck_rate、fatigue_factor未定义时使用默认值）
+        """
+        self.base_luck_rate = global_config.get("base_luck_rate", DEFAULT_LUCKY_PARAMS["base_luck_rate"])
+        self.fatigue_factor = global_config.get("fatigue_factor", DEFAULT_LUCKY_PARAMS["fatigue_factor"])
+
+    def luck_rate(self, behaviors_count: int) -> float:
+        """今日已记录behaviors_count个行为时的幸运率（随行为数衰减）"""
+        return self.base_luck_rate * (self.fatigue_factor ** behaviors_count)
+
+    def draw(self, stream: LuckyStream, behaviors_count: int) -> Dict[str, Any]:
+        """抽取一次幸运系数（推进stream）
+
+        Args:
+            stream: 用户随机数流
+            behaviors_count: 今日已记录行为数
+
+        Returns:
+            coefficient、is_lucky、lucky_type
+        """
+        trigger = uniform(stream.seed, stream.counter)
+        is_super = uniform(stream.seed, stream.counter + 1) < SUPER_LUCKY_RATE
+        stream.counter += DRAWS_PER_BEHAVIOR
+
+        is_lucky = stream.unlucky >= PITY_THRESHOLD or trigger < self.luck_rate(behaviors_count)
+        stream.unlucky = 0 if is_lucky else stream.unlucky + 1
+        return _lucky_result(is_lucky, is_super)
+
+    def draw_batch(self, stream: LuckyStream, behaviors_counts: Sequence[int]) -> List[Dict[str, Any]]:
+        """批量抽取，结果与逐次调用draw完全相同（推进stream）
+
+        先一次生成整批随机数得到自然触发的位置，再在相邻两次自然触发之间
+        按保底间隔直接计算强制触发的位置，只需遍历触发位置而不是逐次模拟
+
+        Args:
+            stream: 用户随机数流
+            behaviors_counts: 每次抽取时今日已记录行为数
+
+        Returns:
+            每次抽取的coefficient、is_lucky、lucky_type
+        """
+        seed, counter = stream.seed, stream.counter
+        count = len(behaviors_counts)
+        lucky = [uniform(seed, counter + DRAWS_PER_BEHAVIOR * index) < self.luck_rate(behaviors_count)
+                 for index, behaviors_count in enumerate(behaviors_counts)]
+        supers = [uniform(seed, counter + DRAWS_PER_BEHAVIOR * index + 1) < SUPER_LUCKY_RATE
+                  for index in range(count)]
+
+        unlucky = stream.unlucky
+        index = 0
+        while index < count:
+            try:
+                hit = lucky.index(True, index)
+            except ValueError:
+                hit = count
+            # [index, hit)都没有自然触发：连续未触发次数达到阈值的位置强制触发
+            first_forced = index + max(0, PITY_THRESHOLD - unlucky)
+            last_forced = None
+            for forced in range(first_forced, hit, PITY_THRESHOLD + 1):
+                lucky[forced] = True
+                last_forced = forced
+            if hit < count:
+                unlucky = 0
+            elif last_forced is not None:
+                unlucky = hit - last_forced - 1
+            else:
+                unlucky += hit - index
+            index = hit + 1
+
+        stream.counter = counter + DRAWS_PER_BEHAVIOR * count
+        stream.unlucky = unlucky
+        return [_lucky_result(is_lucky, is_super) for is_lucky, is_super in zip(lucky, supers)]
+
+
+def _lucky_result(is_lucky: bool, is_super: bool) -> Dict[str, Any]:
+    """抽取结果"""
+    if not is_lucky:
+        return {"coefficient": 1.0, "is_lucky": False, "lucky_type": "none"}
+    if is_super:
+        return {"coefficient": SUPER_LUCKY_COEFFICIENT, "is_lucky": True, "lucky_type": "super"}
+    return {"coefficient": LUCKY_COEFFICIENT, "is_lucky": True, "lucky_type": "normal"}
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+最优日程规划
+
+在可用时间段内，从行为目录中搜索使最终得分最大、且精力始终不低于低精力阈值的日程
+动态规划状态为（时间槽, 精力桶, 连击状态, 各等级已安排次数, 距上次行为结束的时间槽数），
+按帕累托前沿剪枝；重复行为递减与短时长高频两项防滥用惩罚在搜索中按DaySimulator的规则计入
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from src.scoring.engine import ScoringCore
+from src.scoring.recovery import RecoveryIntegrator
+from src.scoring.simulator import SHORT_FREQUENCY_GAP, DaySimulator, to_minute_of_day
+from src.utils.config import get_config
+
+# 默认可选时长（分钟）
+DEFAULT_DURATIONS = (15, 30, 45, 60, 90)
+
+# 每个时间槽保留的最大状态数
+DEFAULT_BEAM_WIDTH = 200
+
+# 参考精力：此时精力系数为1.0
+REFERENCE_ENERGY = 70.0
+
+# 参与规划的等级（C/D为负分行为，不推荐安排）
+PLANNABLE_LEVELS = ("S", "A", "B", "R")
+
+# 同一行为已记录该次数后开始收益递减（与ScoringCore.apply_balance一致）
+REPEAT_PENALTY_COUNT = 3
+
+# 状态键：(连击状态, 各等级已安排次数, 距上次行为结束的时间槽数, 精力桶)
+StateKey = Tuple[Tuple[str, ...], Tuple[int, ...], int, int]
+
+
+def format_minute(minute: int) -> str:
+    """将当天分钟数格式化为HH:MM
+
+    Args:
+        minute: 当天分钟数
+
+    Returns:
+        HH:MM格式字符串
+    """
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class DayPlanner:
+    """最优日程规划类
+
+    转移的得分与精力变化直接调用ScoringCore计算，并按连击状态缓存成转移表；
+    行为只能在可用时间段内连续进行，时间段内不安排空闲（R级恢复总是优于空闲）。
+    同等级行为按目录中的名称轮换，因此某个名称的重复次数由该等级已安排的次数决定：
+    状态中记录各等级的次数（达到开始递减的次数后不再区分）和距上次行为结束的时间，
+    搜索时的得分与DaySimulator推演的实际得分按同样的防滥用规则计算。
+    """
+
+    def __init__(self, catalog: Sequence[Dict[str, Any]], user_data: Optional[Dict[str, Any]] = None,
+                 slot_minutes: int = 5, durations: Sequence[int] = DEFAULT_DURATIONS,
+                 energy_bucket: float = 4.0, beam_width: Optional[int] = DEFAULT_BEAM_WIDTH,
+                 global_config: Optional[Dict[str, Any]] = None):
+        """初始化规划器
+
+        Args:
+            catalog: 行为目录（behavior_def中的行为，至少包含name、level）
+            user_data: 用户数据，包含current_energy、beginner_period
+            slot_minutes: 时间粒度（分钟）
+            durations: 可选的行为时长（分钟），需为时间粒度的整数倍
+            energy_bucket: 精力桶大小，同一桶内只保留得分最高的状态
+            beam_width: 每个时间槽保留的最大状态数，None为精确搜索（状态含各等级次数，只适合很短的时间段）
+            global_config: 全局配置，默认读取配置文件中的global_config
+        """
+        self.user_data = user_data or {}
+        self.global_config = global_config or get_config("global_config")
+        self.slot_minutes = slot_minutes
+        self.duration_slots = sorted({d // slot_minutes for d in durations if d >= slot_minutes})
+        self.threshold = self.global_config["energy_low_threshold"]
+
+        # 可规划等级 -> 行为名称列表
+        self.names_by_level: Dict[str, List[str]] = {}
+        for item in catalog:
+            level = str(item["level"]).upper()
+            if level in PLANNABLE_LEVELS:
+                self.names_by_level.setdefault(level, []).append(item["name"])
+
+        self.beginner_period = self.user_data.get("beginner_period", False)
+        self.core = ScoringCore(get_config("level_config"), self.global_config, get_config("time_period_config"))
+        self.energy_bucket = energy_bucket
+        self.beam_width = beam_width
+        self._coefficient_cache: Dict[int, float] = {}
+        self._transition_cache: Dict[Tuple[Tuple[str, ...], bool], List[Tuple[int, int, Tuple[str, ...], float, float]]] = {}
+
+        # 各等级按names_by_level的顺序编号；名称轮换一轮后，每个名称的重复次数加一
+        self.levels = list(self.names_by_level)
+        self._repeat_caps = tuple(REPEAT_PENALTY_COUNT * len(self.names_by_level[level]) for level in self.levels)
+        # 距上次行为结束不少于该时间槽数时不可能构成短时长高频
+        self._short_slots = -(-SHORT_FREQUENCY_GAP // slot_minutes)
+
+    def plan(self, blocks: Sequence[Tuple[Any, Any]]) -> Dict[str, Any]:
+        """搜索最优日程
+
+        Args:
+            blocks: 可用时间段列表，如[("09:00", "12:00"), ("14:00", "18:00")]
+
+        Returns:
+            规划结果字典：schedule（日程列表）、total_score（推演得分）、
+            final_energy、min_energy、expected_score（规划目标值）
+        """
+        ranges = self._build_ranges(blocks)
+        start_energy = float(self.user_data.get("current_energy", 100.0))
+        energy_max = self.global_config["energy_max"]
+        recovery = RecoveryIntegrator(self.global_config)
+        threshold = self.threshold
+        bucket = self.energy_bucket
+        energy_value = self._energy_value()
+        core = self.core
+        time_period_enabled = core.time_period_enabled
+        slot_minutes = self.slot_minutes
+        repeat_caps = self._repeat_caps
+        short_slots = self._short_slots
+        # 防滥用惩罚的倍数（R级的防刷惩罚依赖连击状态，已计入转移表）
+        repeat_factor = core.apply_balance(1.0, REPEAT_PENALTY_COUNT, False, "S", ())
+        short_factor = core.apply_balance(1.0, 0, True, "S", ())
+
+        # frontier[slot][(连击状态, 各等级次数, 距上次结束的时间槽数, 精力桶)] = (得分, 精力, 回溯节点)
+        frontier: Dict[int, Dict[StateKey, Tuple[float, float, Any]]] = {}
+        initial_counts = (0,) * len(self.levels)
+        frontier[ranges[0][0]] = {((), initial_counts, short_slots, self._bucket(start_energy)): (0.0, start_energy, None)}
+        best = (0.0, None)
+
+        for index, (block_start, block_end) in enumerate(ranges):
+            next_start = ranges[index + 1][0] if index + 1 < len(ranges) else None
+            for slot in range(block_start, block_end + 1):
+                states = frontier.pop(slot, None)
+                if not states:
+                    continue
+                for (recent, counts, since), energy, score, node in self._prune(states, self.beam_width, energy_value):
+                    if score > best[0]:
+                        best = (score, node)
+
+                    # 结束当前时间段，空闲到下一个时间段开始（与DaySimulator相同的间隔恢复）
+                    if next_start is not None:
+                        gained = recovery.minute_recovery(slot * slot_minutes, next_start * slot_minutes)["total"]
+                        recovered = min(energy_max, energy + gained)
+                        idle_since = min(short_slots, since + next_start - slot)
+                        self._push(frontier, next_start, (recent, counts, idle_since), recovered, score, node)
+
+                    # 内层循环直接写入目标时间槽的状态表（热点路径，不经过_push）
+                    coefficient = self._coefficient(energy)
+                    for level_index, length, new_recent, factor, energy_cost in self._transitions(recent, energy):
+                        end = slot + length
+                        if end > block_end:
+                            break
+                        new_energy = energy - energy_cost
+                        if new_energy > energy_max:
+                            new_energy = energy_max
+                        elif new_energy < threshold:
+                            continue
+                        # 轮换到的名称已重复REPEAT_PENALTY_COUNT次时收益递减，之后次数不再区分
+                        used = counts[level_index]
+                        if used >= repeat_caps[level_index]:
+                            new_counts = counts
+                            factor *= repeat_factor
+                        else:
+                            new_counts = counts[:level_index] + (used + 1,) + counts[level_index + 1:]
+                        if since + length < short_slots and (since + length) * slot_minutes < SHORT_FREQUENCY_GAP:
+                            factor *= short_factor
+                        if time_period_enabled:
+                            new_score = score + factor * coefficient * core.time_period_coefficient(
+                                slot * slot_minutes, end * slot_minutes)
+                        else:
+                            new_score = score + factor * coefficient
+                        targets = frontier.get(end)
+                        if targets is None:
+                            targets = frontier[end] = {}
+                        key = (new_recent, new_counts, 0, int(new_energy // bucket))
+                        current = targets.get(key)
+                        if current is None or new_score > current[0]:
+                            targets[key] = (new_score, new_energy, (slot, self.levels[level_index], length, node))
+
+        schedule = self._build_schedule(best[1])
+        if schedule:
+            simulator = DaySimulator({
+                "current_energy": start_energy,
+                "beginner_period": self.beginner_period
+            }, global_config=self.global_config)
+            result = simulator.simulate_day(schedule, with_curve=False)
+        else:
+            result = {"total_score": 0.0, "final_energy": start_energy, "min_energy": start_energy}
+        return {
+            "schedule": schedule,
+            "expected_score": best[0],
+            "total_score": result["total_score"],
+            "final_energy": result["final_energy"],
+            "min_energy": result["min_energy"]
+        }
+
+    def _build_ranges(self, blocks: Sequence[Tuple[Any, Any]]) -> List[Tuple[int, int]]:
+        """将可用时间段转换为不重叠的时间槽区间
+
+        Args:
+            blocks: 可用时间段列表
+
+        Returns:
+            按时间排序的(开始时间槽, 结束时间槽)列表
+        """
+        ranges = []
+        for start, end in sorted((to_minute_of_day(start), to_minute_of_day(end)) for start, end in blocks):
+            start_slot = -(-start // self.slot_minutes)
+            end_slot = end // self.slot_minutes
+            if end_slot <= start_slot:
+                continue
+            if ranges and start_slot <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end_slot))
+            else:
+                ranges.append((start_slot, end_slot))
+        if not ranges:
+            raise ValueError("没有可用的时间段")
+        return ranges
+
+    def _energy_value(self) -> float:
+        """剩余精力的估值：可规划的消耗型行为中，每点精力能换到的最高基础分"""
+        level_config = get_config("level_config")
+        values = [level_config[level]["base_score_per_min"] / level_config[level]["energy_cost_per_min"]
+                  for level in self.names_by_level
+                  if level in level_config and level_config[level]["energy_cost_per_min"] > 0]
+        return max(values, default=0.0)
+
+    def _bucket(self, energy: float) -> int:
+        """精力所在的桶编号"""
+        return int(energy // self.energy_bucket)
+
+    def _coefficient(self, energy: float) -> float:
+        """精力系数（按整数精力查表，向下取整）"""
+        value = int(energy)
+        coefficient = self._coefficient_cache.get(value)
+        if coefficient is None:
+            coefficient = self.core.energy_coefficient(float(value))
+            self._coefficient_cache[value] = coefficient
+        return coefficient
+
+    def _transitions(self, recent: Tuple[str, ...], energy: float) -> List[Tuple[int, int, Tuple[str, ...], float, float]]:
+        """获取连击状态下所有可选行为的转移（按时长升序）
+
+        得分与精力系数、时段系数成正比，因此每个转移只在参考精力下调用一次ScoringCore，
+        得到"每单位精力系数的得分"（时段系数在搜索时按开始时间乘上）；
+        低于低精力阈值时恢复加成会改变精力变化，单独缓存。
+        表中的得分只含依赖连击状态的R级防刷惩罚，重复递减与短时长高频在搜索时按状态计入
+
+        Args:
+            recent: 最近行为等级（最多3个）
+            energy: 行为开始时的精力
+
+        Returns:
+            (等级编号, 时间槽数, 新连击状态, 单位系数得分, 精力消耗)列表
+        """
+        low = energy < self.threshold
+        key = (recent, low)
+        table = self._transition_cache.get(key)
+        if table is not None:
+            return table
+
+        reference_energy = float(int(energy)) if low else REFERENCE_ENERGY
+        core = self.core
+        coefficient = core.energy_coefficient(reference_energy)
+        last_level = recent[-1] if recent else None
+
+        table = []
+        for length in self.duration_slots:
+            duration = length * self.slot_minutes
+            for level_index, level in enumerate(self.levels):
+                behavior_info = core.get_behavior_info(level, duration, 3, last_level)
+                energy_cost = core.energy_cost(behavior_info, duration, reference_energy)["final_energy_cost"]
+                if level == "B":
+                    energy_cost *= 1 - self.global_config["b_level_recovery_percent"]
+                score = core.score(behavior_info, level, duration, reference_energy, recent,
+                                   self.beginner_period)["final_score"]
+                score = core.apply_balance(score, 0, False, level, recent)
+                table.append((level_index, length, (recent + (level,))[-3:], score / coefficient, energy_cost))
+
+        if not low:
+            self._transition_cache[key] = table
+        return table
+
+    def _push(self, frontier: Dict[int, Dict[StateKey, Tuple[float, float, Any]]], slot: int,
+              group: Tuple[Tuple[str, ...], Tuple[int, ...], int], energy: float, score: float, node: Any) -> None:
+        """向指定时间槽添加候选状态，同一（连击状态, 各等级次数, 距上次结束时间, 精力桶）只保留得分最高者"""
+        states = frontier.get(slot)
+        if states is None:
+            states = frontier[slot] = {}
+        key = group + (self._bucket(energy),)
+        current = states.get(key)
+        if current is None or score > current[0]:
+            states[key] = (score, energy, node)
+
+    @staticmethod
+    def _prune(states: Dict[StateKey, Tuple[float, float, Any]], beam_width: Optional[int],
+               energy_value: float) -> List[Tuple[Tuple[Tuple[str, ...], Tuple[int, ...], int], float, float, Any]]:
+        """剪枝：同一（连击状态, 各等级次数, 距上次结束时间）下去掉精力和得分都不占优的状态，
+        再保留得分最高的beam_width个
+
+        Args:
+            states: 同一时间槽的候选状态
+            beam_width: 每个时间槽最多保留的状态数，None表示不限制
+            energy_value: 每点剩余精力折算的得分，用于比较不同精力的状态
+
+        Returns:
+            保留的((连击状态, 各等级次数, 距上次结束时间), 精力, 得分, 回溯节点)列表
+        """
+        ordered = sorted(states.items(), key=lambda item: (item[0][:3], -item[1][1]))
+        kept = []
+        previous = None
+        best_score = float("-inf")
+        for key, (score, energy, node) in ordered:
+            group = key[:3]
+            if group != previous:
+                previous = group
+                best_score = float("-inf")
+            if score > best_score:
+                kept.append((group, energy, score, node))
+                best_score = score
+        if beam_width is not None and len(kept) > beam_width:
+            kept.sort(key=lambda item: item[2] + energy_value * item[1], reverse=True)
+            del kept[beam_width:]
+        return kept
+
+    def _build_schedule(self, node: Any) -> List[Dict[str, Any]]:
+        """由回溯节点还原日程，同等级行为按目录名称轮换
+
+        Args:
+            node: 最优状态的回溯节点
+
+        Returns:
+            日程列表（可直接交给DaySimulator推演）
+        """
+        steps = []
+        while node is not None:
+            slot, level, length, node = node
+            steps.append((slot, level, length))
+        steps.reverse()
+
+        used: Dict[str, int] = {}
+        schedule = []
+        for slot, level, length in steps:
+            names = self.names_by_level[level]
+            name = names[used.get(level, 0) % len(names)]
+            used[level] = used.get(level, 0) + 1
+            schedule.append({
+                "name": name,
+                "level": level,
+                "start": format_minute(slot * self.slot_minutes),
+                "duration": length * self.slot_minutes
+            })
+        return schedule
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+精力恢复积分
+
+行为间隔的被动恢复、无行为时按时段的每小时恢复、跨天的睡眠恢复统一在这里计算。
+每小时恢复率按时段分段，间隔在时段边界和零点处切分，每段按闭式积分，
+借助每天恢复量的前缀和，任意长度的间隔（包括离开多天、导入历史重放）都是O(1)计算
+"""
+
+from bisect import bisect_right
+from datetime import datetime
+from itertools import accumulate
+from typing import Dict, Any, List, Sequence, Tuple
+from src.scoring.time_period import to_absolute_minute
+
+# 一天的分钟数
+MINUTES_PER_DAY = 1440
+
+# 无行为时的每小时恢复率：(开始小时, 结束小时, 每小时恢复点数)
+HOURLY_RECOVERY_RATES = (
+    (0, 6, 1.0),    # 凌晨
+    (6, 12, 2.0),   # 早晨
+    (12, 14, 1.5),  # 中午
+    (14, 18, 2.0),  # 下午
+    (18, 22, 1.5),  # 晚上
+    (22, 24, 1.0),  # 深夜
+)
+
+# 每晚睡眠恢复：默认8小时×7点=56点
+SLEEP_RECOVERY = 56
+
+# 睡眠恢复覆盖的时段：零点起的小时数（跨天后的间隔恢复从当天该时刻开始）
+SLEEP_HOURS = 8
+
+# 被动恢复的最小间隔（分钟）
+PASSIVE_RECOVERY_MIN_GAP = 30
+
+# 无行为恢复的最小间隔（分钟）
+NO_BEHAVIOR_RECOVERY_MIN_GAP = 60
+
+
+def to_datetime(value: Any) -> datetime:
+    """将datetime、Unix时间戳或ISO格式字符串转换为datetime"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromtimestamp(value)
+
+
+class RecoveryIntegrator:
+    """精力恢复积分类"""
+
+    def __init__(self, global_config: Dict[str, Any],
+                 hourly_rates: Sequence[Tuple[float, float, float]] = HOURLY_RECOVERY_RATES,
+                 sleep_recovery: float = SLEEP_RECOVERY):
+        """初始化恢复积分
+
+        Args:
+            global_config: 全局配置（passive_recovery_rate、energy_max等）
+            hourly_rates: 每小时恢复率分段，需覆盖0-24点且按时间排序
+            sleep_recovery: 每晚睡眠恢复点数
+        """
+        self.global_config = global_config
+        self.passive_rate = global_config["passive_recovery_rate"]
+        self.sleep_recovery = sleep_recovery
+
+        # 分段边界（当天分钟数）、每分钟恢复率、边界处的累计恢复量
+        self.boundaries = [int(start * 60) for start, _, _ in hourly_rates]
+        self.rates = [rate / 60 for _, _, rate in hourly_rates]
+        lengths = [int(end * 60) - int(start * 60) for start, end, _ in hourly_rates]
+        if self.boundaries[0] != 0 or sum(lengths) != MINUTES_PER_DAY:
+            raise ValueError("每小时恢复率分段必须覆盖0-24点")
+        self.prefix = list(accumulate((length * rate for length, rate in zip(lengths, self.rates)), initial=0.0))
+        self.day_total = self.prefix[-1]
+
+    def _cumulative(self, minute: float) -> float:
+        """从第0天0点到绝对分钟数minute的无行为恢复累计量"""
+        days, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+        index = bisect_right(self.boundaries, minute_of_day) - 1
+        return (days * self.day_total + self.prefix[index]
+                + (minute_of_day - self.boundaries[index]) * self.rates[index])
+
+    def hourly_recovery(self, start_minute: float, end_minute: float) -> float:
+        """[start_minute, end_minute)内按时段积分的无行为恢复量（不判断最小间隔）
+
+        Args:
+            start_minute: 开始分钟（当天分钟数或绝对分钟数）
+            end_minute: 结束分钟
+
+        Returns:
+            无行为恢复量
+        """
+        if end_minute <= start_minute:
+            return 0.0
+        return self._cumulative(end_minute) - self._cumulative(start_minute)
+
+    def hourly_pieces(self, start_minute: float, end_minute: float) -> List[Tuple[float, float, float]]:
+        """将[start_minute, end_minute)在时段边界处切分（O(经过的边界数)）
+
+        Args:
+            start_minute: 开始分钟
+            end_minute: 结束分钟
+
+        Returns:
+            (开始分钟, 结束分钟, 每分钟无行为恢复量)列表
+        """
+        pieces = []
+        minute = start_minute
+        while minute < end_minute:
+            day_start = (minute // MINUTES_PER_DAY) * MINUTES_PER_DAY
+            index = bisect_right(self.boundaries, minute - day_start) - 1
+            if index + 1 < len(self.boundaries):
+                boundary = day_start + self.boundaries[index + 1]
+            else:
+                boundary = day_start + MINUTES_PER_DAY
+            piece_end = min(boundary, end_minute)
+            pieces.append((minute, piece_end, self.rates[index]))
+            minute = piece_end
+        return pieces
+
+    def minute_recovery(self, start_minute: float, end_minute: float) -> Dict[str, float]:
+        """计算[start_minute, end_minute)空闲间隔的恢复
+
+        Args:
+            start_minute: 开始分钟（当天分钟数或绝对分钟数）
+            end_minute: 结束分钟
+
+        Returns:
+            恢复详情：minutes（间隔分钟数）、passive（被动恢复）、no_behavior（无行为恢复）、total
+        """
+        minutes = end_minute - start_minute
+        passive = no_behavior = 0.0
+
+        # 间隔>30分钟才恢复：每分钟恢复passive_recovery_rate点
+        if minutes > PASSIVE_RECOVERY_MIN_GAP:
+            passive = minutes * self.passive_rate
+
+            # 间隔>1小时：按间隔内实际经过的各时段恢复率积分
+            if minutes > NO_BEHAVIOR_RECOVERY_MIN_GAP:
+                no_behavior = self.hourly_recovery(start_minute, end_minute)
+
+        return {
+            "minutes": minutes,
+            "passive": passive,
+            "no_behavior": no_behavior,
+            "total": passive + no_behavior
+        }
+
+    def gap_recovery(self, start: Any, end: Any) -> Dict[str, float]:
+        """计算两次行为之间的间隔恢复
+
+        Args:
+            start: 上次记录时间（datetime、时间戳或ISO字符串）
+            end: 当前时间
+
+        Returns:
+            恢复详情，参见minute_recovery
+        """
+        return self.minute_recovery(to_absolute_minute(to_datetime(start)), to_absolute_minute(to_datetime(end)))
+
+    @staticmethod
+    def nights_between(start: Any, end: Any) -> int:
+        """[start, end]之间经过的夜晚数（跨过的零点数）"""
+        return max(0, (to_datetime(end).date() - to_datetime(start).date()).days)
+
+    def sleep_recovery_between(self, start: Any, end: Any) -> float:
+        """[start, end]之间每个夜晚的睡眠恢复合计"""
+        return self.nights_between(start, end) * self.sleep_recovery
+
+    def recover(self, energy: float, start: Any, end: Any, include_sleep: bool = False) -> float:
+        """计算经过间隔后的精力
+
+        恢复量都是非负的，精力单调上升，因此最后统一应用精力上限与逐段应用等价
+
+        Args:
+            energy: 间隔开始时的精力
+            start: 间隔开始时间
+            end: 间隔结束时间
+            include_sleep: 是否包含跨天的睡眠恢复
+
+        Returns:
+            间隔结束时的精力
+        """
+        recovery = self.gap_recovery(start, end)["total"]
+        if include_sleep:
+            recovery += self.sleep_recovery_between(start, end)
+        return min(self.global_config["energy_max"], energy + recovery)
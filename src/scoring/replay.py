@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+状态重放
+
+按时间顺序重放行为记录和心愿兑换，重建任意时刻的精力、连击、当日计数和积分余额。
+每日状态快照（daily_state_snapshot）保存一天结束时的状态，
+查询某一时刻的状态时从最近的快照开始，只重放之后（通常只有当天）的事件
+"""
+
+import copy
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional
+from src.scoring.engine import POSITIVE_LEVELS
+from src.scoring.recovery import SLEEP_HOURS, RecoveryIntegrator
+
+# 初始精力，与user_state.current_energy的默认值一致
+INITIAL_ENERGY = 100.0
+
+# 连击检测使用的最近行为数
+RECENT_WINDOW = 3
+
+
+def day_key_of(ts: float) -> str:
+    """时间戳所在的日期键，格式：YYYY-MM-DD"""
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+
+def day_start_ts(day_key: str) -> int:
+    """日期键当天0点的时间戳"""
+    return int(datetime.strptime(day_key, "%Y-%m-%d").timestamp())
+
+
+def next_day_key(day_key: str) -> str:
+    """下一天的日期键"""
+    return (datetime.strptime(day_key, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def in_beginner_period(first_day_key: Optional[str], day_key: str, beginner_period_days: int) -> bool:
+    """day_key是否处于新手期：从第一条记录的日期起beginner_period_days天内（还没有记录时也算）"""
+    if first_day_key is None:
+        return True
+    elapsed = (datetime.strptime(day_key, "%Y-%m-%d") - datetime.strptime(first_day_key, "%Y-%m-%d")).days
+    return elapsed < beginner_period_days
+
+
+def recovery_start_ts(last_ts: float, ts: float) -> float:
+    """从last_ts到ts的间隔恢复的起点
+
+    last_ts在ts的前一天及更早时，夜间（当天0点到SLEEP_HOURS点）的恢复已由
+    每日重置的睡眠恢复计入，间隔恢复只从当天SLEEP_HOURS点开始计算
+    """
+    day_start = day_start_ts(day_key_of(ts))
+    if last_ts >= day_start:
+        return last_ts
+    return min(ts, day_start + SLEEP_HOURS * 3600)
+
+
+class StateReplayer:
+    """状态重放类
+
+    重放规则与实时记录一致：
+    - 跨天时每晚睡眠恢复，当日得分、计数和连击清零
+    - 每条记录前按上次记录以来的间隔恢复精力（RecoveryIntegrator；跨天时夜间由睡眠恢复计入，见recovery_start_ts）
+    - 记录的精力消耗扣减精力，B级返还部分消耗，精力限制在[0, 精力上限]
+    - 余额 = 累计得分 - 已兑换心愿的成本
+    """
+
+    def __init__(self, global_config: Dict[str, Any], recovery: Optional[RecoveryIntegrator] = None):
+        """初始化重放器
+
+        Args:
+            global_config: 全局配置
+            recovery: 精力恢复积分，默认按global_config创建
+        """
+        self.global_config = global_config
+        self.recovery = recovery or RecoveryIntegrator(global_config)
+
+    @staticmethod
+    def initial_state() -> Dict[str, Any]:
+        """没有任何历史时的状态"""
+        return {
+            "day_key": None,
+            "energy": INITIAL_ENERGY,
+            "combo_count": 0,
+            "recent_levels": [],
+            "behavior_count": 0,
+            "level_counts": {},
+            "day_score": 0.0,
+            "total_score": 0.0,
+            "redeemed_cost": 0.0,
+            "balance": 0.0,
+            "last_record_ts": None,
+            "as_of_ts": None
+        }
+
+    # ----------------- 事件 -----------------
+    def start_day(self, state: Dict[str, Any], day_key: str) -> None:
+        """进入新的一天：按经过的夜晚数计算睡眠恢复，清零当日数据
+
+        Args:
+            state: 当前状态（原地修改）
+            day_key: 新的日期键
+        """
+        if state["day_key"] is not None and day_key > state["day_key"]:
+            nights = (datetime.strptime(day_key, "%Y-%m-%d") - datetime.strptime(state["day_key"], "%Y-%m-%d")).days
+            state["energy"] = min(self.global_config["energy_max"],
+                                  state["energy"] + nights * self.recovery.sleep_recovery)
+        state["day_key"] = day_key
+        state["combo_count"] = 0
+        state["recent_levels"] = []
+        state["behavior_count"] = 0
+        state["level_counts"] = {}
+        state["day_score"] = 0.0
+
+    def begin_record(self, state: Dict[str, Any], record: Dict[str, Any]) -> float:
+        """记录开始前：必要时进入新的一天，返回间隔恢复后的精力（不写回state["energy"]）
+
+        Args:
+            state: 当前状态（跨天时原地修改）
+            record: 行为记录
+
+        Returns:
+            行为开始时的精力
+        """
+        day_key = day_key_of(record["start_ts"])
+        if day_key != state["day_key"]:
+            self.start_day(state, day_key)
+
+        energy = state["energy"]
+        if state["last_record_ts"] is not None:
+            energy = self.recovery.recover(energy, recovery_start_ts(state["last_record_ts"], record["start_ts"]),
+                                           record["start_ts"])
+        return energy
+
+    def finish_record(self, state: Dict[str, Any], record: Dict[str, Any], energy: float) -> None:
+        """记录结束：扣减精力消耗，累计得分、计数和连击
+
+        Args:
+            state: 当前状态（原地修改）
+            record: 行为记录，包含level、end_ts、final_score（已含记录时抽取的幸运系数）、energy_consume
+            energy: 行为开始时的精力（begin_record的返回值）
+        """
+        energy_consume = record["energy_consume"] or 0.0
+        energy -= energy_consume
+        if record["level"] == "B":
+            energy += energy_consume * self.global_config["b_level_recovery_percent"]
+        state["energy"] = min(self.global_config["energy_max"], max(0.0, energy))
+
+        final_score = record["final_score"] or 0.0
+        state["day_score"] += final_score
+        state["total_score"] += final_score
+        state["balance"] = state["total_score"] - state["redeemed_cost"]
+        state["behavior_count"] += 1
+        state["level_counts"][record["level"]] = state["level_counts"].get(record["level"], 0) + 1
+        state["recent_levels"] = (state["recent_levels"] + [record["level"]])[-RECENT_WINDOW:]
+        state["combo_count"] = sum(1 for level in state["recent_levels"] if level in POSITIVE_LEVELS)
+        state["last_record_ts"] = max(state["last_record_ts"] or 0, record["end_ts"])
+        state["as_of_ts"] = record["end_ts"]
+
+    def apply_record(self, state: Dict[str, Any], record: Dict[str, Any]) -> None:
+        """应用一条行为记录
+
+        Args:
+            state: 当前状态（原地修改）
+            record: 行为记录，包含level、start_ts、end_ts、final_score、energy_consume
+        """
+        self.finish_record(state, record, self.begin_record(state, record))
+
+    def apply_redemption(self, state: Dict[str, Any], redemption: Dict[str, Any]) -> None:
+        """应用一次心愿兑换
+
+        Args:
+            state: 当前状态（原地修改）
+            redemption: 兑换记录，包含redeemed_at、cost
+        """
+        state["redeemed_cost"] += redemption["cost"]
+        state["balance"] = state["total_score"] - state["redeemed_cost"]
+
+    def replay(self, state: Dict[str, Any], records: Iterable[Dict[str, Any]],
+               redemptions: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """按时间顺序重放事件
+
+        Args:
+            state: 起始状态（不修改）
+            records: 按start_ts升序的行为记录
+            redemptions: 按redeemed_at升序的兑换记录
+
+        Returns:
+            重放后的状态
+        """
+        state = copy.deepcopy(state)
+        pending = list(redemptions)
+        index = 0
+        for record in records:
+            while index < len(pending) and pending[index]["redeemed_at"] <= record["start_ts"]:
+                self.apply_redemption(state, pending[index])
+                index += 1
+            self.apply_record(state, record)
+        for redemption in pending[index:]:
+            self.apply_redemption(state, redemption)
+        return state
+
+    def state_at(self, state: Dict[str, Any], ts: float) -> Dict[str, Any]:
+        """将重放结果推进到指定时刻（跨天清零、睡眠恢复和间隔恢复）
+
+        Args:
+            state: 重放到ts之前最后一个事件的状态（不修改）
+            ts: 查询时刻
+
+        Returns:
+            该时刻的状态
+        """
+        state = copy.deepcopy(state)
+        day_key = day_key_of(ts)
+        if state["day_key"] is not None and day_key != state["day_key"]:
+            self.start_day(state, day_key)
+        if state["last_record_ts"] is not None:
+            state["energy"] = self.recovery.recover(state["energy"], recovery_start_ts(state["last_record_ts"], ts), ts)
+        state["day_key"] = day_key
+        state["as_of_ts"] = ts
+        return state
+
+    # ----------------- 快照 -----------------
+    @staticmethod
+    def to_snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
+        """将一天结束时的状态转换为daily_state_snapshot行"""
+        return {
+            "day_key": state["day_key"],
+            "end_energy": state["energy"],
+            "combo_count": state["combo_count"],
+            "behavior_count": state["behavior_count"],
+            "day_score": state["day_score"],
+            "total_score": state["total_score"],
+            "redeemed_cost": state["redeemed_cost"],
+            "balance": state["balance"],
+            "last_record_ts": state["last_record_ts"],
+            "counters": json.dumps(state["level_counts"], ensure_ascii=False),
+            "recent_levels": json.dumps(state["recent_levels"])
+        }
+
+    @staticmethod
+    def from_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """由daily_state_snapshot行恢复状态"""
+        return {
+            "day_key": snapshot["day_key"],
+            "energy": snapshot["end_energy"],
+            "combo_count": snapshot["combo_count"],
+            "recent_levels": json.loads(snapshot["recent_levels"] or "[]"),
+            "behavior_count": snapshot["behavior_count"],
+            "level_counts": json.loads(snapshot["counters"] or "{}"),
+            "day_score": snapshot["day_score"],
+            "total_score": snapshot["total_score"],
+            "redeemed_cost": snapshot["redeemed_cost"],
+            "balance": snapshot["balance"],
+            "last_record_ts": snapshot["last_record_ts"],
+            "as_of_ts": snapshot["last_record_ts"]
+        }
+
+    def daily_snapshots(self, state: Dict[str, Any], records: Iterable[Dict[str, Any]],
+                        redemptions: Iterable[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+        """重放事件，返回每个有记录的日期结束时的快照
+
+        Args:
+            state: 起始状态（不修改）
+            records: 按start_ts升序的行为记录
+            redemptions: 按redeemed_at升序的兑换记录
+
+        Returns:
+            快照行列表（按日期升序）
+        """
+        state = copy.deepcopy(state)
+        pending = list(redemptions)
+        index = 0
+        snapshots = []
+        for record in records:
+            day_key = day_key_of(record["start_ts"])
+            if state["day_key"] is not None and day_key != state["day_key"] and state["behavior_count"]:
+                while index < len(pending) and pending[index]["redeemed_at"] < day_start_ts(next_day_key(state["day_key"])):
+                    self.apply_redemption(state, pending[index])
+                    index += 1
+                snapshots.append(self.to_snapshot(state))
+            while index < len(pending) and pending[index]["redeemed_at"] <= record["start_ts"]:
+                self.apply_redemption(state, pending[index])
+                index += 1
+            self.apply_record(state, record)
+        if state["behavior_count"]:
+            while index < len(pending) and pending[index]["redeemed_at"] < day_start_ts(next_day_key(state["day_key"])):
+                self.apply_redemption(state, pending[index])
+                index += 1
+            snapshots.append(self.to_snapshot(state))
+        return snapshots
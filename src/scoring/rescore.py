@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+补录后的重新计分
+
+在过去的某个时刻插入、修改或删除行为后，当天该时刻之后的记录
+（行为开始时的精力、连击、防滥用惩罚、精力消耗和最终得分）都需要重新计算。
+重新计分从受影响的位置开始，之前的记录只重放状态，不重新计分
+"""
+
+import copy
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from src.scoring.engine import ScoringCore
+from src.scoring.replay import StateReplayer
+
+# 短时长高频判定：同一行为两次开始的间隔（秒）
+SHORT_FREQUENCY_SECONDS = 10 * 60
+
+# 判断得分、精力消耗是否变化的容差
+TOLERANCE = 1e-9
+
+
+def counter_key(record: Dict[str, Any]) -> str:
+    """防滥用计数的键：有行为名称时按名称，否则按等级（与每日计数表一致）"""
+    if record.get("name"):
+        return f"behavior:{record['name']}"
+    return f"level:{record['level']}"
+
+
+class DayRescorer:
+    """单日重新计分类"""
+
+    def __init__(self, core: ScoringCore, replayer: StateReplayer, beginner_period: bool = True):
+        """初始化重新计分
+
+        Args:
+            core: 积分计算核心
+            replayer: 状态重放器（精力恢复、跨天规则）
+            beginner_period: 是否处于新手期
+        """
+        self.core = core
+        self.replayer = replayer
+        self.beginner_period = beginner_period
+
+    def score_record(self, state: Dict[str, Any], record: Dict[str, Any], energy: float,
+                     same_behavior_count: int, is_short_frequency: bool) -> Dict[str, Any]:
+        """按记录前的状态重新计算一条记录的得分和精力消耗
+
+        Args:
+            state: 记录前的状态
+            record: 行为记录，包含level、duration、mood、start_ts、end_ts、lucky_coeff
+            energy: 行为开始时的精力
+            same_behavior_count: 同一行为当日已记录次数
+            is_short_frequency: 是否为短时长高频
+
+        Returns:
+            base_score、dynamic_coeff、final_score、energy_consume
+        """
+        level = record["level"]
+        duration = record["duration"]
+        recent_levels: Sequence[str] = state["recent_levels"]
+        last_level = recent_levels[-1] if recent_levels else None
+
+        behavior_info = self.core.get_behavior_info(level, duration, record["mood"], last_level)
+        energy_cost = self.core.energy_cost(behavior_info, duration, energy)
+
+        # 旧版记录的开始、结束时间都是记录时刻，时段按结束前的duration分钟计算
+        span_start = min(record["start_ts"], record["end_ts"] - duration * 60)
+        time_period_coeff = self.core.time_period_coefficient_between(span_start, record["end_ts"])
+
+        score = self.core.score(behavior_info, level, duration, energy, recent_levels,
+                                self.beginner_period, time_period_coeff)
+        final_score = self.core.apply_balance(score["final_score"], same_behavior_count,
+                                              is_short_frequency, level, recent_levels)
+        # 记录时抽取的幸运系数只作用于得分为正的行为（与记录时一致，重新计分不重新抽取）
+        if final_score > 0:
+            final_score *= record.get("lucky_coeff") or 1.0
+        return {
+            "base_score": score["base_score"],
+            "dynamic_coeff": score["dynamic_coefficient"],
+            "final_score": final_score,
+            "energy_consume": energy_cost["final_energy_cost"]
+        }
+
+    def rescore(self, state: Dict[str, Any], records: List[Dict[str, Any]], from_index: int = 0,
+                redemptions: Iterable[Dict[str, Any]] = (),
+                previous_last_ts: Optional[Dict[str, int]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """重新计算一天中from_index及之后的记录
+
+        Args:
+            state: 当天开始前的状态（不修改）
+            records: 当天按开始时间升序的全部记录
+            from_index: 第一条需要重新计分的记录
+            redemptions: 当天按兑换时间升序的心愿兑换
+            previous_last_ts: 前一天各计数键的上次出现时间（短时长高频判断跨过零点）
+
+        Returns:
+            (发生变化的记录列表（含id和新的得分字段）, 当天结束时的状态)
+        """
+        state = copy.deepcopy(state)
+        pending = list(redemptions)
+        index = 0
+        counters: Dict[str, Dict[str, Any]] = {
+            key: {"count": 0, "last_ts": last_ts} for key, last_ts in (previous_last_ts or {}).items()
+        }
+        changed = []
+
+        for position, record in enumerate(records):
+            while index < len(pending) and pending[index]["redeemed_at"] <= record["start_ts"]:
+                self.replayer.apply_redemption(state, pending[index])
+                index += 1
+
+            key = counter_key(record)
+            counter = counters.setdefault(key, {"count": 0, "last_ts": None})
+            energy = self.replayer.begin_record(state, record)
+
+            if position >= from_index:
+                is_short_frequency = (counter["last_ts"] is not None
+                                      and record["start_ts"] - counter["last_ts"] < SHORT_FREQUENCY_SECONDS)
+                values = self.score_record(state, record, energy, counter["count"], is_short_frequency)
+                if any(abs((record[field] or 0.0) - value) > TOLERANCE for field, value in values.items()):
+                    record = dict(record, **values)
+                    changed.append(record)
+
+            self.replayer.finish_record(state, record, energy)
+            counter["count"] += 1
+            counter["last_ts"] = record["start_ts"]
+
+        for redemption in pending[index:]:
+            self.replayer.apply_redemption(state, redemption)
+        return changed, state
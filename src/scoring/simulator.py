@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+精力时间线模拟器
+
+给定一天的行为计划（行为等级、开始时间、时长），推演逐分钟的精力曲线和预计得分
+用于"如果这样安排会怎样"的规划推演，不写入数据库
+"""
+
+from itertools import accumulate
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from datetime import datetime, time
+from src.scoring.engine import ScoringCore
+from src.scoring.recovery import RecoveryIntegrator, PASSIVE_RECOVERY_MIN_GAP, NO_BEHAVIOR_RECOVERY_MIN_GAP
+from src.utils.config import get_config
+
+# 一天的分钟数
+MINUTES_PER_DAY = 1440
+
+# 短时长高频判定间隔（分钟）
+SHORT_FREQUENCY_GAP = 10
+
+
+def to_minute_of_day(value: Any) -> int:
+    """将时间表示转换为当天的分钟数
+
+    Args:
+        value: 分钟数(int)、"HH:MM"字符串、datetime或time对象
+
+    Returns:
+        当天的分钟数（0-1440）
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"无效的时间: {value!r}")
+    if isinstance(value, int):
+        minute = value
+    elif isinstance(value, (datetime, time)):
+        minute = value.hour * 60 + value.minute
+    elif isinstance(value, str):
+        hour, _, minute_part = value.strip().partition(":")
+        minute = int(hour) * 60 + int(minute_part or 0)
+    else:
+        raise ValueError(f"无效的时间: {value!r}")
+
+    if not 0 <= minute <= MINUTES_PER_DAY:
+        raise ValueError(f"时间超出当天范围: {value!r}")
+    return minute
+
+
+class DaySimulator:
+    """精力时间线模拟类
+
+    直接调用ScoringCore的得分/精力计算规则，按计划顺序推演一天：
+    - 行为的精力消耗/恢复（含开始奖励、低精力恢复加成、B级消耗返还）
+    - 行为间隔>30分钟的被动恢复，>1小时时按经过的时段叠加无行为恢复（与EnergyManager一致）
+    - 精力上限与0下限，精力为0时不得分
+    - 防滥用平衡机制后的预计得分
+
+    每段行为内的精力变化是单调的，因此先按段用闭式计算端点，
+    再用逐分钟增量的累加（itertools.accumulate）生成曲线，两者结果一致。
+    批量评估候选计划时可跳过曲线，只做O(行为数)的端点计算。
+    """
+
+    def __init__(self, user_data: Optional[Dict[str, Any]] = None,
+                 global_config: Optional[Dict[str, Any]] = None):
+        """初始化模拟器
+
+        Args:
+            user_data: 用户数据，包含current_energy、recent_behaviors、beginner_period
+            global_config: 全局配置，默认读取配置文件中的global_config
+        """
+        user_data = user_data or {}
+        self.initial_energy = float(user_data.get("current_energy", 100.0))
+        recent_behaviors = list(user_data.get("recent_behaviors", []))[-3:]
+        self.initial_recent_levels = [behavior.level for behavior in recent_behaviors]
+        self.beginner_period = user_data.get("beginner_period", False)
+        self.global_config = global_config or get_config("global_config")
+        self.recovery = RecoveryIntegrator(self.global_config)
+        self.core = ScoringCore(get_config("level_config"), self.global_config, get_config("time_period_config"))
+
+    def simulate_day(self, plan: Sequence[Dict[str, Any]], with_curve: bool = True,
+                     day_start: Optional[Any] = None, day_end: Any = MINUTES_PER_DAY) -> Dict[str, Any]:
+        """推演一天的行为计划
+
+        Args:
+            plan: 行为计划列表，每项包含level、start、duration，可选mood、name
+            with_curve: 是否生成逐分钟精力曲线
+            day_start: 推演起点，默认为第一个行为的开始时间
+            day_end: 推演终点，默认为24:00
+
+        Returns:
+            推演结果字典：energy_curve（索引为当天分钟数，共1441个点）、
+            behaviors（每个行为的精力/得分明细）、total_score、final_energy、min_energy等
+        """
+        entries = self._normalize_plan(plan)
+        end_minute = to_minute_of_day(day_end)
+        if entries:
+            start_minute = entries[0]["start"] if day_start is None else to_minute_of_day(day_start)
+            if start_minute > entries[0]["start"] or entries[-1]["end"] > end_minute:
+                raise ValueError("行为计划超出推演时间范围")
+        else:
+            start_minute = end_minute if day_start is None else to_minute_of_day(day_start)
+
+        energy_max = self.global_config["energy_max"]
+        core = self.core
+        recent_levels = list(self.initial_recent_levels)
+
+        # 分段：(开始分钟, 结束分钟, 每分钟精力变化)
+        segments: List[Tuple[int, int, float]] = []
+        results = []
+        same_counts: Dict[str, int] = {}
+        energy = self.initial_energy
+        min_energy = energy
+        total_score = 0.0
+        cursor = start_minute
+        last_end = None
+
+        for entry in entries:
+            energy = self._apply_gap(segments, cursor, entry["start"], energy)
+            min_energy = min(min_energy, energy)
+
+            level, duration = entry["level"], entry["duration"]
+            behavior_info = core.get_behavior_info(level, duration, entry["mood"],
+                                                   recent_levels[-1] if recent_levels else None)
+
+            # 精力变化：正数为消耗，负数为恢复
+            energy_details = core.energy_cost(behavior_info, duration, energy)
+            energy_cost, is_recovery = energy_details["final_energy_cost"], energy_details["is_recovery"]
+            if level == "B":
+                energy_cost *= 1 - self.global_config["b_level_recovery_percent"]
+
+            # 得分以行为开始时的精力为准
+            score = core.score(
+                behavior_info, level, duration, energy, recent_levels, self.beginner_period,
+                core.time_period_coefficient(entry["start"], entry["end"])
+            )["final_score"]
+            key = entry["name"] or level
+            is_short_frequency = last_end is not None and entry["end"] - last_end < SHORT_FREQUENCY_GAP
+            score = core.apply_balance(score, same_counts.get(key, 0), is_short_frequency, level, recent_levels)
+            same_counts[key] = same_counts.get(key, 0) + 1
+
+            energy_after = min(energy_max, max(0.0, energy - energy_cost))
+            segments.append((entry["start"], entry["end"], -energy_cost / entry["duration"]))
+
+            results.append({
+                "name": entry["name"],
+                "level": entry["level"],
+                "start": entry["start"],
+                "end": entry["end"],
+                "duration": entry["duration"],
+                "energy_before": energy,
+                "energy_after": energy_after,
+                "energy_cost": energy_cost,
+                "is_recovery": is_recovery,
+                "is_energy_zero": energy <= self.global_config["energy_zero_threshold"],
+                "final_score": score
+            })
+
+            total_score += score
+            energy = energy_after
+            min_energy = min(min_energy, energy)
+            recent_levels = (recent_levels + [level])[-3:]
+            cursor = last_end = entry["end"]
+
+        energy = self._apply_gap(segments, cursor, end_minute, energy)
+
+        result = {
+            "behaviors": results,
+            "total_score": total_score,
+            "final_energy": energy,
+            "min_energy": min_energy,
+            "start_minute": start_minute,
+            "end_minute": end_minute
+        }
+        if with_curve:
+            curve = self._build_curve(segments)
+            result["energy_curve"] = curve
+            result["min_energy"] = min(curve)
+            result["low_energy_minutes"] = sum(
+                1 for value in curve[start_minute:end_minute] if value < self.global_config["energy_low_threshold"]
+            )
+        return result
+
+    def simulate_many(self, plans: Sequence[Sequence[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """批量推演候选计划（不生成曲线）
+
+        Args:
+            plans: 候选计划列表
+
+        Returns:
+            每个计划的推演摘要，顺序与输入一致
+        """
+        return [self.simulate_day(plan, with_curve=False) for plan in plans]
+
+    def _apply_gap(self, segments: List[Tuple[int, int, float]], start: int, end: int, energy: float) -> float:
+        """处理两个行为之间的空闲间隔，间隔>30分钟时按被动恢复率恢复，
+        >1小时时在时段边界处分段叠加无行为恢复
+
+        Args:
+            segments: 分段列表（原地追加）
+            start: 间隔开始分钟
+            end: 间隔结束分钟
+            energy: 间隔开始时的精力
+
+        Returns:
+            间隔结束时的精力
+        """
+        gap = end - start
+        if gap <= PASSIVE_RECOVERY_MIN_GAP:
+            return energy
+        rate = self.recovery.passive_rate
+        if gap <= NO_BEHAVIOR_RECOVERY_MIN_GAP:
+            segments.append((start, end, rate))
+        else:
+            for piece_start, piece_end, hourly_rate in self.recovery.hourly_pieces(start, end):
+                segments.append((piece_start, piece_end, rate + hourly_rate))
+        return min(self.global_config["energy_max"], energy + self.recovery.minute_recovery(start, end)["total"])
+
+    def _build_curve(self, segments: List[Tuple[int, int, float]]) -> List[float]:
+        """由分段的每分钟变化量累加得到逐分钟精力曲线
+
+        Args:
+            segments: 分段列表
+
+        Returns:
+            长度为1441的精力曲线，curve[m]为第m分钟开始时的精力
+        """
+        deltas = [0.0] * MINUTES_PER_DAY
+        for start, end, rate in segments:
+            deltas[start:end] = [rate] * (end - start)
+
+        energy_max = self.global_config["energy_max"]
+
+        def step(energy: float, delta: float) -> float:
+            return min(energy_max, max(0.0, energy + delta))
+
+        return list(accumulate(deltas, step, initial=self.initial_energy))
+
+    def _normalize_plan(self, plan: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """规范化并校验行为计划
+
+        Args:
+            plan: 原始行为计划
+
+        Returns:
+            按开始时间排序的计划项列表
+        """
+        entries = []
+        for item in plan:
+            level = str(item["level"]).upper()
+            duration = int(item["duration"])
+            if duration <= 0:
+                raise ValueError(f"时长必须大于0: {item!r}")
+            start = to_minute_of_day(item["start"])
+            entries.append({
+                "level": level,
+                "start": start,
+                "end": start + duration,
+                "duration": duration,
+                "mood": int(item.get("mood", 3)),
+                "name": item.get("name")
+            })
+
+        entries.sort(key=lambda e: e["start"])
+        for previous, current in zip(entries, entries[1:]):
+            if current["start"] < previous["end"]:
+                raise ValueError(f"行为计划时间重叠: {previous['start']}-{previous['end']} 与 {current['start']}")
+        if entries and entries[-1]["end"] > MINUTES_PER_DAY:
+            raise ValueError("行为计划超出当天范围")
+        return entries
+
+
+def simulate_day(plan: Sequence[Dict[str, Any]], user_data: Optional[Dict[str, Any]] = None,
+                 with_curve: bool = True) -> Dict[str, Any]:
+    """推演一天的行为计划
+
+    Args:
+        plan: 行为计划列表，每项包含level、start、duration，可选mood、name
+        user_data: 用户数据，默认为精力100的非新手用户
+        with_curve: 是否生成逐分钟精力曲线
+
+    Returns:
+        推演结果字典，参见DaySimulator.simulate_day
+    """
+    return DaySimulator(user_data).simulate_day(plan, with_curve=with_curve)
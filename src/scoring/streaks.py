@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连续天数位图
+
+每个条件（有正向行为、当日得分达标、完成S级行为）一张位图，每天一位，
+第n位表示EPOCH之后第n天是否满足条件，按小端字节序保存为BLOB。
+当前连续天数、最长连续天数、区间内满足的天数和年历都是整数上的位运算，
+记录行为时只需置位当天的一位
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+# 位图第0位对应的日期（更早的日期不记录）
+EPOCH = date(2000, 1, 1)
+
+# 计入的正向等级
+POSITIVE_LEVELS = frozenset(("S", "A", "B"))
+
+# 连续天数条件
+CONDITION_POSITIVE = "positive"        # 当天有正向行为（S、A、B级）
+CONDITION_SCORE_TARGET = "score_target"  # 当日得分达到目标
+CONDITION_S_DONE = "s_done"            # 当天完成了S级行为
+CONDITIONS = (CONDITION_POSITIVE, CONDITION_SCORE_TARGET, CONDITION_S_DONE)
+
+# 默认的当日得分目标（global_config中没有daily_score_target时使用）
+DEFAULT_DAILY_SCORE_TARGET = 300
+
+
+def day_index(day_key: str) -> int:
+    """日期键（YYYY-MM-DD）对应的位序号"""
+    return (datetime.strptime(day_key, "%Y-%m-%d").date() - EPOCH).days
+
+
+def index_day_key(index: int) -> str:
+    """位序号对应的日期键"""
+    return (EPOCH + timedelta(days=index)).strftime("%Y-%m-%d")
+
+
+def day_conditions(levels: Iterable[str], day_score: float,
+                   score_target: float = DEFAULT_DAILY_SCORE_TARGET) -> Dict[str, bool]:
+    """一天满足的条件
+
+    Args:
+        levels: 当天全部行为的等级
+        day_score: 当日得分
+        score_target: 当日得分目标
+    """
+    levels = set(levels)
+    return {
+        CONDITION_POSITIVE: bool(levels & POSITIVE_LEVELS),
+        CONDITION_SCORE_TARGET: day_score >= score_target,
+        CONDITION_S_DONE: "S" in levels
+    }
+
+
+class DayBitmap:
+    """单个条件的按天位图类（位保存在Python整数中，按需与BLOB互转）"""
+
+    def __init__(self, data: bytes = b""):
+        """由BLOB建立位图
+
+        Args:
+            data: 小端字节序的位图
+        """
+        self.bits = int.from_bytes(data or b"", "little")
+
+    def to_bytes(self) -> bytes:
+        """序列化为BLOB（只保留到最高位所在的字节）"""
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+
+    # ----------------- 修改 -----------------
+    def set(self, day_key: str, value: bool = True) -> None:
+        """设置某天是否满足条件（EPOCH之前的日期无法表示，忽略）"""
+        index = day_index(day_key)
+        if index < 0:
+            return
+        mask = 1 << index
+        if value:
+            self.bits |= mask
+        else:
+            self.bits &= ~mask
+
+    # ----------------- 查询 -----------------
+    def test(self, day_key: str) -> bool:
+        """某天是否满足条件"""
+        index = day_index(day_key)
+        return index >= 0 and bool(self.bits >> index & 1)
+
+    def popcount(self, start_key: Optional[str] = None, end_key: Optional[str] = None) -> int:
+        """[start_key, end_key]内满足条件的天数（不指定时为全部）"""
+        bits = self.bits
+        if end_key is not None:
+            bits &= (1 << (day_index(end_key) + 1)) - 1
+        if start_key is not None:
+            bits >>= max(0, day_index(start_key))
+        return bits.bit_count()
+
+    def runs(self) -> Iterator[Tuple[str, int]]:
+        """按时间顺序列出连续满足条件的区间
+
+        Yields:
+            (开始日期键, 连续天数)
+        """
+        bits = self.bits
+        offset = 0
+        while bits:
+            zeros = (bits & -bits).bit_length() - 1
+            bits >>= zeros
+            offset += zeros
+            length = (~bits & (bits + 1)).bit_length() - 1
+            yield index_day_key(offset), length
+            bits >>= length
+            offset += length
+
+    def current_streak(self, today_key: str) -> int:
+        """截至今天的连续天数
+
+        今天还没有满足条件时从昨天开始计算（当天还有机会延续）
+        """
+        index = day_index(today_key)
+        if not self.bits >> index & 1:
+            index -= 1
+        if index < 0 or not self.bits >> index & 1:
+            return 0
+        # 取出index及之前的位，翻转后最低的0位之前就是连续的1
+        window = self.bits & ((1 << (index + 1)) - 1)
+        inverted = ~window & ((1 << (index + 1)) - 1)
+        if not inverted:
+            return index + 1
+        return index - (inverted.bit_length() - 1)
+
+    def longest_streak(self) -> int:
+        """最长连续天数：反复与右移一位的自身相与，每次消去每段连续1的一位"""
+        bits = self.bits
+        length = 0
+        while bits:
+            bits &= bits >> 1
+            length += 1
+        return length
+
+    def window(self, start_key: str, end_key: str) -> "DayBitmap":
+        """只保留[start_key, end_key]内各位的位图（区间内的连续天数统计用）"""
+        start = max(0, day_index(start_key))
+        end = day_index(end_key)
+        window = DayBitmap()
+        if end >= start:
+            window.bits = self.bits & ((1 << (end + 1)) - 1) & ~((1 << start) - 1)
+        return window
+
+    def calendar(self, year: int) -> List[bool]:
+        """一年中每天是否满足条件（按日期顺序，闰年366项）"""
+        start = (date(year, 1, 1) - EPOCH).days
+        days = (date(year + 1, 1, 1) - date(year, 1, 1)).days
+        bits = (self.bits >> start if start >= 0 else self.bits << -start) & ((1 << days) - 1)
+        return [bool(bits >> day & 1) for day in range(days)]
+
+
+def streak_summary(bitmaps: Dict[str, DayBitmap], today_key: str) -> Dict[str, Dict[str, Any]]:
+    """各条件的当前连续天数、最长连续天数和累计天数"""
+    return {
+        condition: {
+            "current": bitmap.current_streak(today_key),
+            "longest": bitmap.longest_streak(),
+            "total": bitmap.popcount()
+        }
+        for condition, bitmap in bitmaps.items()
+    }
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时段系数表
+
+将time_period_config预编译为一天1440分钟的逐分钟系数数组和前缀和，
+任意时间跨度的时段系数为按时长加权的平均值，O(1)查询。
+跨越多个时段（如从黄金时段进入疲劳时段）的行为按各时段的分钟数折算
+从历史学习到的高效时段（efficient_periods）可叠加到表中
+"""
+
+from datetime import datetime
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from src.scoring.efficiency import periods_to_ranges
+
+# 一天的分钟数
+MINUTES_PER_DAY = 1440
+
+# 未被任何时段覆盖的分钟使用的时段
+DEFAULT_PERIOD = "standard"
+
+# 学习到的高效时段
+EFFICIENT_PERIOD = "efficient"
+
+# 配置中没有efficient时段时的高效时段系数
+DEFAULT_EFFICIENT_COEFFICIENT = 1.2
+
+
+def to_absolute_minute(value: Any) -> float:
+    """将时间转换为绝对分钟数（自公元元年起，本地时间）
+
+    Args:
+        value: datetime对象或Unix时间戳
+
+    Returns:
+        绝对分钟数（保留秒的小数部分）
+    """
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value)
+    return (value.toordinal() * MINUTES_PER_DAY + value.hour * 60 + value.minute
+            + (value.second + value.microsecond / 1e6) / 60)
+
+
+class TimePeriodTable:
+    """逐分钟时段系数表
+
+    时段按配置顺序匹配，先匹配到的时段优先（与逐时段遍历的旧实现一致），
+    time_ranges为[开始小时, 结束小时)，允许小数小时。
+    学习到的高效时段只会提高系数：取高效时段系数与配置时段系数中较大者
+    """
+
+    def __init__(self, time_period_config: Dict[str, Any], efficient_periods: Optional[Sequence[str]] = None):
+        """预编译时段系数表
+
+        Args:
+            time_period_config: 时段配置
+            efficient_periods: 学习到的高效时段（"HH:MM-HH:MM"列表）
+        """
+        self.config = time_period_config
+        default = time_period_config.get(DEFAULT_PERIOD, {"coefficient": 1.0})
+
+        periods: List[Optional[str]] = [None] * MINUTES_PER_DAY
+        for period, config in time_period_config.items():
+            if period == DEFAULT_PERIOD:
+                continue
+            for start, end in config["time_ranges"]:
+                start_minute = max(0, int(round(start * 60)))
+                end_minute = min(MINUTES_PER_DAY, int(round(end * 60)))
+                for minute in range(start_minute, end_minute):
+                    if periods[minute] is None:
+                        periods[minute] = period
+
+        self.periods = [period or DEFAULT_PERIOD for period in periods]
+        self.coefficients = [
+            time_period_config[period]["coefficient"] if period in time_period_config else default["coefficient"]
+            for period in self.periods
+        ]
+
+        efficient_coefficient = time_period_config.get(EFFICIENT_PERIOD, {}).get(
+            "coefficient", DEFAULT_EFFICIENT_COEFFICIENT)
+        for start, end in periods_to_ranges(efficient_periods):
+            for minute in range(start, end):
+                minute %= MINUTES_PER_DAY
+                if efficient_coefficient > self.coefficients[minute]:
+                    self.coefficients[minute] = efficient_coefficient
+                    self.periods[minute] = EFFICIENT_PERIOD
+
+        self.prefix = list(accumulate(self.coefficients, initial=0.0))
+        self.day_total = self.prefix[-1]
+
+    def lookup(self, minute_of_day: int) -> Dict[str, Any]:
+        """查询某一分钟所在的时段
+
+        Args:
+            minute_of_day: 当天分钟数
+
+        Returns:
+            coefficient、period_type、description
+        """
+        minute = int(minute_of_day) % MINUTES_PER_DAY
+        period = self.periods[minute]
+        description = self.config.get(period, {}).get("description", "")
+        if period == EFFICIENT_PERIOD and not description:
+            description = "个人高效时段"
+        return {
+            "coefficient": self.coefficients[minute],
+            "period_type": period,
+            "description": description
+        }
+
+    def _cumulative(self, minute: float) -> float:
+        """从第0天0点到绝对分钟数minute的系数累计值（分钟内按比例折算）"""
+        days, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+        whole = int(minute_of_day)
+        total = days * self.day_total + self.prefix[whole]
+        if minute_of_day > whole:
+            total += (minute_of_day - whole) * self.coefficients[whole]
+        return total
+
+    def average(self, start_minute: float, end_minute: float) -> float:
+        """[start_minute, end_minute)的按时长加权平均系数
+
+        分钟数可以是当天分钟数，也可以是绝对分钟数，跨零点和跨多天的跨度同样适用
+
+        Args:
+            start_minute: 开始分钟
+            end_minute: 结束分钟
+
+        Returns:
+            平均系数；跨度为空时返回开始分钟所在时段的系数
+        """
+        if end_minute <= start_minute:
+            return self.coefficients[int(start_minute) % MINUTES_PER_DAY]
+        return (self._cumulative(end_minute) - self._cumulative(start_minute)) / (end_minute - start_minute)
+
+    def average_between(self, start: Any, end: Any) -> float:
+        """[start, end)的按时长加权平均系数
+
+        Args:
+            start: 开始时间（datetime或Unix时间戳）
+            end: 结束时间（datetime或Unix时间戳）
+
+        Returns:
+            平均系数
+        """
+        return self.average(to_absolute_minute(start), to_absolute_minute(end))
+
+
+def _freeze(value: Any) -> Any:
+    """将配置转换为可哈希的形式，作为编译缓存的键"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@lru_cache(maxsize=16)
+def _compile(frozen_config: Tuple, efficient_periods: Tuple[str, ...]) -> TimePeriodTable:
+    """按冻结后的配置编译时段系数表"""
+    return TimePeriodTable(_thaw(frozen_config), efficient_periods)
+
+
+def _thaw(frozen_config: Tuple) -> Dict[str, Any]:
+    """还原_freeze之前的时段配置（保持时段顺序）"""
+    return {period: dict(config) for period, config in frozen_config}
+
+
+def compile_time_periods(time_period_config: Dict[str, Any],
+                         efficient_periods: Optional[Sequence[str]] = None) -> TimePeriodTable:
+    """编译时段系数表（相同配置复用同一张表）
+
+    Args:
+        time_period_config: 时段配置
+        efficient_periods: 学习到的高效时段（"HH:MM-HH:MM"列表）
+
+    Returns:
+        时段系数表
+    """
+    frozen = tuple((period, _freeze(config)) for period, config in time_period_config.items())
+    return _compile(frozen, tuple(efficient_periods or ()))
@@ -117,6 +117,8 @@ DEFAULT_CONFIG = {
         "novice_bonus": 1.2,  # 新手奖励系数
         "enable_time_period_coeff": False,  # 是否启用时段系数
         "enable_lucky_coeff": False,  # 是否启用幸运系数
+        "base_luck_rate": 0.1,  # 基础幸运率
+        "fatigue_factor": 0.9,  # 幸运率随当日行为数的衰减因子
         "enable_mood_coeff": False  # 是否启用心情系数
     },
     "time_period_config": {
@@ -144,6 +146,11 @@ DEFAULT_CONFIG = {
             "time_ranges": [[0, 6]],
             "coefficient": 0.5,
             "description": "应睡眠时间"
+        },
+        "efficient": {
+            "time_ranges": [],  # 由历史记录学习，见user_state.efficient_periods
+            "coefficient": 1.2,
+            "description": "个人高效时段"
         }
     }
 }
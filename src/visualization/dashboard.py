@@ -7,9 +7,26 @@ CLI可视化仪表盘
 对应iOS的DashboardViewModel
 """
 
-from typing import List, Dict, Any
-from termcolor import colored
-from datetime import datetime, timedelta
+import json
+import time
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+from src.scoring.recovery import RecoveryIntegrator
+from src.scoring.replay import recovery_start_ts
+from src.utils.config import get_config
+from src.visualization.heatmap import quantile_thresholds, render_heatmap, render_years, legend
+from src.db.energy_series import series_summary
+from src.visualization.render import FrameBuffer, sparkline, star_rating, timeline_lines, heatmap_start_for_width
+from src.visualization.snapshot import (
+    DashboardSnapshot, DataVersionWatcher, load_dashboard_snapshot, refresh_dashboard_snapshot
+)
+
+# 监视模式的默认轮询间隔（秒）
+WATCH_INTERVAL = 1.0
+
+# 精力曲线面板的周期标签
+ENERGY_PERIOD_LABELS = {"day": "今日", "week": "本周", "month": "本月"}
+
 
 class Dashboard:
     """CLI可视化仪表盘类
@@ -28,43 +45,130 @@ class Dashboard:
             db: 数据库操作对象
         """
         self.db = db
+        self.recovery = RecoveryIntegrator(get_config("global_config"))
     
-    def show(self):
+    def show(self, frame: Optional[FrameBuffer] = None, clear: bool = False):
         """显示完整仪表盘
         
         对应iOS的DashboardViewController.viewDidLoad()
+        
+        所有面板的数据在一个读事务中一次读取，各面板只根据这份快照渲染到帧缓冲，
+        整帧一次写出
+        
+        Args:
+            frame: 帧缓冲，默认新建（输出到终端）
+            clear: 是否覆盖屏幕上的上一帧（原地重绘）
+        """
+        snapshot = load_dashboard_snapshot(self.db)
+        frame = frame or FrameBuffer()
+        self.render(frame, snapshot)
+        frame.flush(clear)
+    
+    def watch(self, interval: float = WATCH_INTERVAL, max_polls: Optional[int] = None):
+        """监视模式：数据库有新的提交时刷新并原地重绘，Ctrl+C退出
+        
+        每次轮询只读取PRAGMA data_version；有新提交时比较快照各部分的版本，
+        只重新读取变化的部分。没有写入时精力按闭式恢复积分向前推算，
+        只有显示的数值变化（或终端宽度变化）时才重绘
+        
+        Args:
+            interval: 轮询间隔（秒）
+            max_polls: 最多轮询次数，默认不限
         """
-        print("\n" + "="*60)
-        print(colored("TimeScore 仪表盘", "cyan", attrs=["bold"]))
-        print("="*60)
+        snapshot = load_dashboard_snapshot(self.db)
+        watcher = DataVersionWatcher(self.db.db_path)
+        shown = None
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                now = datetime.now()
+                if watcher.changed() or now.date() != snapshot.heatmap_end:
+                    snapshot, _ = refresh_dashboard_snapshot(self.db, snapshot, now=now)
+                else:
+                    snapshot = snapshot._replace(taken_at=now)
+                
+                frame = FrameBuffer()
+                key = (snapshot.versions, snapshot.heatmap_end, frame.width, self._energy_text(snapshot))
+                if key != shown:
+                    self.render(frame, snapshot)
+                    frame.line(f"监视中（每{interval:g}秒检查一次，Ctrl+C退出）  更新于 {now.strftime('%H:%M:%S')}")
+                    frame.flush(clear=True)
+                    shown = key
+                
+                polls += 1
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+    
+    def projected_energy(self, snapshot: DashboardSnapshot) -> Optional[float]:
+        """快照读取时刻的精力：上次记录后的精力加上至今的间隔恢复（闭式积分）
+        
+        Args:
+            snapshot: 仪表盘快照
+        
+        Returns:
+            精力值，没有用户状态时为None
+        """
+        energy = snapshot.user_state.get("current_energy")
+        if energy is None:
+            return None
+        last_record_ts = snapshot.user_state.get("last_record_ts")
+        if not last_record_ts or snapshot.taken_at.timestamp() <= last_record_ts:
+            return energy
+        return self.recovery.recover(energy, recovery_start_ts(last_record_ts, snapshot.taken_at.timestamp()),
+                                     snapshot.taken_at)
+    
+    def _energy_text(self, snapshot: DashboardSnapshot) -> str:
+        """精力显示文本"""
+        energy = self.projected_energy(snapshot)
+        if energy is None:
+            return "当前精力: -"
+        return f"当前精力: {energy:.1f}/{self.recovery.global_config['energy_max']}"
+    
+    def render(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
+        """把快照渲染到帧缓冲
+        
+        Args:
+            frame: 帧缓冲
+            snapshot: 仪表盘快照
+        """
+        frame.title("TimeScore 仪表盘", width=60)
         
         # 显示核心指标卡片
-        self._show_core_metrics()
+        self._show_core_metrics(frame, snapshot)
         
         # 显示时间轴
-        self._show_timeline()
+        self._show_timeline(frame, snapshot)
+        
+        # 显示精力曲线
+        self._show_energy_curve(frame, snapshot)
         
         # 显示热力图
-        self._show_heatmap()
+        self._show_heatmap(frame, snapshot)
+        
+        # 显示等级分布
+        self._show_level_distribution(frame, snapshot)
         
         # 显示RPG反馈
-        self._show_rpg_feedback()
+        self._show_rpg_feedback(frame, snapshot)
         
-        print("="*60 + "\n")
+        frame.rule("=", 60)
+        frame.line()
     
-    def _show_core_metrics(self):
+    def _show_core_metrics(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
         """显示核心指标卡片
         
         对应iOS的DashboardViewModel.showCoreMetrics()
-        """
-        # 获取总积分
-        total_score = self.db.get_total_score()
-        
-        # 获取用户状态
-        user_state = self.db.get_user_state()
         
-        # 获取今日记录
-        today_records = self.db.get_today_records()
+        Args:
+            frame: 帧缓冲
+            snapshot: 仪表盘快照
+        """
+        total_score = snapshot.total_score
+        user_state = snapshot.user_state
+        today_records = snapshot.today_records
         
         # 计算平均心情
         if today_records:
@@ -74,151 +178,159 @@ class Dashboard:
             avg_mood = 3
         
         # 计算效率比（如果有精力消耗数据）
-        total_energy_cost = sum(abs(record["energy_consume"]) for record in today_records if "energy_consume" in record)
+        total_energy_cost = sum(abs(record["energy_consume"] or 0) for record in today_records)
         if total_energy_cost > 0:
             efficiency = total_score / total_energy_cost
         else:
             efficiency = 0
         
         # 显示仪表盘卡片
-        print("┌──────────────┐ ┌──────────────┐")
-        print(f"│总积分: {total_score:.1f} │ │效率: {efficiency:.1f}/点 │")
-        print("└──────────────┘ └──────────────┘")
-        print("┌──────────────┐ ┌──────────────┐")
-        print(f"│连击: {user_state['combo_count']}次  │ │心情: {self._get_star_rating(avg_mood)} │")
-        print("└──────────────┘ └──────────────┘")
+        frame.extend([
+            "┌──────────────┐ ┌──────────────┐",
+            f"│总积分: {total_score:.1f} │ │效率: {efficiency:.1f}/点 │",
+            "└──────────────┘ └──────────────┘",
+            "┌──────────────┐ ┌──────────────┐",
+            f"│连击: {user_state.get('combo_count', 0)}次  │ │心情: {star_rating(avg_mood)} │",
+            "└──────────────┘ └──────────────┘",
+            f"可用余额: {snapshot.balance:.1f}（已兑换 {snapshot.redeemed_cost:.0f}）",
+            self._energy_text(snapshot)
+        ])
+        
+        # 显示高效时段（从历史记录学习）
+        efficient_periods = self._parse_efficient_periods(user_state.get("efficient_periods"))
+        if efficient_periods:
+            frame.line(f"高效时段: {', '.join(efficient_periods)}")
+    
+    def _parse_efficient_periods(self, value) -> List[str]:
+        """解析user_state中的高效时段（JSON文本或列表）
+        
+        Args:
+            value: efficient_periods字段值
+        
+        Returns:
+            高效时段列表
+        """
+        if not value:
+            return []
+        if isinstance(value, list):
+            return value
+        try:
+            return json.loads(value)
+        except (TypeError, ValueError):
+            return []
     
-    def _show_timeline(self, days: int = 1):
+    def _show_timeline(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
         """显示时间轴
         
         对应iOS的DashboardViewModel.showTimeline()
         
         Args:
-            days: 显示天数
+            frame: 帧缓冲
+            snapshot: 仪表盘快照（今日记录已按开始时间排序）
         """
-        print("\n" + "="*50)
-        print(colored("时间轴", "cyan", attrs=["bold"]))
-        print("="*50)
+        frame.title("时间轴")
         
-        # 获取今日记录
-        today_records = self.db.get_today_records()
-        
-        if not today_records:
-            print("今日暂无行为记录")
+        if not snapshot.today_records:
+            frame.line("今日暂无行为记录")
             return
         
-        # 按时间排序
-        sorted_records = sorted(today_records, key=lambda x: x["start_ts"])
-        
-        for record in sorted_records:
-            # 格式化时间
-            start_time = datetime.fromtimestamp(record["start_ts"]).strftime("%H:%M")
-            end_time = datetime.fromtimestamp(record["end_ts"]).strftime("%H:%M")
-            
-            # 等级颜色
-            level_color_map = {
-                "S": "green",
-                "A": "blue",
-                "B": "yellow",
-                "C": "magenta",
-                "D": "red",
-                "R": "cyan"
-            }
-            level_color = level_color_map.get(record["level"], "white")
-            
-            # 生成进度条
-            bar_length = min(20, int(record["duration"] / 5))  # 每5分钟一个字符
-            bar = "■" * bar_length
-            
-            # 生成星级
-            star_rating = self._get_star_rating(record["mood"])
-            
-            # 显示记录
-            print(f"{start_time}-{end_time} [{colored(bar, level_color)}] {record['level']}级 "
-                  f"积分:{record['final_score']:.0f} 精力:{record['energy_consume']:+.1f} "
-                  f"心情:{star_rating}")
+        frame.extend(timeline_lines(snapshot.today_records, frame.styles, frame.width))
     
-    def _show_heatmap(self, days: int = 30):
-        """显示热力图
+    def _show_energy_curve(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
+        """显示今日、本周、本月的精力迷你折线图（精力时间序列降采样）
+        
+        Args:
+            frame: 帧缓冲
+            snapshot: 仪表盘快照
+        """
+        frame.title("精力曲线")
+        
+        energy_max = self.recovery.global_config["energy_max"]
+        for period, values in snapshot.energy_series.items():
+            summary = series_summary(values)
+            if summary is None:
+                frame.line(f"{ENERGY_PERIOD_LABELS[period]}: 暂无数据")
+                continue
+            low, average, high = summary
+            # 标签和统计约占24列
+            line = sparkline(values, energy_max, max(8, frame.width - 24))
+            frame.line(f"{ENERGY_PERIOD_LABELS[period]} {frame.styles.paint(line, 'cyan')} "
+                       f"低{low:.0f} 均{average:.0f} 高{high:.0f}")
+    
+    def _show_heatmap(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
+        """显示热力图（快照中的热力图序列，终端较窄时只显示最近的若干周）
         
         对应iOS的DashboardViewModel.showHeatmap()
         
         Args:
-            days: 显示天数
+            frame: 帧缓冲
+            snapshot: 仪表盘快照
         """
-        print("\n" + "="*50)
-        print(colored("热力图", "cyan", attrs=["bold"]))
-        print("="*50)
-        
-        # 获取过去days天的日期
-        today = datetime.now().date()
-        dates = [today - timedelta(days=i) for i in range(days-1, -1, -1)]
-        
-        # 简化处理，实际应该从数据库获取每日积分
-        # 这里使用模拟数据
-        daily_scores = {}
-        for date in dates:
-            # 计算当天的时间戳范围
-            start_ts = int(datetime.combine(date, datetime.min.time()).timestamp())
-            end_ts = int(datetime.combine(date, datetime.max.time()).timestamp())
-            
-            # 查询当天的所有记录
-            self.db.cursor.execute(
-                "SELECT SUM(final_score) FROM core_behavior WHERE start_ts BETWEEN ? AND ?",
-                (start_ts, end_ts)
-            )
-            result = self.db.cursor.fetchone()[0]
-            daily_scores[date] = result or 0
-        
-        # 显示月份
-        print(f"{today.strftime('%b %Y')}")
-        print("S M T W T F S")
-        
-        # 生成热力图网格
-        week = []
-        for date in dates:
-            day = date.day
-            score = daily_scores[date]
-            
-            # 根据分数确定颜色
-            if score < 50:
-                color = "red"
-                char = "□"
-            elif score < 100:
-                color = "yellow"
-                char = "■"
-            elif score < 200:
-                color = "green"
-                char = "■"
-            else:
-                color = "green"
-                char = "■■"
-            
-            week.append(colored(f"{day:2d}{char}", color))
-            
-            # 每周换行
-            if date.weekday() == 6:  # 周日
-                print(" ".join(week))
-                week = []
-        
-        # 打印剩余的
-        if week:
-            print(" ".join(week))
+        frame.title("热力图")
+        
+        thresholds = quantile_thresholds(list(snapshot.daily_scores.values()))
+        start = heatmap_start_for_width(snapshot.heatmap_start, snapshot.heatmap_end, frame.width)
+        frame.extend(render_heatmap(snapshot.daily_scores, start, snapshot.heatmap_end,
+                                    thresholds, frame.styles.heat_cell))
+        frame.line(legend(thresholds, frame.styles.heat_cell))
     
-    def _show_rpg_feedback(self):
+    def _show_level_distribution(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
+        """显示等级分布（次数、时长、积分，以及时长的中位数、P90、P99）
+        
+        Args:
+            frame: 帧缓冲
+            snapshot: 仪表盘快照
+        """
+        frame.title("等级分布")
+        
+        distribution = snapshot.level_distribution
+        total_count = sum(item["count"] for item in distribution.values())
+        if not total_count:
+            frame.line("暂无数据可分析")
+            return
+        for level in ("S", "A", "B", "C", "D", "R"):
+            item = distribution.get(level)
+            if not item:
+                continue
+            percent = item["count"] / total_count * 100
+            bar = frame.styles.level(level, "■" * int(percent / 5))
+            frame.line(f"{level}级: {bar} {percent:.1f}%  {item['count']}次 {item['minutes']}分钟 {item['score']:.0f}分")
+            quantiles = snapshot.duration_percentiles.get(level)
+            if quantiles:
+                frame.line("      时长 " + " / ".join(f"P{fraction * 100:g}:{value:.0f}" for fraction, value in quantiles.items()) + " 分钟")
+    
+    def show_heatmap_years(self, years: int = 3):
+        """显示多年热力图（每年一块，分档统一）
+        
+        Args:
+            years: 显示的年数（含今年）
+        """
+        frame = FrameBuffer()
+        frame.title("多年热力图")
+        
+        this_year = datetime.now().year
+        year_list = list(range(this_year - years + 1, this_year + 1))
+        daily_scores = self.db.get_daily_scores(
+            int(datetime(year_list[0], 1, 1).timestamp()),
+            int(datetime(this_year, 12, 31, 23, 59, 59).timestamp())
+        )
+        frame.extend(render_years(daily_scores, year_list, frame.styles.heat_cell))
+        frame.line(legend(quantile_thresholds(list(daily_scores.values())), frame.styles.heat_cell))
+        frame.flush()
+    
+    def _show_rpg_feedback(self, frame: FrameBuffer, snapshot: DashboardSnapshot):
         """显示RPG反馈
         
         对应iOS的DashboardViewModel.showRPGFeedback()
-        """
-        print("\n" + "="*50)
-        print(colored("RPG反馈", "cyan", attrs=["bold"]))
-        print("="*50)
         
-        # 获取总积分
-        total_score = self.db.get_total_score()
+        Args:
+            frame: 帧缓冲
+            snapshot: 仪表盘快照
+        """
+        frame.title("RPG反馈")
         
-        # 获取用户状态
-        user_state = self.db.get_user_state()
+        total_score = snapshot.total_score
+        combo_count = snapshot.user_state.get("combo_count", 0)
         
         # 计算等级（每1000分升一级）
         level = int(total_score / 1000) + 1
@@ -230,20 +342,22 @@ class Dashboard:
         xp_bar = "■" * filled_bars + "□" * (xp_bar_length - filled_bars)
         
         # 显示RPG信息
-        print(f"角色: 时间大师 Lv.{level}")
-        print(f"XP: [{xp_bar}] {xp}/1000")
-        print("属性:")
-        print(f"- 专注: Lv.{min(5, level)} ({'■' * min(5, level)})")
-        print(f"- 恢复: Lv.{min(5, int(level/2))} ({'■' * min(5, int(level/2))})")
-        print(f"- 耐力: Lv.{min(5, int(level/3))} ({'■' * min(5, int(level/3))})")
+        frame.extend([
+            f"角色: 时间大师 Lv.{level}",
+            f"XP: [{xp_bar}] {xp}/1000",
+            "属性:",
+            f"- 专注: Lv.{min(5, level)} ({'■' * min(5, level)})",
+            f"- 恢复: Lv.{min(5, int(level/2))} ({'■' * min(5, int(level/2))})",
+            f"- 耐力: Lv.{min(5, int(level/3))} ({'■' * min(5, int(level/3))})"
+        ])
         
         # 装备（基于连击数）
-        if user_state['combo_count'] >= 3:
-            print("装备: 连击剑 (解锁于3连击)")
-        elif user_state['combo_count'] >= 1:
-            print("装备: 入门装备")
+        if combo_count >= 3:
+            frame.line("装备: 连击剑 (解锁于3连击)")
+        elif combo_count >= 1:
+            frame.line("装备: 入门装备")
         else:
-            print("装备: 无")
+            frame.line("装备: 无")
     
     def _get_star_rating(self, mood: int) -> str:
         """根据心情值生成星级评分
@@ -252,10 +366,8 @@ class Dashboard:
         
         Args:
             mood: 心情值（1-5）
-            
+        
         Returns:
             星级评分字符串
         """
-        full_star = "★"
-        empty_star = "☆"
-        return full_star * mood + empty_star * (5 - mood)
+        return star_rating(mood)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日历热力图
+
+按GitHub贡献图的方式排列：每列一周（周日开始），每行一个星期几，
+列的顶部标注月份。每日得分由一次分组查询得到，
+颜色分档按所有有得分日期的分位数计算一次，整年渲染只是一次遍历
+"""
+
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 分档字符：0档为没有得分，1～4档按分位数由低到高
+BUCKET_CHARS = ("·", "░", "▒", "▓", "█")
+
+# 分档颜色（ANSI颜色名，None为不着色）
+BUCKET_COLORS = (None, "red", "yellow", "green", "green")
+
+# 星期行标签（周日开始）
+WEEKDAY_LABELS = ("日", "一", "二", "三", "四", "五", "六")
+
+MONTH_LABELS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def quantile_thresholds(values: Sequence[float], buckets: int = len(BUCKET_CHARS) - 1) -> List[float]:
+    """正得分的分位数分档阈值
+
+    Args:
+        values: 每日得分
+        buckets: 有得分日期的档数
+
+    Returns:
+        buckets - 1个升序阈值，得分不低于第i个阈值时至少为第i + 2档
+    """
+    positive = sorted(value for value in values if value > 0)
+    if not positive:
+        return []
+    return [positive[min(len(positive) - 1, len(positive) * i // buckets)] for i in range(1, buckets)]
+
+
+def bucket_of(score: float, thresholds: Sequence[float]) -> int:
+    """得分所在的档（0为没有得分）"""
+    if score <= 0:
+        return 0
+    bucket = 1
+    for threshold in thresholds:
+        if score >= threshold:
+            bucket += 1
+    return bucket
+
+
+def _week_start(day: date) -> date:
+    """day所在周的周日"""
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def render_heatmap(daily_scores: Dict[str, float], start: date, end: date,
+                   thresholds: Optional[Sequence[float]] = None,
+                   colorize: Optional[Callable[[str, int], str]] = None) -> List[str]:
+    """渲染[start, end]的热力图
+
+    Args:
+        daily_scores: {日期键: 当日得分}
+        start: 开始日期
+        end: 结束日期
+        thresholds: 分档阈值，不指定时按daily_scores计算
+        colorize: 着色函数(字符, 档) -> 字符串，不指定时不着色
+
+    Returns:
+        输出行：月份标签行和7个星期行
+    """
+    if thresholds is None:
+        thresholds = quantile_thresholds(list(daily_scores.values()))
+    first_week = _week_start(start)
+    weeks = (end - first_week).days // 7 + 1
+
+    # 月份标签：写在该月第一天所在的列上，放不下时跳过
+    month_row = [" "] * (weeks + 3)
+    day = date(start.year, start.month, 1)
+    while day <= end:
+        column = max(0, (day - first_week).days // 7)
+        label = MONTH_LABELS[day.month - 1]
+        if all(cell == " " for cell in month_row[max(0, column - 1):column + len(label)]):
+            month_row[column:column + len(label)] = list(label)
+        day = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+    rows = [[] for _ in range(7)]
+    for column in range(weeks):
+        week_start = first_week + timedelta(days=column * 7)
+        for weekday in range(7):
+            day = week_start + timedelta(days=weekday)
+            if day < start or day > end:
+                rows[weekday].append(" ")
+                continue
+            bucket = bucket_of(daily_scores.get(day.strftime("%Y-%m-%d"), 0), thresholds)
+            char = BUCKET_CHARS[bucket]
+            rows[weekday].append(colorize(char, bucket) if colorize else char)
+
+    lines = ["   " + "".join(month_row).rstrip()]
+    lines.extend(f"{WEEKDAY_LABELS[weekday]} " + "".join(cells) for weekday, cells in enumerate(rows))
+    return lines
+
+
+def render_years(daily_scores: Dict[str, float], years: Sequence[int],
+                 colorize: Optional[Callable[[str, int], str]] = None) -> List[str]:
+    """多年热力图：每年一块（今年只到今天），分档阈值按所有年份统一计算
+
+    Args:
+        daily_scores: {日期键: 当日得分}
+        years: 年份列表
+        colorize: 着色函数
+
+    Returns:
+        输出行
+    """
+    thresholds = quantile_thresholds(list(daily_scores.values()))
+    lines = []
+    for year in years:
+        year_scores = [score for key, score in daily_scores.items() if key.startswith(f"{year}-")]
+        active_days = sum(1 for score in year_scores if score > 0)
+        lines.append(f"{year}年  有得分 {active_days} 天  合计 {sum(year_scores):.0f} 分")
+        year_end = min(date(year, 12, 31), date.today())
+        lines.extend(render_heatmap(daily_scores, date(year, 1, 1), year_end, thresholds, colorize))
+        lines.append("")
+    return lines
+
+
+def legend(thresholds: Sequence[float], colorize: Optional[Callable[[str, int], str]] = None) -> str:
+    """分档图例"""
+    cells = []
+    for bucket, char in enumerate(BUCKET_CHARS):
+        cells.append(colorize(char, bucket) if colorize else char)
+    bounds = " / ".join(f"{threshold:.0f}" for threshold in thresholds)
+    return f"少 {' '.join(cells)} 多" + (f"  (分档: {bounds})" if bounds else "")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML历史报告
+
+生成不依赖外部资源的单个HTML文件（内联SVG和CSS）：概要、逐年热力图、精力曲线、
+等级分布和心愿时间线。报告由生成器按块产出并逐块写入文件：
+热力图每年一次分组查询（每日汇总表），精力曲线用流式读取的行为记录逐条重放，
+每天只保留当天的最低和结束精力，因此多年历史的内存占用与记录数无关
+"""
+
+import html
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+from src.db.rollup import RollupCube
+from src.scoring.replay import StateReplayer, day_key_of, day_start_ts, next_day_key
+from src.utils.config import get_config
+from src.visualization.heatmap import MONTH_LABELS, WEEKDAY_LABELS, bucket_of, quantile_thresholds
+from src.visualization.report import ReportEngine
+
+# 热力图分档颜色（0档为没有得分）
+BUCKET_FILLS = ("#ebedf0", "#9be9a8", "#40c463", "#30a14e", "#216e39")
+
+# 等级颜色
+LEVEL_FILLS = {"S": "#2da44e", "A": "#0969da", "B": "#bf8700", "C": "#8250df", "D": "#cf222e", "R": "#1b7c83"}
+
+# 热力图单元格边长和间距（像素）
+CELL = 11
+GAP = 2
+
+# 精力曲线、心愿时间线的绘图尺寸（像素）
+CHART_WIDTH = 900
+CHART_HEIGHT = 220
+CHART_MARGIN = 30
+
+# 精力曲线每多少个点输出一块
+POINTS_PER_CHUNK = 200
+
+STYLE = """
+body { font-family: -apple-system, "PingFang SC", "Microsoft YaHei", sans-serif; margin: 24px; color: #24292f; }
+h1 { font-size: 22px; } h2 { font-size: 17px; margin-top: 32px; border-bottom: 1px solid #d0d7de; }
+table { border-collapse: collapse; } td, th { padding: 4px 10px; border-bottom: 1px solid #eaeef2; text-align: left; }
+svg text { font-size: 10px; fill: #57606a; }
+.legend span { display: inline-block; width: 11px; height: 11px; margin: 0 2px; vertical-align: middle; }
+"""
+
+
+class HtmlReportWriter:
+    """HTML历史报告生成类"""
+
+    def __init__(self, storage, years: int = 5, today: Optional[date] = None):
+        """初始化报告
+
+        Args:
+            storage: 存储引擎（StorageEngine）
+            years: 报告包含的年数（含今年）
+            today: 报告截止日期，默认为今天
+        """
+        self.storage = storage
+        self.today = today or date.today()
+        self.years = list(range(self.today.year - years + 1, self.today.year + 1))
+        self.start = date(self.years[0], 1, 1)
+        # 时间轴范围：报告开始日0点到截止日次日0点
+        self.range_start = day_start_ts(self.start.strftime("%Y-%m-%d"))
+        self.range_end = day_start_ts(next_day_key(self.today.strftime("%Y-%m-%d")))
+        self.replayer = StateReplayer(get_config("global_config"))
+
+    def write(self, stream: TextIO) -> int:
+        """逐块写入报告
+
+        Returns:
+            写入的字符数
+        """
+        written = 0
+        for chunk in self.chunks():
+            stream.write(chunk)
+            written += len(chunk)
+        return written
+
+    def chunks(self) -> Iterator[str]:
+        """按块产出报告"""
+        title = f"OneDay 历史报告 {self.start.strftime('%Y-%m-%d')} ~ {self.today.strftime('%Y-%m-%d')}"
+        yield (f'<!DOCTYPE html>\n<html lang="zh-CN"><head><meta charset="utf-8">'
+               f'<title>{html.escape(title)}</title><style>{STYLE}</style></head><body>\n'
+               f'<h1>{html.escape(title)}</h1>\n')
+        yield from self._summary()
+        yield from self._heatmaps()
+        yield from self._energy_curve()
+        yield from self._level_distribution()
+        yield from self._wish_timeline()
+        yield f'<p><small>生成于 {datetime.now().strftime("%Y-%m-%d %H:%M")}</small></p>\n</body></html>\n'
+
+    # ----------------- 概要 -----------------
+    def _summary(self) -> Iterator[str]:
+        """概要表（报告引擎）"""
+        report = ReportEngine(self.storage.conn).report((self.start, self.today))
+        totals = report["totals"]
+        efficiency = report["efficiency"]["score_per_energy"]
+        rows = [
+            ("行为次数", f"{totals['count']}"),
+            ("投入时长", f"{totals['minutes'] / 60:.1f} 小时"),
+            ("总积分", f"{totals['score']:.0f}"),
+            ("有记录的天数", f"{totals['active_days']} / {report['days']}"),
+            ("精力效率", f"{efficiency:.2f} 分/点" if efficiency is not None else "-"),
+            ("最长连续正向天数", f"{report['streaks']['positive']['longest']}"),
+            ("积分余额", f"{report['wishes']['balance']:.0f}")
+        ]
+        yield "<h2>概要</h2>\n<table>\n"
+        yield "".join(f"<tr><th>{name}</th><td>{html.escape(value)}</td></tr>\n" for name, value in rows)
+        if report["top_behaviors"]:
+            top = "、".join(f"{html.escape(item['name'])}（{item['score']:.0f}分）" for item in report["top_behaviors"])
+            yield f"<tr><th>得分最高的行为</th><td>{top}</td></tr>\n"
+        yield "</table>\n"
+
+    # ----------------- 热力图 -----------------
+    def _daily_scores(self, start: date, end: date) -> Dict[str, float]:
+        """[start, end]内每天的总得分（每日汇总表分组查询）"""
+        rows = self.storage.conn.execute('''
+            SELECT day_key, TOTAL(score) FROM rollup_day WHERE day_key BETWEEN ? AND ? GROUP BY day_key
+        ''', (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")))
+        return dict(rows.fetchall())
+
+    def _heatmaps(self) -> Iterator[str]:
+        """逐年热力图（分档阈值按全部年份统一计算）"""
+        all_scores = self.storage.conn.execute('''
+            SELECT TOTAL(score) FROM rollup_day WHERE day_key BETWEEN ? AND ? GROUP BY day_key
+        ''', (self.start.strftime("%Y-%m-%d"), self.today.strftime("%Y-%m-%d"))).fetchall()
+        thresholds = quantile_thresholds([row[0] for row in all_scores])
+        legend = "".join(f'<span style="background:{fill}"></span>' for fill in BUCKET_FILLS)
+        yield f'<h2>热力图</h2>\n<p class="legend">少 {legend} 多</p>\n'
+        for year in reversed(self.years):
+            end = min(date(year, 12, 31), self.today)
+            yield self._year_svg(year, end, self._daily_scores(date(year, 1, 1), end), thresholds)
+
+    def _year_svg(self, year: int, end: date, daily_scores: Dict[str, float], thresholds: List[float]) -> str:
+        """一年的热力图SVG（每列一周，周日开始）"""
+        first = date(year, 1, 1)
+        first_week = first - timedelta(days=(first.weekday() + 1) % 7)
+        step = CELL + GAP
+        left, top = 24, 16
+        weeks = (date(year, 12, 31) - first_week).days // 7 + 1
+        parts = [f'<h3>{year}年 · 有得分 {sum(1 for score in daily_scores.values() if score > 0)} 天 · '
+                 f'合计 {sum(daily_scores.values()):.0f} 分</h3>\n'
+                 f'<svg width="{left + weeks * step}" height="{top + 7 * step}" role="img">']
+        for month in range(1, 13):
+            column = (date(year, month, 1) - first_week).days // 7
+            parts.append(f'<text x="{left + column * step}" y="10">{MONTH_LABELS[month - 1]}</text>')
+        for weekday in (1, 3, 5):
+            parts.append(f'<text x="0" y="{top + weekday * step + CELL - 2}">{WEEKDAY_LABELS[weekday]}</text>')
+        day = first
+        while day <= end:
+            offset = (day - first_week).days
+            day_key = day.strftime("%Y-%m-%d")
+            score = daily_scores.get(day_key, 0.0)
+            fill = BUCKET_FILLS[bucket_of(score, thresholds)]
+            parts.append(f'<rect x="{left + offset // 7 * step}" y="{top + offset % 7 * step}" width="{CELL}" '
+                         f'height="{CELL}" rx="2" fill="{fill}"><title>{day_key}: {score:.0f}分</title></rect>')
+            day += timedelta(days=1)
+        parts.append('</svg>\n')
+        return "".join(parts)
+
+    # ----------------- 精力曲线 -----------------
+    def _x(self, ts: float) -> float:
+        """时间戳在时间轴上的横坐标"""
+        return CHART_MARGIN + (ts - self.range_start) / (self.range_end - self.range_start) * (CHART_WIDTH - 2 * CHART_MARGIN)
+
+    def _daily_energy(self) -> Iterator[Dict[str, Any]]:
+        """流式重放行为记录，逐日产出当天的最低精力和结束精力（从报告开始前最近的快照出发）"""
+        start_key = self.start.strftime("%Y-%m-%d")
+        snapshot = self.storage.get_latest_snapshot(start_key)
+        if snapshot is None:
+            state, from_ts = StateReplayer.initial_state(), 0
+        else:
+            state, from_ts = StateReplayer.from_snapshot(snapshot), day_start_ts(next_day_key(snapshot["day_key"]))
+        until_ts = self.range_end - 1
+
+        current = None
+        for record in self.storage.iter_records_between(from_ts, until_ts):
+            day_key = day_key_of(record["start_ts"])
+            energy = self.replayer.begin_record(state, record)
+            self.replayer.finish_record(state, record, energy)
+            if day_key < start_key:
+                continue
+            if current is None or current["day_key"] != day_key:
+                if current is not None:
+                    yield current
+                current = {"day_key": day_key, "ts": day_start_ts(day_key), "low": energy, "end": state["energy"]}
+            current["low"] = min(current["low"], energy, state["energy"])
+            current["end"] = state["energy"]
+        if current is not None:
+            yield current
+
+    def _energy_curve(self) -> Iterator[str]:
+        """精力曲线SVG：每天的结束精力连线，最低精力画为浅色竖线"""
+        energy_max = self.replayer.global_config["energy_max"]
+        height = CHART_HEIGHT - 2 * CHART_MARGIN
+
+        def y(value: float) -> float:
+            return CHART_MARGIN + (1 - value / energy_max) * height
+
+        yield (f'<h2>精力曲线</h2>\n<svg width="{CHART_WIDTH}" height="{CHART_HEIGHT}" role="img">'
+               f'<line x1="{CHART_MARGIN}" y1="{y(0):.1f}" x2="{CHART_WIDTH - CHART_MARGIN}" y2="{y(0):.1f}" stroke="#d0d7de"/>'
+               f'<text x="2" y="{y(energy_max) + 4:.1f}">{energy_max}</text><text x="2" y="{y(0) + 4:.1f}">0</text>')
+        yield from self._axis_labels(CHART_HEIGHT - 8)
+
+        lows, points = [], []
+        for day in self._daily_energy():
+            x = self._x(day["ts"] + 43200)
+            lows.append(f'M{x:.1f} {y(day["low"]):.1f}V{y(day["end"]):.1f}')
+            points.append(f'{x:.1f},{y(day["end"]):.1f}')
+            if len(points) >= POINTS_PER_CHUNK:
+                yield (f'<path d="{"".join(lows)}" stroke="#d8b9ff" stroke-width="1"/>'
+                       f'<polyline points="{" ".join(points)}" fill="none" stroke="#8250df" stroke-width="1.2"/>')
+                # 下一块从本块最后一点接续
+                lows, points = [], points[-1:]
+        if len(points) > 1 or lows:
+            yield (f'<path d="{"".join(lows)}" stroke="#d8b9ff" stroke-width="1"/>'
+                   f'<polyline points="{" ".join(points)}" fill="none" stroke="#8250df" stroke-width="1.2"/>')
+        yield '</svg>\n'
+
+    def _axis_labels(self, baseline: float) -> Iterator[str]:
+        """时间轴的年份标签"""
+        yield "".join(f'<text x="{self._x(day_start_ts(f"{year}-01-01")):.1f}" y="{baseline}">{year}</text>'
+                      for year in self.years)
+
+    # ----------------- 等级分布 -----------------
+    def _level_distribution(self) -> Iterator[str]:
+        """各等级的时长和积分（汇总立方体）"""
+        rows = RollupCube(self.storage.conn).slice(by=("level",), month_from=self.start.strftime("%Y-%m"))
+        rows = [row for row in rows if row["count"]]
+        yield "<h2>等级分布</h2>\n"
+        if not rows:
+            yield "<p>暂无数据</p>\n"
+            return
+        max_minutes = max(row["minutes"] for row in rows) or 1
+        bar_width = CHART_WIDTH - 260
+        parts = [f'<svg width="{CHART_WIDTH}" height="{len(rows) * 26 + 10}" role="img">']
+        for index, row in enumerate(sorted(rows, key=lambda item: "SABCDR".find(item["level"]))):
+            top = 8 + index * 26
+            width = row["minutes"] / max_minutes * bar_width
+            parts.append(f'<text x="4" y="{top + 13}" style="font-size:12px">{html.escape(row["level"])}级</text>'
+                         f'<rect x="40" y="{top}" width="{width:.1f}" height="18" rx="3" '
+                         f'fill="{LEVEL_FILLS.get(row["level"], "#57606a")}"/>'
+                         f'<text x="{48 + width:.1f}" y="{top + 13}" style="font-size:11px">'
+                         f'{row["count"]}次 · {row["minutes"] / 60:.1f}小时 · {row["score"]:.0f}分</text>')
+        parts.append('</svg>\n')
+        yield "".join(parts)
+
+    # ----------------- 心愿时间线 -----------------
+    def _wish_timeline(self) -> Iterator[str]:
+        """心愿的创建和兑换时间（空心为创建，实心为兑换）"""
+        wishes = self.storage.conn.execute('''
+            SELECT name, cost, status, created_at, redeemed_at FROM wishes WHERE user_id = 1 ORDER BY created_at
+        ''').fetchall()
+        yield "<h2>心愿时间线</h2>\n"
+        if not wishes:
+            yield "<p>暂无心愿</p>\n"
+            return
+        range_start = self.range_start
+        row_height = 22
+        parts = [f'<svg width="{CHART_WIDTH}" height="{len(wishes) * row_height + 30}" role="img">']
+        parts.extend(self._axis_labels(len(wishes) * row_height + 24))
+        for index, (name, cost, status, created_at, redeemed_at) in enumerate(wishes):
+            top = 10 + index * row_height
+            created_x = self._x(max(created_at or range_start, range_start))
+            label = f'{html.escape(name)}（{cost}）'
+            if status == "redeemed" and redeemed_at:
+                redeemed_x = self._x(max(redeemed_at, range_start))
+                parts.append(f'<line x1="{created_x:.1f}" y1="{top}" x2="{redeemed_x:.1f}" y2="{top}" stroke="#2da44e" stroke-width="2"/>'
+                             f'<circle cx="{redeemed_x:.1f}" cy="{top}" r="4" fill="#2da44e">'
+                             f'<title>{label} 兑换于 {datetime.fromtimestamp(redeemed_at).strftime("%Y-%m-%d")}</title></circle>')
+                end_x = redeemed_x
+            else:
+                end_x = created_x
+            parts.append(f'<circle cx="{created_x:.1f}" cy="{top}" r="4" fill="#fff" stroke="#0969da">'
+                         f'<title>{label} 创建于 {datetime.fromtimestamp(created_at or range_start).strftime("%Y-%m-%d")}</title></circle>'
+                         f'<text x="{min(end_x + 8, CHART_WIDTH - 160):.1f}" y="{top + 4}">{label}</text>')
+        parts.append('</svg>\n')
+        yield "".join(parts)
+
+
+def write_html_report(storage, path: str, years: int = 5) -> int:
+    """把最近years年的历史报告写入path
+
+    Returns:
+        写入的字符数
+    """
+    with open(path, "w", encoding="utf-8") as stream:
+        return HtmlReportWriter(storage, years).write(stream)
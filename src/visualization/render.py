@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+终端渲染层
+
+面板把输出行写入内存中的帧缓冲，整帧拼接后一次sys.stdout.write输出，
+避免逐行print造成的闪烁。ANSI样式前缀按(颜色, 属性)预先计算并缓存，
+等级、热力图分档等反复出现的着色字形也只生成一次。
+帧宽度取终端宽度，分隔线、进度条和热力图按宽度收缩
+"""
+
+import os
+import shutil
+import sys
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, TextIO, Tuple
+
+from src.visualization.heatmap import BUCKET_COLORS
+
+# ANSI颜色和属性
+ANSI_COLORS = {
+    "grey": 30, "red": 31, "green": 32, "yellow": 33,
+    "blue": 34, "magenta": 35, "cyan": 36, "white": 37
+}
+ANSI_ATTRS = {"bold": 1, "dark": 2, "underline": 4, "blink": 5, "reverse": 7, "concealed": 8}
+RESET = "\033[0m"
+
+# 原地重绘：光标移到左上角，每行清除行尾残留，最后清除帧以下的旧内容
+CURSOR_HOME = "\033[H"
+CLEAR_LINE = "\033[K"
+CLEAR_BELOW = "\033[J"
+
+# 等级颜色
+LEVEL_COLORS = {"S": "green", "A": "blue", "B": "yellow", "C": "magenta", "D": "red", "R": "cyan"}
+
+# 面板分隔线的最大宽度
+RULE_WIDTH = 50
+
+# 时间轴进度条的最大长度（每5分钟一个字符）
+TIMELINE_BAR_MAX = 20
+
+# 迷你折线图的八级字符
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def color_enabled(stream: TextIO) -> bool:
+    """输出流是否使用颜色：遵循NO_COLOR / FORCE_COLOR，否则只在终端中着色"""
+    if os.environ.get("NO_COLOR"):
+        return False
+    if os.environ.get("FORCE_COLOR"):
+        return True
+    return hasattr(stream, "isatty") and stream.isatty()
+
+
+def display_width(text: str) -> int:
+    """文本在终端中占用的列数（中文等全角字符占两列，不含ANSI序列）"""
+    width = 0
+    in_escape = False
+    for char in text:
+        if in_escape:
+            in_escape = char != "m"
+        elif char == "\033":
+            in_escape = True
+        else:
+            width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+    return width
+
+
+class Styles:
+    """ANSI样式缓存类"""
+
+    def __init__(self, enabled: bool = True):
+        """初始化样式缓存
+
+        Args:
+            enabled: 是否输出ANSI颜色
+        """
+        self.enabled = enabled
+        self._prefixes: Dict[Tuple[Optional[str], Tuple[str, ...]], str] = {}
+        self._glyphs: Dict[Tuple[str, Optional[str], Tuple[str, ...]], str] = {}
+
+    def prefix(self, color: Optional[str], attrs: Sequence[str] = ()) -> str:
+        """(颜色, 属性)对应的ANSI前缀（缓存）"""
+        key = (color, tuple(attrs))
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            codes = [ANSI_ATTRS[attr] for attr in attrs]
+            if color in ANSI_COLORS:
+                codes.append(ANSI_COLORS[color])
+            prefix = f"\033[{';'.join(map(str, codes))}m" if codes and self.enabled else ""
+            self._prefixes[key] = prefix
+        return prefix
+
+    def paint(self, text: str, color: Optional[str] = None, attrs: Sequence[str] = ()) -> str:
+        """着色任意文本（只缓存前缀）"""
+        prefix = self.prefix(color, attrs)
+        return f"{prefix}{text}{RESET}" if prefix else text
+
+    def glyph(self, text: str, color: Optional[str] = None, attrs: Sequence[str] = ()) -> str:
+        """着色反复出现的字形（整段缓存）"""
+        key = (text, color, tuple(attrs))
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            glyph = self._glyphs[key] = self.paint(text, color, attrs)
+        return glyph
+
+    def level(self, level: str, text: Optional[str] = None) -> str:
+        """按等级着色（默认着色等级字母本身）"""
+        return self.glyph(level if text is None else text, LEVEL_COLORS.get(level, "white"))
+
+    def heat_cell(self, char: str, bucket: int) -> str:
+        """热力图单元格着色（可直接作为render_heatmap的colorize）"""
+        return self.glyph(char, BUCKET_COLORS[bucket])
+
+
+class FrameBuffer:
+    """帧缓冲类：收集一帧的输出行，flush时一次写出"""
+
+    def __init__(self, styles: Optional[Styles] = None, stream: Optional[TextIO] = None,
+                 width: Optional[int] = None):
+        """初始化帧缓冲
+
+        Args:
+            styles: 样式缓存，默认按输出流是否为终端决定是否着色
+            stream: 输出流，默认为sys.stdout
+            width: 帧宽度，默认为终端宽度
+        """
+        self.stream = stream or sys.stdout
+        self.styles = styles or Styles(color_enabled(self.stream))
+        self.width = width or shutil.get_terminal_size((80, 24)).columns
+        self.lines: List[str] = []
+
+    @property
+    def rule_width(self) -> int:
+        """分隔线宽度"""
+        return min(RULE_WIDTH, self.width)
+
+    def line(self, text: str = "") -> None:
+        """追加一行"""
+        self.lines.append(text)
+
+    def extend(self, lines: Iterable[str]) -> None:
+        """追加多行"""
+        self.lines.extend(lines)
+
+    def rule(self, char: str = "=", width: Optional[int] = None) -> None:
+        """追加分隔线"""
+        self.lines.append(char * min(width or self.rule_width, self.width))
+
+    def title(self, text: str, width: Optional[int] = None, attrs: Sequence[str] = ("bold",)) -> None:
+        """追加面板标题（前后分隔线，与原先print的格式一致）"""
+        self.line()
+        self.rule("=", width)
+        self.line(self.styles.paint(text, "cyan", attrs))
+        self.rule("=", width)
+
+    def render(self, in_place: bool = False) -> str:
+        """整帧文本
+
+        Args:
+            in_place: 是否生成原地重绘的文本（覆盖上一帧，不先清屏，避免闪烁）
+        """
+        if in_place:
+            return CURSOR_HOME + "".join(line + CLEAR_LINE + "\n" for line in self.lines) + CLEAR_BELOW
+        return "\n".join(self.lines) + "\n" if self.lines else ""
+
+    def flush(self, clear: bool = False) -> None:
+        """一次写出整帧并清空缓冲
+
+        Args:
+            clear: 是否覆盖屏幕上的上一帧（原地重绘）
+        """
+        text = self.render(clear)
+        self.stream.write(text)
+        self.stream.flush()
+        self.lines = []
+
+
+def star_rating(mood: int) -> str:
+    """根据心情值生成星级评分"""
+    return "★" * mood + "☆" * (5 - mood)
+
+
+def timeline_lines(records: Iterable[Mapping[str, Any]], styles: Styles, width: int = 80) -> List[str]:
+    """时间轴的输出行（记录应已按开始时间排序）
+
+    进度条按等级和长度缓存着色结果；终端较窄时缩短进度条
+
+    Args:
+        records: 行为记录
+        styles: 样式缓存
+        width: 帧宽度
+
+    Returns:
+        每条记录一行
+    """
+    bar_max = max(5, min(TIMELINE_BAR_MAX, width - 60))
+    lines = []
+    for record in records:
+        level = record["level"]
+        start_time = datetime.fromtimestamp(record["start_ts"]).strftime("%H:%M")
+        end_time = datetime.fromtimestamp(record["end_ts"]).strftime("%H:%M")
+        bar = styles.level(level, "■" * min(bar_max, int(record["duration"] / 5)))
+        lines.append(
+            f"{start_time}-{end_time} [{bar}] {level}级 "
+            f"积分:{record['final_score']:.0f} 精力:{(record['energy_consume'] or 0):+.1f} "
+            f"心情:{star_rating(record['mood'])}"
+        )
+    return lines
+
+
+def heatmap_start_for_width(start: date, end: date, width: int) -> date:
+    """终端放不下时，热力图只显示能放下的最近若干周（行标签占3列，每周一列）"""
+    columns = max(1, width - 3)
+    last_week = end - timedelta(days=(end.weekday() + 1) % 7)
+    return max(start, last_week - timedelta(days=(columns - 1) * 7))
+
+
+def sparkline(values: Sequence[Optional[float]], maximum: float, width: Optional[int] = None) -> str:
+    """迷你折线图：每个值一个字符，按[0, maximum]分为八级，None（没有数据）为空格
+
+    width小于值的个数时只显示截至最后一个有数据的值的最近width个
+    """
+    if width is not None and len(values) > width:
+        last = max((index for index, value in enumerate(values) if value is not None), default=len(values) - 1)
+        end = max(width, last + 1)
+        values = values[end - width:end]
+    top = len(SPARK_CHARS) - 1
+    return "".join(
+        " " if value is None else SPARK_CHARS[min(top, max(0, int(value / maximum * top + 0.5)))]
+        for value in values
+    )
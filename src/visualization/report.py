@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多周期报告引擎
+
+report(period)按日、周、月、年或自定义日期区间生成结构化报告：合计、等级分布、
+精力效率、连续天数、得分最高的行为和心愿进度。数据只来自汇总表
+（rollup_day每日汇总、rollup_cube立方体、streak_bitmap位图），不扫描行为记录。
+每日汇总按月读取并缓存，重叠的报告（如本周与本月）共用同一个月的数据；
+整份报告按(区间, 当天日期, 数据版本)缓存，数据版本由PRAGMA data_version（其他连接的提交）
+和本连接的total_changes（本连接的写入）组成，数据没有变化时重复报告直接返回缓存
+"""
+
+import copy
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from src.scoring.streaks import CONDITIONS as STREAK_CONDITIONS, DayBitmap
+
+# 支持的周期
+PERIODS = ("day", "week", "month", "year")
+
+# 等级顺序
+LEVELS = ("S", "A", "B", "C", "D", "R")
+
+# 报告中列出的得分最高行为数
+TOP_BEHAVIORS = 5
+
+Period = Union[str, Tuple[Any, Any]]
+
+
+def _to_date(value: Any) -> date:
+    """date、datetime或YYYY-MM-DD字符串转换为date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def period_range(period: Period, anchor: Optional[Any] = None) -> Tuple[str, date, date]:
+    """周期对应的日期区间
+
+    Args:
+        period: "day"、"week"（周一开始）、"month"、"year"，或自定义的(开始日期, 结束日期)
+        anchor: 周期所在的日期，默认为今天
+
+    Returns:
+        (周期名称, 开始日期, 结束日期)，区间包含两端
+    """
+    if isinstance(period, (tuple, list)):
+        start, end = _to_date(period[0]), _to_date(period[1])
+        if end < start:
+            raise ValueError("结束日期不能早于开始日期")
+        return "custom", start, end
+    day = _to_date(anchor) if anchor is not None else date.today()
+    if period == "day":
+        return period, day, day
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return period, start, start + timedelta(days=6)
+    if period == "month":
+        start = day.replace(day=1)
+        return period, start, (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    if period == "year":
+        return period, date(day.year, 1, 1), date(day.year, 12, 31)
+    raise ValueError(f"未知周期: {period}")
+
+
+class ReportEngine:
+    """多周期报告引擎类"""
+
+    def __init__(self, conn: sqlite3.Connection, top_behaviors: int = TOP_BEHAVIORS):
+        """初始化报告引擎
+
+        Args:
+            conn: 数据库连接（StorageEngine.conn或独立连接）
+            top_behaviors: 列出的得分最高行为数
+        """
+        self.conn = conn
+        self.top_behaviors = top_behaviors
+        self._version: Optional[Tuple[int, int]] = None
+        self._months: Dict[str, Dict[str, List[tuple]]] = {}
+        self._reports: Dict[Tuple[str, date, date, date], Dict[str, Any]] = {}
+
+    def data_version(self) -> Tuple[int, int]:
+        """当前数据版本（其他连接的提交次数标记、本连接的累计修改行数）"""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0], self.conn.total_changes
+
+    def _sync(self) -> None:
+        """数据版本变化时清空缓存"""
+        version = self.data_version()
+        if version != self._version:
+            self._version = version
+            self._months.clear()
+            self._reports.clear()
+
+    def _month_days(self, month: str) -> Dict[str, List[tuple]]:
+        """某月的每日汇总{日期键: [(等级, 行为名称, 分钟数, 得分, 精力, 次数)]}（按版本缓存）"""
+        days = self._months.get(month)
+        if days is None:
+            days = {}
+            for row in self.conn.execute('''
+                SELECT day_key, level, name, minutes, score, energy, count FROM rollup_day
+                WHERE day_key BETWEEN ? AND ?
+            ''', (f"{month}-01", f"{month}-31")):
+                days.setdefault(row[0], []).append(row[1:])
+            self._months[month] = days
+        return days
+
+    def _day_rows(self, start: date, end: date):
+        """[start, end]内的每日汇总行
+
+        Yields:
+            (日期键, 等级, 行为名称, 分钟数, 得分, 精力, 次数)
+        """
+        start_key, end_key = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        month = start.replace(day=1)
+        while month <= end:
+            for day_key, rows in self._month_days(month.strftime("%Y-%m")).items():
+                if start_key <= day_key <= end_key:
+                    for row in rows:
+                        yield (day_key,) + tuple(row)
+            month = (month + timedelta(days=32)).replace(day=1)
+
+    def report(self, period: Period = "day", anchor: Optional[Any] = None) -> Dict[str, Any]:
+        """生成报告（可直接json.dumps）
+
+        Args:
+            period: "day"、"week"、"month"、"year"或(开始日期, 结束日期)
+            anchor: 周期所在的日期，默认为今天
+
+        Returns:
+            period、start、end、days、totals、levels、efficiency、daily_scores、
+            streaks、top_behaviors、wishes（缓存的副本，调用方修改不影响缓存）
+        """
+        name, start, end = period_range(period, anchor)
+        self._sync()
+        # 当前连续天数截至今天，跨过0点后重新计算
+        key = (name, start, end, date.today())
+        cached = self._reports.get(key)
+        if cached is None:
+            cached = self._reports[key] = self._build(name, start, end)
+        return copy.deepcopy(cached)
+
+    def _build(self, name: str, start: date, end: date) -> Dict[str, Any]:
+        """按汇总表计算报告"""
+        levels = {}
+        behaviors = {}
+        daily_scores = {}
+        totals = {"count": 0, "minutes": 0.0, "score": 0.0, "energy": 0.0}
+        for day_key, level, behavior, minutes, score, energy, count in self._day_rows(start, end):
+            if not count and not minutes:
+                continue
+            item = levels.setdefault(level, {"count": 0, "minutes": 0.0, "score": 0.0, "energy": 0.0})
+            for field, value in (("count", count), ("minutes", minutes), ("score", score), ("energy", energy)):
+                item[field] += value
+                totals[field] += value
+            daily_scores[day_key] = daily_scores.get(day_key, 0.0) + score
+            if behavior:
+                item = behaviors.setdefault(behavior, {"name": behavior, "level": level, "count": 0, "minutes": 0.0, "score": 0.0})
+                item["count"] += count
+                item["minutes"] += minutes
+                item["score"] += score
+
+        days = (end - start).days + 1
+        totals["active_days"] = len(daily_scores)
+        totals["avg_daily_score"] = totals["score"] / days
+        for item in levels.values():
+            item["minutes_share"] = item["minutes"] / totals["minutes"] if totals["minutes"] else 0.0
+
+        return {
+            "period": name,
+            "start": start.strftime("%Y-%m-%d"),
+            "end": end.strftime("%Y-%m-%d"),
+            "days": days,
+            "totals": totals,
+            "levels": {level: levels[level] for level in LEVELS if level in levels},
+            "efficiency": {
+                "score_per_energy": totals["score"] / totals["energy"] if totals["energy"] > 0 else None,
+                "score_per_hour": totals["score"] / (totals["minutes"] / 60) if totals["minutes"] else None
+            },
+            "daily_scores": dict(sorted(daily_scores.items())),
+            "streaks": self._streaks(start, end),
+            "top_behaviors": sorted(behaviors.values(), key=lambda item: item["score"], reverse=True)[:self.top_behaviors],
+            "wishes": self._wishes()
+        }
+
+    def _streaks(self, start: date, end: date) -> Dict[str, Dict[str, int]]:
+        """各条件在区间内满足的天数、区间内最长连续天数和截至区间结束的当前连续天数"""
+        start_key, end_key = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        bitmaps = {condition: DayBitmap() for condition in STREAK_CONDITIONS}
+        for condition, bits in self.conn.execute('SELECT condition, bits FROM streak_bitmap WHERE user_id = 1'):
+            bitmaps[condition] = DayBitmap(bits)
+        today_key = min(end, date.today()).strftime("%Y-%m-%d")
+        return {
+            condition: {
+                "days": bitmap.popcount(start_key, end_key),
+                "longest": bitmap.window(start_key, end_key).longest_streak(),
+                "current": bitmap.current_streak(today_key)
+            }
+            for condition, bitmap in bitmaps.items()
+        }
+
+    def _wishes(self) -> Dict[str, Any]:
+        """积分余额和未兑换心愿的进度（总积分取自立方体）"""
+        total_score = self.conn.execute('SELECT TOTAL(score) FROM rollup_cube').fetchone()[0]
+        redeemed = self.conn.execute('''
+            SELECT TOTAL(cost) FROM wishes WHERE status = 'redeemed' AND user_id = 1
+        ''').fetchone()[0]
+        balance = total_score - redeemed
+        pending = [
+            {"id": wish_id, "name": wish_name, "cost": cost,
+             "progress": min(1.0, max(0.0, balance / cost)) if cost else 1.0}
+            for wish_id, wish_name, cost in self.conn.execute('''
+                SELECT id, name, cost FROM wishes WHERE status = 'pending' AND user_id = 1 ORDER BY cost
+            ''')
+        ]
+        return {"balance": balance, "redeemed_cost": redeemed, "pending": pending}
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仪表盘快照
+
+仪表盘各面板需要的全部数据（总积分、余额、用户状态、今日记录、热力图序列、等级分布、精力曲线）
+在同一个读事务中读取，各面板只根据这份不可变快照渲染，不再各自查询数据库，
+因此同一次显示中的数字总是一致的。
+快照按输入分为行为、心愿、用户状态、精力时间序列四部分，每部分带一个版本；
+刷新时先比较版本，只重新读取版本变化的部分
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from src.db.energy_series import downsample
+from src.db.quantiles import percentiles
+from src.visualization.report import period_range
+
+# 旧版存储引擎以整数保存等级
+LEVEL_NAMES = {5: "S", 4: "A", 3: "B", 2: "C", 1: "D", 0: "R"}
+
+# 精力曲线的周期和段数（今日每30分钟、本周每3小时、本月约每12小时一段）
+ENERGY_PERIODS = (("day", 48), ("week", 56), ("month", 60))
+
+
+def level_name(level: Any) -> str:
+    """等级统一为字母（兼容整数等级）"""
+    return LEVEL_NAMES.get(level, level) if isinstance(level, int) else level
+
+
+class DashboardSnapshot(NamedTuple):
+    """仪表盘快照（不可变）
+
+    Attributes:
+        taken_at: 读取时间
+        total_score: 总积分
+        redeemed_cost: 已兑换心愿的总成本
+        balance: 可用余额（总积分 - 已兑换）
+        user_state: 用户状态
+        today_records: 今日行为记录（按开始时间升序）
+        daily_scores: 热力图序列{日期键: 当日得分}
+        heatmap_start: 热力图开始日期
+        heatmap_end: 热力图结束日期
+        level_distribution: 等级分布{等级: {"count", "minutes", "score"}}
+        duration_percentiles: 各等级时长的近似分位数{等级: {分位点: 分钟数}}（分位数草图）
+        energy_series: 各周期的精力曲线{周期: (每段的平均精力或None, ...)}
+        versions: 各部分的版本{部分: 版本}
+    """
+    taken_at: datetime
+    total_score: float
+    redeemed_cost: float
+    balance: float
+    user_state: Mapping[str, Any]
+    today_records: Tuple[Mapping[str, Any], ...]
+    daily_scores: Mapping[str, float]
+    heatmap_start: Any
+    heatmap_end: Any
+    level_distribution: Mapping[str, Mapping[str, float]]
+    duration_percentiles: Mapping[str, Mapping[float, float]]
+    energy_series: Mapping[str, Tuple[Optional[float], ...]]
+    versions: Mapping[str, Tuple]
+
+
+# 快照各部分的版本查询
+# 行为和精力部分：StorageEngine记录、补录、修改、删除行为以及写入精力点都在同一事务内
+# 追加状态事件（BEHAVIOR_RECORDED、BEHAVIOR_REVISED等），以最新事件id为版本；
+# SQLiteDB、数据迁移插入记录和补建精力点时不追加事件，另取行数和最大键。
+# 不经过存储层直接改写这两张表不会改变版本。
+# 心愿部分只读取已兑换心愿（只会新增），user_state整行比较
+SECTION_VERSION_QUERIES = {
+    "behavior": 'SELECT (SELECT MAX(id) FROM state_event), COUNT(*), MAX(id) FROM core_behavior',
+    "wishes": "SELECT COUNT(*), TOTAL(cost) FROM wishes WHERE status = 'redeemed' AND user_id = 1",
+    "state": 'SELECT * FROM user_state WHERE id = 1',
+    "energy": 'SELECT (SELECT MAX(id) FROM state_event), COUNT(*), MAX(ts) FROM energy_timeseries'
+}
+
+
+def read_versions(conn: sqlite3.Connection) -> Dict[str, Tuple]:
+    """读取快照各部分的当前版本"""
+    return {section: tuple(conn.execute(query).fetchone() or ())
+            for section, query in SECTION_VERSION_QUERIES.items()}
+
+
+def _read_behavior(conn: sqlite3.Connection, now: datetime, today_start: datetime, heatmap_start) -> Dict[str, Any]:
+    """行为部分：总积分、今日记录、热力图序列、等级分布、时长分位数"""
+    total_score = conn.execute('SELECT SUM(final_score) FROM core_behavior').fetchone()[0] or 0.0
+    today_rows = conn.execute('''
+        SELECT * FROM core_behavior WHERE start_ts >= ? ORDER BY start_ts
+    ''', (int(today_start.timestamp()),)).fetchall()
+    daily_rows = conn.execute('''
+        SELECT date(start_ts, 'unixepoch', 'localtime') AS day_key, SUM(final_score)
+        FROM core_behavior WHERE start_ts >= ? GROUP BY day_key
+    ''', (int(datetime.combine(heatmap_start, datetime.min.time()).timestamp()),)).fetchall()
+    level_rows = conn.execute('''
+        SELECT level, COUNT(*), SUM(duration), SUM(final_score) FROM core_behavior GROUP BY level
+    ''').fetchall()
+
+    today_records = []
+    for row in today_rows:
+        record = dict(row)
+        record["level"] = level_name(record["level"])
+        today_records.append(MappingProxyType(record))
+
+    level_distribution = {}
+    for level, count, minutes, score in level_rows:
+        item = level_distribution.setdefault(level_name(level), {"count": 0, "minutes": 0, "score": 0.0})
+        item["count"] += count
+        item["minutes"] += minutes or 0
+        item["score"] += score or 0.0
+
+    return {
+        "total_score": total_score,
+        "today_records": tuple(today_records),
+        "daily_scores": MappingProxyType({day_key: score or 0.0 for day_key, score in daily_rows}),
+        "heatmap_start": heatmap_start,
+        "heatmap_end": today_start.date(),
+        "level_distribution": MappingProxyType(
+            {level: MappingProxyType(item) for level, item in level_distribution.items()}
+        ),
+        "duration_percentiles": MappingProxyType(
+            {level: MappingProxyType(item["quantiles"]) for level, item in percentiles(conn, "duration").items()}
+        )
+    }
+
+
+def _read_wishes(conn: sqlite3.Connection, now: datetime, today_start: datetime, heatmap_start) -> Dict[str, Any]:
+    """心愿部分：已兑换心愿的总成本"""
+    redeemed_cost = conn.execute('''
+        SELECT SUM(cost) FROM wishes WHERE status = 'redeemed' AND user_id = 1
+    ''').fetchone()[0] or 0.0
+    return {"redeemed_cost": redeemed_cost}
+
+
+def _read_state(conn: sqlite3.Connection, now: datetime, today_start: datetime, heatmap_start) -> Dict[str, Any]:
+    """用户状态部分"""
+    row = conn.execute('SELECT * FROM user_state WHERE id = 1').fetchone()
+    return {"user_state": MappingProxyType(dict(row) if row else {})}
+
+
+def _read_energy(conn: sqlite3.Connection, now: datetime, today_start: datetime, heatmap_start) -> Dict[str, Any]:
+    """精力时间序列部分：今日、本周、本月的精力曲线（每个周期一次区间查询，在SQL中降采样）"""
+    series = {}
+    for period, buckets in ENERGY_PERIODS:
+        _, start, end = period_range(period, now.date())
+        start_ts = int(datetime.combine(start, datetime.min.time()).timestamp())
+        end_ts = int(datetime.combine(end + timedelta(days=1), datetime.min.time()).timestamp())
+        series[period] = tuple(downsample(conn, start_ts, end_ts, buckets, int(now.timestamp())))
+    return {"energy_series": MappingProxyType(series)}
+
+
+SECTION_READERS = {"behavior": _read_behavior, "wishes": _read_wishes, "state": _read_state, "energy": _read_energy}
+
+
+def _read_sections(db, sections, heatmap_days: int, now: datetime,
+                   versions: Optional[Mapping[str, Tuple]] = None) -> Tuple[Dict[str, Any], Dict[str, Tuple], Tuple[str, ...]]:
+    """在一个读事务中读取版本，并读取指定部分和版本变化的部分
+
+    Returns:
+        (读取的字段, 当前版本, 重新读取的部分)
+    """
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    heatmap_start = (today_start - timedelta(days=heatmap_days - 1)).date()
+
+    with db.get_connection() as conn:
+        # 显式开启事务：之后的所有读取看到同一个数据库版本
+        conn.execute('BEGIN')
+        current = read_versions(conn)
+        changed = tuple(section for section in SECTION_READERS
+                        if section in sections or versions is None or versions.get(section) != current[section])
+        fields = {}
+        for section in changed:
+            fields.update(SECTION_READERS[section](conn, now, today_start, heatmap_start))
+    return fields, current, changed
+
+
+def load_dashboard_snapshot(db, heatmap_days: int = 365, now: Optional[datetime] = None) -> DashboardSnapshot:
+    """在一个读事务中读取仪表盘快照
+
+    Args:
+        db: 数据库操作对象（SQLiteDB）
+        heatmap_days: 热力图天数
+        now: 当前时间，默认为现在
+
+    Returns:
+        仪表盘快照
+    """
+    now = now or datetime.now()
+    fields, versions, _ = _read_sections(db, SECTION_READERS, heatmap_days, now)
+    return DashboardSnapshot(
+        taken_at=now,
+        balance=fields["total_score"] - fields["redeemed_cost"],
+        versions=MappingProxyType(versions),
+        **fields
+    )
+
+
+def refresh_dashboard_snapshot(db, snapshot: DashboardSnapshot, heatmap_days: int = 365,
+                               now: Optional[datetime] = None) -> Tuple[DashboardSnapshot, Tuple[str, ...]]:
+    """刷新快照：只重新读取版本变化的部分（跨天时行为和精力部分总是重新读取）
+
+    Args:
+        db: 数据库操作对象（SQLiteDB）
+        snapshot: 上一次的快照
+        heatmap_days: 热力图天数
+        now: 当前时间，默认为现在
+
+    Returns:
+        (新快照, 重新读取的部分)，没有变化时返回原快照（只更新读取时间）
+    """
+    now = now or datetime.now()
+    sections = ("behavior", "energy") if now.date() != snapshot.heatmap_end else ()
+    fields, versions, changed = _read_sections(db, sections, heatmap_days, now, snapshot.versions)
+    if not changed:
+        return snapshot._replace(taken_at=now), changed
+    total_score = fields.get("total_score", snapshot.total_score)
+    redeemed_cost = fields.get("redeemed_cost", snapshot.redeemed_cost)
+    return snapshot._replace(
+        taken_at=now,
+        balance=total_score - redeemed_cost,
+        versions=MappingProxyType(versions),
+        **fields
+    ), changed
+
+
+class DataVersionWatcher:
+    """数据库变化检测类
+
+    在一个常驻连接上轮询PRAGMA data_version：其他连接提交写入后该值改变，
+    没有写入时每次轮询只是读取一个计数器，不访问任何表
+    """
+
+    def __init__(self, db_path: str):
+        """初始化检测器
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.conn = sqlite3.connect(db_path)
+        self.version = self._data_version()
+
+    def _data_version(self) -> int:
+        """当前data_version"""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed(self) -> bool:
+        """自上次调用以来数据库是否有新的提交"""
+        version = self._data_version()
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+    def close(self):
+        """关闭连接"""
+        self.conn.close()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间轴浏览器
+
+在任意日期范围内按页浏览行为记录。翻页使用键集分页：以(start_ts, id)为游标，
+每页一次start_ts索引上的范围查询（不使用OFFSET），无论历史有多长，翻页、
+按日/周/月跳转都只读取一页。内存中只保留当前显示的一页，
+下一页在后台线程中预取（独立连接），向后翻页时直接取用预取结果
+"""
+
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from src.visualization.render import FrameBuffer, Styles, timeline_lines
+from src.visualization.report import period_range
+from src.visualization.snapshot import level_name
+
+# 每页之外占用的终端行数（标题、页脚、命令提示）
+CHROME_LINES = 8
+
+# 最小每页记录数
+MIN_PAGE_SIZE = 5
+
+WEEKDAY_NAMES = ("一", "二", "三", "四", "五", "六", "日")
+
+HELP = "回车/n 下一页  p 上一页  d/D 后/前一天  w/W 后/前一周  m/M 后/前一月  g 日期 跳转  q 退出"
+
+Key = Tuple[int, int]
+
+
+class Page(NamedTuple):
+    """一页记录
+
+    Attributes:
+        records: 按(start_ts, id)升序的记录
+        first_key: 第一条记录的游标(start_ts, id)，空页为None
+        last_key: 最后一条记录的游标，空页为None
+    """
+    records: Tuple[Dict[str, Any], ...]
+    first_key: Optional[Key]
+    last_key: Optional[Key]
+
+
+def _make_page(records: List[Dict[str, Any]]) -> Page:
+    if not records:
+        return Page((), None, None)
+    return Page(tuple(records), (records[0]["start_ts"], records[0]["id"]),
+                (records[-1]["start_ts"], records[-1]["id"]))
+
+
+def day_start(day: date) -> int:
+    """日期0点的时间戳"""
+    return int(datetime.combine(day, datetime.min.time()).timestamp())
+
+
+def shift_anchor(anchor: date, unit: str, step: int) -> date:
+    """anchor所在日、周（周一开始）或月向前或向后移动step个单位后的开始日期"""
+    if unit == "day":
+        return anchor + timedelta(days=step)
+    if unit == "week":
+        return period_range("week", anchor)[1] + timedelta(days=7 * step)
+    if unit == "month":
+        index = anchor.year * 12 + anchor.month - 1 + step
+        return date(index // 12, index % 12 + 1, 1)
+    raise ValueError(f"未知跳转单位: {unit}")
+
+
+class TimelinePager:
+    """键集分页查询类
+
+    每个线程使用自己的连接（SQLite连接不能跨线程共享），主线程查询当前页，
+    预取线程查询下一页
+    """
+
+    def __init__(self, db_path: str, page_size: int):
+        """初始化分页查询
+
+        Args:
+            db_path: 数据库文件路径
+            page_size: 每页记录数
+        """
+        self.db_path = db_path
+        self.page_size = page_size
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._columns: Optional[str] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        """当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            with self._lock:
+                self._connections.append(conn)
+                if self._columns is None:
+                    # SQLiteDB建立的表没有name列
+                    columns = [row[1] for row in conn.execute('PRAGMA table_info(core_behavior)').fetchall()]
+                    name = "name" if "name" in columns else "NULL"
+                    self._columns = f"id, level, {name}, duration, mood, start_ts, end_ts, final_score, energy_consume"
+        return conn
+
+    def _query(self, condition: str, params: Tuple, descending: bool = False) -> Page:
+        order = "start_ts DESC, id DESC" if descending else "start_ts, id"
+        conn = self._conn()
+        rows = conn.execute(f'''
+            SELECT {self._columns} FROM core_behavior
+            WHERE {condition} ORDER BY {order} LIMIT ?
+        ''', params + (self.page_size,)).fetchall()
+        records = [
+            dict(zip(("id", "level", "name", "duration", "mood", "start_ts", "end_ts", "final_score", "energy_consume"),
+                     (row[0], level_name(row[1])) + tuple(row[2:])))
+            for row in rows
+        ]
+        if descending:
+            records.reverse()
+        return _make_page(records)
+
+    def seek(self, ts: int) -> Page:
+        """开始时间不早于ts的第一页"""
+        return self._query('start_ts >= ?', (ts,))
+
+    def after(self, key: Key) -> Page:
+        """游标key之后的一页"""
+        # start_ts >= ?限定索引范围，其余条件只在范围内过滤
+        return self._query('start_ts >= ? AND (start_ts > ? OR id > ?)', (key[0], key[0], key[1]))
+
+    def before(self, key: Key) -> Page:
+        """游标key之前的一页"""
+        return self._query('start_ts <= ? AND (start_ts < ? OR id < ?)', (key[0], key[0], key[1]), descending=True)
+
+    def last(self) -> Page:
+        """最后一页"""
+        return self._query('1', (), descending=True)
+
+    def close(self) -> None:
+        """关闭各线程的连接"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class TimelineBrowser:
+    """时间轴浏览器类（翻页、按日/周/月跳转、后台预取下一页）"""
+
+    def __init__(self, db_path: str, page_size: Optional[int] = None, styles: Optional[Styles] = None):
+        """初始化浏览器
+
+        Args:
+            db_path: 数据库文件路径
+            page_size: 每页记录数，默认按终端高度
+            styles: 样式缓存，默认按终端是否支持颜色
+        """
+        if page_size is None:
+            page_size = max(MIN_PAGE_SIZE, shutil.get_terminal_size((80, 24)).lines - CHROME_LINES)
+        self.pager = TimelinePager(db_path, page_size)
+        self.styles = styles
+        self.page = Page((), None, None)
+        self.anchor = date.today()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetch: Optional[Tuple[Key, Future]] = None
+        self.message = ""
+
+    # ----------------- 导航 -----------------
+    def _show(self, page: Page, anchor: Optional[date] = None) -> Page:
+        """切换到page并在后台预取其下一页"""
+        self.page = page
+        if page.records:
+            self.anchor = datetime.fromtimestamp(page.records[0]["start_ts"]).date()
+        elif anchor is not None:
+            self.anchor = anchor
+        if page.last_key is not None and len(page.records) == self.pager.page_size:
+            self._prefetch = (page.last_key, self._executor.submit(self.pager.after, page.last_key))
+        else:
+            self._prefetch = None
+        return page
+
+    def goto(self, day: date) -> Page:
+        """跳转到day（当天及之后的第一页；day之后没有记录时显示最后一页）"""
+        page = self.pager.seek(day_start(day))
+        if not page.records:
+            page = self.pager.last()
+        return self._show(page, day)
+
+    def next_page(self) -> Page:
+        """下一页（已预取时直接使用预取结果；已是最后一页时不变）"""
+        if self.page.last_key is None:
+            return self.page
+        if self._prefetch is not None and self._prefetch[0] == self.page.last_key:
+            page = self._prefetch[1].result()
+        else:
+            page = self.pager.after(self.page.last_key)
+        return self._show(page) if page.records else self.page
+
+    def prev_page(self) -> Page:
+        """上一页（已是第一页时不变）"""
+        if self.page.first_key is None:
+            return self.page
+        page = self.pager.before(self.page.first_key)
+        return self._show(page) if page.records else self.page
+
+    def jump(self, unit: str, step: int = 1) -> Page:
+        """按日、周或月向后（step > 0）或向前跳转
+
+        目标区间没有记录时：向后跳到之后最近有记录的一天，向前跳到之前最近有记录的一天
+        """
+        target = shift_anchor(self.anchor, unit, step)
+        if step < 0:
+            current_start = day_start(shift_anchor(self.anchor, unit, 0))
+            page = self.pager.seek(day_start(target))
+            if not page.records or page.first_key[0] >= current_start:
+                earlier = self.pager.before((current_start, 0))
+                if not earlier.records:
+                    return self.page
+                target = datetime.fromtimestamp(earlier.records[-1]["start_ts"]).date()
+        return self.goto(target)
+
+    def close(self) -> None:
+        """停止预取并关闭连接"""
+        self._executor.shutdown(wait=True)
+        self.pager.close()
+
+    # ----------------- 显示 -----------------
+    def render(self, frame: FrameBuffer) -> None:
+        """把当前页渲染到帧缓冲（按日期分组）"""
+        records = self.page.records
+        if records:
+            first = datetime.fromtimestamp(records[0]["start_ts"]).strftime("%Y-%m-%d")
+            last = datetime.fromtimestamp(records[-1]["start_ts"]).strftime("%Y-%m-%d")
+            frame.title(f"时间轴浏览 {first}" + (f" ~ {last}" if last != first else ""))
+        else:
+            frame.title("时间轴浏览")
+            frame.line("暂无行为记录")
+
+        for day_key, day_records in groupby(
+                records, key=lambda record: datetime.fromtimestamp(record["start_ts"]).date()):
+            day_records = list(day_records)
+            frame.line(frame.styles.paint(f"── {day_key.strftime('%Y-%m-%d')} 周{WEEKDAY_NAMES[day_key.weekday()]} ──",
+                                          attrs=("bold",)))
+            lines = timeline_lines(day_records, frame.styles, frame.width)
+            frame.extend(f"{line} {record['name'] or ''}".rstrip() for line, record in zip(lines, day_records))
+        frame.rule("-")
+        frame.line(HELP)
+        if self.message:
+            frame.line(self.message)
+            self.message = ""
+
+    def run(self, start: Optional[date] = None) -> None:
+        """交互浏览，从start（默认今天）开始，q退出"""
+        commands = {
+            "": self.next_page, "n": self.next_page, "p": self.prev_page,
+            "d": lambda: self.jump("day", 1), "D": lambda: self.jump("day", -1),
+            "w": lambda: self.jump("week", 1), "W": lambda: self.jump("week", -1),
+            "m": lambda: self.jump("month", 1), "M": lambda: self.jump("month", -1)
+        }
+        try:
+            self.goto(start or date.today())
+            while True:
+                frame = FrameBuffer(self.styles)
+                self.render(frame)
+                frame.flush(clear=True)
+                try:
+                    command = input("> ").strip()
+                except EOFError:
+                    break
+                if command == "q":
+                    break
+                if command.startswith("g"):
+                    try:
+                        self.goto(datetime.strptime(command[1:].strip(), "%Y-%m-%d").date())
+                    except ValueError:
+                        self.message = "日期格式应为YYYY-MM-DD"
+                    continue
+                action = commands.get(command)
+                if action is not None:
+                    action()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
@@ -0,0 +1,27 @@
+import sys
+from datetime import datetime
+from data_manager import get_state_at
+
+def show_state_at(moment=None):
+    """查看任意时刻的状态（从最近的每日快照开始重放）"""
+    state = get_state_at(moment)
+
+    print("=== 历史状态 ===")
+    print(f"时间: {datetime.fromtimestamp(state['as_of_ts']).strftime('%Y-%m-%d %H:%M')}")
+    print(f"精力: {state['energy']:.1f}")
+    print(f"连击: {state['combo_count']}")
+    print(f"当日行为数: {state['behavior_count']}")
+    if state["level_counts"]:
+        counts = ", ".join(f"{level}:{count}" for level, count in sorted(state["level_counts"].items()))
+        print(f"当日等级分布: {counts}")
+    print(f"当日得分: {state['day_score']:.2f}")
+    print(f"累计得分: {state['total_score']:.2f}")
+    print(f"积分余额: {state['balance']:.2f}")
+    print("================")
+
+if __name__ == "__main__":
+    # 用法：python state_at.py ["YYYY-MM-DD HH:MM"]，默认为当前时间
+    if len(sys.argv) > 1:
+        show_state_at(datetime.strptime(" ".join(sys.argv[1:]), "%Y-%m-%d %H:%M"))
+    else:
+        show_state_at()
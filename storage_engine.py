@@ -1,11 +1,18 @@
 import sqlite3
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import hashlib
+from src.db import energy_series, events, rollup, quantiles
+from src.scoring.streaks import (
+    DayBitmap, day_conditions, CONDITIONS as STREAK_CONDITIONS, CONDITION_POSITIVE, CONDITION_SCORE_TARGET, CONDITION_S_DONE
+)
 
 # 数据库文件路径
 DB_FILE = "time_manage.db"
 
+# 单条行为的最长时间跨度（秒），区间查询按此界定索引扫描范围
+MAX_BEHAVIOR_SPAN = 24 * 60 * 60
+
 class StorageEngine:
     """SQLite存储引擎"""
     
@@ -35,6 +42,14 @@ class StorageEngine:
             )
         ''')
         
+        # 行为名称列（用于补录后重新计算防滥用惩罚），旧数据库补充该列
+        columns = [row[1] for row in self.cursor.execute('PRAGMA table_info(core_behavior)').fetchall()]
+        if 'name' not in columns:
+            self.cursor.execute('ALTER TABLE core_behavior ADD COLUMN name TEXT')
+        # 记录时抽取的幸运系数（重新计分时重新应用），旧数据库补充该列
+        if 'lucky_coeff' not in columns:
+            self.cursor.execute('ALTER TABLE core_behavior ADD COLUMN lucky_coeff REAL DEFAULT 1.0')
+        
         # 2. 用户状态表
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_state (
@@ -44,9 +59,11 @@ class StorageEngine:
                 today_total_score REAL DEFAULT 0,
                 today_behavior_count INTEGER DEFAULT 0,
                 last_record_ts INTEGER,
-                efficient_periods TEXT
+                efficient_periods TEXT,
+                lucky_state TEXT
             )
         ''')
+        events.ensure_user_state_columns(self.cursor)
         
         # 3. 配置表
         self.cursor.execute('''
@@ -94,25 +111,104 @@ class StorageEngine:
             )
         ''')
         
+        # 7. 每日计数表（防滥用检查：同一行为当日次数、上次出现时间）
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS behavior_day_counter (
+                day_key TEXT NOT NULL,
+                counter_key TEXT NOT NULL,
+                count INTEGER DEFAULT 0,
+                last_ts INTEGER,
+                PRIMARY KEY (day_key, counter_key)
+            ) WITHOUT ROWID
+        ''')
+        
+        # 8. 每日状态快照表（一天结束时的精力、连击、计数和余额，用于状态重放）
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_state_snapshot (
+                day_key TEXT PRIMARY KEY,
+                end_energy REAL NOT NULL,
+                combo_count INTEGER DEFAULT 0,
+                behavior_count INTEGER DEFAULT 0,
+                day_score REAL DEFAULT 0.0,
+                total_score REAL DEFAULT 0.0,
+                redeemed_cost REAL DEFAULT 0.0,
+                balance REAL DEFAULT 0.0,
+                last_record_ts INTEGER,
+                counters TEXT,
+                recent_levels TEXT,
+                create_ts INTEGER DEFAULT (strftime('%s', 'now'))
+            )
+        ''')
+        
+        # 9. 成就计数器表（每个计数器一行，记录行为时增量更新）
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS achievement_counter (
+                counter_key TEXT PRIMARY KEY,
+                value REAL DEFAULT 0,
+                day_key TEXT
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_achievement_type ON user_achievement(type)')
+        # 成就检查点：某天结束时的计数器和已解锁成就（补录、修改、删除后从最近的检查点重放）
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS achievement_checkpoint (
+                day_key TEXT PRIMARY KEY,
+                counters TEXT NOT NULL,
+                unlocks TEXT NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        
+        # 10. 连续天数位图表（每个条件一行，每天一位）
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS streak_bitmap (
+                user_id INTEGER DEFAULT 1,
+                condition TEXT NOT NULL,
+                bits BLOB NOT NULL,
+                PRIMARY KEY (user_id, condition)
+            ) WITHOUT ROWID
+        ''')
+        
+        # 11. 状态事件日志及其投影（daily_summary、combo_state、energy_timeseries）和快照
+        events.create_event_tables(self.cursor)
+        events.ensure_energy_series(self.conn)
+        events.ensure_baseline(self.conn)
+        
+        # 12. 行为汇总立方体（月份×星期×小时×等级，记录增删改时增量更新）
+        rollup.create_rollup_table(self.cursor)
+        
+        # 13. 分位数草图表（每个等级、月份、指标一个KLL草图）
+        quantiles.create_sketch_table(self.cursor)
+
         # 创建索引
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_behavior_ts ON core_behavior(start_ts)')
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_behavior_level ON core_behavior(level)')
+        # 区间查询的覆盖索引（时刻、重叠、空档查询不回表）
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_behavior_span ON core_behavior(start_ts, end_ts, duration)')
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_wishes_user_id ON wishes(user_id)')
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_wishes_status ON wishes(status)')
         
-        # 开启WAL模式
-        self.cursor.execute('PRAGMA journal_mode=WAL')
+        # 启用立方体之前的数据库按历史记录一次性建立立方体
+        rollup.ensure_rollup(self.conn)
+        quantiles.ensure_sketches(self.conn)
+        
+        # 开启WAL模式（读完返回的模式行，否则未结束的语句会阻止下面的提交）
+        self.cursor.execute('PRAGMA journal_mode=WAL').fetchall()
+        
+        # 启用每日计数之前的数据库按昨天和今天已有的记录建立计数（升级当天的重复次数不从0开始）
+        self._ensure_day_counters()
         
         self.conn.commit()
     
     def _level_to_int(self, level):
-        """将等级字符串转换为整数（S=5/A=4/B=3/C=2/D=1）"""
+        """将等级字符串转换为整数（S=5/A=4/B=3/C=2/D=1，R级及其子级=0）"""
         level_map = {'S': 5, 'A': 4, 'B': 3, 'C': 2, 'D': 1}
+        if level.upper().startswith('R'):
+            return 0
         return level_map.get(level.upper(), 3)  # 默认B级
     
     def _int_to_level(self, level_int):
         """将整数转换为等级字符串"""
-        level_map = {5: 'S', 4: 'A', 3: 'B', 2: 'C', 1: 'D'}
+        level_map = {5: 'S', 4: 'A', 3: 'B', 2: 'C', 1: 'D', 0: 'R'}
         return level_map.get(level_int, 'B')
     
     def _generate_md5(self, level, duration, final_score):
@@ -170,22 +266,146 @@ class StorageEngine:
         return behaviors
     
     # ----------------- 行为记录相关 -----------------
-    def add_behavior_record(self, level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume):
+    def _record_from_row(self, row):
+        """将core_behavior的查询行（id, level, name, duration, mood, start_ts, end_ts,
+        base_score, dynamic_coeff, final_score, energy_consume, lucky_coeff）转换为字典"""
+        return {
+            "id": row[0],
+            "level": self._int_to_level(row[1]),
+            "name": row[2],
+            "duration": row[3],
+            "mood": row[4],
+            "start_ts": row[5],
+            "end_ts": row[6],
+            "base_score": row[7],
+            "dynamic_coeff": row[8],
+            "final_score": row[9],
+            "energy_consume": row[10],
+            "lucky_coeff": row[11] if row[11] is not None else 1.0
+        }
+    
+    def add_behavior_record(self, level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, name=None):
         """添加行为记录"""
-        level_int = self._level_to_int(level)
-        md5_check = self._generate_md5(level_int, duration, final_score)
-        
         try:
-            self.cursor.execute('''
-                INSERT INTO core_behavior (level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, md5_check)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (level_int, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, md5_check))
+            self.insert_record_row(level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, name)
             self.conn.commit()
             return True
         except Exception as e:
             print(f"添加行为记录失败: {e}")
             return False
     
+    def insert_record_row(self, level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, name=None,
+                          lucky_coeff=1.0):
+        """插入行为记录并计入汇总立方体和分位数草图（不提交，由调用方在同一事务内提交），返回记录id
+        
+        lucky_coeff为记录时抽取的幸运系数（未抽取时为1.0），重新计分时在平衡机制之后重新应用
+        """
+        level_int = self._level_to_int(level)
+        md5_check = self._generate_md5(level_int, duration, final_score)
+        self.cursor.execute('''
+            INSERT INTO core_behavior (level, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, md5_check, name,
+                                       lucky_coeff)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (level_int, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume, md5_check, name,
+              lucky_coeff))
+        record_id = self.cursor.lastrowid
+        record = {
+            "level": level_int, "name": name, "duration": duration, "start_ts": start_ts, "end_ts": end_ts,
+            "final_score": final_score, "energy_consume": energy_consume
+        }
+        rollup.apply_records(self.conn, [record])
+        quantiles.add_records(self.conn, [record])
+        return record_id
+    
+    def get_record(self, record_id):
+        """按id获取行为记录"""
+        self.cursor.execute('''
+            SELECT id, level, name, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume,
+                   lucky_coeff
+            FROM core_behavior WHERE id = ?
+        ''', (record_id,))
+        row = self.cursor.fetchone()
+        return self._record_from_row(row) if row else None
+    
+    def update_record_row(self, record_id, level, name, duration, mood, start_ts, end_ts):
+        """修改行为记录的输入字段（不提交；得分字段由update_record_scores重新计算）"""
+        old = self.get_record(record_id)
+        self.cursor.execute('''
+            UPDATE core_behavior SET level = ?, name = ?, duration = ?, mood = ?, start_ts = ?, end_ts = ?
+            WHERE id = ?
+        ''', (self._level_to_int(level), name, duration, mood, start_ts, end_ts, record_id))
+        if self.cursor.rowcount == 0:
+            return False
+        new = self.get_record(record_id)
+        rollup.apply_records(self.conn, [old], -1)
+        rollup.apply_records(self.conn, [new])
+        quantiles.rebuild_groups(self.conn, {quantiles.record_group(old), quantiles.record_group(new)})
+        return True
+    
+    def delete_record_row(self, record_id):
+        """删除行为记录，从汇总立方体中减去并重建所属的分位数草图（不提交）"""
+        old = self.get_record(record_id)
+        self.cursor.execute('DELETE FROM core_behavior WHERE id = ?', (record_id,))
+        if self.cursor.rowcount == 0:
+            return False
+        rollup.apply_records(self.conn, [old], -1)
+        quantiles.rebuild_groups(self.conn, [quantiles.record_group(old)])
+        return True
+    
+    def update_record_scores(self, records, rebuild_sketches=True):
+        """批量写回重新计算的得分字段和校验码，汇总立方体和分位数草图同步更新（不提交）
+        
+        Args:
+            records: 重新计分后的记录
+            rebuild_sketches: 是否立即重建涉及的分位数草图；连续重新计分多天时传False，
+                              收集返回的分组，最后用rebuild_sketches统一重建一次
+        
+        Returns:
+            涉及的(等级, 月份)分组集合
+        """
+        old_records = [self.get_record(record["id"]) for record in records]
+        rollup.apply_records(self.conn, [record for record in old_records if record], -1)
+        self.cursor.executemany('''
+            UPDATE core_behavior SET base_score = ?, dynamic_coeff = ?, final_score = ?, energy_consume = ?, md5_check = ?
+            WHERE id = ?
+        ''', [(record["base_score"], record["dynamic_coeff"], record["final_score"], record["energy_consume"],
+               self._generate_md5(self._level_to_int(record["level"]), record["duration"], record["final_score"]),
+               record["id"]) for record in records])
+        new_records = [record for record in (self.get_record(record["id"]) for record in records) if record]
+        rollup.apply_records(self.conn, new_records)
+        groups = {quantiles.record_group(record) for record in new_records}
+        if rebuild_sketches:
+            self.rebuild_sketches(groups)
+        return groups
+    
+    def rebuild_sketches(self, groups):
+        """按记录重建指定(等级, 月份)分组的分位数草图（不提交）"""
+        quantiles.rebuild_groups(self.conn, groups)
+    
+    def get_day_records(self, day_key):
+        """按开始时间升序获取某天开始的全部行为记录（用于单日重新计分）"""
+        day_start_ts = int(datetime.strptime(day_key, '%Y-%m-%d').timestamp())
+        next_day_ts = int((datetime.strptime(day_key, '%Y-%m-%d') + timedelta(days=1)).timestamp())
+        self.cursor.execute('''
+            SELECT id, level, name, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume,
+                   lucky_coeff
+            FROM core_behavior WHERE start_ts >= ? AND start_ts < ? ORDER BY start_ts, id
+        ''', (day_start_ts, next_day_ts))
+        return [self._record_from_row(row) for row in self.cursor.fetchall()]
+    
+    def next_record_day(self, day_key):
+        """day_key之后第一个有记录的日期，没有时返回None"""
+        next_day_ts = int((datetime.strptime(day_key, '%Y-%m-%d') + timedelta(days=1)).timestamp())
+        self.cursor.execute('SELECT MIN(start_ts) FROM core_behavior WHERE start_ts >= ?', (next_day_ts,))
+        row = self.cursor.fetchone()
+        return self._day_key(row[0]) if row and row[0] is not None else None
+    
+    def first_record_day(self):
+        """第一条行为记录的日期（新手期从这天开始计算），没有记录时返回None"""
+        self.cursor.execute('SELECT MIN(start_ts) FROM core_behavior')
+        row = self.cursor.fetchone()
+        return self._day_key(row[0]) if row and row[0] is not None else None
+    
     def get_today_records(self):
         """获取今日行为记录"""
         today = datetime.now().strftime('%Y-%m-%d')
@@ -208,16 +428,483 @@ class StorageEngine:
                 "final_score": row[8],
                 "energy_consume": row[9],
                 "create_ts": row[10],
-                "md5_check": row[11]
+                "md5_check": row[11],
+                "name": row[12] if len(row) > 12 else None
             })
         return records
     
+    def iter_records_after(self, last_id=0):
+        """按id升序流式读取id大于last_id的行为记录（不一次性载入全部历史）"""
+        cursor = self.conn.execute('''
+            SELECT id, start_ts, end_ts, duration, final_score, energy_consume
+            FROM core_behavior WHERE id > ? ORDER BY id
+        ''', (last_id,))
+        for row in cursor:
+            yield {
+                "id": row[0],
+                "start_ts": row[1],
+                "end_ts": row[2],
+                "duration": row[3],
+                "final_score": row[4],
+                "energy_consume": row[5]
+            }
+    
+    def iter_records_between(self, start_ts, end_ts, ended_by=None):
+        """按开始时间升序流式读取开始时间在[start_ts, end_ts]内的行为记录（用于状态重放）
+        
+        每条记录只归属开始时间所在的一天（与每日计数、每日汇总、单日重新计分一致），
+        跨过零点的记录属于前一天的快照和重放区间
+        
+        Args:
+            start_ts: 开始时间下限
+            end_ts: 开始时间上限
+            ended_by: 指定时只取在此之前已结束的记录（查询某一时刻的状态）
+        """
+        if ended_by is None:
+            cursor = self.conn.execute('''
+                SELECT id, level, name, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume,
+                   lucky_coeff
+                FROM core_behavior WHERE start_ts >= ? AND start_ts <= ? ORDER BY start_ts, id
+            ''', (start_ts, end_ts))
+        else:
+            cursor = self.conn.execute('''
+                SELECT id, level, name, duration, mood, start_ts, end_ts, base_score, dynamic_coeff, final_score, energy_consume,
+                   lucky_coeff
+                FROM core_behavior WHERE start_ts >= ? AND start_ts <= ? AND end_ts <= ? ORDER BY start_ts, id
+            ''', (start_ts, end_ts, ended_by))
+        for row in cursor:
+            yield self._record_from_row(row)
+    
+    def get_span_candidates(self, start_ts, end_ts):
+        """可能与[start_ts, end_ts)重叠的行为记录（只读覆盖索引idx_behavior_span）
+        
+        单条行为不超过MAX_BEHAVIOR_SPAN秒，且旧版记录的实际开始时间早于start_ts，
+        因此只需扫描start_ts在[start_ts - 最长区间, end_ts + 最长区间)内的索引项
+        """
+        self.cursor.execute('''
+            SELECT id, start_ts, end_ts, duration FROM core_behavior
+            WHERE start_ts >= ? AND start_ts < ? ORDER BY start_ts, id
+        ''', (start_ts - MAX_BEHAVIOR_SPAN, end_ts + MAX_BEHAVIOR_SPAN + 1))
+        return [{"id": row[0], "start_ts": row[1], "end_ts": row[2], "duration": row[3]}
+                for row in self.cursor.fetchall()]
+    
     def get_total_score(self):
         """获取总得分"""
         self.cursor.execute('SELECT SUM(final_score) FROM core_behavior')
         result = self.cursor.fetchone()[0]
         return result or 0
     
+    def get_daily_scores(self, start_ts, end_ts):
+        """[start_ts, end_ts]内每天的总得分（按开始时间归日，一次分组查询）
+        
+        Returns:
+            {日期键: 当日得分}，没有记录的日期不出现
+        """
+        self.cursor.execute('''
+            SELECT date(start_ts, 'unixepoch', 'localtime') AS day_key, SUM(final_score)
+            FROM core_behavior WHERE start_ts BETWEEN ? AND ? GROUP BY day_key
+        ''', (start_ts, end_ts))
+        return {row[0]: row[1] or 0.0 for row in self.cursor.fetchall()}
+    
+    def get_rollup_cube(self):
+        """汇总立方体查询（月份×星期×小时×等级）"""
+        return rollup.RollupCube(self.conn)
+    
+    def get_percentiles(self, metric="duration", fractions=quantiles.DEFAULT_QUANTILES, levels=None,
+                        month_from=None, month_to=None):
+        """各等级某指标的近似分位数（合并月份范围内的草图，误差界见src/db/quantiles.py）"""
+        return quantiles.percentiles(self.conn, metric, fractions, levels, month_from, month_to)
+    
+    # ----------------- 每日计数相关 -----------------
+    def _day_key(self, ts):
+        """时间戳所在的日期键，格式：YYYY-MM-DD"""
+        return datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+    
+    def increment_day_counter(self, counter_key, ts):
+        """当日计数+1，并记录上次出现时间"""
+        try:
+            self.write_day_counter(counter_key, ts)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"更新每日计数失败: {e}")
+            return False
+    
+    def write_day_counter(self, counter_key, ts):
+        """当日计数+1并记录上次出现时间（不提交，由调用方在同一事务内提交）"""
+        self.cursor.execute('''
+            INSERT INTO behavior_day_counter (day_key, counter_key, count, last_ts)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT(day_key, counter_key) DO UPDATE SET
+                count = count + 1,
+                last_ts = MAX(COALESCE(last_ts, 0), excluded.last_ts)
+        ''', (self._day_key(ts), counter_key, ts))
+    
+    def get_day_counter(self, counter_key, ts=None):
+        """获取当日计数和上次出现时间（主键查询）
+        
+        当天还没有出现时，上次出现时间取前一天的（短时长高频判断跨过零点）
+        """
+        day = datetime.fromtimestamp(ts if ts is not None else self.get_current_timestamp())
+        self.cursor.execute('''
+            SELECT day_key, count, last_ts FROM behavior_day_counter
+            WHERE day_key IN (?, ?) AND counter_key = ? ORDER BY day_key DESC
+        ''', (day.strftime('%Y-%m-%d'), (day - timedelta(days=1)).strftime('%Y-%m-%d'), counter_key))
+        rows = self.cursor.fetchall()
+        
+        if not rows:
+            return {"count": 0, "last_ts": None}
+        day_key, count, last_ts = rows[0]
+        return {"count": count if day_key == day.strftime('%Y-%m-%d') else 0, "last_ts": last_ts}
+    
+    def get_day_counters(self, day_key):
+        """某天的全部计数 {counter_key: {"count": 次数, "last_ts": 上次出现时间}}"""
+        self.cursor.execute('''
+            SELECT counter_key, count, last_ts FROM behavior_day_counter WHERE day_key = ?
+        ''', (day_key,))
+        return {row[0]: {"count": row[1], "last_ts": row[2]} for row in self.cursor.fetchall()}
+    
+    def _ensure_day_counters(self):
+        """计数表为空时，按昨天0点以来的记录建立计数（不提交，由_create_tables提交）"""
+        self.cursor.execute('SELECT 1 FROM behavior_day_counter LIMIT 1')
+        if self.cursor.fetchone():
+            return
+        since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        self.cursor.execute('''
+            SELECT level, name, start_ts FROM core_behavior WHERE start_ts >= ? ORDER BY start_ts
+        ''', (int(since.timestamp()),))
+        counts = {}
+        for level, name, start_ts in self.cursor.fetchall():
+            counter_key = f"behavior:{name}" if name else f"level:{self._int_to_level(level)}"
+            counter = counts.setdefault((self._day_key(start_ts), counter_key), [0, None])
+            counter[0] += 1
+            counter[1] = start_ts
+        if not counts:
+            return
+        self.cursor.executemany('''
+            INSERT INTO behavior_day_counter (day_key, counter_key, count, last_ts) VALUES (?, ?, ?, ?)
+        ''', [(day_key, counter_key, count, last_ts) for (day_key, counter_key), (count, last_ts) in counts.items()])
+    
+    def rebuild_day_counters(self, day_key, counts):
+        """用重新统计的结果替换某天的全部计数（不提交）
+        
+        Args:
+            day_key: 日期键
+            counts: {counter_key: {"count": 次数, "last_ts": 上次出现时间}}
+        """
+        self.cursor.execute('DELETE FROM behavior_day_counter WHERE day_key = ?', (day_key,))
+        self.cursor.executemany('''
+            INSERT INTO behavior_day_counter (day_key, counter_key, count, last_ts) VALUES (?, ?, ?, ?)
+        ''', [(day_key, key, counter["count"], counter["last_ts"]) for key, counter in counts.items()])
+    
+    # ----------------- 每日状态快照相关 -----------------
+    def save_daily_snapshot(self, snapshot):
+        """保存某天结束时的状态快照（同一天重复保存时覆盖）"""
+        try:
+            self.write_daily_snapshot(snapshot)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"保存每日状态快照失败: {e}")
+            return False
+    
+    def write_daily_snapshot(self, snapshot):
+        """写入状态快照（不提交，由调用方在同一事务内提交）"""
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO daily_state_snapshot
+            (day_key, end_energy, combo_count, behavior_count, day_score, total_score,
+             redeemed_cost, balance, last_record_ts, counters, recent_levels, create_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (snapshot["day_key"], snapshot["end_energy"], snapshot["combo_count"],
+              snapshot["behavior_count"], snapshot["day_score"], snapshot["total_score"],
+              snapshot["redeemed_cost"], snapshot["balance"], snapshot["last_record_ts"],
+              snapshot["counters"], snapshot["recent_levels"], self.get_current_timestamp()))
+    
+    def delete_daily_snapshot(self, day_key):
+        """删除某天的状态快照（不提交）"""
+        self.cursor.execute('DELETE FROM daily_state_snapshot WHERE day_key = ?', (day_key,))
+    
+    def shift_snapshots_after(self, day_key, score_delta):
+        """day_key之后的快照累计得分和余额整体平移（不提交）"""
+        self.cursor.execute('''
+            UPDATE daily_state_snapshot SET total_score = total_score + ?, balance = balance + ?
+            WHERE day_key > ?
+        ''', (score_delta, score_delta, day_key))
+    
+    def get_daily_snapshot(self, day_key):
+        """获取某天的状态快照（主键查询）"""
+        self.cursor.execute('''
+            SELECT day_key, end_energy, combo_count, behavior_count, day_score, total_score,
+                   redeemed_cost, balance, last_record_ts, counters, recent_levels
+            FROM daily_state_snapshot WHERE day_key = ?
+        ''', (day_key,))
+        return self._snapshot_from_row(self.cursor.fetchone())
+    
+    def get_latest_snapshot(self, before_day_key):
+        """获取日期早于before_day_key的最近一个状态快照（主键范围查询）"""
+        self.cursor.execute('''
+            SELECT day_key, end_energy, combo_count, behavior_count, day_score, total_score,
+                   redeemed_cost, balance, last_record_ts, counters, recent_levels
+            FROM daily_state_snapshot WHERE day_key < ? ORDER BY day_key DESC LIMIT 1
+        ''', (before_day_key,))
+        return self._snapshot_from_row(self.cursor.fetchone())
+    
+    def _snapshot_from_row(self, row):
+        """将daily_state_snapshot的查询行转换为字典，没有行时返回None"""
+        if not row:
+            return None
+        return {
+            "day_key": row[0],
+            "end_energy": row[1],
+            "combo_count": row[2],
+            "behavior_count": row[3],
+            "day_score": row[4],
+            "total_score": row[5],
+            "redeemed_cost": row[6],
+            "balance": row[7],
+            "last_record_ts": row[8],
+            "counters": row[9],
+            "recent_levels": row[10]
+        }
+    
+    # ----------------- 成就相关 -----------------
+    def record_behavior_event(self, payload, ts, achievement_engine=None, score_target=None):
+        """追加behavior_recorded事件，并在同一事务内更新成就计数器、写入解锁的成就，
+        指定score_target时同时置位当天的连续天数位图
+        
+        Returns:
+            (事件id, 本次解锁的成就规则列表)，失败时事件id为False
+        """
+        try:
+            result = self.write_behavior_event(payload, ts, achievement_engine, score_target)
+            self.conn.commit()
+            return result
+        except Exception as e:
+            self.conn.rollback()
+            print(f"追加状态事件失败: {e}")
+            return False, []
+    
+    def write_behavior_event(self, payload, ts, achievement_engine=None, score_target=None):
+        """追加behavior_recorded事件并更新成就与连续天数位图（不提交，由调用方在同一事务内提交）
+        
+        Returns:
+            (事件id, 本次解锁的成就规则列表)
+        """
+        event_id = events.append_event(self.conn, events.BEHAVIOR_RECORDED, payload, ts)
+        unlocked = []
+        if achievement_engine is not None:
+            counters = self.get_achievement_counters(achievement_engine.counter_keys(payload))
+            achievement_engine.update_counters(counters, payload, payload["start_ts"])
+            candidates = [rule["id"] for rule in achievement_engine.candidate_rules(payload)]
+            unlocked = achievement_engine.evaluate(counters, payload, self.get_unlocked_types(candidates))
+            self.write_achievement_counters(counters)
+            self.write_achievement_unlocks({rule["id"]: {"count": 1, "unlock_ts": ts} for rule in unlocked})
+        if score_target is not None:
+            # 与事件折叠进的每日汇总是同一天（events.event_day_key：行为按开始时间归日）
+            day_key = events.event_day_key(events.BEHAVIOR_RECORDED, payload, ts)
+            summary = events.get_daily_summary(self.conn, day_key)
+            day_score = summary["total_score"] if summary else payload["final_score"]
+            # 有正向行为、完成S级行为只会新增；当日得分按最新汇总判断（负分行为可能跌破目标）
+            flags = day_conditions([payload["level"]], day_score, score_target)
+            bitmaps = self.get_streak_bitmaps()
+            for condition in (CONDITION_POSITIVE, CONDITION_S_DONE):
+                flags[condition] = flags[condition] or bitmaps[condition].test(day_key)
+            self.write_streak_day(day_key, flags, bitmaps)
+        return event_id, unlocked
+    
+    def get_achievement_counters(self, keys):
+        """按键获取成就计数器（主键查询）"""
+        if not keys:
+            return {}
+        placeholders = ', '.join(['?'] * len(keys))
+        self.cursor.execute(f'''
+            SELECT counter_key, value, day_key FROM achievement_counter WHERE counter_key IN ({placeholders})
+        ''', list(keys))
+        return {row[0]: {"value": row[1], "day_key": row[2]} for row in self.cursor.fetchall()}
+    
+    def write_achievement_counters(self, counters):
+        """写回成就计数器（不提交）"""
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO achievement_counter (counter_key, value, day_key) VALUES (?, ?, ?)
+        ''', [(key, counter["value"], counter["day_key"]) for key, counter in counters.items()])
+    
+    def get_unlocked_types(self, rule_ids):
+        """rule_ids中已经解锁过的成就"""
+        if not rule_ids:
+            return set()
+        placeholders = ', '.join(['?'] * len(rule_ids))
+        self.cursor.execute(f'SELECT type FROM user_achievement WHERE type IN ({placeholders})', list(rule_ids))
+        return {row[0] for row in self.cursor.fetchall()}
+    
+    def write_achievement_unlocks(self, unlocks):
+        """写入解锁的成就：已解锁过的累加次数并更新解锁时间（不提交）
+        
+        Args:
+            unlocks: {规则id: {"count": 次数, "unlock_ts": 解锁时间}}
+        """
+        for rule_id, unlock in unlocks.items():
+            self.cursor.execute('''
+                UPDATE user_achievement SET count = count + ?, unlock_ts = ? WHERE type = ?
+            ''', (unlock["count"], unlock["unlock_ts"], rule_id))
+            if self.cursor.rowcount == 0:
+                self.cursor.execute('''
+                    INSERT INTO user_achievement (type, unlock_ts, count) VALUES (?, ?, ?)
+                ''', (rule_id, unlock["unlock_ts"], unlock["count"]))
+    
+    def has_achievement_counters(self):
+        """成就计数器是否已经初始化"""
+        self.cursor.execute('SELECT 1 FROM achievement_counter LIMIT 1')
+        return self.cursor.fetchone() is not None
+    
+    def seed_achievements(self, achievement_engine, before_ts):
+        """成就计数器为空时，按历史记录一次性初始化计数器和已达成的成就
+        
+        Returns:
+            是否进行了初始化
+        """
+        try:
+            seeded = self.write_achievement_seed(achievement_engine, before_ts)
+            if seeded:
+                self.conn.commit()
+            return seeded
+        except Exception as e:
+            self.conn.rollback()
+            print(f"初始化成就计数器失败: {e}")
+            return False
+    
+    def write_achievement_seed(self, achievement_engine, before_ts):
+        """成就计数器为空时按历史记录写入计数器和已达成的成就（不提交）
+        
+        Returns:
+            是否进行了初始化
+        """
+        if self.has_achievement_counters():
+            return False
+        seeded = achievement_engine.replay(self.iter_records_between(0, before_ts))
+        if not seeded["counters"]:
+            return False
+        self.write_achievement_counters(seeded["counters"])
+        self.write_achievement_unlocks(seeded["unlocks"])
+        return True
+    
+    def write_achievement_replay(self, achievement_engine, day_key, checkpoint_before):
+        """day_key及之后的记录变化后，重写成就计数器和已解锁的成就（不提交）
+        
+        从day_key之前最近的检查点开始重放之后的全部记录；day_key及之后的检查点作废，
+        重放经过的、早于checkpoint_before的日期重新写入检查点
+        （之后的日期还可能有实时记录的行为归入，不写检查点）
+        
+        Args:
+            achievement_engine: 成就引擎
+            day_key: 最早发生变化的日期
+            checkpoint_before: 只为早于该日期的日期写入检查点
+        """
+        self.cursor.execute('DELETE FROM achievement_checkpoint WHERE day_key >= ?', (day_key,))
+        self.cursor.execute('''
+            SELECT day_key, counters, unlocks FROM achievement_checkpoint ORDER BY day_key DESC LIMIT 1
+        ''')
+        row = self.cursor.fetchone()
+        if row:
+            counters, unlocks = json.loads(row[1]), json.loads(row[2])
+            from_ts = int((datetime.strptime(row[0], '%Y-%m-%d') + timedelta(days=1)).timestamp())
+        else:
+            counters, unlocks, from_ts = {}, {}, 0
+        
+        checkpoints = []
+        
+        def save_checkpoint(replayed_day, replayed):
+            if replayed_day < checkpoint_before:
+                checkpoints.append((replayed_day, json.dumps(replayed["counters"]), json.dumps(replayed["unlocks"])))
+        
+        last_start_ts = self.cursor.execute('SELECT MAX(start_ts) FROM core_behavior').fetchone()[0] or 0
+        replayed = achievement_engine.replay(self.iter_records_between(from_ts, last_start_ts),
+                                             counters, unlocks, save_checkpoint)
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO achievement_checkpoint (day_key, counters, unlocks) VALUES (?, ?, ?)
+        ''', checkpoints)
+        
+        rule_ids = list(achievement_engine.rules)
+        placeholders = ', '.join(['?'] * len(rule_ids))
+        self.cursor.execute('DELETE FROM achievement_counter')
+        self.cursor.execute(f'DELETE FROM user_achievement WHERE type IN ({placeholders})', rule_ids)
+        self.write_achievement_counters(replayed["counters"])
+        self.write_achievement_unlocks(replayed["unlocks"])
+    
+    def get_achievements(self, unlock_ts=None):
+        """获取已解锁的成就（按解锁时间排序），可只取某一时刻解锁的成就"""
+        if unlock_ts is None:
+            self.cursor.execute('SELECT type, unlock_ts, count FROM user_achievement ORDER BY unlock_ts')
+        else:
+            self.cursor.execute('SELECT type, unlock_ts, count FROM user_achievement WHERE unlock_ts = ?', (unlock_ts,))
+        return [{"type": row[0], "unlock_ts": row[1], "count": row[2]} for row in self.cursor.fetchall()]
+    
+    # ----------------- 连续天数位图相关 -----------------
+    def get_streak_bitmaps(self, user_id=1):
+        """获取各条件的按天位图"""
+        self.cursor.execute('SELECT condition, bits FROM streak_bitmap WHERE user_id = ?', (user_id,))
+        bitmaps = {condition: DayBitmap() for condition in STREAK_CONDITIONS}
+        for condition, bits in self.cursor.fetchall():
+            bitmaps[condition] = DayBitmap(bits)
+        return bitmaps
+    
+    def write_streak_day(self, day_key, flags, bitmaps=None, user_id=1):
+        """设置某天各条件的位（不提交）
+        
+        Args:
+            day_key: 日期键
+            flags: {条件: 是否满足}
+            bitmaps: 已读取的位图，不指定时重新读取
+        """
+        bitmaps = bitmaps or self.get_streak_bitmaps(user_id)
+        for condition, value in flags.items():
+            bitmaps[condition].set(day_key, value)
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO streak_bitmap (user_id, condition, bits) VALUES (?, ?, ?)
+        ''', [(user_id, condition, bitmap.to_bytes()) for condition, bitmap in bitmaps.items()])
+    
+    def seed_streak_bitmaps(self, score_target, user_id=1):
+        """位图为空时，按每天的行为汇总一次性建立位图
+        
+        Returns:
+            是否进行了初始化
+        """
+        try:
+            seeded = self.write_streak_seed(score_target, user_id)
+            if seeded:
+                self.conn.commit()
+            return seeded
+        except Exception as e:
+            self.conn.rollback()
+            print(f"初始化连续天数位图失败: {e}")
+            return False
+    
+    def write_streak_seed(self, score_target, user_id=1):
+        """位图为空时按每天的行为汇总写入位图（不提交）
+        
+        Returns:
+            是否进行了初始化
+        """
+        self.cursor.execute('SELECT 1 FROM streak_bitmap WHERE user_id = ? LIMIT 1', (user_id,))
+        if self.cursor.fetchone():
+            return False
+        self.cursor.execute('''
+            SELECT date(start_ts, 'unixepoch', 'localtime') AS day_key,
+                   MAX(level BETWEEN 3 AND 5), MAX(level = 5), SUM(final_score)
+            FROM core_behavior GROUP BY day_key
+        ''')
+        rows = self.cursor.fetchall()
+        if not rows:
+            return False
+        bitmaps = {condition: DayBitmap() for condition in STREAK_CONDITIONS}
+        for day_key, has_positive, has_s, day_score in rows:
+            bitmaps[CONDITION_POSITIVE].set(day_key, bool(has_positive))
+            bitmaps[CONDITION_S_DONE].set(day_key, bool(has_s))
+            bitmaps[CONDITION_SCORE_TARGET].set(day_key, (day_score or 0.0) >= score_target)
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO streak_bitmap (user_id, condition, bits) VALUES (?, ?, ?)
+        ''', [(user_id, condition, bitmap.to_bytes()) for condition, bitmap in bitmaps.items()])
+        return True
+    
     # ----------------- 用户状态相关 -----------------
     def get_user_state(self):
         """获取用户状态"""
@@ -237,56 +924,83 @@ class StorageEngine:
             "today_total_score": row[3],
             "today_behavior_count": row[4],
             "last_record_ts": row[5],
-            "efficient_periods": json.loads(row[6]) if row[6] else []
+            "efficient_periods": json.loads(row[6]) if row[6] else [],
+            "lucky_state": row[7]
         }
     
     def update_user_state(self, **kwargs):
-        """更新用户状态"""
+        """更新用户状态（追加state_set事件，由投影写回user_state）"""
         if not kwargs:
             return True
+        return self.append_state_event(events.STATE_SET, kwargs) is not False
+    
+    # ----------------- 状态事件相关 -----------------
+    def append_state_event(self, event_type, payload, ts=None, energy_samples=()):
+        """追加状态事件并在同一事务内更新投影，返回事件id
         
-        # 构建更新语句
-        set_clause = ', '.join([f"{key} = ?" for key in kwargs.keys()])
-        values = list(kwargs.values())
-        
+        energy_samples为事件之前空档中的精力采样点[(时间戳, 精力)]，与事件在同一事务内写入
+        """
         try:
-            # 先检查是否存在记录
-            self.cursor.execute('SELECT id FROM user_state WHERE id = 1')
-            exists = self.cursor.fetchone()
-            
-            if exists:
-                # 更新现有记录
-                sql = f"UPDATE user_state SET {set_clause} WHERE id = 1"
-                self.cursor.execute(sql, values)
-            else:
-                # 插入新记录
-                columns = ', '.join(['id'] + list(kwargs.keys()))
-                placeholders = ', '.join(['?'] * (len(kwargs) + 1))
-                sql = f"INSERT INTO user_state ({columns}) VALUES ({placeholders})"
-                self.cursor.execute(sql, [1] + values)
-            
+            event_id = self.write_state_event(event_type, payload, ts, energy_samples)
             self.conn.commit()
-            return True
+            return event_id
         except Exception as e:
-            print(f"更新用户状态失败: {e}")
+            self.conn.rollback()
+            print(f"追加状态事件失败: {e}")
             return False
     
+    def write_state_event(self, event_type, payload, ts=None, energy_samples=()):
+        """追加状态事件、更新投影并写入精力采样点（不提交，由调用方在同一事务内提交），返回事件id"""
+        energy_series.add_points(self.conn, energy_samples, energy_series.KIND_SAMPLE)
+        return events.append_event(self.conn, event_type, payload, ts)
+    
+    def get_state_events(self, day_key=None, after_id=0):
+        """获取状态事件（可按日期过滤），用于审计"""
+        return list(events.iter_events(self.conn, after_id, day_key))
+    
+    def get_daily_summary(self, day_key):
+        """获取每日汇总投影"""
+        return events.get_daily_summary(self.conn, day_key)
+    
+    def replace_energy_range(self, start_ts, end_ts, points, samples=()):
+        """重写[start_ts, end_ts)内的精力时间序列（重新计分用；不提交，由调用方在同一事务内提交）"""
+        energy_series.replace_range(self.conn, start_ts, end_ts, points, samples)
+    
+    def get_energy_series(self, start_ts, end_ts, buckets, until_ts=None):
+        """[start_ts, end_ts)等分为buckets段的平均精力（一次区间查询，在SQL中降采样）"""
+        return energy_series.downsample(self.conn, start_ts, end_ts, buckets, until_ts)
+    
+    def rebuild_projections(self, day_key=None):
+        """由事件日志重建user_state、连击状态和每日汇总"""
+        try:
+            projection = events.rebuild_projections(self.conn, day_key)
+            self.conn.commit()
+            return projection
+        except Exception as e:
+            self.conn.rollback()
+            print(f"重建状态投影失败: {e}")
+            return None
+    
     # ----------------- 配置相关 -----------------
     def set_config(self, key, value):
         """设置配置"""
-        json_value = json.dumps(value)
         try:
-            self.cursor.execute('''
-                INSERT INTO system_config (key, value)
-                VALUES (?, ?)
-                ON CONFLICT(key) DO UPDATE SET value = ?
-            ''', (key, json_value, json_value))
+            self.write_config(key, value)
             self.conn.commit()
             return True
         except Exception as e:
             print(f"设置配置失败: {e}")
             return False
     
+    def write_config(self, key, value):
+        """写入配置（不提交，由调用方在同一事务内提交）"""
+        json_value = json.dumps(value)
+        self.cursor.execute('''
+            INSERT INTO system_config (key, value)
+            VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = ?
+        ''', (key, json_value, json_value))
+    
     def get_config(self, key, default=None):
         """获取配置"""
         self.cursor.execute('SELECT value FROM system_config WHERE key = ?', (key,))
@@ -378,18 +1092,36 @@ class StorageEngine:
         }
     
     def redeem_wish(self, wish_id, user_id=1):
-        """兑换心愿"""
+        """兑换心愿（同一事务内追加wish_redeemed事件）"""
         try:
             # 更新心愿状态为已兑换
+            redeemed_at = self.get_current_timestamp()
             self.cursor.execute('''
                 UPDATE wishes SET status = 'redeemed', redeemed_at = ? WHERE id = ? AND user_id = ?
-            ''', (self.get_current_timestamp(), wish_id, user_id))
+            ''', (redeemed_at, wish_id, user_id))
+            if self.cursor.rowcount == 0:
+                self.conn.rollback()
+                return False
+            
+            self.cursor.execute('SELECT cost FROM wishes WHERE id = ?', (wish_id,))
+            cost = self.cursor.fetchone()[0]
+            events.append_event(self.conn, events.WISH_REDEEMED, {"wish_id": wish_id, "cost": cost}, redeemed_at)
             self.conn.commit()
-            return self.cursor.rowcount > 0
+            return True
         except Exception as e:
+            self.conn.rollback()
             print(f"兑换心愿失败: {e}")
             return False
     
+    def get_redemptions_between(self, start_ts, end_ts, user_id=1):
+        """按兑换时间升序获取[start_ts, end_ts]内的心愿兑换"""
+        self.cursor.execute('''
+            SELECT redeemed_at, cost FROM wishes
+            WHERE user_id = ? AND status = 'redeemed' AND redeemed_at >= ? AND redeemed_at <= ?
+            ORDER BY redeemed_at
+        ''', (user_id, start_ts, end_ts))
+        return [{"redeemed_at": row[0], "cost": row[1]} for row in self.cursor.fetchall()]
+    
     def update_wish_progress(self, wish_id, progress, user_id=1):
         """更新心愿进度"""
         try:
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""成就计数器：补录、修改、删除后与按全部记录重放的结果一致"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_manager
+from storage_engine import StorageEngine
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    yield storage
+    storage.close()
+    # 补录、修改、删除后安排的高效时段学习按当前目录打开数据库，切换目录前等待它结束
+    data_manager.schedule_efficient_periods_update().result()
+
+
+def _day(offset, hour, minute=0):
+    start = (datetime.now() - timedelta(days=10)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start + timedelta(days=offset, hours=hour, minutes=minute)
+
+
+def _achievements(storage):
+    """当前的成就计数器和已解锁成就"""
+    counters = {key: (round(counter["value"], 6), counter["day_key"])
+                for key, counter in storage.get_achievement_counters(
+                    [row[0] for row in storage.conn.execute('SELECT counter_key FROM achievement_counter')]).items()}
+    unlocks = {achievement["type"]: (achievement["count"], achievement["unlock_ts"])
+               for achievement in storage.get_achievements()}
+    return counters, unlocks
+
+
+def _replayed(storage):
+    """按全部记录从头重放的成就计数器和已解锁成就"""
+    replayed = data_manager.ACHIEVEMENT_ENGINE.replay(storage.iter_records_between(0, datetime.now().timestamp()))
+    counters = {key: (round(counter["value"], 6), counter["day_key"]) for key, counter in replayed["counters"].items()}
+    unlocks = {rule_id: (unlock["count"], unlock["unlock_ts"]) for rule_id, unlock in replayed["unlocks"].items()}
+    return counters, unlocks
+
+
+def test_delete_rolls_back_counters_and_unlocks(storage):
+    record_ids = []
+    for index in range(3):
+        start_ts = int(_day(9, 9 + index).timestamp())
+        assert data_manager.add_behavior_record("S", 30, 3, start_ts, start_ts + 1800, 400, 1.0, 400, 10, "写作")
+        record_ids.append(storage.conn.execute('SELECT MAX(id) FROM core_behavior').fetchone()[0])
+    counters, unlocks = _achievements(storage)
+    assert counters["total_score"][0] == 1200 and counters["minutes:S"][0] == 90
+    assert {"total_1000", "combo_3"} <= set(unlocks)
+
+    for record_id in record_ids[1:]:
+        assert data_manager.delete_behavior(record_id)
+    counters, unlocks = _achievements(storage)
+    assert (counters, unlocks) == _replayed(storage)
+    assert counters["minutes:S"][0] == 30
+    assert counters["total_score"][0] < 1000
+    assert not {"total_1000", "combo_3"} & set(unlocks)
+
+
+def test_out_of_order_inserts_match_replay(storage):
+    # 倒序补录：连续天数和连击按开始时间重新统计
+    for offset in (4, 2, 3, 0, 1):
+        for hour in (9, 10, 11):
+            assert data_manager.insert_behavior_at("写作", "S", 40, 4, _day(offset, hour))
+    counters, unlocks = _achievements(storage)
+    assert (counters, unlocks) == _replayed(storage)
+    assert counters["streak_days"][0] == 5
+    assert {"streak_3", "combo_3"} <= set(unlocks)
+
+    # 中间一天改为负向行为：连续天数中断
+    record = next(storage.iter_records_between(int(_day(2, 0).timestamp()), int(_day(3, 0).timestamp())))
+    assert data_manager.edit_behavior(record["id"], level="D", name="刷手机")
+    counters, unlocks = _achievements(storage)
+    assert (counters, unlocks) == _replayed(storage)
+
+
+def test_replay_from_checkpoint_matches_full_replay(storage):
+    for offset in range(8):
+        assert data_manager.insert_behavior_at("读书", "A" if offset % 3 else "C", 60, 3, _day(offset, 20))
+    checkpoints = [row[0] for row in storage.conn.execute('SELECT day_key FROM achievement_checkpoint ORDER BY day_key')]
+    assert checkpoints == [_day(offset, 0).strftime("%Y-%m-%d") for offset in range(8)]
+
+    # 修改较晚的一天：之前的检查点保留，从最近的检查点重放
+    record = next(storage.iter_records_between(int(_day(6, 0).timestamp()), int(_day(7, 0).timestamp())))
+    assert data_manager.edit_behavior(record["id"], duration=120)
+    assert (storage.conn.execute('SELECT COUNT(*) FROM achievement_checkpoint').fetchone()[0]) == 8
+    assert _achievements(storage) == _replayed(storage)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""高效时段学习：最少样本、检查点恢复、补录/修改/删除后重新学习"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_manager
+from src.scoring.efficiency import EfficiencyTracker, periods_to_ranges
+from storage_engine import StorageEngine
+
+
+def _ts(day, hour, minute=0):
+    return datetime(2026, 3, day, hour, minute).timestamp()
+
+
+def _covers(periods, hour):
+    """高效时段是否覆盖hour开始的一小时"""
+    return any(start <= hour * 60 and hour * 60 + 60 <= end for start, end in periods_to_ranges(periods))
+
+
+def _add(tracker, day, hour, duration, score):
+    start_ts = _ts(day, hour)
+    tracker.add(start_ts, start_ts + duration * 60, duration, score, duration * 0.5)
+
+
+def test_single_record_does_not_form_a_window():
+    tracker = EfficiencyTracker()
+    _add(tracker, 1, 9, 60, 300)
+    _add(tracker, 1, 20, 60, 30)
+    assert tracker.best_windows() == []
+
+    # 记录按时间衰减计数，需要足够多的近期记录
+    for day in (2, 3, 4):
+        _add(tracker, day, 9, 60, 300)
+    periods = tracker.efficient_periods()
+    assert len(periods) == 1 and _covers(periods, 9)
+
+
+def test_checkpoint_keeps_window_records():
+    tracker = EfficiencyTracker()
+    for day in range(1, 6):
+        _add(tracker, day, 9, 60, 300)
+        _add(tracker, day, 20, 60, 30)
+    restored = EfficiencyTracker.from_dict(tracker.to_dict())
+    assert restored.window_records == tracker.window_records
+    assert restored.best_windows() == tracker.best_windows()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    yield storage
+    storage.close()
+
+
+def _learned(storage):
+    """等待后台学习完成，返回学习结果和当前检查点"""
+    data_manager.schedule_efficient_periods_update().result()
+    return storage.get_user_state()["efficient_periods"], storage.get_config(data_manager.EFFICIENCY_STATE_KEY)
+
+
+def test_revisions_relearn_from_history(storage):
+    start = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0) - timedelta(days=10)
+    ids = []
+    for day in range(8):
+        ids.append(data_manager.insert_behavior_at("写作", "S", 60, 4, start + timedelta(days=day)))
+        assert data_manager.insert_behavior_at("读书", "B", 60, 3, start + timedelta(days=day, hours=11))
+    assert all(ids)
+    periods, _ = _learned(storage)
+    assert _covers(periods, 9)
+
+    # 补录、修改后的得分都应反映在检查点中，与从头学习的结果一致
+    assert data_manager.insert_behavior_at("刷手机", "D", 120, 2, start + timedelta(days=3, hours=-3))
+    for day, record_id in enumerate(ids[2:], 2):
+        assert data_manager.edit_behavior(record_id, start_time=start + timedelta(days=day, hours=8))
+    periods, checkpoint = _learned(storage)
+    assert checkpoint["revision"] == storage.get_config(data_manager.EFFICIENCY_REVISION_KEY)
+    assert checkpoint["last_id"] == max(record["id"] for record in storage.iter_records_after())
+    assert periods == data_manager.update_efficient_periods(storage, rebuild=True)
+    assert _covers(periods, 17) and not _covers(periods, 9)
+
+    for record_id in ids[2:]:
+        assert data_manager.delete_behavior(record_id)
+    periods, _ = _learned(storage)
+    assert not _covers(periods, 17)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""状态事件日志：增量投影与重建一致、投影快照、state_set字段校验"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.db import events
+from storage_engine import StorageEngine
+
+LEVELS = ("S", "A", "B", "C", "D", "R")
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    yield storage
+    storage.close()
+
+
+def _append_history(storage, seed, days=6):
+    """按天追加每日重置、恢复、行为、兑换和state_set事件（超过一个快照间隔）"""
+    rng = random.Random(seed)
+    energy = 100.0
+    day = datetime(2026, 3, 1)
+    for day_index in range(days):
+        day_start = day + timedelta(days=day_index)
+        energy = min(120.0, energy + 56)
+        assert storage.append_state_event(events.DAILY_RESET, {
+            "day_key": day_start.strftime("%Y-%m-%d"), "sleep_recovery": 56, "energy_after": energy
+        }, day_start.timestamp())
+        ts = day_start.timestamp() + 8 * 3600
+        for _ in range(rng.randint(15, 25)):
+            if rng.random() < 0.3:
+                amount = round(rng.uniform(1, 10), 2)
+                energy = min(120.0, energy + amount)
+                assert storage.append_state_event(events.RECOVERY_APPLIED, {"amount": amount, "energy_after": energy}, ts)
+            duration = rng.randint(10, 40)
+            energy_consume = round(rng.uniform(-5, 15), 2)
+            energy = max(0.0, energy - energy_consume)
+            assert storage.append_state_event(events.BEHAVIOR_RECORDED, {
+                "record_id": None, "name": "行为", "level": rng.choice(LEVELS), "duration": duration,
+                "start_ts": ts, "end_ts": ts + duration * 60, "final_score": round(rng.uniform(-20, 80), 2),
+                "energy_consume": energy_consume, "energy_after": energy
+            }, ts + duration * 60)
+            ts += duration * 60 + rng.randint(0, 90) * 60
+        wish_id = storage.add_wish(f"心愿{day_index}", rng.randint(10, 50))
+        assert storage.redeem_wish(wish_id)
+        assert storage.update_user_state(efficient_periods=f'["0{day_index}:00-0{day_index + 1}:00"]')
+
+
+def _summaries(storage):
+    day_keys = [row[0] for row in storage.conn.execute('SELECT day_key FROM daily_summary ORDER BY day_key')]
+    return {day_key: storage.get_daily_summary(day_key) for day_key in day_keys}
+
+
+def _combo_state(storage):
+    return storage.conn.execute('SELECT recent_levels, last_event_id FROM combo_state').fetchone()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rebuild_matches_incremental_projection(storage, seed):
+    _append_history(storage, seed)
+    last_event_id = storage.get_state_events()[-1]["id"]
+    assert last_event_id > events.SNAPSHOT_INTERVAL
+    user_state, combo_state, summaries = storage.get_user_state(), _combo_state(storage), _summaries(storage)
+
+    # 破坏投影后由事件日志重建（从最近的快照开始折叠）
+    storage.conn.execute('UPDATE user_state SET current_energy = -1, combo_count = 99, today_total_score = 0')
+    storage.conn.execute("UPDATE daily_summary SET total_score = 0, level_counts = '{}'")
+    storage.conn.commit()
+    projection = storage.rebuild_projections()
+    assert projection["last_event_id"] == last_event_id
+    assert storage.get_user_state() == user_state
+    assert _combo_state(storage) == combo_state
+    assert _summaries(storage) == summaries
+
+    # 没有快照时从第一条事件折叠，结果相同
+    storage.conn.execute('DELETE FROM state_snapshot')
+    storage.conn.commit()
+    storage.rebuild_projections()
+    assert storage.get_user_state() == user_state
+    assert _summaries(storage) == summaries
+
+
+def test_daily_summary_matches_events(storage):
+    _append_history(storage, 5)
+    for day_key, summary in _summaries(storage).items():
+        day_events = storage.get_state_events(day_key)
+        behaviors = [event["payload"] for event in day_events if event["event_type"] == events.BEHAVIOR_RECORDED]
+        assert summary["behavior_count"] == len(behaviors)
+        assert summary["total_score"] == pytest.approx(sum(payload["final_score"] for payload in behaviors))
+        assert sum(summary["level_counts"].values()) == len(behaviors)
+        assert summary["redeemed_cost"] == sum(event["payload"]["cost"] for event in day_events
+                                               if event["event_type"] == events.WISH_REDEEMED)
+
+    # 只重建一天的汇总时其他日期不受影响
+    summaries = _summaries(storage)
+    day_key = sorted(summaries)[2]
+    storage.conn.execute('DELETE FROM daily_summary WHERE day_key = ?', (day_key,))
+    storage.conn.commit()
+    storage.rebuild_projections(day_key)
+    assert _summaries(storage) == summaries
+
+
+def test_state_set_rejects_unknown_fields(storage):
+    events_before = len(storage.get_state_events())
+    assert storage.update_user_state(current_energy=42.0)
+    assert storage.update_user_state(current_energy=1.0, total_score=5) is False
+    assert len(storage.get_state_events()) == events_before + 1
+    assert storage.get_user_state()["current_energy"] == 42.0
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""幸运系数引擎：批量抽取与逐次抽取一致、检查点可重放、系数随记录保存并在重新计分时重新应用"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_manager
+from src.scoring.lucky import LuckyEngine, LuckyStream, PITY_THRESHOLD
+from storage_engine import StorageEngine
+
+
+def _sequential(engine, stream, behaviors_counts):
+    return [engine.draw(stream, behaviors_count) for behaviors_count in behaviors_counts]
+
+
+@pytest.mark.parametrize("base_luck_rate", [0.0, 0.05, 0.1, 0.5, 1.0])
+@pytest.mark.parametrize("unlucky", range(PITY_THRESHOLD + 2))
+def test_draw_batch_matches_sequential(base_luck_rate, unlucky):
+    engine = LuckyEngine({"base_luck_rate": base_luck_rate, "fatigue_factor": 0.9})
+    rng = random.Random(base_luck_rate * 100 + unlucky)
+    for _ in range(20):
+        seed, counter = rng.getrandbits(64), rng.randrange(1000)
+        behaviors_counts = [rng.randrange(12) for _ in range(rng.randrange(40))]
+        batch_stream = LuckyStream(seed, counter, unlucky)
+        sequential_stream = LuckyStream(seed, counter, unlucky)
+
+        assert engine.draw_batch(batch_stream, behaviors_counts) == _sequential(engine, sequential_stream, behaviors_counts)
+        assert batch_stream.to_state() == sequential_stream.to_state()
+
+
+def test_draw_batch_in_chunks_matches_one_batch():
+    engine = LuckyEngine({})
+    behaviors_counts = [index % 8 for index in range(100)]
+    whole_stream = LuckyStream(42)
+    whole = engine.draw_batch(whole_stream, behaviors_counts)
+
+    chunked_stream = LuckyStream(42)
+    chunked = []
+    for start in range(0, len(behaviors_counts), 7):
+        chunked.extend(engine.draw_batch(chunked_stream, behaviors_counts[start:start + 7]))
+
+    assert chunked == whole
+    assert chunked_stream.to_state() == whole_stream.to_state()
+
+
+def test_pity_timer_forces_a_hit():
+    engine = LuckyEngine({"base_luck_rate": 0.0})
+    results = engine.draw_batch(LuckyStream(7), [0] * 12)
+    hits = [index for index, result in enumerate(results) if result["is_lucky"]]
+    assert hits == [PITY_THRESHOLD, 2 * PITY_THRESHOLD + 1, 3 * PITY_THRESHOLD + 2]
+
+
+def test_checkpoint_replays_the_same_draws():
+    engine = LuckyEngine({"base_luck_rate": 0.3})
+    stream = LuckyStream(123)
+    engine.draw_batch(stream, range(5))
+    checkpoint = stream.to_state()
+
+    first = _sequential(engine, stream, range(10))
+    second = _sequential(engine, LuckyStream.from_state(checkpoint), range(10))
+    assert first == second
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    # 连续未触发次数达到保底：下一次抽取必定触发
+    assert storage.update_user_state(lucky_state=LuckyStream(7, 0, PITY_THRESHOLD).to_state())
+    yield storage
+    storage.close()
+    # 记录、修改后安排的高效时段学习按当前目录打开数据库，切换目录前等待它结束
+    data_manager.schedule_efficient_periods_update().result()
+
+
+def _lucky_stream(storage):
+    return LuckyStream.from_state(storage.get_user_state()["lucky_state"])
+
+
+def _start_ts(hour):
+    day = (datetime.now() - timedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((day + timedelta(hours=hour)).timestamp())
+
+
+def _record_day(storage):
+    """记录一天的三条行为，第二条抽取幸运系数，返回记录id和抽取结果"""
+    ids, lucky = [], None
+    for index, (level, name, hour) in enumerate((("A", "读书", 9), ("S", "写作", 11), ("B", "散步", 15))):
+        draw = data_manager.calculate_lucky_coefficient(index) if index == 1 else None
+        score = 50.0 * (draw["coefficient"] if draw else 1.0)
+        start_ts = _start_ts(hour)
+        assert data_manager.add_behavior_record(level, 30, 3, start_ts, start_ts + 1800, score, 1.0, score, 5, name,
+                                                lucky=draw)
+        ids.append(storage.conn.execute('SELECT MAX(id) FROM core_behavior').fetchone()[0])
+        lucky = lucky or draw
+    return ids, lucky
+
+
+def test_draw_is_written_with_the_record(storage, monkeypatch):
+    ids, lucky = _record_day(storage)
+    assert lucky["is_lucky"]
+    assert storage.get_record(ids[1])["lucky_coeff"] == lucky["coefficient"]
+    assert storage.get_record(ids[0])["lucky_coeff"] == 1.0
+    stream = _lucky_stream(storage)
+    assert (stream.seed, stream.counter, stream.unlucky) == (7, 2, 0)
+
+    # 记录失败时随机数流不前进
+    def fail(*args, **kwargs):
+        raise RuntimeError("写入失败")
+
+    draw = data_manager.calculate_lucky_coefficient(3)
+    monkeypatch.setattr(StorageEngine, "write_behavior_event", fail)
+    start_ts = _start_ts(18)
+    assert not data_manager.add_behavior_record("S", 30, 3, start_ts, start_ts + 1800, 50, 1.0, 50, 5, "写作", lucky=draw)
+    assert _lucky_stream(storage).to_state() == stream.to_state()
+
+
+def test_edit_keeps_lucky_coefficient(storage):
+    ids, lucky = _record_day(storage)
+    # 记录时的得分是假定值，先整天重新计分一次（修改当天第一条记录的名称）
+    assert data_manager.edit_behavior(ids[0], name="看书")
+    assert storage.get_record(ids[1])["lucky_coeff"] == lucky["coefficient"]
+
+    # 修改幸运的记录本身：系数保留
+    assert data_manager.edit_behavior(ids[1], duration=45)
+    edited = storage.get_record(ids[1])
+    assert edited["lucky_coeff"] == lucky["coefficient"]
+
+    # 修改之前的记录：幸运记录的得分不变
+    assert data_manager.edit_behavior(ids[0], name="读书")
+    assert storage.get_record(ids[1])["final_score"] == pytest.approx(edited["final_score"])
+
+    # 去掉系数后按相同输入重新计分，得分相差的正是系数
+    storage.conn.execute('UPDATE core_behavior SET lucky_coeff = 1.0 WHERE id = ?', (ids[1],))
+    storage.conn.commit()
+    assert data_manager.edit_behavior(ids[0], name="看书")
+    unlucky = storage.get_record(ids[1])
+    assert unlucky["final_score"] > 0
+    assert edited["final_score"] == pytest.approx(unlucky["final_score"] * lucky["coefficient"])
+
+
+def test_daily_reset_clears_pity(storage):
+    storage.set_config(data_manager.LAST_RESET_DATE_KEY, (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"))
+    assert storage.update_user_state(lucky_state=LuckyStream(7, 10, PITY_THRESHOLD - 1).to_state())
+    data_manager.reset_daily_data_if_needed(data_manager.load_user_data())
+    stream = _lucky_stream(storage)
+    assert (stream.seed, stream.counter, stream.unlucky) == (7, 10, 0)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""KLL分位数草图：秩误差界、合并、序列化"""
+
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+
+from src.db.quantiles import KLLSketch
+
+# k=200时的归一化秩误差界（见src/db/quantiles.py）
+RANK_ERROR = 0.0165
+
+FRACTIONS = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+def _rank_error(ordered, value, fraction):
+    """value在有序数据中的秩区间与目标分位的距离（归一化）"""
+    low = bisect_left(ordered, value) / len(ordered)
+    high = bisect_right(ordered, value) / len(ordered)
+    return max(0.0, low - fraction, fraction - high)
+
+
+def _sketch(values):
+    sketch = KLLSketch()
+    for value in values:
+        sketch.update(value)
+    return sketch
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rank_error_within_bound(seed):
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(3, 1) for _ in range(50000)]
+    sketch = _sketch(values)
+    ordered = sorted(values)
+
+    assert sketch.n == len(values)
+    assert sketch._size() < len(values)
+    for fraction, value in zip(FRACTIONS, sketch.quantiles(FRACTIONS)):
+        assert _rank_error(ordered, value, fraction) <= RANK_ERROR
+
+
+def test_merged_sketch_keeps_bound():
+    rng = random.Random(11)
+    months = [[rng.gauss(60 + 10 * month, 15) for _ in range(8000)] for month in range(6)]
+    merged = KLLSketch()
+    for values in months:
+        merged.merge(_sketch(values))
+    ordered = sorted(value for values in months for value in values)
+
+    assert merged.n == len(ordered)
+    assert (merged.min, merged.max) == (ordered[0], ordered[-1])
+    for fraction, value in zip(FRACTIONS, merged.quantiles(FRACTIONS)):
+        assert _rank_error(ordered, value, fraction) <= RANK_ERROR
+
+
+def test_small_sketch_is_exact():
+    values = list(range(150, 0, -1))
+    sketch = _sketch(values)
+    ordered = sorted(values)
+    for fraction, value in zip(FRACTIONS, sketch.quantiles(FRACTIONS)):
+        assert _rank_error(ordered, value, fraction) <= 1 / len(values)
+    assert sketch.quantiles((0, 1)) == [1, 150]
+
+
+def test_bytes_round_trip():
+    rng = random.Random(3)
+    sketch = _sketch(rng.random() for _ in range(5000))
+    restored = KLLSketch.from_bytes(sketch.to_bytes())
+
+    assert (restored.n, restored.min, restored.max) == (sketch.n, sketch.min, sketch.max)
+    assert restored.quantiles(FRACTIONS) == sketch.quantiles(FRACTIONS)
+    assert KLLSketch().quantile(0.5) is None
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""间隔恢复：跨夜间隔不重复计入睡眠恢复，自动恢复与重放一致"""
+
+from datetime import datetime
+
+import pytest
+
+import data_manager
+from src.scoring.energy import EnergyManager
+from src.scoring.recovery import SLEEP_HOURS
+from src.scoring.replay import recovery_start_ts
+from src.scoring.time_period import to_absolute_minute
+
+
+def _manager(last_record_ts):
+    return EnergyManager({"current_energy": 50.0, "last_record_ts": last_record_ts})
+
+
+@pytest.mark.parametrize("last, now", [
+    (datetime(2026, 3, 1, 9), datetime(2026, 3, 1, 15, 30)),
+    (datetime(2026, 3, 1, 22), datetime(2026, 3, 2, 10)),
+    (datetime(2026, 3, 1, 22), datetime(2026, 3, 2, SLEEP_HOURS - 1)),
+    (datetime(2026, 2, 26, 18), datetime(2026, 3, 2, 13, 45)),
+])
+def test_auto_recovery_starts_after_sleep(last, now):
+    manager = _manager(last.timestamp())
+    start = recovery_start_ts(last.timestamp(), now.timestamp())
+    expected = manager.recovery.gap_recovery(start, now)["total"]
+
+    assert manager.calculate_auto_recovery(now) == pytest.approx(expected)
+    assert data_manager.calculate_energy_recovery(last.timestamp(), now) == pytest.approx(expected)
+    assert data_manager.calculate_energy_recovery(last.isoformat(), now) == pytest.approx(expected)
+    if last.date() == now.date():
+        assert expected == pytest.approx(manager.recovery.gap_recovery(last, now)["total"])
+    else:
+        # 夜间的恢复由每日重置的睡眠恢复计入
+        assert expected < manager.recovery.gap_recovery(last, now)["total"]
+
+
+def test_absolute_minute_accepts_datetime_and_timestamp():
+    moment = datetime(2026, 3, 1, 23, 59, 30, 500000)
+    assert to_absolute_minute(moment) == to_absolute_minute(moment.timestamp())
+    assert to_absolute_minute(datetime(2026, 3, 2)) - to_absolute_minute(moment) == pytest.approx(29.5 / 60)
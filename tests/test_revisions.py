@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""补录、修改、删除行为后的重新计分：与按最终记录从头计分的结果一致"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_manager
+from src.db import events
+from storage_engine import StorageEngine
+
+# (天, 时, 分, 等级, 名称, 时长)：天为相对第一天的偏移
+PLAN = [
+    (0, 9, 0, "S", "写作", 60), (0, 10, 30, "B", "散步", 30), (0, 12, 0, "S", "写作", 30),
+    (0, 14, 0, "S", "写作", 45), (0, 16, 0, "S", "写作", 30), (0, 21, 0, "D", "刷手机", 60),
+    (1, 8, 30, "A", "读书", 90), (1, 13, 0, "R", "午睡", 30), (1, 15, 0, "C", "闲聊", 40), (1, 23, 0, "B", "散步", 30),
+    (2, 9, 0, "S", "写作", 60), (2, 11, 0, "S", "写作", 30), (2, 16, 0, "A", "读书", 45),
+    (3, 10, 0, "B", "散步", 30), (3, 19, 0, "D", "刷手机", 90),
+]
+
+
+def _first_day():
+    return (datetime.now() - timedelta(days=8)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _at(day, hour, minute):
+    return _first_day() + timedelta(days=day, hours=hour, minutes=minute)
+
+
+def _insert_all(plan):
+    """按时间顺序补录全部记录（每次补录都只重算之后的记录，结果即从头计分）"""
+    ids = []
+    for day, hour, minute, level, name, duration in sorted(plan):
+        record_id = data_manager.insert_behavior_at(name, level, duration, 3, _at(day, hour, minute))
+        assert record_id
+        ids.append(record_id)
+    return ids
+
+
+def _finish_learning():
+    """等待后台的高效时段学习结束（它按当前目录打开数据库）"""
+    data_manager.schedule_efficient_periods_update().result()
+
+
+def _result():
+    """全部记录的得分和精力消耗、每日快照、今天的状态（记录按开始时间和名称对应）"""
+    _finish_learning()
+    storage = StorageEngine()
+    records = {(record["start_ts"], record["name"]): (round(record["final_score"], 6), round(record["energy_consume"], 6))
+               for record in storage.iter_records_between(0, datetime.now().timestamp())}
+    snapshots = {}
+    for row in storage.conn.execute('SELECT day_key FROM daily_state_snapshot ORDER BY day_key'):
+        snapshot = storage.get_daily_snapshot(row[0])
+        snapshots[row[0]] = (round(snapshot["end_energy"], 6), round(snapshot["total_score"], 6),
+                             snapshot["behavior_count"], snapshot["counters"])
+    state = storage.get_user_state()
+    storage.close()
+    return records, snapshots, round(state["current_energy"], 6)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """被测数据库和对照数据库各用一个目录"""
+    (tmp_path / "revised").mkdir()
+    (tmp_path / "fresh").mkdir()
+    monkeypatch.chdir(tmp_path / "revised")
+
+    def use(name):
+        _finish_learning()
+        monkeypatch.chdir(tmp_path / name)
+
+    yield use
+    _finish_learning()
+
+
+def _expected(workdir, plan):
+    """在对照目录中按最终记录从头计分"""
+    workdir("fresh")
+    _insert_all(plan)
+    data_manager.write_daily_snapshots(datetime.now().strftime("%Y-%m-%d"))
+    result = _result()
+    workdir("revised")
+    return result
+
+
+def test_delete_restores_original_scores(workdir):
+    workdir("revised")
+    _insert_all(PLAN)
+    data_manager.write_daily_snapshots(datetime.now().strftime("%Y-%m-%d"))
+    original = _result()
+
+    record_id = data_manager.insert_behavior_at("跑步", "A", 50, 4, _at(1, 11, 0))
+    assert record_id
+    assert _result()[0] != original[0]
+    assert data_manager.delete_behavior(record_id)
+    assert _result() == original
+
+
+def test_edit_across_midnight(workdir):
+    workdir("revised")
+    ids = _insert_all(PLAN)
+    data_manager.write_daily_snapshots(datetime.now().strftime("%Y-%m-%d"))
+
+    # 第0天21:00的记录改到第2天00:30开始（从一天移到另一天），第1天23:00的记录延长到跨过零点
+    assert data_manager.edit_behavior(ids[5], start_time=_at(2, 0, 30), duration=45)
+    assert data_manager.edit_behavior(ids[9], duration=90)
+    plan = [entry for entry in PLAN if entry[:3] not in ((0, 21, 0), (1, 23, 0))]
+    plan += [(2, 0, 30, "D", "刷手机", 45), (1, 23, 0, "B", "散步", 90)]
+    assert _result() == _expected(workdir, plan)
+
+
+def test_snapshot_shift_matches_full_replay(workdir):
+    workdir("revised")
+    ids = _insert_all(PLAN)
+    data_manager.write_daily_snapshots(datetime.now().strftime("%Y-%m-%d"))
+    original = _result()
+    storage = StorageEngine()
+    last_event_id = storage.get_state_events()[-1]["id"]
+    storage.close()
+
+    # 只改名称：当天第4次“写作”不再受同一行为次数的惩罚，得分变化，但当天结束时的精力和最后记录时间不变，
+    # 之后的日期只平移快照中的累计得分
+    assert data_manager.edit_behavior(ids[4], name="写作课")
+    storage = StorageEngine()
+    revised = [event for event in storage.get_state_events(after_id=last_event_id)
+               if event["event_type"] == events.BEHAVIOR_REVISED]
+    storage.close()
+    assert [event["day_key"] for event in revised] == [_at(0, 0, 0).strftime("%Y-%m-%d")]
+
+    plan = [entry if entry[:3] != (0, 16, 0) else (0, 16, 0, "S", "写作课", 30) for entry in PLAN]
+    result = _result()
+    assert result[1] != original[1]
+    assert result == _expected(workdir, plan)
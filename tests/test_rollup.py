@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""汇总立方体和分位数草图：增量更新与全量重建结果一致"""
+
+import random
+from datetime import datetime
+
+import pytest
+
+from src.db import quantiles, rollup
+from storage_engine import StorageEngine
+
+LEVELS = ("S", "A", "B", "C", "D", "R")
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    yield storage
+    storage.close()
+
+
+def _random_record(rng):
+    start_ts = int(datetime(2026, rng.randint(1, 3), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59)).timestamp())
+    duration = rng.randint(5, 180)
+    return {
+        "level": rng.choice(LEVELS), "name": f"行为{rng.randrange(5)}", "duration": duration, "mood": 3,
+        "start_ts": start_ts, "end_ts": start_ts + duration * 60,
+        "final_score": round(rng.uniform(-20, 120), 2), "energy_consume": round(rng.uniform(-10, 30), 2)
+    }
+
+
+def _insert(storage, record):
+    return storage.insert_record_row(
+        record["level"], record["duration"], record["mood"], record["start_ts"], record["end_ts"],
+        record["final_score"], 1.0, record["final_score"], record["energy_consume"], record["name"]
+    )
+
+
+def _table(conn, table, keys):
+    """汇总表内容（度量四舍五入，去掉全为0的行）"""
+    rows = {}
+    for row in conn.execute(f'SELECT * FROM {table}'):
+        measures = tuple(round(value, 6) for value in row[keys:])
+        if any(measures):
+            rows[row[:keys]] = measures
+    return rows
+
+
+def _rollup_tables(conn):
+    return _table(conn, "rollup_cube", 4), _table(conn, "rollup_day", 3)
+
+
+def _sketch_tables(conn):
+    return {row[:3]: row[3] for row in conn.execute('SELECT level, month, metric, sketch FROM quantile_sketch')}
+
+
+def _populate(storage, seed, count=300):
+    rng = random.Random(seed)
+    ids = [_insert(storage, _random_record(rng)) for _ in range(count)]
+    return rng, ids
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_rollup_matches_rebuild(storage, seed):
+    rng, ids = _populate(storage, seed)
+    for record_id in rng.sample(ids, 60):
+        record = _random_record(rng)
+        assert storage.update_record_row(record_id, record["level"], record["name"], record["duration"],
+                                         record["mood"], record["start_ts"], record["end_ts"])
+    for record_id in rng.sample(ids, 40):
+        storage.delete_record_row(record_id)
+    remaining = [row[0] for row in storage.conn.execute('SELECT id FROM core_behavior')]
+    rescored = []
+    for record_id in rng.sample(remaining, 80):
+        record = storage.get_record(record_id)
+        record.update(final_score=round(rng.uniform(-20, 120), 2), energy_consume=round(rng.uniform(-10, 30), 2))
+        rescored.append(record)
+    storage.update_record_scores(rescored)
+
+    incremental = _rollup_tables(storage.conn)
+    rollup.rebuild_rollup(storage.conn)
+    assert incremental == _rollup_tables(storage.conn)
+
+    incremental = _sketch_tables(storage.conn)
+    quantiles.rebuild_sketches(storage.conn)
+    assert incremental == _sketch_tables(storage.conn)
+
+
+def test_deferred_sketch_rebuild_matches_immediate(storage):
+    rng, ids = _populate(storage, 7)
+    groups = set()
+    for chunk in range(0, 120, 30):
+        rescored = []
+        for record_id in ids[chunk:chunk + 30]:
+            record = storage.get_record(record_id)
+            record["final_score"] = round(rng.uniform(-20, 120), 2)
+            rescored.append(record)
+        groups |= storage.update_record_scores(rescored, rebuild_sketches=False)
+    storage.rebuild_sketches(groups)
+
+    deferred = _sketch_tables(storage.conn)
+    quantiles.rebuild_sketches(storage.conn)
+    assert deferred == _sketch_tables(storage.conn)
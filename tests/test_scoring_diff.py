@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+积分计算差分测试
+
+用随机输入同时驱动重构前的两条计算路径（下方冻结的参考实现）和统一后的ScoringCore适配器，
+逐项比对结果。
+
+唯一预期的差异：旧ScoringCalculator没有应用low_energy_positive_coeff（低精力正面行为系数上限），
+统一后两条路径都应用该上限。低精力时精力系数为0.7，默认配置的上限0.9不会改变结果，
+因此另用上限低于0.7的变体配置和低精力正面行为输入单独校验：
+这些输入在旧src路径上必须全部不同，在旧版路径上必须全部一致
+
+单次完整计算的基准测试：python -m tests.test_scoring_diff [样本数] [随机种子]
+"""
+
+import gc
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from data_manager import LEVEL_CONFIG, GLOBAL_CONFIG
+from scoring_engine import ScoringEngine
+from src.scoring.calculator import ScoringCalculator
+from src.scoring.engine import ScoringCore
+
+LEVELS = ["S", "A", "B", "C", "D", "R", "R1", "R2", "R3"]
+ENERGY_EDGES = [0, 0.5, 29.9, 30, 40, 40.1, 70, 70.1, 100, 120]
+
+# 低精力正面行为系数上限的变体值（低于低精力时的精力系数0.7，上限才会生效）
+LOW_ENERGY_CAP_VARIANT = 0.6
+
+# 差分测试的样本数
+CASE_COUNT = 5000
+
+
+# ----------------- 冻结的参考实现（重构前的代码） -----------------
+class ReferenceLegacyEngine:
+    """重构前的scoring_engine.ScoringEngine与data_manager系数函数"""
+
+    def __init__(self, user_data, level_config, global_config):
+        self.user_data = user_data
+        self.level_config = level_config
+        self.global_config = global_config
+
+    @staticmethod
+    def calculate_energy_coefficient(current_energy):
+        if current_energy > 70:
+            return 1.0 + (current_energy - 70) * 0.01
+        elif current_energy > 40:
+            return 0.85 + (current_energy - 40) * 0.005
+        else:
+            return 0.7
+
+    def calculate_combo_coefficient(self, recent_behaviors, current_level):
+        is_positive = current_level in ["S", "A", "B"]
+        positive_recent = [b for b in recent_behaviors if b["level"] in ["S", "A", "B"]]
+        combo_count = len(positive_recent)
+        if combo_count == 0:
+            combo_coeff = 1.0
+        elif combo_count == 1:
+            combo_coeff = 1.1
+        elif combo_count == 2:
+            combo_coeff = 1.2
+        else:
+            combo_coeff = self.global_config["max_combo_bonus"]
+        is_negative_break = len(recent_behaviors) > 0 and recent_behaviors[-1]["level"] in ["C", "D"]
+        if is_positive and is_negative_break:
+            combo_coeff *= self.global_config["rebound_bonus"]
+        is_same_field = len(positive_recent) > 0 and all(b["level"] == current_level for b in positive_recent)
+        if is_same_field and combo_count >= 1:
+            combo_coeff *= 1.15
+        return {
+            "coefficient": combo_coeff,
+            "combo_count": combo_count,
+            "is_same_field": is_same_field,
+            "is_negative_break": is_negative_break
+        }
+
+    def _infer_r_sublevel(self, level, duration, mood):
+        if len(level) > 1:
+            return level
+        if mood <= 2:
+            inferred_sublevel = "R1"
+        elif mood == 3:
+            inferred_sublevel = "R2"
+        else:
+            inferred_sublevel = "R3"
+        if duration < 15:
+            inferred_sublevel = "R1"
+        elif 15 <= duration <= 30:
+            inferred_sublevel = "R2"
+        else:
+            inferred_sublevel = "R3"
+        if self.user_data["recent_behaviors"]:
+            last_behavior = self.user_data["recent_behaviors"][-1]
+            if last_behavior["level"] in ["S", "A"]:
+                if inferred_sublevel == "R1":
+                    inferred_sublevel = "R2"
+                elif inferred_sublevel == "R2":
+                    inferred_sublevel = "R3"
+        return inferred_sublevel
+
+    def get_behavior_info(self, level, duration, mood):
+        if level.startswith("R"):
+            r_level = self._infer_r_sublevel(level, duration, mood)
+            sublevel_config = self.level_config["R"]["sublevels"][r_level]
+            return {
+                "name": level,
+                "level": level,
+                "category": "恢复行为",
+                "base_score_per_min": sublevel_config["base_score_per_min"],
+                "energy_cost_per_min": sublevel_config["energy_cost_per_min"],
+                "mental_anchor": sublevel_config["mental_anchor"],
+                "example": sublevel_config["example"],
+                "inferred_sublevel": r_level
+            }
+        return self.level_config[level]
+
+    def calculate_energy_cost(self, behavior_info, level, duration, current_energy):
+        start_bonus_energy = 1.0
+        if duration <= self.global_config["start_bonus_duration"]:
+            start_bonus_energy = self.global_config["start_bonus_energy"]
+        energy_cost_per_min = behavior_info["energy_cost_per_min"]
+        final_energy_cost = energy_cost_per_min * duration * start_bonus_energy
+        if current_energy < self.global_config["energy_low_threshold"] and energy_cost_per_min < 0:
+            final_energy_cost *= self.global_config["low_energy_recovery_bonus"]
+        return {
+            "final_energy_cost": final_energy_cost,
+            "base_energy_cost": energy_cost_per_min * duration,
+            "start_bonus_energy": start_bonus_energy,
+            "is_recovery": energy_cost_per_min < 0
+        }
+
+    def calculate_score(self, behavior_info, level, duration, mood, current_energy):
+        if current_energy <= self.global_config["energy_zero_threshold"]:
+            return {
+                "final_score": 0,
+                "base_score": 0,
+                "dynamic_coefficient": 0,
+                "energy_coefficient": 0,
+                "combo_coefficient": 0,
+                "start_bonus_score": 1.0,
+                "novice_bonus": 1.0,
+                "is_energy_zero": True
+            }
+        energy_coeff = self.calculate_energy_coefficient(current_energy)
+        if current_energy < self.global_config["energy_low_threshold"] and level in ["S", "A", "B"]:
+            energy_coeff = min(energy_coeff, self.global_config["low_energy_positive_coeff"])
+        combo_result = self.calculate_combo_coefficient(self.user_data["recent_behaviors"], level)
+        combo_coeff = combo_result["coefficient"]
+        dynamic_coeff = energy_coeff * combo_coeff
+        start_bonus_score = 1.0
+        if duration <= self.global_config["start_bonus_duration"]:
+            start_bonus_score = self.global_config["start_bonus_score"]
+        novice_bonus = 1.0
+        if self.user_data["beginner_period"]:
+            novice_bonus = self.global_config["novice_bonus"]
+        base_score = behavior_info["base_score_per_min"] * duration
+        final_score = base_score * dynamic_coeff * start_bonus_score * novice_bonus
+        return {
+            "final_score": final_score,
+            "base_score": base_score,
+            "dynamic_coefficient": dynamic_coeff,
+            "energy_coefficient": energy_coeff,
+            "combo_coefficient": combo_coeff,
+            "start_bonus_score": start_bonus_score,
+            "novice_bonus": novice_bonus,
+            "combo_result": combo_result,
+            "is_energy_zero": False
+        }
+
+    def apply_balance_mechanisms(self, score_details, same_behavior_count, is_short_frequency, level):
+        final_score = score_details["final_score"]
+        if same_behavior_count >= 3:
+            final_score *= 0.8
+        if is_short_frequency:
+            final_score *= 0.7
+        if level.startswith("R"):
+            r_count = sum(1 for b in self.user_data["recent_behaviors"] if b["level"].startswith("R"))
+            if r_count >= 2:
+                final_score *= 0.8
+        score_details["final_score"] = final_score
+        score_details["applied_balance"] = {
+            "same_behavior_count": same_behavior_count,
+            "is_short_frequency": is_short_frequency
+        }
+        return score_details
+
+
+class ReferenceCalculator:
+    """重构前的src.scoring.calculator.ScoringCalculator"""
+
+    def __init__(self, user_data, level_config, global_config):
+        self.user_data = user_data
+        self.level_config = level_config
+        self.global_config = global_config
+
+    def calculate_score(self, behavior):
+        if self.user_data["current_energy"] <= self.global_config["energy_zero_threshold"]:
+            return 0.0
+        behavior_info = self.get_behavior_info(behavior.level, behavior.duration, behavior.mood)
+        base_score = behavior_info["base_score_per_min"] * behavior.duration
+        energy_coeff = self._calculate_energy_coefficient()
+        combo_coeff = self._calculate_combo_result(behavior.level)["coefficient"]
+        dynamic_coeff = energy_coeff * combo_coeff
+        start_bonus_score = 1.0
+        if behavior.duration <= self.global_config["start_bonus_duration"]:
+            start_bonus_score = self.global_config["start_bonus_score"]
+        novice_bonus = 1.0
+        if self.user_data["beginner_period"]:
+            novice_bonus = self.global_config["novice_bonus"]
+        return base_score * dynamic_coeff * start_bonus_score * novice_bonus
+
+    def calculate_energy_cost(self, behavior):
+        behavior_info = self.get_behavior_info(behavior.level, behavior.duration, behavior.mood)
+        start_bonus_energy = 1.0
+        if behavior.duration <= self.global_config["start_bonus_duration"]:
+            start_bonus_energy = self.global_config["start_bonus_energy"]
+        energy_cost_per_min = behavior_info["energy_cost_per_min"]
+        final_energy_cost = energy_cost_per_min * behavior.duration * start_bonus_energy
+        if self.user_data["current_energy"] < self.global_config["energy_low_threshold"] and energy_cost_per_min < 0:
+            final_energy_cost *= self.global_config["low_energy_recovery_bonus"]
+        return final_energy_cost, energy_cost_per_min < 0
+
+    def get_behavior_info(self, level, duration, mood):
+        if level.startswith("R"):
+            r_level = self._infer_r_sublevel(level, duration, mood)
+            sublevel_config = self.level_config["R"]["sublevels"][r_level]
+            return {
+                "name": level,
+                "level": level,
+                "category": "恢复行为",
+                "base_score_per_min": sublevel_config["base_score_per_min"],
+                "energy_cost_per_min": sublevel_config["energy_cost_per_min"],
+                "mental_anchor": sublevel_config["mental_anchor"],
+                "example": sublevel_config["example"],
+                "inferred_sublevel": r_level
+            }
+        return self.level_config[level]
+
+    def _infer_r_sublevel(self, level, duration, mood):
+        if len(level) > 1:
+            return level
+        if duration < 15:
+            inferred_sublevel = "R1"
+        elif 15 <= duration <= 30:
+            inferred_sublevel = "R2"
+        else:
+            inferred_sublevel = "R3"
+        if self.user_data["recent_behaviors"]:
+            last_behavior = self.user_data["recent_behaviors"][-1]
+            if last_behavior.level in ["S", "A"]:
+                if inferred_sublevel == "R1":
+                    inferred_sublevel = "R2"
+                elif inferred_sublevel == "R2":
+                    inferred_sublevel = "R3"
+        return inferred_sublevel
+
+    def _calculate_energy_coefficient(self):
+        current_energy = self.user_data["current_energy"]
+        if current_energy > 70:
+            return 1.0 + (current_energy - 70) * 0.01
+        elif current_energy > 40:
+            return 0.85 + (current_energy - 40) * 0.005
+        else:
+            return 0.7
+
+    def _calculate_combo_result(self, level):
+        is_positive = level in ["S", "A", "B"]
+        positive_recent = [b for b in self.user_data["recent_behaviors"] if b.level in ["S", "A", "B"]]
+        combo_count = len(positive_recent)
+        if combo_count == 0:
+            combo_coeff = 1.0
+        elif combo_count == 1:
+            combo_coeff = 1.1
+        elif combo_count == 2:
+            combo_coeff = 1.2
+        else:
+            combo_coeff = self.global_config["max_combo_bonus"]
+        is_negative_break = len(self.user_data["recent_behaviors"]) > 0 and self.user_data["recent_behaviors"][-1].level in ["C", "D"]
+        if is_positive and is_negative_break:
+            combo_coeff *= self.global_config["rebound_bonus"]
+        is_same_field = len(positive_recent) > 0 and all(b.level == level for b in positive_recent)
+        if is_same_field and combo_count >= 1:
+            combo_coeff *= 1.15
+        return {"coefficient": combo_coeff}
+
+    def apply_balance_mechanisms(self, final_score, same_behavior_count, is_short_frequency, level):
+        adjusted_score = final_score
+        if same_behavior_count >= 3:
+            adjusted_score *= 0.8
+        if is_short_frequency:
+            adjusted_score *= 0.7
+        if level.startswith("R"):
+            r_count = sum(1 for b in self.user_data["recent_behaviors"] if b.level.startswith("R"))
+            if r_count >= 2:
+                adjusted_score *= 0.8
+        return adjusted_score
+
+
+# ----------------- 随机输入 -----------------
+def generate_cases(count, seed):
+    """生成随机输入（包含精力阈值边界）"""
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            energy = rng.choice(ENERGY_EDGES)
+        else:
+            energy = round(rng.uniform(0, 120), 2)
+        cases.append({
+            "level": rng.choice(LEVELS),
+            "duration": rng.choice([1, 5, 6, 14, 15, 30, 31]) if rng.random() < 0.3 else rng.randint(1, 180),
+            "mood": rng.randint(1, 5),
+            "energy": energy,
+            "recent": [rng.choice(LEVELS) for _ in range(rng.randint(0, 3))],
+            "beginner_period": rng.random() < 0.3,
+            "same_count": rng.randint(0, 5),
+            "is_short_frequency": rng.random() < 0.2
+        })
+    return cases
+
+
+def generate_low_energy_cases(count, seed):
+    """生成低精力（零精力阈值与低精力阈值之间）的正面行为输入"""
+    rng = random.Random(seed)
+    low = GLOBAL_CONFIG["energy_zero_threshold"]
+    high = GLOBAL_CONFIG["energy_low_threshold"]
+    cases = []
+    for case in generate_cases(count, seed):
+        energy = round(rng.uniform(low, high), 2)
+        case["energy"] = energy if low < energy < high else (low + high) / 2
+        case["level"] = rng.choice(["S", "A", "B"])
+        cases.append(case)
+    return cases
+
+
+def legacy_user_data(case):
+    return {
+        "recent_behaviors": [{"level": level} for level in case["recent"]],
+        "beginner_period": case["beginner_period"]
+    }
+
+
+def src_user_data(case):
+    return {
+        "current_energy": case["energy"],
+        "recent_behaviors": [SimpleNamespace(level=level) for level in case["recent"]],
+        "beginner_period": case["beginner_period"]
+    }
+
+
+def run_legacy(engine, case):
+    """旧版调用方式的完整计算"""
+    info = engine.get_behavior_info(case["level"], case["duration"], case["mood"])
+    energy = engine.calculate_energy_cost(info, case["level"], case["duration"], case["energy"])
+    score = engine.calculate_score(info, case["level"], case["duration"], case["mood"], case["energy"])
+    score = engine.apply_balance_mechanisms(score, case["same_count"], case["is_short_frequency"], case["level"])
+    return info, energy, score
+
+
+def run_src(calculator, case):
+    """src调用方式的完整计算"""
+    behavior = SimpleNamespace(level=case["level"], duration=case["duration"], mood=case["mood"],
+                               start_time=None, end_time=None)
+    energy = calculator.calculate_energy_cost(behavior)
+    score = calculator.calculate_score(behavior)
+    score = calculator.apply_balance_mechanisms(score, case["same_count"], case["is_short_frequency"], case["level"])
+    return energy, score
+
+
+def run_core(core, case):
+    """直接调用统一核心的完整计算"""
+    recent = case["recent"]
+    info = core.get_behavior_info(case["level"], case["duration"], case["mood"], recent[-1] if recent else None)
+    energy = core.energy_cost(info, case["duration"], case["energy"])
+    score = core.score(info, case["level"], case["duration"], case["energy"], recent, case["beginner_period"])
+    return energy, core.apply_balance(score["final_score"], case["same_count"], case["is_short_frequency"],
+                                      case["level"], recent)
+
+
+def is_low_energy_positive(case):
+    """旧ScoringCalculator缺少低精力正面行为系数上限的输入"""
+    return (GLOBAL_CONFIG["energy_zero_threshold"] < case["energy"] < GLOBAL_CONFIG["energy_low_threshold"]
+            and case["level"] in ("S", "A", "B"))
+
+
+@pytest.fixture(scope="module")
+def cases():
+    return generate_cases(CASE_COUNT, 0)
+
+
+def test_legacy_adapter_matches_reference(cases):
+    mismatches = []
+    for case in cases:
+        reference = run_legacy(ReferenceLegacyEngine(legacy_user_data(case), LEVEL_CONFIG, GLOBAL_CONFIG), case)
+        unified = run_legacy(ScoringEngine(legacy_user_data(case)), case)
+        unified_score = {key: value for key, value in unified[2].items() if key in reference[2]}
+        if reference[:2] != unified[:2] or reference[2] != unified_score:
+            mismatches.append(case)
+    assert mismatches == []
+
+
+def test_calculator_adapter_matches_reference(cases):
+    mismatches = []
+    expected = 0
+    for case in cases:
+        reference = run_src(ReferenceCalculator(src_user_data(case), LEVEL_CONFIG, GLOBAL_CONFIG), case)
+        unified = run_src(ScoringCalculator(src_user_data(case), GLOBAL_CONFIG), case)
+        if reference == unified:
+            continue
+        # 默认配置下上限不改变结果，允许的差异只可能来自低精力正面行为
+        if is_low_energy_positive(case) and reference[0] == unified[0]:
+            expected += 1
+        else:
+            mismatches.append(case)
+    assert mismatches == []
+    assert expected == 0
+
+
+def test_adapters_match_core(cases):
+    core = ScoringCore(LEVEL_CONFIG, GLOBAL_CONFIG)
+    mismatches = []
+    for case in cases:
+        core_energy, core_score = run_core(core, case)
+        unified = run_src(ScoringCalculator(src_user_data(case), GLOBAL_CONFIG), case)
+        legacy = run_legacy(ScoringEngine(legacy_user_data(case)), case)
+        if ((core_energy["final_energy_cost"], core_energy["is_recovery"]) != unified[0] or core_score != unified[1]
+                or core_energy != legacy[1] or core_score != legacy[2]["final_score"]):
+            mismatches.append(case)
+    assert mismatches == []
+
+
+def test_adapter_follows_replaced_recent_behaviors():
+    user_data = {"recent_behaviors": [], "beginner_period": False}
+    engine = ScoringEngine(user_data)
+    info = engine.get_behavior_info("S", 30, 3)
+    assert engine.calculate_score(info, "S", 30, 3, 80)["combo_result"]["combo_count"] == 0
+    user_data["recent_behaviors"] = [{"level": "S"}, {"level": "A"}]
+    assert engine.calculate_score(info, "S", 30, 3, 80)["combo_result"]["combo_count"] == 2
+    assert engine.get_behavior_info("R", 10, 3)["inferred_sublevel"] == "R2"
+
+
+def test_low_energy_cap_variant():
+    """上限低于0.7时：旧版参考实现与核心一致，旧ScoringCalculator只有得分高于适配器"""
+    variant = dict(GLOBAL_CONFIG, low_energy_positive_coeff=LOW_ENERGY_CAP_VARIANT)
+    core = ScoringCore(LEVEL_CONFIG, variant)
+    for case in generate_low_energy_cases(CASE_COUNT // 10, 0):
+        reference = run_legacy(ReferenceLegacyEngine(legacy_user_data(case), LEVEL_CONFIG, variant), case)
+        core_energy, core_score = run_core(core, case)
+        assert reference[1] == core_energy
+        assert reference[2]["final_score"] == core_score
+
+        reference = run_src(ReferenceCalculator(src_user_data(case), LEVEL_CONFIG, variant), case)
+        unified = run_src(ScoringCalculator(src_user_data(case), variant), case)
+        assert reference[0] == unified[0]
+        assert reference[1] > unified[1]
+
+
+def benchmark(cases, rounds=15):
+    """单次完整计算的耗时（微秒），各实现交替运行，取多轮最小值（计时期间关闭垃圾回收）"""
+    legacy_users = [legacy_user_data(case) for case in cases]
+    src_users = [src_user_data(case) for case in cases]
+    core = ScoringCore(LEVEL_CONFIG, GLOBAL_CONFIG)
+    reference_legacy = [ReferenceLegacyEngine(user, LEVEL_CONFIG, GLOBAL_CONFIG) for user in legacy_users]
+    reference_src = [ReferenceCalculator(user, LEVEL_CONFIG, GLOBAL_CONFIG) for user in src_users]
+    unified_legacy = [ScoringEngine(user) for user in legacy_users]
+    unified_src = [ScoringCalculator(user, GLOBAL_CONFIG) for user in src_users]
+
+    runs = {
+        "旧版ScoringEngine（重构前）": lambda: [run_legacy(e, c) for e, c in zip(reference_legacy, cases)],
+        "旧版ScoringCalculator（重构前）": lambda: [run_src(e, c) for e, c in zip(reference_src, cases)],
+        "ScoringEngine适配器": lambda: [run_legacy(e, c) for e, c in zip(unified_legacy, cases)],
+        "ScoringCalculator适配器": lambda: [run_src(e, c) for e, c in zip(unified_src, cases)],
+        "ScoringCore": lambda: [run_core(core, c) for c in cases],
+    }
+    best = dict.fromkeys(runs, float("inf"))
+    for _ in range(rounds):
+        for name, run in runs.items():
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            run()
+            best[name] = min(best[name], time.perf_counter() - start)
+            gc.enable()
+    return {name: seconds / len(cases) * 1e6 for name, seconds in best.items()}
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    print(f"=== 基准测试（单次完整计算，微秒，{count}组随机输入） ===")
+    for name, micros in benchmark(generate_cases(count, seed)).items():
+        print(f"{name}: {micros:.2f}")
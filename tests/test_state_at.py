@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""任意时刻的状态查询：重放结果与记录时的实时状态一致（有无每日快照）"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_manager
+from scoring_engine import ScoringEngine
+from storage_engine import StorageEngine
+
+# (等级, 开始时, 开始分, 时长)：包含连击、连击中断、R级和B级的精力恢复、超过1小时的空档
+PLAN = [("S", 9, 0, 60), ("B", 10, 30, 45), ("R", 11, 20, 20), ("A", 14, 0, 90),
+        ("C", 16, 0, 30), ("S", 16, 40, 30), ("D", 20, 0, 60)]
+
+
+@pytest.fixture
+def live_states(tmp_path, monkeypatch):
+    """按记录时的方式逐条计分、写入两天前的行为，返回每条记录结束时的实时状态"""
+    monkeypatch.chdir(tmp_path)
+    day = (datetime.now() - timedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
+    recent = []
+    states = []
+    for level, hour, minute, duration in PLAN:
+        start_ts = int((day + timedelta(hours=hour, minutes=minute)).timestamp())
+        end_ts = start_ts + duration * 60
+        energy = data_manager.gap_recovery_before(start_ts)["energy_after"]
+        engine = ScoringEngine({"recent_behaviors": [{"level": previous} for previous in recent[-3:]], "beginner_period": True})
+        info = engine.get_behavior_info(level, duration, 3)
+        energy_cost = engine.calculate_energy_cost(info, level, duration, energy)["final_energy_cost"]
+        score = engine.calculate_score(info, level, duration, 3, energy, start_ts, end_ts)["final_score"]
+        assert data_manager.add_behavior_record(level, duration, 3, start_ts, end_ts, score, 1.0, score, energy_cost,
+                                                f"{level}行为")
+        recent.append(level)
+
+        storage = StorageEngine()
+        states.append((end_ts, storage.get_user_state(), storage.get_total_score()))
+        storage.close()
+    yield states
+    # 记录后安排的高效时段学习按当前目录打开数据库，切换目录前等待它结束
+    data_manager.schedule_efficient_periods_update().result()
+
+
+def _assert_matches(state, live, total_score):
+    assert state["energy"] == pytest.approx(live["current_energy"])
+    assert state["combo_count"] == live["combo_count"]
+    assert state["behavior_count"] == live["today_behavior_count"]
+    assert state["day_score"] == pytest.approx(live["today_total_score"])
+    assert state["total_score"] == pytest.approx(total_score)
+    assert state["last_record_ts"] == live["last_record_ts"]
+
+
+def test_state_at_matches_live_state(live_states):
+    for end_ts, live, total_score in live_states:
+        _assert_matches(data_manager.get_state_at(end_ts), live, total_score)
+
+
+def test_state_at_from_snapshot_matches_live_state(live_states):
+    assert data_manager.write_daily_snapshots(datetime.now().strftime("%Y-%m-%d")) == 1
+    for end_ts, live, total_score in live_states:
+        _assert_matches(data_manager.get_state_at(end_ts), live, total_score)
+
+    # 快照之后的日期从快照开始重放：经过两个夜晚的睡眠恢复，分数不变
+    end_ts, live, total_score = live_states[-1]
+    later = data_manager.get_state_at(datetime.now())
+    assert later["total_score"] == pytest.approx(total_score)
+    assert later["behavior_count"] == 0
+    assert later["energy"] > live["current_energy"]
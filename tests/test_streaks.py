@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""连续天数位图：位运算与逐日计算一致、增量置位与按历史建立的位图一致"""
+
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import data_manager
+from src.scoring.streaks import DayBitmap, CONDITIONS, streak_summary
+from storage_engine import StorageEngine
+
+
+def _key(day):
+    return day.strftime("%Y-%m-%d")
+
+
+def _random_days(seed):
+    rng = random.Random(seed)
+    start = date(2025, 11, 1)
+    return {start + timedelta(days=offset) for offset in range(200) if rng.random() < 0.6}
+
+
+def _bitmap(days):
+    bitmap = DayBitmap()
+    for day in days:
+        bitmap.set(_key(day))
+    return bitmap
+
+
+def _naive_runs(days):
+    runs = []
+    for day in sorted(days):
+        if runs and runs[-1][0] + timedelta(days=runs[-1][1]) == day:
+            runs[-1][1] += 1
+        else:
+            runs.append([day, 1])
+    return [(_key(start), length) for start, length in runs]
+
+
+def _naive_current(days, today):
+    day = today if today in days else today - timedelta(days=1)
+    streak = 0
+    while day in days:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_bit_operations_match_day_by_day(seed):
+    days = _random_days(seed)
+    bitmap = _bitmap(days)
+    runs = _naive_runs(days)
+
+    assert list(bitmap.runs()) == runs
+    assert bitmap.longest_streak() == max(length for _, length in runs)
+    assert bitmap.popcount() == len(days)
+    for today in (date(2025, 11, 1) + timedelta(days=offset) for offset in range(0, 210, 7)):
+        assert bitmap.current_streak(_key(today)) == _naive_current(days, today)
+    start, end = date(2025, 12, 10), date(2026, 2, 3)
+    assert bitmap.popcount(_key(start), _key(end)) == sum(1 for day in days if start <= day <= end)
+    assert bitmap.window(_key(start), _key(end)).popcount() == bitmap.popcount(_key(start), _key(end))
+    calendar = bitmap.calendar(2026)
+    assert len(calendar) == 365
+    assert [index for index, value in enumerate(calendar) if value] == sorted(
+        (day - date(2026, 1, 1)).days for day in days if day.year == 2026)
+    assert DayBitmap(bitmap.to_bytes()).bits == bitmap.bits
+
+
+def test_clearing_a_day_splits_the_run():
+    bitmap = _bitmap(date(2026, 3, day) for day in range(1, 11))
+    bitmap.set("2026-03-05", False)
+    assert list(bitmap.runs()) == [("2026-03-01", 4), ("2026-03-06", 5)]
+    assert bitmap.current_streak("2026-03-11") == 5
+    assert bitmap.current_streak("2026-03-12") == 0
+    assert DayBitmap().current_streak("2026-03-12") == 0
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    yield storage
+    storage.close()
+    # 记录、补录后安排的高效时段学习按当前目录打开数据库，切换目录前等待它结束
+    data_manager.schedule_efficient_periods_update().result()
+
+
+def _seeded(storage):
+    """清空位图后按全部记录重新建立"""
+    storage.conn.execute('DELETE FROM streak_bitmap')
+    assert storage.write_streak_seed(data_manager.DAILY_SCORE_TARGET)
+    return {condition: bitmap.bits for condition, bitmap in storage.get_streak_bitmaps().items()}
+
+
+def test_incremental_bitmaps_match_seed(storage):
+    rng = random.Random(3)
+    start = (datetime.now() - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(20):
+        if rng.random() < 0.2:
+            continue
+        for hour in rng.sample(range(8, 22), rng.randint(1, 4)):
+            start_ts = int((start + timedelta(days=offset, hours=hour)).timestamp())
+            level = rng.choice("SABCD")
+            score = rng.uniform(-30, 150)
+            assert data_manager.add_behavior_record(level, 30, 3, start_ts, start_ts + 1800, score, 1.0, score, 5, "行为")
+    # 补录一天只有负向行为、一天有S级行为
+    assert data_manager.insert_behavior_at("刷手机", "D", 60, 2, start + timedelta(days=22, hours=20))
+    assert data_manager.insert_behavior_at("写作", "S", 60, 4, start + timedelta(days=24, hours=9))
+
+    incremental = {condition: bitmap.bits for condition, bitmap in storage.get_streak_bitmaps().items()}
+    assert incremental == _seeded(storage)
+    summary = data_manager.get_streaks(_key(start + timedelta(days=25)))
+    assert set(summary) == set(CONDITIONS)
+    assert summary == streak_summary(storage.get_streak_bitmaps(), _key(start + timedelta(days=25)))
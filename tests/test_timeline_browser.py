@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""时间轴键集分页：翻页边界、相同开始时间的记录、按日跳转"""
+
+from datetime import date, datetime
+
+import pytest
+
+from src.visualization.timeline_browser import TimelineBrowser, TimelinePager, day_start
+from storage_engine import StorageEngine
+
+PAGE_SIZE = 4
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """三天的记录，每个开始时间有两条（id不同）"""
+    monkeypatch.chdir(tmp_path)
+    storage = StorageEngine()
+    for day in (1, 2, 5):
+        for hour in (8, 12, 16):
+            start_ts = int(datetime(2026, 3, day, hour).timestamp())
+            for name in ("读书", "跑步"):
+                storage.insert_record_row("B", 30, 3, start_ts, start_ts + 1800, 10.0, 1.0, 10.0, 5.0, name)
+    storage.conn.commit()
+    storage.close()
+    return str(tmp_path / "time_manage.db")
+
+
+@pytest.fixture
+def pager(db_path):
+    pager = TimelinePager(db_path, PAGE_SIZE)
+    yield pager
+    pager.close()
+
+
+def _all_keys(db_path):
+    storage = StorageEngine()
+    keys = [tuple(row) for row in storage.conn.execute('SELECT start_ts, id FROM core_behavior ORDER BY start_ts, id')]
+    storage.close()
+    return keys
+
+
+def _keys(page):
+    return [(record["start_ts"], record["id"]) for record in page.records]
+
+
+def test_forward_paging_visits_every_record_once(pager, db_path):
+    keys = []
+    page = pager.seek(0)
+    while page.records:
+        assert len(page.records) <= PAGE_SIZE
+        keys.extend(_keys(page))
+        page = pager.after(page.last_key)
+    assert keys == _all_keys(db_path)
+
+
+def test_backward_paging_visits_every_record_once(pager, db_path):
+    keys = []
+    page = pager.last()
+    assert page.last_key == _all_keys(db_path)[-1]
+    while page.records:
+        keys[:0] = _keys(page)
+        page = pager.before(page.first_key)
+    assert keys == _all_keys(db_path)
+
+
+def test_page_boundary_between_equal_start_times(db_path):
+    # 每页3条：第一页在同一开始时间的两条记录之间结束
+    pager = TimelinePager(db_path, 3)
+    try:
+        first = pager.seek(0)
+        second = pager.after(first.last_key)
+        assert first.last_key[0] == second.first_key[0]
+        assert second.first_key[1] > first.last_key[1]
+        assert pager.before(second.first_key) == first
+    finally:
+        pager.close()
+
+
+def test_first_and_last_page_edges(pager, db_path):
+    keys = _all_keys(db_path)
+    assert pager.before(keys[0]).records == ()
+    assert pager.after(keys[-1]).records == ()
+    assert _keys(pager.before(keys[1])) == keys[:1]
+    assert _keys(pager.after(keys[-2])) == keys[-1:]
+    assert pager.seek(keys[-1][0] + 1).first_key is None
+
+
+def test_seek_starts_at_day(pager):
+    page = pager.seek(day_start(date(2026, 3, 3)))
+    assert datetime.fromtimestamp(page.first_key[0]) == datetime(2026, 3, 5, 8)
+
+
+def test_browser_goto_and_step(db_path):
+    browser = TimelineBrowser(db_path, PAGE_SIZE)
+    try:
+        browser.goto(date(2026, 3, 2))
+        assert browser.anchor == date(2026, 3, 2)
+        browser.next_page()
+        assert browser.anchor == date(2026, 3, 2)
+        browser.next_page()
+        assert browser.anchor == date(2026, 3, 5)
+        # 最后一页之后不再前进，第一页之前不再后退
+        for _ in range(3):
+            browser.next_page()
+        assert browser.page.last_key == _all_keys(db_path)[-1]
+        browser.goto(date(2026, 1, 1))
+        first = browser.page
+        assert browser.prev_page() == first
+        # 目标日期之后没有记录时显示最后一页
+        browser.goto(date(2026, 4, 1))
+        assert browser.page.last_key == _all_keys(db_path)[-1]
+    finally:
+        browser.close()
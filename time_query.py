@@ -0,0 +1,45 @@
+import sys
+from datetime import datetime
+from data_manager import behaviors_at, unrecorded_gaps
+
+def _format_ts(ts):
+    """时间戳格式化为HH:MM"""
+    return datetime.fromtimestamp(ts).strftime("%H:%M")
+
+def show_behaviors_at(moment):
+    """查看某一时刻正在进行的行为"""
+    records = behaviors_at(moment)
+    print(f"=== {moment.strftime('%Y-%m-%d %H:%M')} ===")
+    if not records:
+        print("该时刻没有记录任何行为")
+        return
+    for record in records:
+        name = record["name"] or f"{record['level']}级行为"
+        print(f"- {name}（{record['level']}级，{record['duration']}分钟，得分{record['final_score']:.2f}）")
+
+def show_gaps(day=None):
+    """查看某天没有记录行为的空档"""
+    gaps = unrecorded_gaps(day)
+    print(f"=== {day or datetime.now().strftime('%Y-%m-%d')} 未记录的空档 ===")
+    if not gaps:
+        print("没有未记录的空档")
+        return
+    total_minutes = 0
+    for start, end in gaps:
+        minutes = (end - start) // 60
+        total_minutes += minutes
+        print(f"- {_format_ts(start)}-{_format_ts(end)}（{minutes}分钟）")
+    print(f"合计: {total_minutes}分钟")
+
+if __name__ == "__main__":
+    # 用法：python time_query.py HH:MM | "YYYY-MM-DD HH:MM" | --gaps [YYYY-MM-DD]
+    args = sys.argv[1:]
+    if not args:
+        print('用法: python time_query.py HH:MM | "YYYY-MM-DD HH:MM" | --gaps [YYYY-MM-DD]')
+    elif args[0] == "--gaps":
+        show_gaps(args[1] if len(args) > 1 else None)
+    elif len(" ".join(args)) <= 5:
+        time_of_day = datetime.strptime(args[0], "%H:%M")
+        show_behaviors_at(datetime.now().replace(hour=time_of_day.hour, minute=time_of_day.minute, second=0, microsecond=0))
+    else:
+        show_behaviors_at(datetime.strptime(" ".join(args), "%Y-%m-%d %H:%M"))
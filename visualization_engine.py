@@ -6,33 +6,48 @@
 包含仪表盘、时间轴、热力图、分布图和RPG元素
 """
 
-from termcolor import colored
+import sys
 from datetime import datetime, timedelta
 import json
 from storage_engine import StorageEngine
+from src.db.rollup import WEEKDAY_NAMES
+from src.visualization.report import ReportEngine
+from src.visualization.heatmap import quantile_thresholds, render_heatmap, render_years, legend
+from src.visualization.render import (
+    FrameBuffer, Styles, color_enabled, star_rating, timeline_lines, heatmap_start_for_width
+)
 
 class VisualizationEngine:
-    """可视化引擎类，负责生成各种CLI可视化输出"""
+    """可视化引擎类，负责生成各种CLI可视化输出
+    
+    各generate_*方法把输出写入帧缓冲；传入frame时由调用方统一输出，
+    否则方法自己新建帧缓冲并在结束时一次写出
+    """
     
     def __init__(self):
         """初始化可视化引擎"""
         self.storage = StorageEngine()
+        self.styles = Styles(color_enabled(sys.stdout))
+        self.reports = ReportEngine(self.storage.conn)
     
     def close(self):
         """关闭数据库连接"""
         self.storage.close()
     
+    def _frame(self, frame):
+        """返回(帧缓冲, 是否由本方法输出)"""
+        if frame is not None:
+            return frame, False
+        return FrameBuffer(self.styles), True
+    
     def get_star_rating(self, mood):
         """根据心情值生成星级评分"""
-        full_star = "★"
-        empty_star = "☆"
-        return full_star * mood + empty_star * (5 - mood)
+        return star_rating(mood)
     
-    def generate_dashboard(self, user_data, today_records):
+    def generate_dashboard(self, user_data, today_records, frame=None):
         """生成仪表盘概览"""
-        print("\n" + "="*50)
-        print(colored("仪表盘概览", "cyan", attrs=["bold"]))
-        print("="*50)
+        frame, owned = self._frame(frame)
+        frame.title("仪表盘概览")
         
         # 计算当日总积分
         today_total_score = sum(record["final_score"] for record in today_records)
@@ -52,122 +67,73 @@ class VisualizationEngine:
             efficiency = 0
         
         # 显示仪表盘卡片
-        print("┌──────────────┐ ┌──────────────┐")
-        print(f"│总积分: {today_total_score:.1f} │ │效率: {efficiency:.1f}/点 │")
-        print("└──────────────┘ └──────────────┘")
-        print("┌──────────────┐ ┌──────────────┐")
-        print(f"│连击: {user_data['combo_count']}次  │ │心情: {self.get_star_rating(avg_mood)} │")
-        print("└──────────────┘ └──────────────┘")
+        frame.extend([
+            "┌──────────────┐ ┌──────────────┐",
+            f"│总积分: {today_total_score:.1f} │ │效率: {efficiency:.1f}/点 │",
+            "└──────────────┘ └──────────────┘",
+            "┌──────────────┐ ┌──────────────┐",
+            f"│连击: {user_data['combo_count']}次  │ │心情: {star_rating(avg_mood)} │",
+            "└──────────────┘ └──────────────┘"
+        ])
+        
+        # 高效时段（从历史记录学习）
+        if user_data.get("efficient_periods"):
+            frame.line(f"高效时段: {', '.join(user_data['efficient_periods'])}")
+        if owned:
+            frame.flush()
     
-    def generate_timeline(self, records):
+    def generate_timeline(self, records, frame=None):
         """生成多维时间轴"""
-        print("\n" + "="*50)
-        print(colored("时间轴", "cyan", attrs=["bold"]))
-        print("="*50)
+        frame, owned = self._frame(frame)
+        frame.title("时间轴")
         
         if not records:
-            print("今日暂无行为记录")
-            return
-        
-        # 按时间排序
-        sorted_records = sorted(records, key=lambda x: x["start_ts"])
-        
-        for record in sorted_records:
-            # 格式化时间
-            start_time = datetime.fromtimestamp(record["start_ts"]).strftime("%H:%M")
-            end_time = datetime.fromtimestamp(record["end_ts"]).strftime("%H:%M")
-            
-            # 等级颜色
-            level_color_map = {
-                "S": "green",
-                "A": "blue",
-                "B": "yellow",
-                "C": "magenta",
-                "D": "red",
-                "R": "cyan"
-            }
-            level_color = level_color_map.get(record["level"], "white")
-            
-            # 生成进度条
-            bar_length = min(20, int(record["duration"] / 5))  # 每5分钟一个字符
-            bar = "■" * bar_length
-            
-            # 生成星级
-            star_rating = self.get_star_rating(record["mood"])
-            
-            # 显示记录
-            print(f"{start_time}-{end_time} [{colored(bar, level_color)}] {record['level']}级 "
-                  f"积分:{record['final_score']:.0f} 精力:{record['energy_consume']:+.1f} "
-                  f"心情:{star_rating}")
+            frame.line("今日暂无行为记录")
+        else:
+            # 按时间排序
+            sorted_records = sorted(records, key=lambda x: x["start_ts"])
+            frame.extend(timeline_lines(sorted_records, frame.styles, frame.width))
+        if owned:
+            frame.flush()
     
-    def generate_heatmap(self, days=30):
-        """生成热力图"""
-        print("\n" + "="*50)
-        print(colored("热力图", "cyan", attrs=["bold"]))
-        print("="*50)
+    def generate_heatmap(self, days=365, years=None, frame=None):
+        """生成热力图（最近days天；指定years时显示最近years年，每年一块）"""
+        frame, owned = self._frame(frame)
+        frame.title("热力图")
         
-        # 获取过去days天的日期
+        # 一次分组查询得到每日总积分
         today = datetime.now().date()
-        dates = [today - timedelta(days=i) for i in range(days-1, -1, -1)]
-        
-        # 获取每日总积分
-        daily_scores = {}
-        for date in dates:
-            # 计算当天的时间戳范围
-            start_ts = int(datetime.combine(date, datetime.min.time()).timestamp())
-            end_ts = int(datetime.combine(date, datetime.max.time()).timestamp())
-            
-            # 查询当天的所有记录
-            self.storage.cursor.execute(
-                "SELECT SUM(final_score) FROM core_behavior WHERE start_ts BETWEEN ? AND ?",
-                (start_ts, end_ts)
-            )
-            result = self.storage.cursor.fetchone()[0]
-            daily_scores[date] = result or 0
-        
-        # 显示月份
-        print(f"{today.strftime('%b %Y')}")
-        print("S M T W T F S")
-        
-        # 生成热力图网格
-        week = []
-        for date in dates:
-            day = date.day
-            score = daily_scores[date]
-            
-            # 根据分数确定颜色
-            if score < 50:
-                color = "red"
-                char = "□"
-            elif score < 100:
-                color = "yellow"
-                char = "■"
-            elif score < 200:
-                color = "green"
-                char = "■"
-            else:
-                color = "green"
-                char = "■■"
-            
-            week.append(colored(f"{day:2d}{char}", color))
-            
-            # 每周换行
-            if date.weekday() == 6:  # 周日
-                print(" ".join(week))
-                week = []
-        
-        # 打印剩余的
-        if week:
-            print(" ".join(week))
+        if years:
+            year_list = list(range(today.year - years + 1, today.year + 1))
+            start = datetime(year_list[0], 1, 1).date()
+            end = datetime(today.year, 12, 31).date()
+        else:
+            start = today - timedelta(days=days - 1)
+            end = today
+        daily_scores = self.storage.get_daily_scores(
+            int(datetime.combine(start, datetime.min.time()).timestamp()),
+            int(datetime.combine(end, datetime.max.time()).timestamp())
+        )
+        
+        thresholds = quantile_thresholds(list(daily_scores.values()))
+        if years:
+            frame.extend(render_years(daily_scores, year_list, frame.styles.heat_cell))
+        else:
+            start = heatmap_start_for_width(start, end, frame.width)
+            frame.extend(render_heatmap(daily_scores, start, end, thresholds, frame.styles.heat_cell))
+        frame.line(legend(thresholds, frame.styles.heat_cell))
+        if owned:
+            frame.flush()
     
-    def generate_distribution(self, records):
+    def generate_distribution(self, records, frame=None):
         """生成数据洞察/分布图"""
-        print("\n" + "="*50)
-        print(colored("数据洞察/分布图", "cyan", attrs=["bold"]))
-        print("="*50)
+        frame, owned = self._frame(frame)
+        frame.title("数据洞察/分布图")
         
         if not records:
-            print("暂无数据可分析")
+            frame.line("暂无数据可分析")
+            if owned:
+                frame.flush()
             return
         
         # 等级分布
@@ -178,25 +144,53 @@ class VisualizationEngine:
             level = record["level"]
             level_counts[level] = level_counts.get(level, 0) + 1
         
-        print("等级分布:")
+        frame.line("等级分布:")
         for level in sorted(level_counts.keys()):
             count = level_counts[level]
             percentage = (count / total_records) * 100
             bar_length = int(percentage / 5)  # 每5%一个字符
-            bar = "■" * bar_length
-            print(f"{level}: {bar} ({percentage:.1f}%)")
-        
-        # 周趋势（简化版）
-        print("\n周趋势:")
-        # 这里简化处理，只显示当日数据
-        today_total = sum(record["final_score"] for record in records)
-        print(f"今日: {today_total:.0f}分")
+            bar = frame.styles.level(level, "■" * bar_length)
+            frame.line(f"{level}: {bar} ({percentage:.1f}%)")
+        
+        # 各等级历史时长、得分分位数（分位数草图，不排序历史记录）
+        frame.line("\n历史分位数（P50 / P90 / P99）:")
+        durations = self.storage.get_percentiles("duration")
+        scores = self.storage.get_percentiles("final_score")
+        for level in sorted(durations):
+            duration_text = " / ".join(f"{value:.0f}" for value in durations[level]["quantiles"].values())
+            score_text = " / ".join(f"{value:.0f}" for value in scores[level]["quantiles"].values())
+            frame.line(f"{level}: 时长 {duration_text} 分钟  得分 {score_text}  ({durations[level]['count']}次)")
+        
+        # 以下统计读取汇总立方体（几百个单元），不扫描历史记录
+        cube = self.storage.get_rollup_cube()
+        
+        # 周趋势：最近3个月按星期汇总
+        frame.line("\n周趋势（最近3个月）:")
+        trend = cube.weekday_trend(3)
+        max_score = max((abs(item["score"]) for item in trend), default=0) or 1
+        for item in trend:
+            bar = "■" * int(abs(item["score"]) / max_score * 20)
+            frame.line(f"周{WEEKDAY_NAMES[item['weekday']]}: {bar} {item['score']:.0f}分 {item['minutes']:.0f}分钟")
+        
+        # S级最佳时段
+        best = cube.best_hours("S")
+        if best:
+            hours = ", ".join(f"{item['hour']:02d}:00（{item['minutes']:.0f}分钟）" for item in best)
+            frame.line(f"\nS级最佳时段: {hours}")
+        
+        # 月度对比
+        comparison = cube.month_over_month()
+        current, previous = comparison["current"], comparison["previous"]
+        change = f"{(current['score'] - previous['score']) / abs(previous['score']) * 100:+.0f}%" if previous["score"] else "-"
+        frame.line(f"\n本月({current['month']}): {current['score']:.0f}分 {current['minutes']:.0f}分钟  "
+                   f"上月({previous['month']}): {previous['score']:.0f}分 {previous['minutes']:.0f}分钟  环比: {change}")
+        if owned:
+            frame.flush()
     
-    def generate_rpg_elements(self, user_data, total_score):
+    def generate_rpg_elements(self, user_data, total_score, frame=None):
         """生成RPG/游戏化反馈"""
-        print("\n" + "="*50)
-        print(colored("RPG元素", "cyan", attrs=["bold"]))
-        print("="*50)
+        frame, owned = self._frame(frame)
+        frame.title("RPG元素")
         
         # 计算等级（每1000分升一级）
         level = int(total_score / 1000) + 1
@@ -225,98 +219,104 @@ class VisualizationEngine:
         endurance_level = min(5, int(user_data['day_energy'] / 20) + 1)
         
         # 显示RPG信息
-        print(f"角色: 时间大师 Lv.{level}")
-        print(f"XP: [{xp_bar}] {xp}/1000")
-        print("属性:")
-        print(f"- 专注: Lv.{focus_level} ({'■' * focus_level})")
-        print(f"- 恢复: Lv.{recovery_level} ({'■' * recovery_level})")
-        print(f"- 耐力: Lv.{endurance_level} ({'■' * endurance_level})")
+        frame.extend([
+            f"角色: 时间大师 Lv.{level}",
+            f"XP: [{xp_bar}] {xp}/1000",
+            "属性:",
+            f"- 专注: Lv.{focus_level} ({'■' * focus_level})",
+            f"- 恢复: Lv.{recovery_level} ({'■' * recovery_level})",
+            f"- 耐力: Lv.{endurance_level} ({'■' * endurance_level})"
+        ])
         
         # 装备（基于连击数）
         if user_data['combo_count'] >= 3:
-            print("装备: 连击剑 (解锁于3连击)")
+            frame.line("装备: 连击剑 (解锁于3连击)")
         elif user_data['combo_count'] >= 1:
-            print("装备: 入门装备")
+            frame.line("装备: 入门装备")
         else:
-            print("装备: 无")
+            frame.line("装备: 无")
+        if owned:
+            frame.flush()
     
-    def generate_behavior_visualization(self, behavior_record):
+    def generate_behavior_visualization(self, behavior_record, frame=None):
         """生成单次行为的可视化反馈"""
-        print("\n" + "="*50)
-        print(colored("行为可视化", "cyan", attrs=["bold"]))
-        print("="*50)
-        
-        # 等级颜色
-        level_color_map = {
-            "S": "green",
-            "A": "blue",
-            "B": "yellow",
-            "C": "magenta",
-            "D": "red",
-            "R": "cyan"
-        }
-        level_color = level_color_map.get(behavior_record["level"], "white")
+        frame, owned = self._frame(frame)
+        frame.title("行为可视化")
+        
+        level = behavior_record["level"]
         
         # 显示行为基本信息
-        print(f"行为等级: {colored(behavior_record['level'], level_color)}")
-        print(f"持续时长: {behavior_record['duration']}分钟")
-        print(f"心情评分: {self.get_star_rating(behavior_record['mood'])}")
-        print(f"最终得分: {behavior_record['final_score']:.2f}")
-        print(f"精力变化: {behavior_record['energy_consume']:+.1f}")
+        frame.extend([
+            f"行为等级: {frame.styles.level(level)}",
+            f"持续时长: {behavior_record['duration']}分钟",
+            f"心情评分: {star_rating(behavior_record['mood'])}",
+            f"最终得分: {behavior_record['final_score']:.2f}",
+            f"精力变化: {behavior_record['energy_consume']:+.1f}"
+        ])
         
         # 生成进度条
         max_score = 200  # 假设最大得分为200
-        bar_length = min(30, int((behavior_record['final_score'] / max_score) * 30))
+        bar_length = max(0, min(30, int((behavior_record['final_score'] / max_score) * 30)))
         bar = "■" * bar_length + "□" * (30 - bar_length)
         
-        print(f"\n得分进度: [{colored(bar, level_color)}] {behavior_record['final_score']:.0f}/{max_score}")
+        frame.line(f"\n得分进度: [{frame.styles.level(level, bar)}] {behavior_record['final_score']:.0f}/{max_score}")
         
         # 生成AI洞察（简单规则）
         if behavior_record['final_score'] >= 100:
-            print("\n💡 AI洞察: 高效的行为！继续保持这个状态。")
+            frame.line("\n💡 AI洞察: 高效的行为！继续保持这个状态。")
         elif behavior_record['final_score'] >= 50:
-            print("\n💡 AI洞察: 良好的表现，继续努力。")
+            frame.line("\n💡 AI洞察: 良好的表现，继续努力。")
         elif behavior_record['final_score'] < 0:
-            print("\n💡 AI洞察: 建议调整行为，恢复精力。")
+            frame.line("\n💡 AI洞察: 建议调整行为，恢复精力。")
+        if owned:
+            frame.flush()
     
     def show_historical_review(self):
-        """显示历史回顾系统"""
-        print("\n" + "="*60)
-        print(colored("历史回顾系统", "cyan", attrs=["bold", "underline"]))
-        print("="*60)
+        """显示历史回顾系统（所有面板写入同一帧，一次输出）"""
+        frame = FrameBuffer(self.styles)
+        frame.title("历史回顾系统", width=60, attrs=("bold", "underline"))
         
         # 加载用户数据
+        user_state = self.storage.get_user_state()
+        today_records = self.storage.get_today_records()
         user_data = {
-            "combo_count": self.storage.get_user_state()["combo_count"],
-            "day_energy": self.storage.get_user_state()["current_energy"],
-            "today_behaviors_count": self.storage.get_user_state()["today_behavior_count"],
-            "behavior_day_list": self.storage.get_today_records()
+            "combo_count": user_state["combo_count"],
+            "day_energy": user_state["current_energy"],
+            "today_behaviors_count": user_state["today_behavior_count"],
+            "behavior_day_list": today_records
         }
         
-        # 获取今日记录
-        today_records = self.storage.get_today_records()
-        
         # 获取总得分
         total_score = self.storage.get_total_score()
         
         # 显示完整视图
-        self.generate_dashboard(user_data, today_records)
-        self.generate_timeline(today_records)
-        self.generate_heatmap()
-        self.generate_distribution(today_records)
-        self.generate_rpg_elements(user_data, total_score)
-        
-        print("\n" + "="*60)
-        print("历史回顾完成")
-        print("="*60)
+        self.generate_dashboard(user_data, today_records, frame)
+        self.generate_timeline(today_records, frame)
+        self.generate_heatmap(frame=frame)
+        self.generate_distribution(today_records, frame)
+        self.generate_rpg_elements(user_data, total_score, frame)
+        
+        frame.line()
+        frame.rule("=", 60)
+        frame.line("历史回顾完成")
+        frame.rule("=", 60)
+        frame.flush()
     
     def show_behavior_feedback(self, behavior_record):
         """显示单次行为的反馈"""
         self.generate_behavior_visualization(behavior_record)
     
-    def generate_summary_json(self, user_data, records):
-        """生成总结JSON"""
-        today_total_score = sum(record["final_score"] for record in records)
+    def generate_summary_json(self, user_data, records, period=None):
+        """生成总结JSON
+        
+        不指定period时为今日总结；指定period（day/week/month/year或(开始日期, 结束日期)）时
+        返回报告引擎的完整报告（合计、等级分布、精力效率、连续天数、最佳行为、心愿进度）
+        """
+        if period is not None:
+            return json.dumps(self.reports.report(period), ensure_ascii=False, indent=2)
+        
+        # 今日合计取自报告引擎（汇总表，按数据版本缓存）
+        today = self.reports.report("day")
         
         if records:
             avg_mood = sum(record["mood"] for record in records) / len(records)
@@ -325,10 +325,10 @@ class VisualizationEngine:
             avg_mood = 3
         
         summary = {
-            "today_total_score": today_total_score,
+            "today_total_score": today["totals"]["score"],
             "combo_count": user_data["combo_count"],
             "avg_mood": avg_mood,
-            "behavior_count": len(records),
+            "behavior_count": today["totals"]["count"],
             "current_energy": user_data["day_energy"]
         }
         